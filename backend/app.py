@@ -17,6 +17,9 @@ from flask_socketio import SocketIO
 # --- Import your modules ---
 from src.utils.config import load_secrets
 from src.backend.database.mongo_utils import get_mongo_db_connection
+from src.retrieval.embedding_cache import CachedEmbeddings, EMBEDDING_CACHE_COLLECTION
+from src.retrieval.quantization import EMBEDDING_DIMENSIONS
+from src.jobs.worker import start_embedded as start_job_worker
 
 from routes.auth import auth_bp
 from routes.bug_routes import bug_bp
@@ -38,6 +41,14 @@ logger = logging.getLogger(__name__)
 
 socketio = SocketIO(cors_allowed_origins="*")
 
+# Also used by the ASGI chat service (asgi_chat.py).
+ALLOWED_ORIGINS = [
+    "http://localhost:3000",
+    "https://app.bitterlylab.com",
+    "https://app.actrlab.com",
+    r"^https://.*\.qualtrics\.com$"
+]
+
 def create_app():
     app = Flask(__name__)
     # Behind nginx: trust one proxy hop so request.remote_addr / is_secure
@@ -55,21 +66,17 @@ def create_app():
     app.config["JWT_ACCESS_TOKEN_EXPIRES"] = timedelta(hours=1)
     app.config["JWT_REFRESH_TOKEN_EXPIRES"] = timedelta(days=30)
     
-    allowed_origins = [
-        "http://localhost:3000",
-        "https://app.bitterlylab.com",
-        "https://app.actrlab.com",
-        r"^https://.*\.qualtrics\.com$" 
-    ]
-    
-    CORS(app, resources={r"/api/*": {"origins": allowed_origins, "supports_credentials": True, "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]}})
+    CORS(app, resources={r"/api/*": {"origins": ALLOWED_ORIGINS, "supports_credentials": True, "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"]}})
 
     mail.init_app(app)
     jwt.init_app(app)
     bcrypt.init_app(app)
     
     # --- USE THREADING (Simple-WebSocket) INSTEAD OF EVENTLET ---
-    socketio.init_app(app, async_mode='threading')
+    # SOCKETIO_MESSAGE_QUEUE (e.g. redis://...) lets standalone job workers
+    # (python -m src.jobs.worker) emit to browsers connected here.
+    socketio.init_app(app, async_mode='threading',
+                      message_queue=os.getenv("SOCKETIO_MESSAGE_QUEUE") or None)
 
     client, db, mongo_collection = get_mongo_db_connection(
         mongo_uri=app.config["MONGO_URI"],
@@ -82,9 +89,20 @@ def create_app():
     
     # OpenAI is used ONLY for embeddings (RAG vector search).
     # Chat models are configured per-bot (Claude, Deepseek, Gemini, etc.).
-    app.config['EMBEDDINGS'] = OpenAIEmbeddings(
-        model="text-embedding-3-large",
-        api_key=app.config["OPENAI_API_KEY"]
+    # Wrapped in a query cache: repeated student questions skip the embedding
+    # round-trip. EMBEDDING_CACHE_SHARED=false keeps the cache process-local.
+    shared_cache = os.getenv("EMBEDDING_CACHE_SHARED", "true").lower() in ("true", "1")
+    app.config['EMBEDDINGS'] = CachedEmbeddings(
+        OpenAIEmbeddings(
+            model="text-embedding-3-large",
+            api_key=app.config["OPENAI_API_KEY"],
+            # EMBEDDING_DIMENSIONS (e.g. 1024) shortens vectors; must match the
+            # Atlas index (scripts/migrate_vector_storage.py).
+            dimensions=EMBEDDING_DIMENSIONS,
+        ),
+        collection=db[EMBEDDING_CACHE_COLLECTION] if shared_cache else None,
+        max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "4096")),
+        ttl_seconds=float(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(24 * 3600))),
     )
     app.config['RAG_CHAIN_CACHE'] = {}
 
@@ -104,6 +122,11 @@ def create_app():
 
     register_socket_events(socketio, app)
 
+    # Durable background jobs (uploads needing OCR, video pipeline). One
+    # process per host runs them; JOB_WORKER_EMBEDDED=false when workers
+    # run as their own process.
+    start_job_worker(app)
+
     @app.route('/health', methods=['GET'])
     def health_check():
         return jsonify({"status": "healthy", "message": "Backend is running!"})
@@ -0,0 +1,81 @@
+"""
+ASGI chat service: asyncio-native streaming for POST /api/chat/<config_id>/<chat_id>
+(routes/chat_async.py), run next to the threaded Flask app (app.py).
+
+Run:
+    cd backend && uvicorn asgi_chat:app --host 0.0.0.0 --port 5001 \
+        --proxy-headers --forwarded-allow-ips='*'
+
+and have nginx send POSTs to /api/chat/<config_id>/<chat_id> here; every
+other /api route (including DELETE on the same path) stays on port 5000.
+One uvicorn worker holds thousands of open streams; add workers
+(--workers N) for CPU, not for concurrency.
+
+The Flask app is still built (create_app) so the shared sync helpers —
+JWT decoding, usage limits, retrieval, agent tools — see the same
+config and Mongo/embedding clients; its embedded job worker is off here
+unless JOB_WORKER_EMBEDDED is set explicitly.
+
+Settings:
+    ASGI_CHAT_OFFLOAD_THREADS   worker threads for those sync helpers (64)
+"""
+import os
+import threading
+from contextlib import asynccontextmanager
+
+os.environ.setdefault("JOB_WORKER_EMBEDDED", "false")
+
+import anyio.to_thread
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from app import ALLOWED_ORIGINS, create_app
+from routes import chat_async
+from src.backend.database.mongo_utils import get_async_mongo_db
+
+ASGI_CHAT_OFFLOAD_THREADS = int(os.getenv("ASGI_CHAT_OFFLOAD_THREADS", "64"))
+
+
+@asynccontextmanager
+async def lifespan(app):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = ASGI_CHAT_OFFLOAD_THREADS
+    flask_app = create_app()
+    client, db = get_async_mongo_db(flask_app.config["MONGO_URI"], flask_app.config["MONGO_DB_NAME"])
+    app.state.flask_app = flask_app
+    app.state.db = db
+    try:
+        yield
+    finally:
+        await client.close()
+
+
+async def health(request):
+    return JSONResponse({
+        "status": "healthy",
+        "message": "Async chat is running!",
+        "threads": threading.active_count(),
+        **chat_async.inflight(),
+    })
+
+
+def create_asgi_app():
+    origins = [o for o in ALLOWED_ORIGINS if not o.startswith("^")]
+    origin_regex = "|".join(o for o in ALLOWED_ORIGINS if o.startswith("^")) or None
+    return Starlette(
+        routes=[Route("/health", health), *chat_async.routes],
+        middleware=[Middleware(
+            CORSMiddleware,
+            allow_origins=origins,
+            allow_origin_regex=origin_regex,
+            allow_credentials=True,
+            allow_methods=["POST", "OPTIONS"],
+            allow_headers=["*"],
+        )],
+        lifespan=lifespan,
+    )
+
+
+app = create_asgi_app()
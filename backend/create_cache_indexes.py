@@ -0,0 +1,78 @@
+"""One-off: create the indexes behind the shared caches.
+
+Run once after deploy:  python create_cache_indexes.py
+
+- embedding_cache.created_at (TTL): expires shared query embeddings so the
+  collection can't grow without bound. The cache works without it, it just
+  never forgets.
+- chunk_embeddings is keyed by `_id` = "<model>:<content hash>", so the
+  default `_id` index already serves the bulk lookup.
+- vector_collection.content_hash: lets re-ingestion / diffing find existing
+  chunks of a file by hash without scanning.
+- ocr_checkpoints.key + created_at (TTL): per-window OCR results of an
+  upload still being ingested. Cleared when the job ends; the TTL sweeps
+  up after workers that died for good.
+- page_cache.created_at (TTL) + last_access: fetched pages shared by
+  web_fetch and URL ingestion; last_access drives the LRU size cap.
+- user_files.user_id + source_url (sparse): bulk URL ingest finds the
+  record (and its saved ETag / Last-Modified) of a URL already ingested.
+- user_files.uploaded_at (partial: awaiting_upload): the direct-upload
+  sweep finds uploads whose /uploaded call never came.
+
+Idempotent — safe to re-run.
+"""
+from pymongo import ASCENDING
+
+from src.utils.config import load_secrets
+from src.utils.web.page_cache import PAGE_CACHE_TTL_SECONDS
+from src.backend.database.mongo_utils import get_mongo_db_connection
+
+EMBEDDING_CACHE_TTL_SECONDS = 7 * 24 * 3600
+OCR_CHECKPOINT_TTL_SECONDS = 2 * 24 * 3600
+
+if __name__ == "__main__":
+    secrets = load_secrets()
+    _client, db, _ = get_mongo_db_connection(
+        mongo_uri=secrets["MONGO_URI"],
+        db_name=secrets["MONGO_DB_NAME"],
+        collection_name=secrets["USER"],
+    )
+    name = db["embedding_cache"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=EMBEDDING_CACHE_TTL_SECONDS,
+        name="created_at_ttl",
+    )
+    print(f"Created index '{name}' on embedding_cache")
+    name = db["vector_collection"].create_index(
+        [("source_file_id", ASCENDING), ("content_hash", ASCENDING)],
+        name="source_file_content_hash",
+    )
+    print(f"Created index '{name}' on vector_collection")
+    name = db["ocr_checkpoints"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=OCR_CHECKPOINT_TTL_SECONDS,
+        name="created_at_ttl",
+    )
+    print(f"Created index '{name}' on ocr_checkpoints")
+    name = db["ocr_checkpoints"].create_index([("key", ASCENDING)], name="key")
+    print(f"Created index '{name}' on ocr_checkpoints")
+    name = db["page_cache"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=int(PAGE_CACHE_TTL_SECONDS),
+        name="created_at_ttl",
+    )
+    print(f"Created index '{name}' on page_cache")
+    name = db["page_cache"].create_index([("last_access", ASCENDING)], name="last_access")
+    print(f"Created index '{name}' on page_cache")
+    name = db["user_files"].create_index(
+        [("user_id", ASCENDING), ("source_url", ASCENDING)],
+        name="user_source_url",
+        sparse=True,
+    )
+    print(f"Created index '{name}' on user_files")
+    name = db["user_files"].create_index(
+        [("uploaded_at", ASCENDING)],
+        name="awaiting_upload_uploaded_at",
+        partialFilterExpression={"ingest_status": "awaiting_upload"},
+    )
+    print(f"Created index '{name}' on user_files")
@@ -0,0 +1,40 @@
+"""One-off: create the indexes behind bounded chat-history reads.
+
+Run once after deploy:  python create_history_indexes.py
+
+- chat_history_buckets.session_id + seq (unique): every history read —
+  the prompt window, the summary refresh, the transcript — fetches a
+  range of a session's buckets; unique so two appends racing to open the
+  same bucket can't both insert it.
+- chat_histories.SessionId + _id: legacy per-message store, read in
+  order for sessions not migrated yet and by scripts/migrate_chat_history.py.
+- chat_session_metadata.session_id: message_count / first_message /
+  summary are read and updated by session on every turn.
+
+Idempotent — safe to re-run.
+"""
+from pymongo import ASCENDING
+
+from src.utils.config import load_secrets
+from src.backend.database.mongo_utils import get_mongo_db_connection
+
+if __name__ == "__main__":
+    secrets = load_secrets()
+    _client, db, _ = get_mongo_db_connection(
+        mongo_uri=secrets["MONGO_URI"],
+        db_name=secrets["MONGO_DB_NAME"],
+        collection_name=secrets["USER"],
+    )
+    name = db["chat_history_buckets"].create_index(
+        [("session_id", ASCENDING), ("seq", ASCENDING)],
+        name="session_id_seq",
+        unique=True,
+    )
+    print(f"Created index '{name}' on chat_history_buckets")
+    name = db["chat_histories"].create_index(
+        [("SessionId", ASCENDING), ("_id", ASCENDING)],
+        name="session_id_order",
+    )
+    print(f"Created index '{name}' on chat_histories")
+    name = db["chat_session_metadata"].create_index([("session_id", ASCENDING)], name="session_id")
+    print(f"Created index '{name}' on chat_session_metadata")
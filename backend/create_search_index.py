@@ -0,0 +1,42 @@
+"""One-off: create the Atlas Search (BM25) index behind hybrid retrieval.
+
+Run once after deploy:  python create_search_index.py
+
+Configs with retrieval_mode="hybrid" run `$search` on vector_collection next
+to `$vectorSearch` (src/retrieval/engine.py). Until this index exists (Atlas
+builds it asynchronously, usually a minute or two) hybrid configs log a
+warning and fall back to vector-only retrieval.
+
+config_id / source_file_id are `token` fields so the scope filter can use
+`equals` / `in`. Idempotent — skips creation if the index already exists.
+"""
+from pymongo.operations import SearchIndexModel
+
+from src.utils.config import load_secrets
+from src.backend.database.mongo_utils import get_mongo_db_connection
+from src.retrieval.lexical import SEARCH_INDEX_NAME
+
+DEFINITION = {
+    "mappings": {
+        "dynamic": False,
+        "fields": {
+            "text": {"type": "string", "analyzer": "lucene.standard"},
+            "config_id": {"type": "token"},
+            "source_file_id": {"type": "token"},
+        },
+    },
+}
+
+if __name__ == "__main__":
+    secrets = load_secrets()
+    _client, db, _ = get_mongo_db_connection(
+        mongo_uri=secrets["MONGO_URI"],
+        db_name=secrets["MONGO_DB_NAME"],
+        collection_name=secrets["USER"],
+    )
+    collection = db["vector_collection"]
+    if list(collection.list_search_indexes(SEARCH_INDEX_NAME)):
+        print(f"Search index '{SEARCH_INDEX_NAME}' already exists on vector_collection")
+    else:
+        name = collection.create_search_index(SearchIndexModel(definition=DEFINITION, name=SEARCH_INDEX_NAME))
+        print(f"Created search index '{name}' on vector_collection (builds asynchronously)")
@@ -4,7 +4,11 @@ from flask import Blueprint, request, jsonify, current_app
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from bson import ObjectId
 from models.user import User
+from src.jobs import queue as job_queue
+from src.llm import clients as llm_clients
 from src.usage import limits as usage_limits
+from src.utils import ttl_cache
+from src.utils.web import page_cache, search as web_search
 
 admin_bp = Blueprint('admin', __name__)
 
@@ -187,6 +191,27 @@ def delete_usage_tier(tier_id):
     return jsonify(_settings_payload(usage_limits.get_settings())), 200
 
 
+@admin_bp.route('/ops/caches', methods=['GET'])
+@jwt_required()
+def cache_stats():
+    """Hit rates of every in-process cache (this worker), plus the web
+    search / fetched-page counters, shared LLM clients and job queue
+    depth."""
+    _, err = _require_admin()
+    if err:
+        return err
+    embeddings = current_app.config.get('EMBEDDINGS')
+    return jsonify({
+        "pid": os.getpid(),
+        "caches": ttl_cache.all_stats(),
+        "web_search": web_search.stats(),
+        "fetched_pages": page_cache.stats(),
+        "query_embeddings": embeddings.stats() if hasattr(embeddings, "stats") else None,
+        "llm_clients": llm_clients.stats(),
+        "jobs": job_queue.stats(current_app.config['MONGO_DB']),
+    }), 200
+
+
 @admin_bp.route('/promote', methods=['POST'])
 def bootstrap_admin():
     """
@@ -10,9 +10,10 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from bson import ObjectId
 from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, message_to_dict
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
+from langchain_core.messages import HumanMessage
+
+from src.history import store as history_store
+from src.llm.clients import get_chat_model
 
 logger = logging.getLogger(__name__)
 analysis_bp = Blueprint('analysis', __name__)
@@ -38,23 +39,14 @@ def _parse_json(text):
 
 
 def _llm(api_key, prompt, max_tokens=600):
-    llm = ChatAnthropic(model='claude-sonnet-4-6', api_key=api_key, max_tokens=max_tokens)
+    llm = get_chat_model('anthropic', 'claude-sonnet-4-6', api_key, max_tokens=max_tokens)
     response = llm.invoke([HumanMessage(content=prompt)])
     return response.content
 
 
 def _get_transcript(mongo_client, db_name, session_id):
-    history = MongoDBChatMessageHistory(
-        connection_string=None,
-        client=mongo_client,
-        session_id=session_id,
-        database_name=db_name,
-        collection_name='chat_histories',
-        create_index=False,
-    )
     lines = []
-    for msg in history.messages:
-        d = message_to_dict(msg)
+    for d in history_store.read_dicts(mongo_client[db_name], session_id):
         role = 'Student' if d.get('type') == 'human' else 'AI'
         content = (d.get('data') or {}).get('content', '')
         if isinstance(content, list):
@@ -297,12 +289,13 @@ def analyze_debug(config_id):
         result = []
         for s in sessions[:5]:
             sid = s.get('session_id', str(s['_id']))
-            hist_doc = db['chat_histories'].find_one({'SessionId': sid})
+            first = history_store.read_dicts(db, sid, 0, 1)
             history_sample = None
-            if hist_doc:
-                raw = hist_doc.get('History') or []
-                history_sample = {'count': len(raw), 'first_entry_preview': str(raw[0])[:300] if raw else None}
-            result.append({'session_id': sid, 'history_doc_found': hist_doc is not None, 'history_sample': history_sample})
+            if first:
+                history_sample = {'count': history_store.message_count(db, sid),
+                                  'first_entry_preview': str(first[0])[:300]}
+            result.append({'session_id': sid, 'history_doc_found': bool(first),
+                           'bucketed': 'message_count' in s, 'history_sample': history_sample})
         return jsonify({'sessions': result, 'total': len(sessions)})
     except Exception as e:
         import traceback
@@ -330,12 +323,6 @@ def analyze_config(config_id):
         users_col = current_app.config['MONGO_COLLECTION']
         pipeline = [
             {'$match': {'config_id': config_id}},
-            {'$lookup': {
-                'from': 'chat_histories',
-                'let': {'sid': '$session_id'},
-                'pipeline': [{'$match': {'$expr': {'$eq': ['$SessionId', '$$sid']}}}, {'$count': 'n'}],
-                'as': 'msg_count',
-            }},
             {'$lookup': {
                 'from': users_col.name,
                 'let': {'uid': '$user_id'},
@@ -350,7 +337,8 @@ def analyze_config(config_id):
             }},
             {'$project': {
                 'session_id': 1,
-                'message_count': {'$ifNull': [{'$arrayElemAt': ['$msg_count.n', 0]}, 0]},
+                # Missing until the session is migrated (scripts/migrate_chat_history.py).
+                'message_count': {'$ifNull': ['$message_count', None]},
                 'user_email': {'$ifNull': [{'$arrayElemAt': ['$user_info.email', 0]}, None]},
                 'qualtrics_id': 1,
                 'student_label': 1,
@@ -378,7 +366,8 @@ def analyze_config(config_id):
             labeled.append({
                 'session_id': sid,
                 'display_name': display,
-                'message_count': s.get('message_count', 0),
+                'message_count': (s['message_count'] if s.get('message_count') is not None
+                                  else history_store.message_count(db, sid)),
             })
 
         job_id = str(uuid.uuid4())
@@ -0,0 +1,456 @@
+"""
+Async streaming chat — the asyncio twin of POST /api/chat/<config_id>/<chat_id>.
+
+The Flask route runs under Flask-SocketIO's threading server, so each
+streaming reply pins an OS thread for the whole generation (10-30 s);
+a class hitting the bot at once exhausts threads long before CPU. These
+routes are served by asgi_chat.py (uvicorn) next to the Flask app and
+emit the same NDJSON events (sources, token, tool_use, tool_result,
+done, error), so the browser cannot tell which one answered.
+
+Per request, the long parts are async: provider streaming (LangChain
+`astream`, AsyncAnthropic for the agent), config / session / history
+reads and writes (pymongo's AsyncMongoClient). The short sync helpers
+shared with the Flask route — usage counters, user lookup, vector
+retrieval, agent tool calls — run on a bounded worker-thread pool
+(ASGI_CHAT_OFFLOAD_THREADS) inside a Flask app context, and hold a
+thread only for their own few hundred milliseconds.
+
+Request parsing, prompt, model selection, usage and session metadata
+come from src/chat/turn.py, as they do for the Flask route, so the two
+paths stay in step. As there, the history read and retrieval start as
+soon as auth passes and overlap the usage check, the chat title is
+generated off the critical path, and the done event carries per-stage
+timings (a 429 also sends them as a Server-Timing header).
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from functools import partial
+
+import anyio
+from bson import ObjectId
+from bson.errors import InvalidId
+from flask_jwt_extended import decode_token
+from langchain_core.messages import AIMessage
+from langchain_core.output_parsers import StrOutputParser
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from src.agentic.agent_runner import astream_agentic_response
+from src.agentic.tools.base import ToolContext
+from src.chat import turn as chat_turn
+from src.history import store as history_store
+from src.history import window as history_window
+from src.retrieval.context_builder import budget_for, build_context, render as render_context
+from src.retrieval.engine import retrieve
+from src.usage import limits as usage_limits
+from src.utils.request_plan import StageTimings, run_in_background
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Streams currently open on this process; reported by /health.
+_inflight = {"streams": 0, "peak": 0}
+
+
+# Fire-and-forget tasks (chat titles); referenced here so they aren't
+# garbage-collected mid-flight.
+_background = set()
+
+
+def inflight():
+    return dict(_inflight)
+
+
+def _in_background(coro):
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_background.discard)
+
+
+async def _offload(flask_app, fn, *args, **kwargs):
+    """Run a sync helper on the worker-thread pool inside an app context."""
+    def run():
+        with flask_app.app_context():
+            return fn(*args, **kwargs)
+    return await anyio.to_thread.run_sync(run)
+
+
+def _jwt_identity(request, flask_app):
+    """User id from a Bearer access *or* refresh token, else None — the
+    Flask route also falls back to the refresh token."""
+    config = flask_app.config
+    header = request.headers.get(config.get("JWT_HEADER_NAME") or "Authorization", "")
+    header_type = config.get("JWT_HEADER_TYPE", "Bearer")
+    parts = header.split()
+    if header_type:
+        if len(parts) != 2 or parts[0] != header_type:
+            return None
+        token = parts[1]
+    else:
+        token = header.strip()
+    if not token:
+        return None
+    try:
+        with flask_app.app_context():
+            return decode_token(token).get(config.get("JWT_IDENTITY_CLAIM", "sub"))
+    except Exception:
+        return None
+
+
+# --- usage ------------------------------------------------------------------------
+
+def _resolve_usage(config_doc, metering_user_id, client_ip, device_id):
+    """-> (identity, pre-flight status) for the metered user, if any."""
+    metering_user = User.find_by_id(metering_user_id) if metering_user_id else None
+    return chat_turn.resolve_usage(config_doc, metering_user, client_ip, device_id)
+
+
+# --- async Mongo: session metadata + history ---------------------------------
+
+async def _agenerate_chat_title(text):
+    try:
+        result = await chat_turn.title_model().ainvoke(chat_turn.title_prompt(text))
+        return result.content.strip()
+    except Exception:
+        return chat_turn.fallback_chat_title(text)
+
+
+async def _arefresh_chat_title(db, session_id, text):
+    try:
+        await db["chat_session_metadata"].update_one(
+            {"session_id": session_id}, {"$set": {"title": await _agenerate_chat_title(text)}}
+        )
+    except Exception as e:
+        logger.warning("Background step failed | step=title err=%s", e)
+
+
+async def _aensure_session(db, *, session_id, user_id, config_id, user_input, qualtrics_id=None,
+                           student_label=None, student_email=None, marketing_opt_in=None):
+    """Async _ensure_session_metadata(): create the metadata doc on the
+    first message (placeholder title, generated title in the background),
+    or add identity fields that arrived later."""
+    metadata = db["chat_session_metadata"]
+    identity_fields = chat_turn.session_identity_fields(qualtrics_id, student_label, student_email, marketing_opt_in)
+    if await metadata.count_documents({"session_id": session_id}, limit=1) == 0:
+        doc = {
+            "session_id": session_id,
+            "user_id": user_id,
+            "config_id": config_id,
+            "timestamp": time.time(),
+            "message_count": 0,
+        }
+        if user_input:
+            doc["title"] = chat_turn.fallback_chat_title(user_input)
+            _in_background(_arefresh_chat_title(db, session_id, user_input))
+        doc.update(identity_fields)
+        await metadata.insert_one(doc)
+        if student_email:
+            await db["potential_users"].update_one(
+                *chat_turn.potential_user_upsert(student_email, student_label, marketing_opt_in), upsert=True,
+            )
+    elif qualtrics_id or student_label or student_email:
+        await metadata.update_one(
+            {"session_id": session_id, "qualtrics_id": {"$exists": False}},
+            {"$set": identity_fields},
+        )
+
+
+async def _aload_history(db, session_id, model_name):
+    """Async _load_history(): bounded read of the recent window + summary."""
+    messages, stats = await history_window.aload(db, session_id, model_name)
+    if stats["messages"]:
+        logger.info(
+            "History | session=%s messages=%d read=%d sent=%d summarized=%d dropped=%d tokens=%d budget=%d",
+            session_id, stats["messages"], stats["read"], stats["sent"], stats["summarized"],
+            stats["dropped"], stats["tokens"], stats["budget"],
+        )
+    return messages
+
+
+async def _aappend_history(db, offload, session_id, messages):
+    await history_store.aappend(db, session_id, messages, migrate=partial(offload, chat_turn.migrate_history))
+
+
+async def _arecord_context_usage(db, session_id, stats):
+    logger.info(
+        "Context | session=%s chunks=%d blocks=%d tokens=%d budget=%d truncated=%d dropped=%d",
+        session_id, stats["chunks"], stats["blocks"], stats["tokens"], stats["budget"],
+        stats["truncated"], stats["dropped"],
+    )
+    try:
+        await db["chat_session_metadata"].update_one(
+            {"session_id": session_id},
+            {
+                "$inc": {"context_tokens_total": stats["tokens"], "context_turns": 1},
+                "$set": {"last_context_tokens": stats["tokens"]},
+            },
+        )
+    except Exception as e:
+        logger.warning("Failed to record context usage | session=%s err=%s", session_id, e)
+
+
+# --- generators ----------------------------------------------------------------
+
+def _line(event):
+    return json.dumps(event) + "\n"
+
+
+async def _charge(offload, identity, label):
+    try:
+        return await offload(usage_limits.consume, identity, 1)
+    except Exception as e:
+        logger.error("usage consume (%s) failed: %s", label, e)
+        return None
+
+
+async def _timed(timings, name, awaitable):
+    with timings.stage(name):
+        return await awaitable
+
+
+def _finish_timings(timings, chat_id):
+    timings.mark("done")
+    out = timings.timings()
+    logger.info("Async chat timings | session=%s %s", chat_id,
+                " ".join(f"{name}={ms}" for name, ms in out.items()))
+    return out
+
+
+async def _agenerate_legacy(*, flask_app, db, offload, timings, steps, config_doc, payload, chat_id,
+                            user_id_for_history, identity):
+    user_input = payload["user_input"]
+    try:
+        docs = await steps["retrieval"]
+        sources = [
+            {"source": d.metadata.get("source", "Unknown"), "page_content": d.page_content[:200]}
+            for d in docs
+        ]
+        yield _line({"type": "sources", "data": sources})
+
+        with timings.stage("context"):
+            context_blocks, context_stats = build_context(
+                docs, budget_for(config_doc.get("model_name", "gpt-4o"))
+            )
+            chain = chat_turn.legacy_prompt(config_doc) | chat_turn.select_chat_llm(config_doc, flask_app.config) | StrOutputParser()
+
+        answer = []
+        async for chunk in chain.astream({
+            "question": user_input,
+            "context": render_context(context_blocks),
+            "history": await steps["history"],
+        }):
+            if chunk:
+                timings.mark("first_token")
+                answer.append(chunk)
+            yield _line({"type": "token", "data": chunk})
+
+        await steps["session"]
+        await _aappend_history(db, offload, chat_id, [
+            chat_turn.user_message(user_input, payload["attached_files"]),
+            AIMessage(content="".join(answer)),
+        ])
+        run_in_background(flask_app, "summary", chat_turn.refresh_history_summary, chat_id)
+        await _arecord_context_usage(db, chat_id, context_stats)
+
+        # Charge one message only if the turn actually produced output.
+        done_payload = {"type": "done"}
+        if identity is not None and answer:
+            usage = await _charge(offload, identity, "legacy")
+            if usage is not None:
+                done_payload["usage"] = usage
+        done_payload["timings"] = _finish_timings(timings, chat_id)
+        yield _line(done_payload)
+
+    except Exception as e:
+        logger.error("Async stream error: %s", e, exc_info=True)
+        yield _line({"type": "error", "data": str(e)})
+    finally:
+        for step in steps.values():
+            step.cancel()
+
+
+async def _agenerate_agentic(*, flask_app, db, offload, timings, steps, config_doc, payload, chat_id, config_id,
+                             user_id_for_history, identity):
+    user_input = payload["user_input"]
+    try:
+        history_messages = chat_turn.to_anthropic_history(await steps["history"])
+
+        # Model-only note about selected library files; the persisted user
+        # message stays clean.
+        note = await steps["files_note"]
+        ctx = ToolContext(
+            user_id=user_id_for_history if user_id_for_history != "anonymous" else None,
+            config_id=config_id,
+            config=config_doc,
+            variant=payload["file_variant"],
+            selected_file_ids=payload["selected_file_ids"] or [],
+            session_id=chat_id,
+        )
+
+        accumulated_text = ""
+        full_trace = []
+        final_stop_reason = "end_turn"
+        async for event in astream_agentic_response(
+            config=config_doc,
+            user_input=note + user_input if note else user_input,
+            history_messages=history_messages,
+            ctx=ctx,
+            images=chat_turn.parse_image_blocks(payload["images"]),
+            offload=offload,
+        ):
+            etype = event.get("type")
+            if etype == "token":
+                timings.mark("first_token")
+                accumulated_text += event.get("data") or ""
+                yield _line(event)
+            elif etype in ("tool_use", "tool_result"):
+                yield _line(event)
+            elif etype == "done":
+                full_trace = event.get("assistant_blocks") or []
+                final_stop_reason = event.get("stop_reason") or "end_turn"
+                done_payload = {"type": "done", "stop_reason": final_stop_reason}
+                if identity is not None and final_stop_reason != "error" and accumulated_text.strip():
+                    usage = await _charge(offload, identity, "agentic")
+                    if usage is not None:
+                        done_payload["usage"] = usage
+                done_payload["timings"] = _finish_timings(timings, chat_id)
+                yield _line(done_payload)
+
+        await steps["session"]
+        # Skip on error — don't persist an error string as a model reply.
+        if final_stop_reason != "error" and accumulated_text.strip():
+            try:
+                await _aappend_history(db, offload, chat_id, [
+                    chat_turn.user_message(user_input, payload["attached_files"]),
+                    AIMessage(
+                        content=accumulated_text,
+                        additional_kwargs={"tool_trace": full_trace} if full_trace else {},
+                    ),
+                ])
+                run_in_background(flask_app, "summary", chat_turn.refresh_history_summary, chat_id)
+            except Exception as e:
+                logger.error("Failed to persist agentic turn: %s", e, exc_info=True)
+
+    except Exception as e:
+        logger.error("Async agentic stream error: %s", e, exc_info=True)
+        yield _line({"type": "error", "data": str(e)})
+    finally:
+        for step in steps.values():
+            step.cancel()
+
+
+async def _tracked(stream, session_id):
+    """Count open streams and log each turn's length."""
+    _inflight["streams"] += 1
+    _inflight["peak"] = max(_inflight["peak"], _inflight["streams"])
+    started = time.perf_counter()
+    try:
+        async for line in stream:
+            yield line
+    finally:
+        _inflight["streams"] -= 1
+        logger.info("Async chat DONE | session=%s secs=%.2f open=%d",
+                    session_id, time.perf_counter() - started, _inflight["streams"])
+
+
+# --- route -------------------------------------------------------------------------
+
+async def chat(request):
+    flask_app = request.app.state.flask_app
+    db = request.app.state.db
+    offload = partial(_offload, flask_app)
+    timings = StageTimings()
+    config_id = request.path_params["config_id"]
+    chat_id = request.path_params["chat_id"]
+
+    try:
+        data = await request.json()
+    except Exception:
+        data = {}
+    payload = chat_turn.parse_chat_payload(data if isinstance(data, dict) else {})
+    if not payload["user_input"]:
+        return JSONResponse({"message": "Missing 'input' field"}, status_code=400)
+
+    try:
+        config_oid = ObjectId(config_id.strip())
+    except (InvalidId, TypeError):
+        return JSONResponse({"message": "Configuration not found"}, status_code=404)
+    with timings.stage("config"):
+        config_doc = await db["config_collections"].find_one({"_id": config_oid}, chat_turn.CHAT_CONFIG_PROJECTION)
+    if not config_doc:
+        return JSONResponse({"message": "Configuration not found"}, status_code=404)
+
+    token_user = _jwt_identity(request, flask_app)
+    user_id_for_history = "anonymous"
+    if not config_doc.get("is_public"):
+        if not token_user:
+            return JSONResponse({"message": "Authentication failed."}, status_code=401)
+        user_id_for_history = token_user
+
+    config_doc = chat_turn.apply_model_override(config_doc, payload["model_override"])
+    agentic = chat_turn.is_agentic(config_doc)
+
+    # History and retrieval (or the agent's files note) overlap the usage
+    # check; if it blocks, they are cancelled.
+    cancelled = threading.Event()
+    steps = {"history": asyncio.ensure_future(_timed(timings, "history", _aload_history(
+        db, chat_id, config_doc.get("model_name"))))}
+    if agentic:
+        steps["files_note"] = asyncio.ensure_future(_timed(timings, "files_note", offload(
+            chat_turn.selected_files_context_note, payload["selected_file_ids"], user_id_for_history)))
+    else:
+        steps["retrieval"] = asyncio.ensure_future(_timed(timings, "retrieval", offload(
+            retrieve,
+            payload["user_input"],
+            config_id=config_id,
+            user_id=user_id_for_history,
+            variant=payload["file_variant"],
+            selected_file_ids=payload["selected_file_ids"],
+            mode=config_doc.get("retrieval_mode"),
+            rerank=bool(config_doc.get("rerank")),
+            cancelled=cancelled,
+        )))
+
+    with timings.stage("usage"):
+        with flask_app.app_context():
+            client_ip = usage_limits.client_ip(request)
+            device_id, device_cookie = usage_limits.get_or_set_device_id(request)
+        identity, pre = await offload(_resolve_usage, config_doc, token_user, client_ip, device_id)
+    if pre.get("status") == "blocked":
+        cancelled.set()
+        for step in steps.values():
+            step.cancel()
+        resp = JSONResponse({"error": "usage_limit", "usage": pre}, status_code=429,
+                            headers={"Server-Timing": timings.server_timing()})
+        if device_cookie:
+            chat_turn.set_device_cookie(resp, device_cookie, request)
+        return resp
+
+    steps["session"] = asyncio.ensure_future(_timed(timings, "session", _aensure_session(
+        db, session_id=chat_id, user_id=user_id_for_history, config_id=config_id,
+        user_input=payload["user_input"], qualtrics_id=payload["qualtrics_id"],
+        student_label=payload["student_label"], student_email=payload["student_email"],
+        marketing_opt_in=payload["marketing_opt_in"],
+    )))
+
+    kwargs = dict(flask_app=flask_app, db=db, offload=offload, timings=timings, steps=steps, config_doc=config_doc,
+                  payload=payload, chat_id=chat_id, user_id_for_history=user_id_for_history,
+                  identity=identity)
+    if agentic:
+        stream = _agenerate_agentic(config_id=config_id, **kwargs)
+    else:
+        stream = _agenerate_legacy(**kwargs)
+
+    resp = StreamingResponse(_tracked(stream, chat_id), media_type="application/x-ndjson")
+    if device_cookie:
+        chat_turn.set_device_cookie(resp, device_cookie, request)
+    return resp
+
+
+routes = [
+    Route("/api/chat/{config_id}/{chat_id}", chat, methods=["POST"]),
+]
@@ -2,57 +2,32 @@ from flask import Blueprint, request, jsonify, current_app, Response, stream_wit
 from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
 import logging
 import json
-import re
 import time
 import requests
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables import RunnablePassthrough, RunnableLambda
 from langchain_core.output_parsers import StrOutputParser
-from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
-from langchain_mongodb.chat_message_histories import MongoDBChatMessageHistory
-from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, message_to_dict
+from langchain_core.messages import AIMessage, BaseMessage
 from bson import ObjectId
-from langchain_community.chat_models import ChatTongyi
-from langchain_deepseek import ChatDeepSeek
-from langchain_anthropic import ChatAnthropic
 
-from src.agentic.agent_runner import stream_agentic_response, FORMATTING_GUIDE
+from src.agentic.agent_runner import stream_agentic_response
 from src.agentic.tools.base import ToolContext
+from src.chat import turn as chat_turn
+from src.history import store as history_store
+from src.retrieval.context_builder import budget_for, build_context, render as render_context
+from src.retrieval.engine import retrieve
 from src.usage import limits as usage_limits
+from src.utils.request_plan import RequestPlan
 from models.user import User
 
 logger = logging.getLogger(__name__)
 chat_bp = Blueprint('chat_routes', __name__)
 
 
-def _set_device_cookie(resp, signed_value, request):
-    """Attach the signed device-id cookie. SameSite=None+Secure for the
-    Qualtrics iframe (cross-site); Lax fallback on plain-http dev."""
-    secure = bool(request.is_secure)
-    resp.set_cookie(
-        usage_limits.DEVICE_COOKIE, signed_value,
-        max_age=usage_limits.DEVICE_COOKIE_MAX_AGE,
-        httponly=True, secure=secure, samesite="None" if secure else "Lax",
-    )
-
-# Allowed template variables for the chat prompt - others are escaped to avoid LangChain errors
-ALLOWED_PROMPT_VARS = {"context", "history", "question"}
-
-def _escape_prompt_variables(text: str) -> str:
-    """Escape {var} to {{var}} for any var not in ALLOWED_PROMPT_VARS, so LangChain treats them as literal."""
-    if not text:
-        return text
-    def replacer(m):
-        var = m.group(1)
-        return m.group(0) if var in ALLOWED_PROMPT_VARS else "{{" + var + "}}"
-    return re.sub(r"\{(\w+)\}", replacer, text)
-
 # --- DB Collections ---
 # 1. chat_session_metadata: Stores one document per chat session with user_id and config_id.
-# 2. chat_histories: Stores all messages from all sessions.
+# 2. chat_history_buckets: Stores each session's messages, 100 per bucket
+#    document (src/history/store.py). chat_histories is the legacy
+#    one-document-per-message store, read until a session is migrated.
 
 HEYGEN_BASE_URL = "https://api.heygen.com/v1"
 
@@ -171,14 +146,7 @@ def stop_heygen_session():
 def get_chat_history(chat_id):
     """Retrieves the message history for a specific chat session."""
     try:
-        history = MongoDBChatMessageHistory(
-            connection_string=current_app.config['MONGO_URI'],
-            session_id=chat_id,
-            database_name=current_app.config['MONGO_DB'].name,
-            collection_name="chat_histories"
-        )
-        history_dicts = [message_to_dict(m) for m in history.messages]
-        
+        history_dicts = history_store.read_dicts(current_app.config['MONGO_DB'], chat_id)
         return jsonify({"history": history_dicts}), 200
     except Exception as e:
         logger.error(f"Error fetching history for chat {chat_id}: {e}", exc_info=True)
@@ -204,19 +172,6 @@ def get_chat_list(config_id):
                 }
             },
             {'$sort': {'_id': -1}},
-            {
-                '$lookup': {
-                    'from': 'chat_histories',
-                    'let': {'session_id_str': '$session_id'},
-                    'pipeline': [
-                        {'$match': {'$expr': {'$eq': ['$SessionId', '$$session_id_str']}}},
-                        {'$sort': {'_id': 1}},
-                        {'$limit': 1},
-                        {'$project': {'History': 1, '_id': 0}}
-                    ],
-                    'as': 'first_message_info'
-                }
-            },
             {
                 '$project': {
                     '_id': 1,
@@ -224,7 +179,8 @@ def get_chat_list(config_id):
                     'user_id': '$user_id',
                     'title': 1,
                     'timestamp': {'$dateToString': {'format': '%Y-%m-%dT%H:%M:%S.%LZ', 'date': '$_id'}},
-                    'first_message_history': {'$arrayElemAt': ['$first_message_info.History', 0]}
+                    'first_message': 1,
+                    'message_count': 1,
                 }
             }
         ]
@@ -246,16 +202,17 @@ def get_chat_list(config_id):
             if not title:
                 # Old session — generate from first message and cache it
                 try:
-                    if session.get('first_message_history'):
-                        history_data = json.loads(session['first_message_history'])
-                        raw = (history_data.get("data", {}).get("content")
-                               or history_data.get("content", ""))
-                        if raw:
-                            title = _generate_chat_title(raw)
-                            metadata_collection.update_one(
-                                {"_id": session["_id"]},
-                                {"$set": {"title": title}}
-                            )
+                    raw = session.get('first_message')
+                    if not raw and 'message_count' not in session:
+                        # Not migrated yet: read just its first message.
+                        raw = history_store.first_message(
+                            history_store.read_dicts(db, session['session_id'], 0, 1, meta=session))
+                    if raw:
+                        title = chat_turn.generate_chat_title(raw)
+                        metadata_collection.update_one(
+                            {"_id": session["_id"]},
+                            {"$set": {"title": title}}
+                        )
                 except (json.JSONDecodeError, TypeError, Exception):
                     pass
 
@@ -359,17 +316,6 @@ def get_config_sessions(config_id):
                     "as": "user_info"
                 }
             },
-            {
-                "$lookup": {
-                    "from": "chat_histories",
-                    "let": {"sid": "$session_id"},
-                    "pipeline": [
-                        {"$match": {"$expr": {"$eq": ["$SessionId", "$$sid"]}}},
-                        {"$count": "n"}
-                    ],
-                    "as": "msg_count"
-                }
-            },
             {
                 "$project": {
                     "_id": 0,
@@ -388,7 +334,7 @@ def get_config_sessions(config_id):
                         }
                     },
                     "user_email": {"$ifNull": [{"$arrayElemAt": ["$user_info.email", 0]}, None]},
-                    "message_count": {"$ifNull": [{"$arrayElemAt": ["$msg_count.n", 0]}, 0]},
+                    "message_count": {"$ifNull": ["$message_count", None]},
                     "qualtrics_id": 1,
                     "student_label": 1,
                     "student_email": 1
@@ -398,6 +344,10 @@ def get_config_sessions(config_id):
         ]
 
         sessions = list(metadata_collection.aggregate(pipeline))
+        for session in sessions:
+            # Sessions not migrated to history buckets yet carry no counter.
+            if session.get("message_count") is None:
+                session["message_count"] = history_store.message_count(db, session["session_id"])
         return jsonify({"sessions": sessions, "total": len(sessions)}), 200
 
     except Exception as e:
@@ -419,7 +369,7 @@ def delete_chat(config_id, chat_id):
         if not meta:
             return jsonify({"message": "Not found"}), 404
         db["chat_session_metadata"].delete_one({"session_id": chat_id})
-        db["chat_histories"].delete_many({"SessionId": chat_id})
+        history_store.delete_sessions(db, [chat_id])
         return jsonify({"message": "Deleted"}), 200
     except Exception as e:
         logger.error(f"Error deleting chat {chat_id}: {e}", exc_info=True)
@@ -428,235 +378,70 @@ def delete_chat(config_id, chat_id):
 
 # --- FACTORY & HELPERS ---
 
-class _AttachedFilesMongoHistory(MongoDBChatMessageHistory):
-    """MongoDBChatMessageHistory that injects `attached_files` into the
-    `additional_kwargs` of the next HumanMessage it persists.
-
-    Set `pending_attached_files` on the instance before the chain (or
-    direct add_user_message call) runs; it's consumed once and cleared.
-    """
-
-    def _maybe_inject(self, message):
-        files = getattr(self, "pending_attached_files", None) or []
-        if (
-            files
-            and isinstance(message, HumanMessage)
-            and not (message.additional_kwargs or {}).get("attached_files")
-        ):
-            kwargs = dict(message.additional_kwargs or {})
-            kwargs["attached_files"] = files
-            message = HumanMessage(content=message.content, additional_kwargs=kwargs)
-            self.pending_attached_files = []
-        return message
-
-    def add_message(self, message):
-        super().add_message(self._maybe_inject(message))
-
-    def add_messages(self, messages):
-        super().add_messages([self._maybe_inject(m) for m in messages])
+def _refresh_chat_title(session_id, text):
+    """Background step: replace the placeholder title with a generated one."""
+    current_app.config['MONGO_DB']["chat_session_metadata"].update_one(
+        {"session_id": session_id}, {"$set": {"title": chat_turn.generate_chat_title(text)}}
+    )
 
 
-def _generate_chat_title(text: str) -> str:
-    """Return a 4-6 word summary title for the given user message."""
-    try:
-        llm = ChatOpenAI(model="gpt-4o-mini", max_tokens=20, temperature=0.3)
-        result = llm.invoke([
-            HumanMessage(content=(
-                "Generate a concise 4-6 word title that summarises this chat opening message. "
-                "Return only the title, no quotes, no trailing punctuation.\n\n" + text[:300]
-            ))
-        ])
-        return result.content.strip()
-    except Exception:
-        words = text.split()
-        title, length = "", 0
-        for w in words:
-            if length + len(w) + 1 > 55:
-                break
-            title = (title + " " + w).strip()
-            length += len(w) + 1
-        return title or text[:55]
-
-
-def get_session_history(session_id: str, user_id: str, config_id: str, user_input: str = None,
-                        qualtrics_id: str = None, student_label: str = None,
-                        student_email: str = None, marketing_opt_in: bool = None) -> _AttachedFilesMongoHistory:
+def _ensure_session_metadata(session_id: str, user_id: str, config_id: str, user_input: str = None,
+                             qualtrics_id: str = None, student_label: str = None,
+                             student_email: str = None, marketing_opt_in: bool = None, *, plan) -> None:
+    """Create the chat_session_metadata doc on a session's first message, or
+    add identity fields that arrived later. A new session starts with the
+    message's first words as its title; the gpt-4o-mini title replaces it
+    from a background step so it never delays the first token."""
     db = current_app.config['MONGO_DB']
     metadata_collection = db["chat_session_metadata"]
 
+    identity_fields = chat_turn.session_identity_fields(qualtrics_id, student_label, student_email, marketing_opt_in)
     # Only write to metadata if this is truly the FIRST message
     if metadata_collection.count_documents({"session_id": session_id}, limit=1) == 0:
         doc = {
             "session_id": session_id,
             "user_id": user_id,
             "config_id": config_id,
-            "timestamp": time.time()
+            "timestamp": time.time(),
+            "message_count": 0,
         }
         if user_input:
-            doc["title"] = _generate_chat_title(user_input)
-        if qualtrics_id:
-            doc["qualtrics_id"] = qualtrics_id
-        if student_label:
-            doc["student_label"] = student_label
-        if student_email:
-            doc["student_email"] = student_email
-        if marketing_opt_in is not None:
-            doc["marketing_opt_in"] = marketing_opt_in
+            doc["title"] = chat_turn.fallback_chat_title(user_input)
+            plan.background("title", _refresh_chat_title, session_id, user_input)
+        doc.update(identity_fields)
         metadata_collection.insert_one(doc)
         if student_email:
             db["potential_users"].update_one(
-                {"email": student_email},
-                {"$set": {
-                    "email": student_email,
-                    "name": student_label or "",
-                    "marketing_opt_in": marketing_opt_in if marketing_opt_in is not None else True,
-                    "last_seen": time.time(),
-                }, "$setOnInsert": {"first_seen": time.time()}},
-                upsert=True,
+                *chat_turn.potential_user_upsert(student_email, student_label, marketing_opt_in), upsert=True,
             )
     elif qualtrics_id or student_label or student_email:
         # Update existing session if we now have identity info we didn't before
-        update = {}
-        if qualtrics_id:
-            update["qualtrics_id"] = qualtrics_id
-        if student_label:
-            update["student_label"] = student_label
-        if student_email:
-            update["student_email"] = student_email
-        if marketing_opt_in is not None:
-            update["marketing_opt_in"] = marketing_opt_in
         metadata_collection.update_one(
             {"session_id": session_id, "qualtrics_id": {"$exists": False}},
-            {"$set": update}
-        )
-
-    return _AttachedFilesMongoHistory(
-        session_id=session_id,
-        connection_string=current_app.config["MONGO_URI"],
-        database_name=db.name,           # Uses "survey"
-        collection_name="chat_histories" # Your Message Collection
-    )
-
-def get_vector_store():
-    return MongoDBAtlasVectorSearch(
-        collection=current_app.config['MONGO_DB']['vector_collection'],
-        embedding=current_app.config['EMBEDDINGS'],
-        index_name="vector"
-    )
-
-
-def _load_anthropic_history(history_obj):
-    """Convert LangChain MongoDB messages → Anthropic [{role, content}, ...].
-
-    For agentic AI messages we only feed the rendered text back to Claude on
-    follow-up turns — the tool_trace stays in MongoDB for frontend replay
-    but isn't replayed into the model context (saves tokens, avoids stale
-    tool-use IDs that would confuse the API).
-    """
-    out = []
-    for msg in history_obj.messages:
-        if isinstance(msg, HumanMessage):
-            content = (msg.content or "").strip()
-            if content:
-                out.append({"role": "user", "content": content})
-        elif isinstance(msg, AIMessage):
-            content = (msg.content or "").strip()
-            if content:
-                out.append({"role": "assistant", "content": content})
-    return out
-
-
-def _selected_files_context_note(selected_file_ids, user_id_for_history):
-    """Return a short bracketed note listing names of the user's selected
-    library files, or empty string if none. Prepended to the user input so
-    the agent recognizes that "this", "the document", etc. refer to files
-    it can read via search_knowledge_base.
-    """
-    if not selected_file_ids or user_id_for_history == "anonymous":
-        return ""
-    try:
-        oids = []
-        for fid in selected_file_ids:
-            try:
-                oids.append(ObjectId(str(fid)))
-            except Exception:
-                continue
-        if not oids:
-            return ""
-        files_col = current_app.config['MONGO_DB']['user_files']
-        names = []
-        for doc in files_col.find(
-            {"_id": {"$in": oids}, "user_id": user_id_for_history},
-            {"filename": 1, "source_url": 1, "is_url": 1},
-        ):
-            label = doc.get("filename") or doc.get("source_url") or "(untitled)"
-            if doc.get("is_url") and doc.get("source_url"):
-                label = f"{label} (URL: {doc['source_url']})"
-            names.append(f'"{label}"')
-        if not names:
-            return ""
-        listing = ", ".join(names)
-        return (
-            f"[System note: The user has selected the following file(s) "
-            f"from their library: {listing}. When they refer to \"this\", "
-            f"\"that\", \"the document\", \"the link\", etc., they almost "
-            f"certainly mean these. Use search_knowledge_base to read them.]\n\n"
+            {"$set": identity_fields}
         )
-    except Exception as e:
-        logger.warning("Could not build selected-files context note: %s", e)
-        return ""
-
-
-def _parse_image_blocks(images):
-    """Convert frontend dataUrl list to Anthropic image content blocks."""
-    blocks = []
-    for img in (images or []):
-        data_url = img.get('dataUrl', '')
-        if not data_url.startswith('data:'):
-            continue
-        try:
-            header, b64data = data_url.split(',', 1)
-            media_type = header.split(':')[1].split(';')[0]
-            if media_type not in ('image/jpeg', 'image/png', 'image/gif', 'image/webp'):
-                continue
-            blocks.append({
-                "type": "image",
-                "source": {"type": "base64", "media_type": media_type, "data": b64data},
-            })
-        except Exception:
-            continue
-    return blocks
 
 
-def _generate_agentic(*, config_doc, user_input, chat_id, config_id,
+def _generate_agentic(*, plan, config_doc, user_input, chat_id, config_id,
                      user_id_for_history, file_variant, selected_file_ids,
-                     attached_files, images=None, qualtrics_id=None, student_label=None,
-                     student_email=None, marketing_opt_in=None, identity=None):
+                     attached_files, images=None, identity=None):
     """NDJSON generator for the agentic path.
 
     Forwards token / tool_use / tool_result events from the runner to the
     client, captures the final assistant text + block trace, and persists
-    them to chat_histories with `additional_kwargs.tool_trace`.
+    them to chat_histories with `additional_kwargs.tool_trace`. History,
+    the selected-files note and session metadata come from `plan` steps
+    started by chat().
     """
     try:
-        history_obj = get_session_history(
-            session_id=chat_id,
-            user_id=user_id_for_history,
-            config_id=config_id,
-            user_input=user_input,
-            qualtrics_id=qualtrics_id,
-            student_label=student_label,
-            student_email=student_email,
-            marketing_opt_in=marketing_opt_in,
-        )
-        history_messages = _load_anthropic_history(history_obj)
+        history_messages = chat_turn.to_anthropic_history(plan.result("history"))
 
         # Prepend a context note about selected library files so the agent
         # knows what "this" / "the document" refers to. Persisted user input
         # below stays clean — the note is model-only.
-        note = _selected_files_context_note(selected_file_ids, user_id_for_history)
+        note = plan.result("files_note")
         agent_input = note + user_input if note else user_input
-        image_blocks = _parse_image_blocks(images)
+        image_blocks = chat_turn.parse_image_blocks(images)
 
         ctx = ToolContext(
             user_id=user_id_for_history if user_id_for_history != "anonymous" else None,
@@ -664,6 +449,7 @@ def _generate_agentic(*, config_doc, user_input, chat_id, config_id,
             config=config_doc,
             variant=file_variant,
             selected_file_ids=selected_file_ids or [],
+            session_id=chat_id,
         )
 
         accumulated_text = ""
@@ -679,6 +465,7 @@ def _generate_agentic(*, config_doc, user_input, chat_id, config_id,
         ):
             etype = event.get("type")
             if etype == "token":
+                plan.mark("first_token")
                 accumulated_text += event.get("data") or ""
                 yield json.dumps(event) + "\n"
             elif etype in ("tool_use", "tool_result"):
@@ -695,22 +482,24 @@ def _generate_agentic(*, config_doc, user_input, chat_id, config_id,
                         done_payload["usage"] = usage_limits.consume(identity, 1)
                     except Exception as e:
                         logger.error("usage consume (agentic) failed: %s", e)
+                done_payload["timings"] = _finish_timings(plan, chat_id)
                 yield json.dumps(done_payload) + "\n"
 
         # Persist this turn. User message first, then AI message with the
         # full trace so frontend replay can re-render the tool pills.
         # Skip on error — don't write a user-visible error string as if it
         # were a real model response.
+        plan.result("session")
         if final_stop_reason != "error" and accumulated_text.strip():
             try:
-                if attached_files:
-                    history_obj.pending_attached_files = attached_files
-                history_obj.add_user_message(user_input)
-                ai_msg = AIMessage(
-                    content=accumulated_text,
-                    additional_kwargs={"tool_trace": full_trace} if full_trace else {},
-                )
-                history_obj.add_message(ai_msg)
+                chat_turn.append_history(chat_id, [
+                    chat_turn.user_message(user_input, attached_files),
+                    AIMessage(
+                        content=accumulated_text,
+                        additional_kwargs={"tool_trace": full_trace} if full_trace else {},
+                    ),
+                ])
+                plan.background("summary", chat_turn.refresh_history_summary, chat_id)
             except Exception as e:
                 logger.error("Failed to persist agentic turn: %s", e, exc_info=True)
 
@@ -718,38 +507,50 @@ def _generate_agentic(*, config_doc, user_input, chat_id, config_id,
         logger.error("Agentic stream error: %s", e, exc_info=True)
         yield json.dumps({"type": "error", "data": str(e)}) + "\n"
 
+
+def _finish_timings(plan, chat_id):
+    """Stage timings for the `done` event (ms; first_token / done are
+    offsets from the start of the request)."""
+    plan.mark("done")
+    timings = plan.timings()
+    logger.info("Chat timings | session=%s %s", chat_id,
+                " ".join(f"{name}={ms}" for name, ms in timings.items()))
+    return timings
+
+
 # --- MAIN CHAT ROUTE ---
+# routes/chat_async.py serves the same NDJSON contract from the ASGI chat
+# service (asgi_chat.py); behaviour changes here belong there too.
+
+def _resolve_usage(config_doc, metering_user_id, client_ip, device_id):
+    """-> (identity, pre-flight status) for the metered user, if any."""
+    metering_user = User.find_by_id(metering_user_id) if metering_user_id else None
+    return chat_turn.resolve_usage(config_doc, metering_user, client_ip, device_id)
+
 
 @chat_bp.route('/chat/<string:config_id>/<string:chat_id>', methods=['POST'])
 def chat(config_id, chat_id):
+    # Independent lookups (history, retrieval, session metadata) run as
+    # RequestPlan steps so they overlap; the done event reports how long
+    # each one took. Streamed replies carry no Server-Timing header: it is
+    # sent before retrieval, the model call or the first token happen.
+    plan = RequestPlan(current_app._get_current_object())
+
     # 1. Capture user input
-    data = request.get_json(silent=True) or {}
-    user_input = data.get('input')
+    payload = chat_turn.parse_chat_payload(request.get_json(silent=True) or {})
+    user_input = payload['user_input']
     if not user_input:
         return jsonify({"message": "Missing 'input' field"}), 400
-    file_variant = data.get('variant', 'A')
-    selected_file_ids = data.get('selected_file_ids', [])
-    # Snapshot of file metadata the frontend showed as chips at send time;
-    # persisted on the user message so the chips survive a history reload.
-    attached_files = data.get('attached_files', []) or []
-    images = data.get('images', []) or []
-    qualtrics_id = data.get('qualtrics_id') or None
-    student_label = data.get('student_label') or None
-    student_email = data.get('student_email') or None
-    marketing_opt_in = data.get('marketing_opt_in')
-    if marketing_opt_in is not None:
-        marketing_opt_in = bool(marketing_opt_in)
+    file_variant = payload['file_variant']
+    selected_file_ids = payload['selected_file_ids']
+    attached_files = payload['attached_files']
+    images = payload['images']
 
     # 2. Config Fetch
-    config_doc = current_app.config['MONGO_DB']['config_collections'].find_one(
-        {"_id": ObjectId(config_id.strip())},
-        {
-            "model_name": 1, "temperature": 1, "prompt_template": 1,
-            "is_public": 1, "user_id": 1,
-            "web_access": 1, "bot_name": 1, "instructions": 1,
-            "class_code": 1, "usage_pool": 1, "is_playground": 1, "is_personal": 1,
-        }
-    )
+    with plan.stage("config"):
+        config_doc = current_app.config['MONGO_DB']['config_collections'].find_one(
+            {"_id": ObjectId(config_id.strip())}, chat_turn.CHAT_CONFIG_PROJECTION
+        )
 
     if not config_doc:
         return jsonify({"message": "Configuration not found"}), 404
@@ -769,49 +570,75 @@ def chat(config_id, chat_id):
 
     # 3b. Per-message model override — only honored on free playground / personal
     # bots, never on a professor's class/standard bot.
-    model_override = (data.get('model_override') or '').strip()
-    if (model_override
-            and model_override in usage_limits.ALLOWED_MODELS
-            and (config_doc.get("is_playground") or config_doc.get("is_personal"))):
-        config_doc = {**config_doc, "model_name": model_override}
+    config_doc = chat_turn.apply_model_override(config_doc, payload['model_override'])
+    agentic = chat_turn.is_agentic(config_doc)
+
+    # 3c. Start the lookups that don't depend on the usage check. Retrieval is
+    # speculative: if the check below blocks the request its result is dropped.
+    plan.start("history", chat_turn.load_history, chat_id, config_doc.get("model_name"))
+    if agentic:
+        plan.start("files_note", chat_turn.selected_files_context_note, selected_file_ids, user_id_for_history)
+    else:
+        # Pull both the config-owner's baseline docs and the caller's personal
+        # library in one $vectorSearch. User-library chunks are stored with a
+        # synthetic config_id = f"user:{user_id}" so the Atlas filter works.
+        plan.start(
+            "retrieval", retrieve,
+            user_input,
+            config_id=config_id,
+            user_id=user_id_for_history,
+            variant=file_variant,
+            selected_file_ids=selected_file_ids,
+            mode=config_doc.get("retrieval_mode"),
+            rerank=bool(config_doc.get("rerank")),
+            cancelled=plan.cancelled,
+        )
 
-    # 3c. Usage limiting — resolve which metered population this request belongs
+    # 3d. Usage limiting — resolve which metered population this request belongs
     # to, then hard-block before any model call if the budget is exhausted.
-    client_ip = usage_limits.client_ip(request)
-    device_id, device_cookie = usage_limits.get_or_set_device_id(request)
-    metering_user = None
-    if user_id_for_history and user_id_for_history != "anonymous":
-        metering_user = User.find_by_id(user_id_for_history)
-    else:
-        # Public config (e.g. playground): identify a logged-in user for metering
-        # without changing history attribution, so they draw their own budget.
-        try:
-            verify_jwt_in_request(optional=True)
-            _uid = get_jwt_identity()
-            if _uid:
-                metering_user = User.find_by_id(_uid)
-        except Exception:
-            pass
-    identity = usage_limits.resolve_identity(config_doc, metering_user, client_ip, device_id)
+    with plan.stage("usage"):
+        client_ip = usage_limits.client_ip(request)
+        device_id, device_cookie = usage_limits.get_or_set_device_id(request)
+        metering_user_id = None
+        if user_id_for_history and user_id_for_history != "anonymous":
+            metering_user_id = user_id_for_history
+        else:
+            # Public config (e.g. playground): identify a logged-in user for metering
+            # without changing history attribution, so they draw their own budget.
+            try:
+                verify_jwt_in_request(optional=True)
+                metering_user_id = get_jwt_identity()
+            except Exception:
+                pass
+        identity, pre = _resolve_usage(config_doc, metering_user_id, client_ip, device_id)
 
-    try:
-        pre = usage_limits.check(identity)
-    except Exception as e:
-        logger.error("usage check failed (fail-open): %s", e)
-        pre = {"status": "ok"}
     if pre.get("status") == "blocked":
+        plan.cancel()
         resp = jsonify({"error": "usage_limit", "usage": pre})
         resp.status_code = 429
+        resp.headers["Server-Timing"] = plan.server_timing()
         if device_cookie:
-            _set_device_cookie(resp, device_cookie, request)
+            chat_turn.set_device_cookie(resp, device_cookie, request)
         return resp
 
+    # 3e. Session metadata (title generation runs in the background).
+    plan.start(
+        "session", _ensure_session_metadata,
+        chat_id, user_id_for_history, config_id,
+        user_input=user_input,
+        qualtrics_id=payload['qualtrics_id'],
+        student_label=payload['student_label'],
+        student_email=payload['student_email'],
+        marketing_opt_in=payload['marketing_opt_in'],
+        plan=plan,
+    )
+
     # 4a. Agentic branch — Claude bots with web_access enabled use the
     # tool-using runner. Everything else falls through to the legacy chain.
-    model_name_check = (config_doc.get("model_name") or "").lower()
-    if config_doc.get("web_access") and model_name_check.startswith("claude"):
+    if agentic:
         resp = Response(
             stream_with_context(_generate_agentic(
+                plan=plan,
                 config_doc=config_doc,
                 user_input=user_input,
                 chat_id=chat_id,
@@ -821,56 +648,20 @@ def chat(config_id, chat_id):
                 selected_file_ids=selected_file_ids,
                 attached_files=attached_files,
                 images=images,
-                qualtrics_id=qualtrics_id,
-                student_label=student_label,
-                student_email=student_email,
-                marketing_opt_in=marketing_opt_in,
                 identity=identity,
             )),
             mimetype='application/x-ndjson',
         )
         if device_cookie:
-            _set_device_cookie(resp, device_cookie, request)
+            chat_turn.set_device_cookie(resp, device_cookie, request)
         return resp
 
     # 4. Streaming Generator
     @stream_with_context
     def generate():
         try:
-            # -- STEP A: VECTOR RETRIEVAL --
-            # Pull both the config-owner's baseline docs and the caller's personal
-            # library. User-library chunks are stored with a synthetic
-            # config_id = f"user:{user_id}" so the existing Atlas filter works.
-            vector_store = get_vector_store()
-            is_authenticated = user_id_for_history and user_id_for_history != "anonymous"
-
-            if file_variant == 'B':
-                # Variant B: files are scoped to this bot's config_id — no user library merge
-                docs = vector_store.similarity_search(
-                    query=user_input,
-                    k=3,
-                    pre_filter={"config_id": config_id}
-                )
-            elif selected_file_ids and is_authenticated:
-                # Variant A with explicit selection: config baseline + selected files only
-                docs = vector_store.similarity_search(
-                    query=user_input,
-                    k=5,
-                    pre_filter={"$or": [
-                        {"config_id": config_id},
-                        {"source_file_id": {"$in": selected_file_ids}},
-                    ]}
-                )
-            else:
-                # Variant A default: config baseline + full user library
-                config_ids = [config_id]
-                if is_authenticated:
-                    config_ids.append(f"user:{user_id_for_history}")
-                docs = vector_store.similarity_search(
-                    query=user_input,
-                    k=5 if len(config_ids) > 1 else 3,
-                    pre_filter={"config_id": {"$in": config_ids}}
-                )
+            # -- STEP A: VECTOR RETRIEVAL (started above) --
+            docs = plan.result("retrieval")
 
             # Send Sources immediately
             sources = [
@@ -880,150 +671,37 @@ def chat(config_id, chat_id):
             yield json.dumps({"type": "sources", "data": sources}) + "\n"
 
             # -- STEP B: PREPARE LLM --
-            context_text = "\n\n".join(d.page_content for d in docs)
-            base_instruction = config_doc.get("prompt_template", "Answer based on context.")
-            # Escape any {var} in user prompt that isn't our template vars (context, history, question)
-            base_instruction = _escape_prompt_variables(base_instruction)
-
-            # IMPROVED SYSTEM PROMPT: Forces AI to look at history
-            system_message = f"""{base_instruction}
-
-            Use the provided Context (retrieved documents) and the Conversation History to answer.
-            If the user asks about previous messages, look at the History.
-
-            Context:
-            {{context}}
-            """ + _escape_prompt_variables(FORMATTING_GUIDE)
-
-            prompt = ChatPromptTemplate.from_messages([
-                ("system", system_message),
-                MessagesPlaceholder(variable_name="history"), 
-                ("human", "{question}")
-            ])
-
-            # -- DYNAMIC MODEL SELECTION --
-            model_name = config_doc.get("model_name", "gpt-4o")
-            temperature = config_doc.get("temperature", 0.7)
-            primary_openai_key = current_app.config.get("OPENAI_API_KEY")
-            fallback_openai_key = current_app.config.get("OPENAI_API_KEY_2")
-
-            if model_name == "gpt-5-nano":
-                    # CASE 1: GPT-5-Nano (gpt-4o w/o temperature)
-                    primary_llm = ChatOpenAI(
-                        model="gpt-5-nano", 
-                        api_key=primary_openai_key,
-                        max_tokens=500,
-                        streaming=True
-                    )
-                    if fallback_openai_key:
-                        fallback_llm = ChatOpenAI(
-                            model="gpt-5-nano", 
-                            api_key=fallback_openai_key,
-                            max_tokens=500,
-                            streaming=True
-                        )
-                        llm = primary_llm.with_fallbacks([fallback_llm])
-                    else:
-                        llm = primary_llm
-
-            elif model_name.lower().startswith("gemini"):
-                # CASE 2: Gemini Models (e.g., gemini-2.5-flash, gemini-2.5-pro)
-                llm = ChatGoogleGenerativeAI(
-                    model=model_name,
-                    temperature=temperature,
-                    google_api_key=current_app.config.get("GEMINI_API_KEY"),
-                    streaming=True
+            # Stitch adjacent chunks, drop overlap, cap at the model's budget.
+            with plan.stage("context"):
+                context_blocks, context_stats = build_context(
+                    docs, budget_for(config_doc.get("model_name", "gpt-4o"))
                 )
-            elif model_name.lower().startswith("qwen"):
-                # CASE 2: Qwen models (Use ChatTongyi)
-                llm = ChatTongyi(
-                    model=model_name,
-                    temperature=temperature,
-                    api_key=current_app.config.get("DASHSCOPE_API_KEY"),
-                    streaming=True
-                )
-
-            elif model_name.lower().startswith("deepseek"):
-                # CASE 3: DeepSeek models (Use ChatDeepSeek)
-                llm = ChatDeepSeek(
-                    model=model_name,
-                    temperature=temperature,
-                    api_key=current_app.config.get("DEEPSEEK_API_KEY"),
-                    streaming=True
-                )
-
-            elif model_name.lower().startswith("claude"):
-                # CASE 3b: Anthropic Claude models
-                llm = ChatAnthropic(
-                    model=model_name,
-                    temperature=temperature,
-                    api_key=current_app.config.get("ANTHROPIC_API_KEY"),
-                    max_tokens=500,
-                    streaming=True
-                )
-
-            else:
-                # CASE 4: Standard OpenAI
-                primary_llm = ChatOpenAI(
-                    model=model_name,
-                    temperature=temperature,
-                    api_key=primary_openai_key,
-                    max_tokens=500,
-                    streaming=True
-                )
-                if fallback_openai_key:
-                    fallback_llm = ChatOpenAI(
-                        model=model_name,
-                        temperature=temperature,
-                        api_key=fallback_openai_key,
-                        max_tokens=500,
-                        streaming=True
-                    )
-                    llm = primary_llm.with_fallbacks([fallback_llm])
-                else:
-                    llm = primary_llm
+                context_text = render_context(context_blocks)
+                chain = chat_turn.legacy_prompt(config_doc) | chat_turn.select_chat_llm(config_doc, current_app.config) | StrOutputParser()
 
             # -- STEP C: STREAMING INFERENCE --
-            chain = prompt | llm | StrOutputParser()
-            
-            def get_history_factory(session_id):
-                h = get_session_history(
-                    session_id=session_id,
-                    user_id=user_id_for_history,
-                    config_id=config_id,
-                    user_input=user_input,
-                    qualtrics_id=qualtrics_id,
-                    student_label=student_label,
-                    student_email=student_email,
-                    marketing_opt_in=marketing_opt_in,
-                )
-                if attached_files:
-                    h.pending_attached_files = attached_files
-                return h
-
-            chain_with_history = RunnableWithMessageHistory(
-                chain,
-                get_session_history=get_history_factory,
-                input_messages_key="question",
-                history_messages_key="history",
-            )
-
-            got_any = False
-            for chunk in chain_with_history.stream(
-                {"question": user_input, "context": context_text},
-                config={"configurable": {"session_id": chat_id}}
+            answer = []
+            for chunk in chain.stream(
+                {"question": user_input, "context": context_text, "history": plan.result("history")}
             ):
                 if chunk:
-                    got_any = True
+                    plan.mark("first_token")
+                    answer.append(chunk)
                 yield json.dumps({"type": "token", "data": chunk}) + "\n"
 
+            plan.result("session")
+            chat_turn.append_history(chat_id, [chat_turn.user_message(user_input, attached_files), AIMessage(content="".join(answer))])
+            plan.background("summary", chat_turn.refresh_history_summary, chat_id)
+            chat_turn.record_context_usage(chat_id, context_stats)
+
             # Charge one message only if the turn actually produced output.
             done_payload = {"type": "done"}
-            if identity is not None and got_any:
+            if identity is not None and answer:
                 try:
                     done_payload["usage"] = usage_limits.consume(identity, 1)
                 except Exception as e:
                     logger.error("usage consume (legacy) failed: %s", e)
+            done_payload["timings"] = _finish_timings(plan, chat_id)
             yield json.dumps(done_payload) + "\n"
 
         except Exception as e:
@@ -1032,7 +710,7 @@ def chat(config_id, chat_id):
 
     resp = Response(generate(), mimetype='application/x-ndjson')
     if device_cookie:
-        _set_device_cookie(resp, device_cookie, request)
+        chat_turn.set_device_cookie(resp, device_cookie, request)
     return resp
 
 
@@ -9,6 +9,8 @@ from src.utils.vector_stores.store_vector_stores import process_files_and_create
 from models.config import Config
 from models.user import User
 from src.usage import limits as usage_limits
+from src.retrieval.engine import RETRIEVAL_MODES, DEFAULT_RETRIEVAL_MODE
+from src.utils.chunking.registry import parse_chunk_settings
 
 import re
 import json
@@ -257,6 +259,14 @@ Answer:"""
         except (ValueError, TypeError):
             return jsonify({"error": "Temperature must be a number between 0.0 and 2.0"}), 400
 
+        retrieval_mode = config_data.get('retrieval_mode')
+        if retrieval_mode not in RETRIEVAL_MODES:
+            retrieval_mode = DEFAULT_RETRIEVAL_MODE
+
+        chunking, chunking_error = parse_chunk_settings(config_data)
+        if chunking_error:
+            return jsonify({"error": chunking_error}), 400
+
         # --- 6. Handle File Uploads ---
         os.makedirs(UPLOAD_FOLDER, exist_ok=True)
         temp_file_paths = []
@@ -297,6 +307,9 @@ Answer:"""
             "web_access": bool(config_data.get('web_access', True)),
             "audio_enabled": bool(config_data.get('audio_enabled', False)),
             "hume_config_id": (config_data.get('hume_config_id') or '').strip(),
+            "retrieval_mode": retrieval_mode,
+            "rerank": bool(config_data.get('rerank', False)),
+            **chunking,
         }
 
         # Video-analysis configs carry an assignment type + an editable scoring spec.
@@ -328,7 +341,8 @@ Answer:"""
                 temp_file_paths=temp_file_paths, 
                 user_id=user_id, 
                 collection_name=final_collection_name,
-                config_id=config_id
+                config_id=config_id,
+                chunking=chunking,
             )
             # Update the config with the final collection name if it was generated
             if not collection_name:
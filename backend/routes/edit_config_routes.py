@@ -8,6 +8,10 @@ import json
 from models.config import Config
 from src.utils.vector_stores.store_vector_stores import process_files_and_create_vector_store
 from routes.config_routes import validate_class_usage
+from src.history import store as history_store
+from src.retrieval import scope_versions
+from src.retrieval.engine import RETRIEVAL_MODES
+from src.utils.chunking.registry import config_chunk_settings, parse_chunk_settings
 
 
 edit_config_bp = Blueprint('edit_config_routes', __name__)
@@ -35,6 +39,12 @@ def update_existing_config(config_id):
         if not config_to_update:
             return jsonify({"message": "Configuration not found or access denied"}), 404
 
+        # Chunk settings apply to files uploaded from now on (including this
+        # request's); already-indexed files keep their chunks.
+        chunking, chunking_error = parse_chunk_settings(data)
+        if chunking_error:
+            return jsonify({"error": chunking_error}), 400
+
         # --- LOGGING FOR NEW FILES ---
         # Check if the list of files is not empty and the first item is a real file
         if files and files[0].filename:
@@ -82,7 +92,8 @@ def update_existing_config(config_id):
                     temp_file_paths,
                     user_id,
                     config_to_update.get('collection_name'),
-                    config_id
+                    config_id,
+                    chunking={**config_chunk_settings(config_to_update), **chunking},
                 )
         
         # Update documents list with newly uploaded files
@@ -121,6 +132,14 @@ def update_existing_config(config_id):
             "bots": bots_list
         }
 
+        # Retrieval settings — only touched when sent.
+        retrieval_mode = data.get('retrieval_mode')
+        if retrieval_mode in RETRIEVAL_MODES:
+            update_data['retrieval_mode'] = retrieval_mode
+        if data.get('rerank') is not None:
+            update_data['rerank'] = str(data.get('rerank')).lower() in ['true', '1']
+        update_data.update(chunking)
+
         # --- VIDEO-ANALYSIS FIELDS (assignment type + editable scoring spec + class code) ---
         assignment_type = data.get('assignment_type')
         if assignment_type is not None:
@@ -182,6 +201,7 @@ def delete_config(config_id):
             # 1. Delete associated vector chunks from vector_collection
             vector_collection = db['vector_collection']
             vector_result = vector_collection.delete_many({"config_id": config_id})
+            scope_versions.bump(db, config_id)
             current_app.logger.info(f"Deleted {vector_result.deleted_count} vector chunks for config_id: {config_id}")
 
             # 2. Find all chat sessions associated with this config_id
@@ -190,10 +210,9 @@ def delete_config(config_id):
             session_ids_to_delete = [s['session_id'] for s in sessions_to_delete]
 
             if session_ids_to_delete:
-                # 3. Delete all messages for those sessions from message_store
-                message_collection = db['message_store']
-                message_result = message_collection.delete_many({"SessionId": {"$in": session_ids_to_delete}})
-                current_app.logger.info(f"Deleted {message_result.deleted_count} chat messages for config_id: {config_id}")
+                # 3. Delete all messages for those sessions (history buckets + legacy docs)
+                deleted = history_store.delete_sessions(db, session_ids_to_delete)
+                current_app.logger.info(f"Deleted {deleted} chat history documents for config_id: {config_id}")
 
                 # 4. Delete the chat session metadata itself
                 metadata_result = metadata_collection.delete_many({"config_id": config_id})
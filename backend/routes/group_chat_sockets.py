@@ -3,11 +3,11 @@ from flask_socketio import emit, join_room, leave_room
 import logging
 import json
 from bson import ObjectId
-from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
 
 from src.managers.match_manager import match_manager
 from src.managers.context_manager import get_or_create_context
 from src.managers.bot_manager import analyze_intent, get_or_create_bot
+from src.retrieval.engine import retrieve
 
 logger = logging.getLogger(__name__)
 
@@ -181,13 +181,9 @@ def process_ai_logic(app, room_id, uid, text, socketio):
 
             rag_context = ""
             try:
-                vector_store = MongoDBAtlasVectorSearch(
-                    collection=app.config["MONGO_DB"]["vector_collection"],
-                    embedding=app.config["EMBEDDINGS"],
-                    index_name="vector",
-                )
-                docs = vector_store.similarity_search(
-                    query=text, k=3, pre_filter={"config_id": {"$eq": room_id}}
+                docs = retrieve(
+                    text, config_id=room_id, variant="B", k=3,
+                    db=app.config["MONGO_DB"], embeddings=app.config["EMBEDDINGS"],
                 )
                 rag_context = "\n\n".join(d.page_content for d in docs)
             except Exception as rag_err:
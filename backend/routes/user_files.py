@@ -10,7 +10,6 @@ import logging
 import mimetypes
 import os
 import re
-import threading
 import time
 import uuid
 
@@ -19,23 +18,37 @@ from bson.errors import InvalidId
 from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, jwt_required
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from werkzeug.utils import secure_filename
 
 from models.user import User
+from src.jobs import queue as job_queue
+from src.jobs.queue import PermanentJobError
+from src.retrieval import scope_versions
 from src.utils.s3_client import (
     delete_object as s3_delete,
+    download_file as s3_download,
     generate_download_url,
+    generate_presigned_put_url,
+    object_size,
+    open_object,
     upload_file as s3_upload,
 )
+from src.ocr.batching import OCRDeferred
+from src.ocr.engine import CLAUDE_BATCH_PAGE_THRESHOLD, clear_checkpoints
 from src.utils.vector_stores.store_vector_stores import (
-    CLAUDE_BATCH_PAGE_THRESHOLD,
     _extract_pdf_text_via_claude,
     extract_pdf_chunks_fast,
+    ingest_chunk_stream,
     ingest_chunks,
+    iter_file_chunks,
+    iter_stream_chunks,
     process_user_url_and_create_vectors,
+    replace_file_chunks,
 )
-from src.utils.web.fetch import fetch_url_as_documents, UnsafeURLError
+from src.utils.chunking.registry import chunk_documents, chunk_settings
+from src.utils.vector_stores.embedding_store import content_hash
+from src.utils.web.fetch import extract_documents, fetch_many, UnsafeURLError
+from src.utils.web import page_cache
 
 FACULTY_ROLES = ("professor", "admin")
 
@@ -97,6 +110,23 @@ user_files_bp = Blueprint('user_files_routes', __name__)
 TMP_UPLOAD_DIR = "uploads/user_tmp"
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'md', 'docx', 'pptx'}
 MAX_FILE_SIZE = 50 * 1024 * 1024  # 50 MB
+# Uploads over these limits are extracted and embedded in the background
+# worker (202 + job_id), streamed from S3 a page at a time, instead of
+# holding the request thread (and every chunk) for the whole ingest. PDFs
+# are judged by page count, other files by size. Small files keep the
+# synchronous 201 fast path.
+SYNC_INGEST_MAX_PAGES = int(os.getenv("SYNC_INGEST_MAX_PAGES", "100"))
+SYNC_INGEST_MAX_BYTES = int(os.getenv("SYNC_INGEST_MAX_BYTES", str(512 * 1024)))
+# Most URLs one POST /files/urls (a pasted reading list) may carry.
+URL_BULK_MAX = int(os.getenv("URL_BULK_MAX", "50"))
+# Lifetime of the presigned PUT URL handed out by POST /files/uploads.
+DIRECT_UPLOAD_URL_TTL = int(os.getenv("DIRECT_UPLOAD_URL_TTL", "900"))
+# A direct upload still awaiting its /uploaded call this long after the URL
+# was issued is abandoned: the `direct_upload_sweep` job deletes the row
+# and whatever (partial) object reached S3.
+DIRECT_UPLOAD_ABANDON_SECONDS = int(os.getenv("DIRECT_UPLOAD_ABANDON_SECONDS", str(DIRECT_UPLOAD_URL_TTL + 3600)))
+DIRECT_UPLOAD_SWEEP_KIND = "direct_upload_sweep"
+DIRECT_UPLOAD_SWEEP_BATCH = 500
 
 
 def _allowed(filename: str) -> bool:
@@ -173,8 +203,30 @@ def upload_file():
         doc["config_id"] = config_id
     file_id = files_col.insert_one(doc).inserted_id
 
+    if _defer_extraction(tmp_path, ext, size_bytes):
+        # Large upload: stage it and let the worker stream it from S3 like a
+        # direct upload, so no host but the worker's holds its chunks.
+        storage_key = f"user_files/{user_id}/{file_id}/{filename}"
+        try:
+            s3_upload(tmp_path, storage_key, content_type=content_type)
+        except Exception as e:
+            logger.error("Upload staging to S3 failed | file=%s err=%s", filename, e)
+            files_col.delete_one({"_id": file_id})
+            return jsonify({"message": "Failed to persist file to storage"}), 502
+        finally:
+            _safe_unlink(tmp_path)
+        files_col.update_one({"_id": file_id}, {"$set": {"storage_key": storage_key}})
+        doc["_id"] = str(file_id)
+        doc["storage_key"] = storage_key
+        job_id = _queue_extract_job(db, user_id, doc)
+        logger.info("Upload deferred to worker | file=%s size=%d job=%s file_id=%s",
+                    filename, size_bytes, job_id, doc["_id"])
+        return jsonify({"file": doc, "job_id": job_id}), 202
+
     # Tier 1: pypdf-only fast extraction.
-    splits, page_count, image_only_pages = extract_pdf_chunks_fast(tmp_path, filename)
+    splits, page_count, image_only_pages = extract_pdf_chunks_fast(
+        tmp_path, filename, chunk_settings(db, config_id),
+    )
 
     if splits is None:
         # Hard error during extraction (unsupported, corrupted, etc.)
@@ -202,6 +254,7 @@ def upload_file():
                     "source_file_id": str(file_id),
                     "owner_user_id": user_id,
                 })
+                scope_versions.bump(db, config_id or f"user:{user_id}")
                 files_col.delete_one({"_id": file_id})
                 return jsonify({"message": "Failed to persist file to storage"}), 502
 
@@ -236,7 +289,22 @@ def upload_file():
             len(image_only_pages), page_count, filename,
         )
 
-    # Async dispatch (image-only PDF, or mixed PDF's image-only pages).
+    # Async OCR dispatch (image-only PDF, mixed PDF's image-only pages).
+    # Stage the original in S3 before queueing: the job may run in another
+    # process or on another host, which can't read this host's tmp file.
+    storage_key = f"user_files/{user_id}/{file_id}/{filename}"
+    try:
+        s3_upload(tmp_path, storage_key, content_type=content_type)
+    except Exception as e:
+        logger.error("Upload staging to S3 failed | file=%s err=%s", filename, e)
+        if is_mixed:
+            db['vector_collection'].delete_many({"source_file_id": str(file_id), "owner_user_id": user_id})
+            scope_versions.bump(db, config_id or f"user:{user_id}")
+        files_col.delete_one({"_id": file_id})
+        _safe_unlink(tmp_path)
+        return jsonify({"message": "Failed to persist file to storage"}), 502
+    files_col.update_one({"_id": file_id}, {"$set": {"storage_key": storage_key}})
+
     jobs_col = db['upload_jobs']
     job_doc = {
         "user_id": user_id,
@@ -250,37 +318,244 @@ def upload_file():
     }
     job_id = jobs_col.insert_one(job_doc).inserted_id
 
-    # Hand the tmp file off to the worker — it owns cleanup from here.
-    app = current_app._get_current_object()
-    threading.Thread(
-        target=_run_async_pdf_ingest,
-        kwargs={
-            "app": app,
-            "tmp_path": tmp_path,
-            "user_id": user_id,
-            "file_id_str": str(file_id),
-            "job_id_str": str(job_id),
-            "folder_path": folder_path,
-            "filename": filename,
-            "content_type": content_type,
-            "config_id": config_id,
-            "page_indices": image_only_pages if is_mixed else None,
-            "ocr_page_count": len(image_only_pages) if is_mixed else page_count,
-        },
-        daemon=True,
-    ).start()
+    # The worker owns tmp cleanup from here; a worker on this host reads the
+    # tmp file, any other one downloads the staged copy.
+    queue_job_id = job_queue.enqueue(db, "upload_ingest", {
+        "tmp_path": tmp_path,
+        "storage_key": storage_key,
+        "user_id": user_id,
+        "file_id_str": str(file_id),
+        "job_id_str": str(job_id),
+        "folder_path": folder_path,
+        "filename": filename,
+        "content_type": content_type,
+        "config_id": config_id,
+        "page_indices": image_only_pages if is_mixed else None,
+        "ocr_page_count": len(image_only_pages) if is_mixed else page_count,
+        "embed_text_layer": False,
+        "has_text_layer": bool(splits),
+        "needs_ocr": True,
+    })
+    jobs_col.update_one({"_id": job_id}, {"$set": {"queue_job_id": queue_job_id}})
 
     logger.info(
-        "Upload async dispatched | file=%s pages=%d ocr_pages=%s job=%s file_id=%s",
-        filename, page_count,
-        len(image_only_pages) if is_mixed else "all",
+        "Upload async queued | file=%s pages=%d ocr_pages=%s job=%s file_id=%s",
+        filename, page_count, len(image_only_pages) if is_mixed else "all",
         str(job_id), str(file_id),
     )
 
     doc["_id"] = str(file_id)
+    doc["storage_key"] = storage_key
     return jsonify({"file": doc, "job_id": str(job_id)}), 202
 
 
+@user_files_bp.route('/files/uploads', methods=['POST'])
+@jwt_required()
+def create_direct_upload():
+    """Direct-to-S3 upload, step 1: create the file record and return a
+    presigned PUT URL. The browser uploads the bytes straight to S3 (with
+    exactly the returned content_type), then calls
+    POST /files/<file_id>/uploaded. No file bytes pass through the API.
+    """
+    user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+
+    raw_name = data.get('filename') or ''
+    if not raw_name:
+        return jsonify({"message": "filename is required"}), 400
+    if not _allowed(raw_name):
+        return jsonify({
+            "message": f"Unsupported file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+        }), 400
+    try:
+        size_bytes = int(data.get('size_bytes'))
+    except (TypeError, ValueError):
+        return jsonify({"message": "size_bytes is required"}), 400
+    if size_bytes > MAX_FILE_SIZE:
+        return jsonify({"message": "File exceeds 50 MB limit"}), 413
+
+    folder_path = _normalize_path(data.get('folder_path', ''))
+    config_id = data.get('config_id') or None
+    ok, err = _can_write_to_config(user_id, config_id)
+    if not ok:
+        return jsonify({"message": err}), 403
+    filename = secure_filename(raw_name)
+    content_type = (data.get('content_type') or mimetypes.guess_type(filename)[0]
+                    or 'application/octet-stream')
+
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    doc = {
+        "user_id": user_id,
+        "folder_path": folder_path,
+        "filename": filename,
+        "content_type": content_type,
+        "size_bytes": size_bytes,
+        "uploaded_at": time.time(),
+        "vector_ingested": False,
+        "ingest_status": "awaiting_upload",
+        "storage_key": None,
+    }
+    if config_id:
+        doc["config_id"] = config_id
+    file_id = files_col.insert_one(doc).inserted_id
+    storage_key = f"user_files/{user_id}/{file_id}/{filename}"
+    files_col.update_one({"_id": file_id}, {"$set": {"storage_key": storage_key}})
+
+    try:
+        upload_url = generate_presigned_put_url(storage_key, content_type, expires_in=DIRECT_UPLOAD_URL_TTL)
+    except Exception as e:
+        logger.error("Presign failed | key=%s err=%s", storage_key, e)
+        files_col.delete_one({"_id": file_id})
+        return jsonify({"message": "Could not create upload URL"}), 502
+
+    try:
+        job_queue.enqueue_once(db, DIRECT_UPLOAD_SWEEP_KIND, {}, delay_seconds=DIRECT_UPLOAD_ABANDON_SECONDS)
+    except Exception as e:
+        # The next direct upload arms it again.
+        logger.warning("Direct upload sweep not scheduled | err=%s", e)
+
+    doc["_id"] = str(file_id)
+    doc["storage_key"] = storage_key
+    return jsonify({
+        "file": doc,
+        "upload_url": upload_url,
+        "content_type": content_type,
+        "expires_in": DIRECT_UPLOAD_URL_TTL,
+    }), 201
+
+
+def _sweep_abandoned_uploads(db, now=None):
+    """Delete direct uploads never confirmed within
+    DIRECT_UPLOAD_ABANDON_SECONDS — the row and its S3 object — and re-arm
+    the sweep for the next row that will go stale. Returns the number
+    removed. Runs as the `direct_upload_sweep` job (src/jobs/handlers.py)."""
+    now = time.time() if now is None else now
+    files_col = db['user_files']
+    cutoff = now - DIRECT_UPLOAD_ABANDON_SECONDS
+    stale = files_col.find(
+        {"ingest_status": "awaiting_upload", "uploaded_at": {"$lt": cutoff}},
+        {"storage_key": 1},
+    ).limit(DIRECT_UPLOAD_SWEEP_BATCH)
+    removed = 0
+    for doc in stale:
+        # Conditional: a confirm that lands now wins and keeps the file.
+        if files_col.delete_one({"_id": doc["_id"], "ingest_status": "awaiting_upload"}).deleted_count:
+            if doc.get("storage_key"):
+                s3_delete(doc["storage_key"])
+            removed += 1
+    if removed:
+        logger.info("Direct upload sweep OK | removed=%d", removed)
+
+    if removed == DIRECT_UPLOAD_SWEEP_BATCH:
+        delay = 0
+    else:
+        oldest = files_col.find_one({"ingest_status": "awaiting_upload"}, {"uploaded_at": 1},
+                                    sort=[("uploaded_at", 1)])
+        delay = None if oldest is None else max(1.0, oldest["uploaded_at"] + DIRECT_UPLOAD_ABANDON_SECONDS - now)
+    if delay is not None:
+        job_queue.enqueue_once(db, DIRECT_UPLOAD_SWEEP_KIND, {}, delay_seconds=delay)
+    return removed
+
+
+@user_files_bp.route('/files/<string:file_id>/uploaded', methods=['POST'])
+@jwt_required()
+def confirm_direct_upload(file_id):
+    """Direct-to-S3 upload, step 2: the object landed — queue its ingest.
+
+    Extraction runs in the worker, streaming the object from S3
+    (`upload_ingest` with `extract`); the response is 202 + job_id as for
+    an async multipart upload.
+    """
+    user_id = get_jwt_identity()
+    try:
+        oid = ObjectId(file_id)
+    except InvalidId:
+        return jsonify({"message": "Invalid file id"}), 400
+
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    doc = files_col.find_one({"_id": oid, "user_id": user_id})
+    if not doc:
+        return jsonify({"message": "File not found"}), 404
+    if doc.get("ingest_status") != "awaiting_upload":
+        return jsonify({"message": "Upload already confirmed"}), 409
+
+    storage_key = doc["storage_key"]
+    size_bytes = object_size(storage_key)
+    if size_bytes is None:
+        return jsonify({"message": "Upload not found in storage"}), 409
+    if size_bytes > MAX_FILE_SIZE:
+        s3_delete(storage_key)
+        files_col.delete_one({"_id": oid})
+        return jsonify({"message": "File exceeds 50 MB limit"}), 413
+
+    # Conditional so a double confirm queues one job.
+    if not files_col.find_one_and_update(
+        {"_id": oid, "ingest_status": "awaiting_upload"},
+        {"$set": {"ingest_status": "pending", "size_bytes": size_bytes}},
+    ):
+        return jsonify({"message": "Upload already confirmed"}), 409
+
+    doc["_id"] = file_id
+    doc["ingest_status"] = "pending"
+    doc["size_bytes"] = size_bytes
+    job_id = _queue_extract_job(db, user_id, doc)
+    logger.info("Direct upload queued | file=%s size=%d job=%s file_id=%s",
+                doc["filename"], size_bytes, job_id, file_id)
+    return jsonify({"file": doc, "job_id": job_id}), 202
+
+
+def _defer_extraction(path, ext, size_bytes):
+    """Whether an upload is over the sync-ingest limits. Counts PDF pages
+    from the page tree only — no text is extracted here."""
+    if ext != ".pdf":
+        return size_bytes > SYNC_INGEST_MAX_BYTES
+    try:
+        from pypdf import PdfReader
+        return len(PdfReader(path).pages) > SYNC_INGEST_MAX_PAGES
+    except Exception:
+        return False  # unreadable: the sync path reports it
+
+
+def _queue_extract_job(db, user_id, doc):
+    """Queue an `upload_ingest` job that streams the staged original
+    (doc["storage_key"]) from S3 through extraction, embedding and, for
+    pages without text, OCR. Returns the upload job id."""
+    jobs_col = db['upload_jobs']
+    job_id = jobs_col.insert_one({
+        "user_id": user_id,
+        "file_id": doc["_id"],
+        "filename": doc["filename"],
+        "page_count": None,
+        "status": "pending",
+        "error": None,
+        "created_at": time.time(),
+        "updated_at": time.time(),
+    }).inserted_id
+    queue_job_id = job_queue.enqueue(db, "upload_ingest", {
+        "tmp_path": None,
+        "storage_key": doc["storage_key"],
+        "user_id": user_id,
+        "file_id_str": doc["_id"],
+        "job_id_str": str(job_id),
+        "folder_path": doc["folder_path"],
+        "filename": doc["filename"],
+        "content_type": doc.get("content_type"),
+        "config_id": doc.get("config_id"),
+        "needs_ocr": False,
+        "extract": True,
+    })
+    jobs_col.update_one({"_id": job_id}, {"$set": {"queue_job_id": queue_job_id}})
+    return str(job_id)
+
+
+def _direct_tmp_path(file_id_str, filename):
+    """Local copy of a direct upload, made only when pages need OCR. Fixed
+    per file so a retry reuses it."""
+    return os.path.join(TMP_UPLOAD_DIR, f"{file_id_str}_{filename}")
+
+
 def _safe_unlink(path):
     try:
         if path and os.path.exists(path):
@@ -289,135 +564,232 @@ def _safe_unlink(path):
         pass
 
 
-def _run_async_pdf_ingest(*, app, tmp_path, user_id, file_id_str, job_id_str,
-                          folder_path, filename, content_type, config_id,
-                          page_indices=None, ocr_page_count=0):
-    """Background worker: Claude OCR → split → embed → write → S3 → emit.
+def _emit_upload_event(event, user_id, job_id_str, file_id_str, filename, **payload):
+    # Flask-SocketIO registers itself on app.extensions during init_app;
+    # pulling from current_app avoids the `from app import socketio` lazy
+    # import which re-loads app.py as a fresh module (since the entry
+    # point runs it as __main__) and yields a detached SocketIO instance.
+    sio = current_app.extensions.get('socketio')
+    if not sio:
+        logger.warning("%s not emitted: socketio missing from app.extensions", event)
+        return
+    try:
+        sio.emit(
+            event,
+            {
+                'job_id': job_id_str,
+                'file_id': file_id_str,
+                'filename': filename,
+                **payload,
+            },
+            room=f"user:{user_id}",
+        )
+    except Exception as e:
+        logger.warning("Failed to emit %s: %s", event, e)
+
+
+def _run_async_ingest(*, tmp_path, storage_key, user_id, file_id_str, job_id_str,
+                      folder_path, filename, content_type, config_id,
+                      page_indices=None, ocr_page_count=0, embed_text_layer=False,
+                      has_text_layer=False, needs_ocr=True, ocr_batch_done=False, extract=False,
+                      attempt=1):
+    """`upload_ingest` job: [embed text-layer chunks] → [Claude OCR → split →
+    embed] → write → S3 → emit.
 
+    Runs in a job worker (src/jobs/) inside app_context. `embed_text_layer`
+    (set when a mixed PDF's job retries) streams the file's pages through
+    chunking and embedding a group at a time (flat memory), with per-batch
+    `upload_job_progress` events.
     If page_indices is set, only those pages are OCR'd (mixed PDF where
-    text-layer chunks were already ingested synchronously). OCR failures
-    are soft-fail in that case — the file still has its text-layer content.
+    text-layer chunks were ingested first). OCR that comes back empty is
+    soft-fail in that case — the file still has its text-layer content.
+    OCR windows that fail after their retries (OCRIncomplete) retry the job
+    for scans and mixed PDFs alike; the windows that finished stay
+    checkpointed until the job is done or out of attempts.
+
+    Large scans join the shared OCR Message Batch: the job records
+    `ocr_batched` and ends, and src/ocr/batching.py enqueues a continuation
+    (`ocr_batch_done`, text layer already embedded) once every window is
+    back in the OCR checkpoints.
+
+    Direct-to-S3 uploads and multipart uploads over the sync-ingest limits
+    arrive with `extract` (and no tmp_path): the job streams the object from
+    S3 through extraction and embedding itself, and only downloads a local
+    copy when some pages need OCR.
+
+    Raises to have the queue retry; PermanentJobError when retrying can't
+    help. A retry first drops whatever chunks earlier attempts wrote and
+    re-embeds the text layer, so a re-run never duplicates chunks.
     """
-    is_mixed = page_indices is not None
+    is_mixed = page_indices is not None or embed_text_layer
     will_batch = ocr_page_count >= CLAUDE_BATCH_PAGE_THRESHOLD
-    with app.app_context():
-        db = current_app.config['MONGO_DB']
-        files_col = db['user_files']
-        jobs_col = db['upload_jobs']
-
-        def update_job(status, **extra):
-            jobs_col.update_one(
-                {"_id": ObjectId(job_id_str)},
-                {"$set": {"status": status, "updated_at": time.time(), **extra}},
-            )
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    jobs_col = db['upload_jobs']
 
-        # Flask-SocketIO registers itself on app.extensions during init_app;
-        # pulling from current_app avoids the `from app import socketio` lazy
-        # import which re-loads app.py as a fresh module (since the entry
-        # point runs it as __main__) and yields a detached SocketIO instance.
-        sio = current_app.extensions.get('socketio')
+    def update_job(status, **extra):
+        jobs_col.update_one(
+            {"_id": ObjectId(job_id_str)},
+            {"$set": {"status": status, "updated_at": time.time(), "attempt": attempt, **extra}},
+        )
 
-        def emit(status, error=None):
-            if not sio:
-                logger.warning("upload_job_done not emitted: socketio missing from app.extensions")
-                return
-            try:
-                sio.emit(
-                    'upload_job_done',
-                    {
-                        'job_id': job_id_str,
-                        'file_id': file_id_str,
-                        'filename': filename,
-                        'status': status,
-                        'error': error,
-                    },
-                    room=f"user:{user_id}",
-                )
-            except Exception as e:
-                logger.warning("Failed to emit upload_job_done: %s", e)
+    def emit(status, error=None):
+        _emit_upload_event('upload_job_done', user_id, job_id_str, file_id_str, filename,
+                           status=status, error=error)
 
-        def emit_progress(stage, **extra):
-            if not sio:
-                return
-            try:
-                sio.emit(
-                    'upload_job_progress',
-                    {
-                        'job_id': job_id_str,
-                        'file_id': file_id_str,
-                        'filename': filename,
-                        'stage': stage,
-                        **extra,
-                    },
-                    room=f"user:{user_id}",
+    def emit_progress(stage, **extra):
+        _emit_upload_event('upload_job_progress', user_id, job_id_str, file_id_str, filename,
+                           stage=stage, **extra)
+
+    def embed_progress(done, total):
+        emit_progress('embedding', batches_done=done, batches_total=total)
+
+    if not files_col.find_one({"_id": ObjectId(file_id_str)}, {"_id": 1}):
+        # Deleted by the user while queued.
+        update_job("cancelled")
+        clear_checkpoints(db, file_id_str)
+        _safe_unlink(tmp_path)
+        return
+
+    try:
+        if attempt > 1:
+            db['vector_collection'].delete_many({"source_file_id": file_id_str})
+            scope_versions.bump(db, config_id or f"user:{user_id}")
+            embed_text_layer = has_text_layer and not extract
+
+        if extract:
+            update_job("ingesting")
+            stats = {}
+            with open_object(storage_key) as stream:
+                written = ingest_chunk_stream(
+                    iter_stream_chunks(stream, filename, chunk_settings(db, config_id), stats),
+                    user_id, folder_path, filename, file_id_str,
+                    config_id_override=config_id, on_progress=embed_progress,
                 )
-            except Exception as e:
-                logger.warning("Failed to emit upload_job_progress: %s", e)
+                logger.info("Direct upload streamed from S3 | file=%s pages=%d chunks=%s s3_gets=%d",
+                            filename, stats.get("pages", 0), written, stream.requests)
+            if written is None:
+                raise RuntimeError("Vector indexing failed")
+            image_only_pages = stats.get("image_only", [])
+            if not written and not image_only_pages:
+                raise PermanentJobError("No extractable text in file")
+            jobs_col.update_one({"_id": ObjectId(job_id_str)}, {"$set": {"page_count": stats.get("pages", 0)}})
+            # Scanned pages go through OCR as for a multipart upload; the
+            # batch resume payload below is then a plain `upload_ingest` one
+            # that doesn't stream and embed the text layer again.
+            has_text_layer = bool(written)
+            needs_ocr = bool(image_only_pages)
+            page_indices = image_only_pages if written and needs_ocr else None
+            ocr_page_count = len(image_only_pages)
+            is_mixed = page_indices is not None
+            will_batch = ocr_page_count >= CLAUDE_BATCH_PAGE_THRESHOLD
+            if needs_ocr:
+                tmp_path = _direct_tmp_path(file_id_str, filename)
+
+        if tmp_path and not os.path.exists(tmp_path):
+            if not storage_key:
+                raise PermanentJobError("Staged upload is gone (no local file, no S3 copy)")
+            os.makedirs(TMP_UPLOAD_DIR, exist_ok=True)
+            s3_download(storage_key, tmp_path)
+
+        if embed_text_layer:
+            update_job("ingesting")
+            written = ingest_chunk_stream(
+                iter_file_chunks(tmp_path, filename, chunk_settings(db, config_id)),
+                user_id, folder_path, filename, file_id_str,
+                config_id_override=config_id, on_progress=embed_progress,
+            )
+            if not written:
+                raise RuntimeError("Vector indexing failed")
 
-        try:
+        text = None
+        if needs_ocr:
             update_job("extracting")
             emit_progress('ocr', batch=will_batch, pages=ocr_page_count)
-            text = _extract_pdf_text_via_claude(tmp_path, filename, page_indices=page_indices)
-            if not text and not is_mixed:
-                update_job("failed", error="Could not extract text (Claude OCR returned nothing)")
-                files_col.update_one({"_id": ObjectId(file_id_str)}, {"$set": {"ingest_status": "failed"}})
-                emit("failed", error="Could not extract text from PDF")
+            resume = {"kind": "upload_ingest", "payload": {
+                "tmp_path": tmp_path, "storage_key": storage_key, "user_id": user_id,
+                "file_id_str": file_id_str, "job_id_str": job_id_str, "folder_path": folder_path,
+                "filename": filename, "content_type": content_type, "config_id": config_id,
+                "page_indices": page_indices, "ocr_page_count": ocr_page_count,
+                "embed_text_layer": False, "has_text_layer": has_text_layer,
+                "needs_ocr": needs_ocr, "ocr_batch_done": True,
+            }}
+            try:
+                text = _extract_pdf_text_via_claude(
+                    tmp_path, filename, page_indices=page_indices, checkpoint_key=file_id_str,
+                    batch_resume=None if ocr_batch_done else resume, realtime_only=ocr_batch_done,
+                )
+            except OCRDeferred as e:
+                update_job("ocr_batched", ocr_windows=e.windows)
+                emit_progress('ocr_batched', windows=e.windows)
                 return
-
-            if text:
-                update_job("ingesting")
-                emit_progress('ingesting')
-                splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20)
-                ocr_splits = splitter.split_documents([
-                    Document(page_content=text, metadata={"source": filename})
-                ])
-                if not ingest_chunks(ocr_splits, user_id, folder_path, filename, file_id_str, config_id_override=config_id):
-                    if not is_mixed:
-                        update_job("failed", error="Vector indexing failed")
-                        files_col.update_one({"_id": ObjectId(file_id_str)}, {"$set": {"ingest_status": "failed"}})
-                        emit("failed", error="Vector indexing failed")
-                        return
-                    logger.warning(
-                        "Async ingest: OCR chunk index failed for mixed PDF | file=%s file_id=%s",
-                        filename, file_id_str,
-                    )
-            elif is_mixed:
+        if needs_ocr and not text and not is_mixed:
+            raise PermanentJobError("Could not extract text (Claude OCR returned nothing)")
+
+        if text:
+            update_job("ingesting")
+            emit_progress('ingesting')
+            ocr_splits = chunk_documents([
+                Document(page_content=text, metadata={"source": filename})
+            ], "ocr", **chunk_settings(db, config_id))
+            if not ingest_chunks(ocr_splits, user_id, folder_path, filename, file_id_str,
+                                 config_id_override=config_id, on_progress=embed_progress):
+                if not is_mixed:
+                    raise RuntimeError("Vector indexing failed")
                 logger.warning(
-                    "Async ingest: OCR returned nothing for mixed PDF | file=%s file_id=%s pages=%s",
-                    filename, file_id_str, page_indices,
+                    "Async ingest: OCR chunk index failed for mixed PDF | file=%s file_id=%s",
+                    filename, file_id_str,
                 )
+        elif needs_ocr and is_mixed:
+            logger.warning(
+                "Async ingest: OCR returned nothing for mixed PDF | file=%s file_id=%s pages=%s",
+                filename, file_id_str, page_indices,
+            )
 
-            # S3 best-effort: ingestion succeeded, so don't fail the job if S3 hiccups.
+        # S3 best-effort: ingestion succeeded, so don't fail the job if S3 hiccups.
+        if not storage_key:
             storage_key = f"user_files/{user_id}/{file_id_str}/{filename}"
             try:
                 s3_upload(tmp_path, storage_key, content_type=content_type)
             except Exception as e:
                 logger.error("S3 upload failed in async worker | err=%s", e, exc_info=True)
                 storage_key = None
+    except PermanentJobError:
+        raise
+    except Exception as e:
+        logger.error("Async ingest attempt failed | job=%s attempt=%d err=%s", job_id_str, attempt, e)
+        update_job("retrying", error=str(e))
+        emit_progress('retrying', attempt=attempt)
+        raise
+
+    files_col.update_one(
+        {"_id": ObjectId(file_id_str)},
+        {"$set": {
+            "vector_ingested": True,
+            "ingest_status": "done",
+            "storage_key": storage_key,
+        }},
+    )
+    update_job("done")
+    emit("done")
+    clear_checkpoints(db, file_id_str)
+    _safe_unlink(tmp_path)
 
-            files_col.update_one(
-                {"_id": ObjectId(file_id_str)},
-                {"$set": {
-                    "vector_ingested": True,
-                    "ingest_status": "done",
-                    "storage_key": storage_key,
-                }},
-            )
-            update_job("done")
-            emit("done")
-        except Exception as e:
-            logger.error("Async ingest crashed | job=%s err=%s", job_id_str, e, exc_info=True)
-            try:
-                jobs_col.update_one(
-                    {"_id": ObjectId(job_id_str)},
-                    {"$set": {"status": "failed", "error": str(e), "updated_at": time.time()}},
-                )
-                files_col.update_one({"_id": ObjectId(file_id_str)}, {"$set": {"ingest_status": "failed"}})
-                emit("failed", error=str(e))
-            except Exception:
-                pass
-        finally:
-            _safe_unlink(tmp_path)
+
+def _fail_async_ingest(payload, error):
+    """Final failure of an `upload_ingest` job (out of retries, or permanent)."""
+    db = current_app.config['MONGO_DB']
+    db['upload_jobs'].update_one(
+        {"_id": ObjectId(payload["job_id_str"])},
+        {"$set": {"status": "failed", "error": error, "updated_at": time.time()}},
+    )
+    db['user_files'].update_one({"_id": ObjectId(payload["file_id_str"])}, {"$set": {"ingest_status": "failed"}})
+    _emit_upload_event('upload_job_done', payload["user_id"], payload["job_id_str"],
+                       payload["file_id_str"], payload["filename"], status="failed", error=error)
+    clear_checkpoints(db, payload["file_id_str"])
+    _safe_unlink(payload.get("tmp_path"))
+    if payload.get("extract"):
+        _safe_unlink(_direct_tmp_path(payload["file_id_str"], payload["filename"]))
 
 
 @user_files_bp.route('/files/jobs/<string:job_id>', methods=['GET'])
@@ -459,7 +831,7 @@ def upload_url():
         return jsonify({"message": err}), 403
 
     try:
-        documents, title = fetch_url_as_documents(url)
+        documents, title = page_cache.fetch_documents(url)
     except UnsafeURLError as e:
         return jsonify({"message": str(e)}), 400
     except Exception as e:
@@ -509,6 +881,226 @@ def upload_url():
     return jsonify({"file": doc}), 201
 
 
+@user_files_bp.route('/files/urls', methods=['POST'])
+@jwt_required()
+def ingest_urls():
+    """Bulk URL ingest (a pasted reading list). 202 + job_id.
+
+    Each URL becomes (or reuses — same URL, same scope) a `user_files`
+    record; a `url_ingest` job fetches them concurrently (fetch_many) and
+    embeds what changed. The record keeps the page's ETag / Last-Modified
+    and a digest of its extracted text, so re-submitting an unchanged page
+    is a 304 (or a digest match) with nothing re-embedded, and a changed one
+    only re-embeds the chunks that differ (replace_file_chunks).
+    """
+    user_id = get_jwt_identity()
+    body = request.get_json(silent=True) or {}
+    raw = body.get('urls')
+    if isinstance(raw, str):
+        raw = raw.split()
+    if not isinstance(raw, list) or not raw:
+        return jsonify({"message": "urls is required"}), 400
+    urls = list(dict.fromkeys(u.strip() for u in raw if isinstance(u, str) and u.strip()))
+    if not urls:
+        return jsonify({"message": "urls is required"}), 400
+    if len(urls) > URL_BULK_MAX:
+        return jsonify({"message": f"At most {URL_BULK_MAX} URLs per request"}), 400
+    invalid = [u for u in urls if not u.startswith(('http://', 'https://'))]
+    if invalid:
+        return jsonify({"message": "URLs must start with http:// or https://", "invalid": invalid}), 400
+
+    folder_path = _normalize_path(body.get('folder_path', ''))
+    config_id = body.get('config_id') or None
+    ok, err = _can_write_to_config(user_id, config_id)
+    if not ok:
+        return jsonify({"message": err}), 403
+
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    scope = {"user_id": user_id, "config_id": config_id} if config_id else \
+        {"user_id": user_id, "config_id": {"$exists": False}}
+    files = []
+    for url in urls:
+        existing = files_col.find_one({**scope, "source_url": url, "is_url": True})
+        if existing:
+            files_col.update_one({"_id": existing["_id"]}, {"$set": {"ingest_status": "pending"}})
+            existing["ingest_status"] = "pending"
+            files.append(existing)
+            continue
+        doc = {
+            "user_id": user_id,
+            "folder_path": folder_path,
+            "filename": url[:200],
+            "content_type": "text/html",
+            "size_bytes": 0,
+            "uploaded_at": time.time(),
+            "vector_ingested": False,
+            "ingest_status": "pending",
+            "storage_key": None,
+            "source_url": url,
+            "is_url": True,
+        }
+        if config_id:
+            doc["config_id"] = config_id
+        doc["_id"] = files_col.insert_one(doc).inserted_id
+        files.append(doc)
+
+    jobs_col = db['upload_jobs']
+    job_id = jobs_col.insert_one({
+        "user_id": user_id,
+        "file_ids": [str(f["_id"]) for f in files],
+        "filename": f"{len(files)} URLs",
+        "page_count": None,
+        "status": "pending",
+        "error": None,
+        "created_at": time.time(),
+        "updated_at": time.time(),
+    }).inserted_id
+    queue_job_id = job_queue.enqueue(db, "url_ingest", {
+        "user_id": user_id,
+        "job_id_str": str(job_id),
+        "file_ids": [str(f["_id"]) for f in files],
+        "config_id": config_id,
+    })
+    jobs_col.update_one({"_id": job_id}, {"$set": {"queue_job_id": queue_job_id}})
+    logger.info("URL bulk ingest queued | urls=%d reused=%d job=%s",
+                len(files), sum(1 for f in files if f.get("vector_ingested")), str(job_id))
+    return jsonify({"files": [_serialize(f) for f in files], "job_id": str(job_id)}), 202
+
+
+def _apply_url_fetch(db, doc, result, config_id):
+    """Bring one URL record up to date with its fetch result. Returns
+    (outcome, error): outcome is "unchanged", "updated", "added" or
+    "failed"."""
+    files_col = db['user_files']
+    url = doc["source_url"]
+    file_id_str = str(doc["_id"])
+    ingested = bool(doc.get("vector_ingested"))
+    fetched = {
+        "fetched_at": time.time(),
+        "http_etag": result.get("etag") or doc.get("http_etag"),
+        "http_last_modified": result.get("last_modified") or doc.get("http_last_modified"),
+        "fetch_error": None,
+    }
+
+    if result.get("status") == 304:
+        files_col.update_one({"_id": doc["_id"]}, {"$set": {**fetched, "ingest_status": "done"}})
+        return "unchanged", None
+
+    error = result.get("error")
+    documents, title = [], None
+    if not error:
+        try:
+            documents, title = extract_documents(url, result["html"])
+        except Exception as e:
+            error = str(e)
+        if not error and not documents:
+            error = "Could not extract content from URL"
+    if error:
+        return "failed", error
+    page_cache.put_page(url, documents[0].page_content, title, db)
+
+    digest = content_hash("\n".join(d.page_content for d in documents))
+    fetched.update({
+        "content_digest": digest,
+        "size_bytes": sum(len(d.page_content) for d in documents),
+        "vector_ingested": True,
+        "ingest_status": "done",
+    })
+    if ingested and doc.get("content_digest") == digest:
+        # No validators from the server, but the text didn't change.
+        files_col.update_one({"_id": doc["_id"]}, {"$set": fetched})
+        return "unchanged", None
+
+    if ingested:
+        splits = chunk_documents(documents, "web", **chunk_settings(db, config_id))
+        stats = replace_file_chunks(splits, doc["user_id"], doc.get("folder_path"), doc["filename"],
+                                    file_id_str, config_id_override=config_id)
+        if stats is None:
+            return "failed", "Failed to ingest URL content"
+        files_col.update_one({"_id": doc["_id"]}, {"$set": fetched})
+        logger.info("URL refreshed | url=%s kept=%d added=%d removed=%d",
+                    url, stats["kept"], stats["added"], stats["removed"])
+        return "updated", None
+
+    display_name = (title or url)[:200]
+    if not process_user_url_and_create_vectors(
+        documents=documents,
+        user_id=doc["user_id"],
+        folder_path=doc.get("folder_path"),
+        filename=display_name,
+        source_file_id=doc["_id"],
+        source_url=url,
+        config_id_override=config_id,
+    ):
+        return "failed", "Failed to ingest URL content"
+    files_col.update_one({"_id": doc["_id"]}, {"$set": {**fetched, "filename": display_name}})
+    return "added", None
+
+
+def _settle_failed_url(db, doc, error):
+    """A URL that couldn't be (re)ingested: a new record is dropped (as
+    POST /files/url never creates one); an existing one keeps its chunks."""
+    if doc.get("vector_ingested"):
+        db['user_files'].update_one({"_id": doc["_id"]},
+                                    {"$set": {"ingest_status": "done", "fetch_error": error}})
+    else:
+        db['user_files'].delete_one({"_id": doc["_id"], "vector_ingested": False})
+
+
+def _run_url_ingest(*, user_id, job_id_str, file_ids, config_id, attempt=1):
+    """`url_ingest` job: fetch every URL record of a bulk request
+    (fetch_many — concurrent, per-host polite, conditional) and apply each
+    result as it arrives (_apply_url_fetch). Per-URL failures are recorded
+    on the job (`failed`), they don't fail it. A retry re-fetches: records
+    already done answer 304, so it only redoes the rest.
+    """
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    jobs_col = db['upload_jobs']
+
+    docs = {str(d["_id"]): d for d in files_col.find({"_id": {"$in": [ObjectId(f) for f in file_ids]}})}
+    live = [docs[f] for f in file_ids if f in docs]  # the rest were deleted while queued
+    jobs_col.update_one({"_id": ObjectId(job_id_str)},
+                        {"$set": {"status": "fetching", "attempt": attempt, "updated_at": time.time()}})
+
+    counts = {"unchanged": 0, "updated": 0, "added": 0, "failed": 0}
+    failed = []
+    requests_ = [{
+        "url": d["source_url"],
+        # Only a record that has chunks may take a 304 as "nothing to do".
+        "etag": d.get("http_etag") if d.get("vector_ingested") else None,
+        "last_modified": d.get("http_last_modified") if d.get("vector_ingested") else None,
+    } for d in live]
+    for result in fetch_many(requests_):
+        doc = live[result["i"]]
+        outcome, error = _apply_url_fetch(db, doc, result, config_id)
+        counts[outcome] += 1
+        if error:
+            failed.append({"url": doc["source_url"], "error": error})
+            _settle_failed_url(db, doc, error)
+        _emit_upload_event('upload_job_done', user_id, job_id_str, str(doc["_id"]), doc["filename"],
+                           status="failed" if error else "done", error=error, outcome=outcome)
+
+    jobs_col.update_one({"_id": ObjectId(job_id_str)}, {"$set": {
+        "status": "done", "counts": counts, "failed": failed, "updated_at": time.time(),
+    }})
+    logger.info("URL bulk ingest OK | job=%s urls=%d unchanged=%d updated=%d added=%d failed=%d",
+                job_id_str, len(live), counts["unchanged"], counts["updated"], counts["added"], counts["failed"])
+
+
+def _fail_url_ingest(payload, error):
+    """Final failure of a `url_ingest` job: settle records it left pending."""
+    db = current_app.config['MONGO_DB']
+    db['upload_jobs'].update_one(
+        {"_id": ObjectId(payload["job_id_str"])},
+        {"$set": {"status": "failed", "error": error, "updated_at": time.time()}},
+    )
+    ids = [ObjectId(f) for f in payload["file_ids"]]
+    for doc in db['user_files'].find({"_id": {"$in": ids}, "ingest_status": "pending"}):
+        _settle_failed_url(db, doc, error)
+
+
 def _backfill_legacy_kb_files(db, config_id):
     """Mint user_files rows for filenames in config_collections.documents that
     lack one. Configs whose knowledge base was uploaded via the original
@@ -585,6 +1177,8 @@ def list_files():
 
     if raw_folder is not None:
         query['folder_path'] = _normalize_path(raw_folder)
+    # Direct uploads whose bytes never reached S3 stay out of the listing.
+    query['ingest_status'] = {"$ne": "awaiting_upload"}
 
     files = [_serialize(d) for d in files_col.find(query).sort("uploaded_at", -1)]
     return jsonify({"files": files}), 200
@@ -652,6 +1246,7 @@ def delete_file(file_id):
             "config_id": doc['config_id'],
             "original_file": doc.get('filename'),
         })
+    scope_versions.bump(db, doc.get('config_id') or f"user:{user_id}")
     if doc.get('storage_key'):
         s3_delete(doc['storage_key'])
     db['user_files'].delete_one({"_id": oid})
@@ -668,6 +1263,111 @@ def delete_file(file_id):
     return jsonify({"deleted": True}), 200
 
 
+@user_files_bp.route('/files/<string:file_id>', methods=['PUT'])
+@jwt_required()
+def replace_file(file_id):
+    """Upload a new version of a file in place.
+
+    The new version is chunked like an upload and diffed against the stored
+    chunks (replace_file_chunks): only changed text is embedded and written,
+    vanished chunks are deleted, the file id, folder and bot stay the same.
+    Versions that need OCR (pages without a text layer) aren't supported
+    here — delete and re-upload those.
+    """
+    user_id = get_jwt_identity()
+    try:
+        oid = ObjectId(file_id)
+    except InvalidId:
+        return jsonify({"message": "Invalid file id"}), 400
+
+    if 'file' not in request.files:
+        return jsonify({"message": "No file uploaded"}), 400
+    f = request.files['file']
+    if not f or not f.filename:
+        return jsonify({"message": "Empty file"}), 400
+    if not _allowed(f.filename):
+        return jsonify({
+            "message": f"Unsupported file type. Allowed: {', '.join(sorted(ALLOWED_EXTENSIONS))}"
+        }), 400
+
+    db = current_app.config['MONGO_DB']
+    files_col = db['user_files']
+    doc = files_col.find_one({"_id": oid, "user_id": user_id})
+    if not doc:
+        return jsonify({"message": "File not found"}), 404
+    ok, err = _can_write_to_config(user_id, doc.get('config_id'))
+    if not ok:
+        return jsonify({"message": err}), 403
+    if doc.get('is_legacy') or doc.get('source_url'):
+        return jsonify({"message": "This file can't be replaced; delete it and upload the new version"}), 409
+    if doc.get('ingest_status') not in (None, 'done'):
+        return jsonify({"message": "File is still being processed"}), 409
+
+    config_id = doc.get('config_id')
+    filename = secure_filename(f.filename)
+    content_type = f.content_type or mimetypes.guess_type(filename)[0]
+    os.makedirs(TMP_UPLOAD_DIR, exist_ok=True)
+    tmp_path = os.path.join(TMP_UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
+    f.save(tmp_path)
+    try:
+        size_bytes = os.path.getsize(tmp_path)
+        if size_bytes > MAX_FILE_SIZE:
+            return jsonify({"message": "File exceeds 50 MB limit"}), 413
+
+        splits, page_count, image_only_pages = extract_pdf_chunks_fast(
+            tmp_path, filename, chunk_settings(db, config_id),
+        )
+        if splits is None:
+            return jsonify({"message": "Failed to read file"}), 500
+        if not splits or image_only_pages:
+            return jsonify({
+                "message": "The new version has pages without a text layer; delete the file and upload it again"
+            }), 422
+
+        # Store the new original first, under a key of its own: the old
+        # object (and the row pointing at it) stays valid until the chunk
+        # diff has succeeded, and a failed diff only has to drop the new one.
+        version = doc.get("version", 1) + 1
+        storage_key = f"user_files/{user_id}/{file_id}/v{version}/{filename}"
+        try:
+            s3_upload(tmp_path, storage_key, content_type=content_type)
+        except Exception as e:
+            logger.error("S3 upload failed on replace | key=%s err=%s", storage_key, e)
+            return jsonify({"message": "Failed to persist file to storage"}), 502
+
+        try:
+            diff = replace_file_chunks(splits, user_id, doc.get('folder_path'), filename, file_id,
+                                       config_id_override=config_id)
+        except Exception as e:
+            logger.error("Replace diff failed | file_id=%s err=%s", file_id, e, exc_info=True)
+            diff = None
+        if diff is None:
+            s3_delete(storage_key)
+            return jsonify({"message": "Failed to update file content"}), 500
+    finally:
+        _safe_unlink(tmp_path)
+
+    update = {
+        "filename": filename,
+        "content_type": content_type,
+        "size_bytes": size_bytes,
+        "storage_key": storage_key,
+        "replaced_at": time.time(),
+        "vector_ingested": True,
+        "ingest_status": "done",
+        "version": version,
+    }
+    files_col.update_one({"_id": oid}, {"$set": update})
+    if doc.get('storage_key') and doc['storage_key'] != storage_key:
+        s3_delete(doc['storage_key'])
+    logger.info(
+        "Replace file | file_id=%s pages=%d kept=%d added=%d removed=%d",
+        file_id, page_count, diff["kept"], diff["added"], diff["removed"],
+    )
+    doc.update(update)
+    return jsonify({"file": _serialize(doc), "diff": diff}), 200
+
+
 # ---------------------------------------------------------------------------
 # URL ingestion
 # ---------------------------------------------------------------------------
@@ -678,7 +1378,6 @@ def ingest_url():
     """Fetch a public URL, extract text, and ingest into the user's vector library."""
     from src.utils.web.fetch import fetch_url
     from langchain_core.documents import Document
-    from langchain_text_splitters import RecursiveCharacterTextSplitter
     from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
 
     user_id = get_jwt_identity()
@@ -728,7 +1427,7 @@ def ingest_url():
             "original_file": display_name,
             "source": url,
         })
-        splits = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20).split_documents([doc])
+        splits = chunk_documents([doc], "web", **chunk_settings(db, config_id))
         if not splits:
             files_col.delete_one({"_id": file_id})
             return jsonify({"message": "No content extracted"}), 422
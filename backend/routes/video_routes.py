@@ -18,10 +18,10 @@ from bson import ObjectId
 from bson.errors import InvalidId
 from flask import Blueprint, current_app, jsonify, request
 from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
-from langchain_anthropic import ChatAnthropic
 from langchain_core.messages import HumanMessage
 from werkzeug.utils import secure_filename
 
+from src.llm.clients import get_chat_model
 from src.utils.s3_client import (
     generate_presigned_put_url,
     generate_download_url,
@@ -644,7 +644,7 @@ def _parse_json_va(text):
 
 
 def _llm_va(api_key, prompt, max_tokens=500):
-    llm = ChatAnthropic(model='claude-sonnet-4-6', api_key=api_key, max_tokens=max_tokens)
+    llm = get_chat_model('anthropic', 'claude-sonnet-4-6', api_key, max_tokens=max_tokens)
     return llm.invoke([HumanMessage(content=prompt)]).content
 
 
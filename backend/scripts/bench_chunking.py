@@ -0,0 +1,146 @@
+"""
+Benchmark: chunking strategies — retrieval hit-rate vs chunk count / embedding cost.
+Usage: cd backend && python scripts/bench_chunking.py [--corpus PATH] [--files a.pdf b.pptx --queries q.json]
+                                                    [--sizes 300 500 1000] [--k 3] [--retriever bm25|vector]
+
+Chunks every document with each registered strategy (src/utils/chunking/)
+at each chunk size — `auto` is the per-loader mapping uploads use — then
+runs the labelled queries against the chunks.
+
+Queries are labelled with an `answer` snippet rather than chunk ids, so the
+labels hold whatever the chunk boundaries are: a query is a hit@k when one
+of its top-k chunks contains the whole snippet (whitespace / case
+insensitive). An answer cut in half by a chunk boundary is a miss for every
+strategy that cuts it.
+
+--retriever bm25 (default) ranks with lexical.BM25Index — offline, no API
+key. --retriever vector embeds with text-embedding-3-large (OPENAI_API_KEY)
+and ranks by exact cosine.
+
+The fixture (scripts/fixtures/chunking_corpus.json) carries documents as
+pre-extracted pages tagged with the loader that would have produced them.
+--files loads real files through the ingestion loaders instead; pair it
+with --queries (a JSON list of {"query", "answer"}).
+
+Reports per strategy × size: chunks, embedded tokens, embedding cost
+(EMBED_PRICE_PER_M) and hit@k.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.retrieval.lexical import BM25Index
+from src.retrieval.quantization import cosine
+from src.utils.chunking import base
+from src.utils.chunking.registry import chunk_documents
+from src.utils.vector_stores.embed_pipeline import estimate_tokens
+from src.utils.vector_stores.splitting import CHUNK_OVERLAP
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "chunking_corpus.json")
+# text-embedding-3-large list price, USD per 1M input tokens.
+EMBED_PRICE_PER_M = float(os.getenv("EMBED_PRICE_PER_M", "0.13"))
+
+
+def _normalize(text):
+    return " ".join((text or "").split()).casefold()
+
+
+def load_fixture(path):
+    from langchain_core.documents import Document
+
+    with open(path, encoding="utf-8") as f:
+        fixture = json.load(f)
+    documents = [
+        (d["loader"], [Document(page_content=p["text"], metadata={**p.get("metadata", {}), "source": d["name"]})
+                       for p in d["pages"]])
+        for d in fixture["documents"]
+    ]
+    return documents, fixture["queries"]
+
+
+def load_files(paths):
+    from src.utils.vector_stores.store_vector_stores import get_document_loader
+
+    documents = []
+    for path in paths:
+        loader = get_document_loader(path)
+        if loader is None:
+            print(f"skipping {path}: no loader for this file type")
+            continue
+        documents.append((type(loader).__name__, loader.load()))
+    return documents
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--files", nargs="+")
+    parser.add_argument("--queries", help="JSON list of {query, answer}; required with --files")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300, 500, 1000])
+    parser.add_argument("--overlap", type=int, default=CHUNK_OVERLAP)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--retriever", choices=("bm25", "vector"), default="bm25")
+    args = parser.parse_args()
+
+    if args.files:
+        if not args.queries:
+            parser.error("--files needs --queries")
+        documents = load_files(args.files)
+        with open(args.queries, encoding="utf-8") as f:
+            queries = json.load(f)
+    else:
+        documents, queries = load_fixture(args.corpus)
+
+    embeddings = query_vecs = None
+    if args.retriever == "vector":
+        from langchain_openai.embeddings import OpenAIEmbeddings
+        embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key=os.getenv("OPENAI_API_KEY"))
+        query_vecs = embeddings.embed_documents([q["query"] for q in queries])
+
+    pages = sum(len(docs) for _, docs in documents)
+    print(f"Corpus: {len(documents)} documents, {pages} pages/slides, {len(queries)} queries | "
+          f"k={args.k} retriever={args.retriever} overlap={args.overlap}\n")
+    header = f"{'strategy':<12}{'size':<7}{'chunks':<8}{'tokens':<9}{'cost $':<10}{'hit@k':<8}{'avg chars'}"
+    print(header)
+    print("-" * len(header))
+
+    for strategy in ["auto", *base.CHUNKERS]:
+        for size in args.sizes:
+            chunks = []
+            for loader_type, docs in documents:
+                chunks.extend(chunk_documents(
+                    docs, loader_type, chunk_size=size, chunk_overlap=args.overlap,
+                    strategy=None if strategy == "auto" else strategy,
+                ))
+            texts = [c.page_content for c in chunks]
+            tokens = sum(estimate_tokens(t) for t in texts)
+
+            if embeddings is not None:
+                vecs = embeddings.embed_documents(texts)
+                ranked = [
+                    sorted(range(len(texts)), key=lambda i: cosine(query_vecs[qi], vecs[i]), reverse=True)[:args.k]
+                    for qi in range(len(queries))
+                ]
+            else:
+                bm25 = BM25Index(texts)
+                ranked = [[i for i, _ in bm25.search(q["query"], args.k)] for q in queries]
+
+            normalized = [_normalize(t) for t in texts]
+            hits = [
+                any(_normalize(q["answer"]) in normalized[i] for i in ranked[qi])
+                for qi, q in enumerate(queries)
+            ]
+            print(f"{strategy:<12}{size:<7}{len(chunks):<8}{tokens:<9}"
+                  f"{tokens / 1e6 * EMBED_PRICE_PER_M:<10.6f}{statistics.mean(hits):<8.3f}"
+                  f"{statistics.mean(len(t) for t in texts) if texts else 0:.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark: peak memory of PDF extraction, all-at-once vs streamed.
+Usage: cd backend && python scripts/bench_extraction_memory.py path/to/file.pdf [--window 10]
+
+No API calls. Measures (tracemalloc peak, Python allocations only):
+  text layer  — loader.load() + split everything, vs iter_file_chunks()
+                (lazy pages, split one at a time)
+  OCR render  — every page rendered to base64 JPEG up front (old
+                _extract_pdf_text_via_claude), vs one OCR window at a time
+                (src.ocr.render.render_window, released after each window)
+
+Run it on a 10-page and a 100-page scan: the streamed numbers should stay
+roughly flat while the all-at-once ones grow with page count.
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.utils.chunking.registry import chunk_documents
+from src.ocr.render import render_window
+from src.utils.vector_stores.store_vector_stores import get_document_loader, iter_file_chunks
+
+
+def _peak(fn):
+    tracemalloc.start()
+    result = fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, peak / 1024 / 1024
+
+
+def text_eager(path):
+    loader = get_document_loader(path)
+    return len(chunk_documents(loader.load(), type(loader).__name__))
+
+
+def text_streamed(path):
+    return sum(1 for _ in iter_file_chunks(path, os.path.basename(path)))
+
+
+def render_eager(path, window):
+    import fitz
+
+    with fitz.open(path) as pdf_doc:
+        blocks = render_window(pdf_doc, range(pdf_doc.page_count))
+        return len(blocks)
+
+
+def render_windowed(path, window):
+    import fitz
+
+    pages = 0
+    with fitz.open(path) as pdf_doc:
+        for start in range(0, pdf_doc.page_count, window):
+            blocks = render_window(pdf_doc, range(start, min(start + window, pdf_doc.page_count)))
+            pages += len(blocks)
+            del blocks
+    return pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdf")
+    parser.add_argument("--window", type=int, default=10)
+    args = parser.parse_args()
+
+    print(f"{'stage':<26}{'items':<8}{'peak MiB'}")
+    for name, fn in (
+        ("text layer, eager", lambda: text_eager(args.pdf)),
+        ("text layer, streamed", lambda: text_streamed(args.pdf)),
+        ("OCR render, eager", lambda: render_eager(args.pdf, args.window)),
+        (f"OCR render, window={args.window}", lambda: render_windowed(args.pdf, args.window)),
+    ):
+        items, peak = _peak(fn)
+        print(f"{name:<26}{items:<8}{peak:.1f}")
+
+
+if __name__ == "__main__":
+    main()
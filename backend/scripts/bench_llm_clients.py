@@ -0,0 +1,130 @@
+"""
+Benchmark: time-to-first-token with a client per request vs the shared
+client registry (src/llm/clients.py).
+Usage: cd backend && python scripts/bench_llm_clients.py [--provider anthropic|openai] [--model M]
+                                                         [--requests 10] [--pause 0] [--handshake-only]
+
+Sends --requests short streaming prompts one after another, --pause
+seconds apart (a pause longer than httpx's 5 s keep-alive shows what
+LLM_KEEPALIVE_SECONDS buys), in two modes:
+
+  fresh   — a new client per request (what chat() and the agent runner did)
+  shared  — get_chat_model / anthropic_client from the registry
+
+and reports time to first streamed token: mean, p50, p95, and the first
+request separately (it pays the handshake in both modes).
+
+--handshake-only needs no API key: it times an unauthenticated GET to the
+provider's API host (the 401 arrives after the same TCP + TLS setup), so
+it isolates the connection cost that the registry removes.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.llm import clients
+
+PROMPT = "Reply with the single word: ok"
+API_HOSTS = {"anthropic": "https://api.anthropic.com/v1/models", "openai": "https://api.openai.com/v1/models"}
+DEFAULT_MODELS = {"anthropic": "claude-haiku-4-5", "openai": "gpt-4o-mini"}
+
+
+def _anthropic_ttft(client, model):
+    start = time.perf_counter()
+    with client.messages.stream(model=model, max_tokens=8,
+                                messages=[{"role": "user", "content": PROMPT}]) as stream:
+        for _ in stream.text_stream:
+            return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+def _langchain_ttft(llm):
+    start = time.perf_counter()
+    for _ in llm.stream(PROMPT):
+        return time.perf_counter() - start
+    return time.perf_counter() - start
+
+
+def make_probe(provider, model, mode):
+    """-> callable returning one request's TTFT in seconds."""
+    if provider == "anthropic":
+        key = os.getenv("ANTHROPIC_API_KEY")
+        if mode == "fresh":
+            import anthropic
+            return lambda: _anthropic_ttft(anthropic.Anthropic(api_key=key), model)
+        return lambda: _anthropic_ttft(clients.anthropic_client(key), model)
+    key = os.getenv("OPENAI_API_KEY")
+    if mode == "fresh":
+        from langchain_openai import ChatOpenAI
+        return lambda: _langchain_ttft(ChatOpenAI(model=model, api_key=key, max_tokens=8, streaming=True))
+    return lambda: _langchain_ttft(clients.get_chat_model("openai", model, key, max_tokens=8, streaming=True))
+
+
+def make_handshake_probe(provider, mode):
+    import httpx
+
+    url = API_HOSTS[provider]
+    shared = httpx.Client(limits=httpx.Limits(keepalive_expiry=clients.LLM_KEEPALIVE_SECONDS))
+
+    def probe():
+        client = httpx.Client() if mode == "fresh" else shared
+        start = time.perf_counter()
+        client.get(url)
+        elapsed = time.perf_counter() - start
+        if mode == "fresh":
+            client.close()
+        return elapsed
+
+    return probe
+
+
+def run(probe, n, pause):
+    times = []
+    for i in range(n):
+        if i and pause:
+            time.sleep(pause)
+        times.append(probe())
+    return times
+
+
+def summarize(name, times):
+    ordered = sorted(times)
+    p95 = ordered[min(len(ordered) - 1, int(round(0.95 * (len(ordered) - 1))))]
+    rest = times[1:] or times
+    print(f"{name:<8} first={times[0] * 1000:7.0f}ms  mean={statistics.mean(times) * 1000:7.0f}ms  "
+          f"p50={statistics.median(times) * 1000:7.0f}ms  p95={p95 * 1000:7.0f}ms  "
+          f"mean(after first)={statistics.mean(rest) * 1000:7.0f}ms")
+    return statistics.mean(rest)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=["anthropic", "openai"], default="anthropic")
+    parser.add_argument("--model")
+    parser.add_argument("--requests", type=int, default=10)
+    parser.add_argument("--pause", type=float, default=0.0)
+    parser.add_argument("--handshake-only", action="store_true")
+    args = parser.parse_args()
+    model = args.model or DEFAULT_MODELS[args.provider]
+
+    label = "GET (handshake)" if args.handshake_only else f"TTFT {args.provider}:{model}"
+    print(f"{label}, {args.requests} sequential requests, pause={args.pause}s")
+    results = {}
+    for mode in ("fresh", "shared"):
+        probe = (make_handshake_probe(args.provider, mode) if args.handshake_only
+                 else make_probe(args.provider, model, mode))
+        results[mode] = summarize(mode, run(probe, args.requests, args.pause))
+    saved = results["fresh"] - results["shared"]
+    print(f"\nshared saves {saved * 1000:.0f}ms per request after the first "
+          f"({saved / results['fresh'] * 100:.0f}%)" if results["fresh"] else "")
+
+
+if __name__ == "__main__":
+    main()
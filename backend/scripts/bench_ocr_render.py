@@ -0,0 +1,108 @@
+"""
+Benchmark: OCR page rendering, fixed 150 DPI colour vs adaptive.
+Usage: cd backend && python scripts/bench_ocr_render.py path/to/file.pdf [more.pdf ...] [--pages 20] [--ocr]
+
+Renders the first --pages pages of each PDF both ways (src/ocr/render.py)
+and reports pages sent, JPEG bytes and Claude image tokens (estimated from
+the image size, the way Claude bills them). Adaptive skips blank and
+duplicate pages, crops margins, picks DPI from the line pitch and drops
+colour — the table shows what each saves.
+
+--ocr also transcribes every page with CLAUDE_PDF_FALLBACK_MODEL, one page
+per request in both modes (ANTHROPIC_API_KEY), and reports billed input
+tokens and character error rate. CER is measured against the page's own
+text layer, so run it on born-digital PDFs: the text layer is the ground
+truth the rendered image should reproduce. Pages without one, and pages
+adaptive skipped, are left out of CER.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.ocr.engine import CLAUDE_PDF_FALLBACK_MODEL, OCR_MAX_TOKENS, _content, _message_text
+from src.ocr.render import PageRenderer
+
+
+def _normalize(text):
+    return " ".join((text or "").split())
+
+
+def edit_distance(a, b):
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def cer(hypothesis, reference):
+    reference, hypothesis = _normalize(reference), _normalize(hypothesis)
+    return edit_distance(hypothesis, reference) / max(len(reference), 1)
+
+
+def run_mode(pdf_doc, pages, adaptive, client=None):
+    """Render (and optionally OCR) `pages` one at a time. Returns
+    (renderer stats, {page: (text, input_tokens)})."""
+    renderer = PageRenderer(adaptive=adaptive)
+    results = {}
+    for i in pages:
+        images = renderer.render_window(pdf_doc, [i])
+        if not images or client is None:
+            continue
+        msg = client.messages.create(
+            model=CLAUDE_PDF_FALLBACK_MODEL,
+            max_tokens=OCR_MAX_TOKENS,
+            messages=[{"role": "user", "content": _content(images)}],
+        )
+        results[i] = (_message_text(msg), msg.usage.input_tokens)
+    return renderer.stats, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("pdfs", nargs="+")
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--ocr", action="store_true")
+    args = parser.parse_args()
+
+    import fitz  # PyMuPDF
+
+    client = None
+    if args.ocr:
+        from anthropic import Anthropic
+        client = Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+
+    header = f"{'file':<28}{'mode':<10}{'sent':<6}{'blank':<7}{'dup':<5}{'KiB':<9}{'img tokens':<12}"
+    if client:
+        header += f"{'billed in':<11}{'CER':<8}{'CER pages'}"
+    print(header)
+    print("-" * len(header))
+
+    for path in args.pdfs:
+        with fitz.open(path) as pdf_doc:
+            pages = list(range(min(args.pages, pdf_doc.page_count)))
+            reference = {i: pdf_doc[i].get_text() for i in pages}
+            runs = {mode: run_mode(pdf_doc, pages, mode == "adaptive", client) for mode in ("fixed", "adaptive")}
+
+        # CER over the same pages in both modes: rendered by both, with a text layer.
+        scored = [i for i in pages if _normalize(reference[i])
+                  and all(i in results for _, results in runs.values())]
+        for mode, (stats, results) in runs.items():
+            line = (f"{os.path.basename(path)[:27]:<28}{mode:<10}{stats['rendered']:<6}{stats['blank']:<7}"
+                    f"{stats['duplicate']:<5}{stats['bytes'] / 1024:<9.0f}{stats['image_tokens']:<12}")
+            if client:
+                billed = sum(tokens for _, tokens in results.values())
+                rate = (sum(cer(results[i][0], reference[i]) for i in scored) / len(scored)) if scored else float("nan")
+                line += f"{billed:<11}{rate:<8.4f}{len(scored)}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+Benchmark: recall lost vs memory saved for reduced-dimension / quantized vectors.
+Usage: cd backend && python scripts/bench_quantization.py [--corpus PATH] [--k 5] [--dims 3072 1024 512 256]
+
+Embeds the fixture corpus (scripts/fixtures/retrieval_corpus.json) once at
+full 3072 dims (needs OPENAI_API_KEY), then for each dims × storage mode
+encodes every chunk exactly as ingestion would (quantization.py), searches
+on the stored representation and — for int8 / binary — rescores the top
+k × VECTOR_RESCORE_MULTIPLIER candidates against the float32 copy, like the
+engine does.
+
+Reports, per configuration:
+  overlap@k  — share of the float-3072 top-k it reproduces (recall loss)
+  recall@k   — labelled-query recall (same metric as bench_retrieval.py)
+  indexed B  — bytes per chunk of the indexed `embedding` field (index RAM)
+  stored B   — indexed + rescore copy (disk)
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.retrieval import quantization
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "retrieval_corpus.json")
+FULL_DIMS = 3072
+
+
+def _rank(query, vectors, k):
+    scores = sorted(((quantization.cosine(query, v), i) for i, v in enumerate(vectors)), reverse=True)
+    return [i for _, i in scores[:k]]
+
+
+def _search(mode, query_full, doc_full, dims, k):
+    query = quantization.truncate(query_full, dims)
+    docs = [quantization.truncate(v, dims) for v in doc_full]
+    if mode in ("float", "float32"):
+        return _rank(query, docs, k)
+    encoder = quantization.quantize_int8 if mode == "int8" else quantization.quantize_binary
+    stored = [quantization.decode(*encoder(v)) for v in docs]
+    candidates = _rank(quantization.decode(*encoder(query)), stored, k * quantization.RESCORE_MULTIPLIER)
+    rescored = sorted(((quantization.cosine(query, docs[i]), i) for i in candidates), reverse=True)
+    return [i for _, i in rescored[:k]]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--dims", type=int, nargs="+", default=[3072, 1024, 512, 256])
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        fixture = json.load(f)
+    chunks, queries = fixture["chunks"], fixture["queries"]
+    ids = [c["id"] for c in chunks]
+
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key=os.getenv("OPENAI_API_KEY"))
+    doc_full = embeddings.embed_documents([c["text"] for c in chunks])
+    query_full = embeddings.embed_documents([q["query"] for q in queries])
+
+    baseline = [_rank(q, doc_full, args.k) for q in query_full]
+    base_bytes = quantization.bson_size("float", FULL_DIMS)["indexed"]
+
+    print(f"Corpus: {len(chunks)} chunks, {len(queries)} queries, k={args.k}, "
+          f"rescore x{quantization.RESCORE_MULTIPLIER}\n")
+    header = f"{'format':<16}{'overlap@k':<11}{'recall@k':<10}{'indexed B':<11}{'stored B':<10}{'index RAM saved'}"
+    print(header)
+    print("-" * len(header))
+    for dims in args.dims:
+        for mode in quantization.STORAGE_MODES:
+            overlaps, recalls = [], []
+            for qi, q in enumerate(queries):
+                ranked = _search(mode, query_full[qi], doc_full, dims, args.k)
+                overlaps.append(len(set(ranked) & set(baseline[qi])) / args.k)
+                relevant = set(q["relevant"])
+                recalls.append(len(relevant & {ids[i] for i in ranked}) / len(relevant))
+            size = quantization.bson_size(mode, dims)
+            print(f"{quantization.storage_format(dims, mode):<16}{statistics.mean(overlaps):<11.3f}"
+                  f"{statistics.mean(recalls):<10.3f}{size['indexed']:<11}{size['stored']:<10}"
+                  f"{1 - size['indexed'] / base_bytes:.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: pure-vector vs hybrid (BM25 + vector, RRF) retrieval.
+Usage: cd backend && python scripts/bench_retrieval.py [--corpus PATH] [--k 3 5]
+
+Runs on a local fixture corpus (scripts/fixtures/retrieval_corpus.json) with
+labelled queries — no Atlas needed. Chunks and queries are embedded once with
+the production model (text-embedding-3-large, needs OPENAI_API_KEY); vector
+search is exact cosine, lexical search is lexical.BM25Index, and hybrid fuses
+the two with the same reciprocal_rank_fusion the engine uses.
+
+Reports recall@k and MRR per mode, plus the per-query ranking latency
+(embedding time is reported separately — it is identical for both modes).
+"""
+import argparse
+import json
+import math
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.retrieval.lexical import BM25Index, reciprocal_rank_fusion
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures", "retrieval_corpus.json")
+FETCH = 20  # candidates per side before fusion (engine.HYBRID_FETCH_MIN)
+
+
+def _cosine_rank(query_vec, doc_vecs, k):
+    def norm(v):
+        return math.sqrt(sum(x * x for x in v)) or 1.0
+
+    qn = norm(query_vec)
+    scores = [
+        (i, sum(a * b for a, b in zip(query_vec, v)) / (qn * norm(v)))
+        for i, v in enumerate(doc_vecs)
+    ]
+    scores.sort(key=lambda x: x[1], reverse=True)
+    return [i for i, _ in scores[:k]]
+
+
+def _percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--k", type=int, nargs="+", default=[3, 5])
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as f:
+        fixture = json.load(f)
+    chunks, queries = fixture["chunks"], fixture["queries"]
+    ids = [c["id"] for c in chunks]
+    texts = [c["text"] for c in chunks]
+
+    from langchain_openai.embeddings import OpenAIEmbeddings
+    embeddings = OpenAIEmbeddings(model="text-embedding-3-large", api_key=os.getenv("OPENAI_API_KEY"))
+
+    t0 = time.perf_counter()
+    doc_vecs = embeddings.embed_documents(texts)
+    query_vecs = embeddings.embed_documents([q["query"] for q in queries])
+    embed_ms = (time.perf_counter() - t0) * 1000
+
+    bm25 = BM25Index(texts)
+    max_k = max(args.k)
+
+    def vector_search(qi, q):
+        return _cosine_rank(query_vecs[qi], doc_vecs, max_k)
+
+    def hybrid_search(qi, q):
+        dense = _cosine_rank(query_vecs[qi], doc_vecs, FETCH)
+        lexical = [i for i, _ in bm25.search(q["query"], FETCH)]
+        return [i for i, _ in reciprocal_rank_fusion([dense, lexical], limit=max_k)]
+
+    print(f"Corpus: {len(chunks)} chunks, {len(queries)} queries | embedding {embed_ms:.0f} ms total\n")
+    header = "mode     " + "".join(f"recall@{k:<4}" for k in args.k) + "MRR     p50 ms   p95 ms"
+    print(header)
+    print("-" * len(header))
+    for name, search in (("vector", vector_search), ("hybrid", hybrid_search)):
+        recalls = {k: [] for k in args.k}
+        rr, latencies = [], []
+        for qi, q in enumerate(queries):
+            t0 = time.perf_counter()
+            ranked = [ids[i] for i in search(qi, q)]
+            latencies.append((time.perf_counter() - t0) * 1000)
+            relevant = set(q["relevant"])
+            for k in args.k:
+                recalls[k].append(len(relevant & set(ranked[:k])) / len(relevant))
+            first = next((rank for rank, doc_id in enumerate(ranked, 1) if doc_id in relevant), None)
+            rr.append(1 / first if first else 0.0)
+        row = f"{name:<9}" + "".join(f"{statistics.mean(recalls[k]):<11.3f}" for k in args.k)
+        row += f"{statistics.mean(rr):<8.3f}{_percentile(latencies, 50):<9.2f}{_percentile(latencies, 95):.2f}"
+        print(row)
+
+
+if __name__ == "__main__":
+    main()
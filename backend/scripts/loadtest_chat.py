@@ -0,0 +1,231 @@
+"""
+Load test: concurrent streaming chats against the threaded Flask route
+(app.py, :5000) and the ASGI chat service (asgi_chat.py, :5001), with a
+local fake LLM so the test costs nothing and generation time is fixed.
+
+1. Fake LLM — OpenAI chat completions + embeddings and Anthropic messages,
+   streaming --tokens tokens --token-delay seconds apart:
+
+       cd backend && python scripts/loadtest_chat.py fake-llm --port 8090 --tokens 200 --token-delay 0.05
+
+2. Point both servers at it (the SDKs read these variables) and start them:
+
+       export OPENAI_BASE_URL=http://localhost:8090/v1 ANTHROPIC_BASE_URL=http://localhost:8090
+       python app.py &
+       uvicorn asgi_chat:app --port 5001 &
+
+3. Drive load at a public bot (any config with is_public: true):
+
+       python scripts/loadtest_chat.py run --config-id <id> --concurrency 1000 --requests 2000 \\
+           --url http://localhost:5000 --url http://localhost:5001
+
+For each --url it reports completed / failed turns, time to first token
+and to `done` (p50 / p95 / p99), turns per second, and the server's peak
+open streams and thread count sampled from /health (ASGI service only).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+
+# --- fake LLM server -----------------------------------------------------------
+
+def fake_llm_app(tokens, token_delay, dimensions):
+    from starlette.applications import Starlette
+    from starlette.requests import Request
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    words = [f"word{i} " for i in range(tokens)]
+
+    def sse(payload, event=None):
+        head = f"event: {event}\n" if event else ""
+        return f"{head}data: {json.dumps(payload)}\n\n"
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+        if not body.get("stream"):
+            return JSONResponse({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": int(time.time()), "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "Load test chat"},
+                             "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": 10, "completion_tokens": 3, "total_tokens": 13},
+            })
+
+        async def gen():
+            for word in words:
+                await asyncio.sleep(token_delay)
+                yield sse({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                           "choices": [{"index": 0, "delta": {"role": "assistant", "content": word},
+                                        "finish_reason": None}]})
+            yield sse({"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": 0, "model": model,
+                       "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    async def embeddings(request: Request):
+        body = await request.json()
+        inputs = body.get("input")
+        inputs = inputs if isinstance(inputs, list) and inputs and not isinstance(inputs[0], int) else [inputs]
+        dims = int(body.get("dimensions") or dimensions)
+        vector = [1.0 / dims ** 0.5] * dims
+        return JSONResponse({
+            "object": "list", "model": body.get("model", "fake"),
+            "data": [{"object": "embedding", "index": i, "embedding": vector} for i in range(len(inputs))],
+            "usage": {"prompt_tokens": 1, "total_tokens": 1},
+        })
+
+    async def messages(request: Request):
+        body = await request.json()
+        model = body.get("model", "fake")
+
+        async def gen():
+            yield sse({"type": "message_start", "message": {
+                "id": "msg_fake", "type": "message", "role": "assistant", "model": model, "content": [],
+                "stop_reason": None, "stop_sequence": None,
+                "usage": {"input_tokens": 10, "output_tokens": 0}}}, "message_start")
+            yield sse({"type": "content_block_start", "index": 0,
+                       "content_block": {"type": "text", "text": ""}}, "content_block_start")
+            for word in words:
+                await asyncio.sleep(token_delay)
+                yield sse({"type": "content_block_delta", "index": 0,
+                           "delta": {"type": "text_delta", "text": word}}, "content_block_delta")
+            yield sse({"type": "content_block_stop", "index": 0}, "content_block_stop")
+            yield sse({"type": "message_delta", "delta": {"stop_reason": "end_turn", "stop_sequence": None},
+                       "usage": {"output_tokens": len(words)}}, "message_delta")
+            yield sse({"type": "message_stop"}, "message_stop")
+        return StreamingResponse(gen(), media_type="text/event-stream")
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/messages", messages, methods=["POST"]),
+    ])
+
+
+# --- load driver -----------------------------------------------------------------
+
+def _pct(values, p):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))]
+
+
+async def _one_turn(client, url, config_id, prompt, results):
+    chat_id = uuid.uuid4().hex
+    start = time.perf_counter()
+    ttft = None
+    try:
+        async with client.stream("POST", f"{url}/api/chat/{config_id}/{chat_id}", json={"input": prompt}) as resp:
+            if resp.status_code != 200:
+                results["errors"][f"HTTP {resp.status_code}"] += 1
+                return
+            async for line in resp.aiter_lines():
+                if not line:
+                    continue
+                event = json.loads(line)
+                if event.get("type") == "token" and ttft is None:
+                    ttft = time.perf_counter() - start
+                elif event.get("type") == "error":
+                    results["errors"]["error event"] += 1
+                    return
+                elif event.get("type") == "done":
+                    results["ttft"].append(ttft if ttft is not None else time.perf_counter() - start)
+                    results["total"].append(time.perf_counter() - start)
+                    return
+            results["errors"]["closed before done"] += 1
+    except Exception as e:
+        results["errors"][type(e).__name__] += 1
+
+
+async def _sample_health(client, url, results, stop):
+    while not stop.is_set():
+        try:
+            health = (await client.get(f"{url}/health", timeout=5)).json()
+            for key in ("threads", "streams"):
+                if key in health:
+                    results["peak_" + key] = max(results.get("peak_" + key, 0), int(health[key]))
+        except Exception:
+            pass
+        await asyncio.sleep(0.5)
+
+
+async def run_load(url, config_id, concurrency, requests_, prompt):
+    results = {"ttft": [], "total": [], "errors": Counter()}
+    limits = httpx.Limits(max_connections=concurrency + 5, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(600.0, connect=30.0)) as client:
+        stop = asyncio.Event()
+        sampler = asyncio.create_task(_sample_health(client, url, results, stop))
+        gate = asyncio.Semaphore(concurrency)
+
+        async def guarded():
+            async with gate:
+                await _one_turn(client, url, config_id, prompt, results)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(guarded() for _ in range(requests_)))
+        results["wall"] = time.perf_counter() - start
+        stop.set()
+        await sampler
+    return results
+
+
+def report(url, results, requests_):
+    ok = len(results["total"])
+    print(f"\n{url}")
+    print(f"  completed {ok}/{requests_} in {results['wall']:.1f}s  ({ok / results['wall']:.1f} turns/s)")
+    for name in ("ttft", "total"):
+        values = results[name]
+        print(f"  {name:<6} p50={_pct(values, 50):6.2f}s  p95={_pct(values, 95):6.2f}s  "
+              f"p99={_pct(values, 99):6.2f}s  max={max(values) if values else float('nan'):6.2f}s")
+    if results["errors"]:
+        print("  errors " + ", ".join(f"{k}={v}" for k, v in results["errors"].most_common()))
+    if "peak_streams" in results or "peak_threads" in results:
+        print(f"  server peak streams={results.get('peak_streams', '?')} threads={results.get('peak_threads', '?')}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    fake = sub.add_parser("fake-llm", help="serve the fake OpenAI / Anthropic endpoints")
+    fake.add_argument("--host", default="127.0.0.1")
+    fake.add_argument("--port", type=int, default=8090)
+    fake.add_argument("--tokens", type=int, default=200)
+    fake.add_argument("--token-delay", type=float, default=0.05)
+    fake.add_argument("--dimensions", type=int, default=3072)
+
+    load = sub.add_parser("run", help="drive concurrent chats at one or more servers")
+    load.add_argument("--url", action="append", required=True)
+    load.add_argument("--config-id", required=True)
+    load.add_argument("--concurrency", type=int, default=200)
+    load.add_argument("--requests", type=int, default=400)
+    load.add_argument("--prompt", default="Explain photosynthesis in two sentences.")
+
+    args = parser.parse_args()
+    if args.cmd == "fake-llm":
+        import uvicorn
+        uvicorn.run(fake_llm_app(args.tokens, args.token_delay, args.dimensions),
+                    host=args.host, port=args.port, log_level="warning", backlog=4096)
+        return
+
+    print(f"{args.requests} chats, {args.concurrency} concurrent, config={args.config_id}")
+    for url in args.url:
+        url = url.rstrip("/")
+        report(url, asyncio.run(run_load(url, args.config_id, args.concurrency, args.requests, args.prompt)),
+               args.requests)
+
+
+if __name__ == "__main__":
+    main()
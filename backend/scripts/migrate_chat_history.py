@@ -0,0 +1,92 @@
+"""
+Move chat history from the legacy per-message store (chat_histories) into
+per-session buckets (chat_history_buckets, src/history/store.py).
+Usage: cd backend && python scripts/migrate_chat_history.py [--dry-run] [--drop-legacy] [--batch 200]
+
+For each chat_session_metadata doc without `message_count`, copies the
+session's messages (in insertion order, as native BSON) into buckets and
+sets `message_count` / `first_message` on the metadata. Sessions already
+migrated are skipped, so the script is resumable and safe to run while
+the app is serving: chat turns migrate a legacy session on its next
+append the same way, and a bucket that already exists is never
+overwritten.
+
+Rollout:
+  1. python create_history_indexes.py (the unique session_id + seq index).
+  2. Deploy; new sessions start in buckets.
+  3. Run this script. Until it finishes, session lists count legacy
+     sessions' messages in chat_histories (one count per session) and show
+     no first message for them (reads still fall back).
+  4. Once the counts look right, re-run with --drop-legacy to delete the
+     migrated chat_histories documents (they are kept for rollback otherwise).
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.utils.config import load_secrets
+from src.backend.database.mongo_utils import get_mongo_db_connection
+from src.history import store
+
+
+def migrate(db, batch_size: int, dry_run: bool, drop_legacy: bool) -> dict:
+    metadata = db[store.METADATA_COLLECTION]
+    query = {} if drop_legacy else {"message_count": {"$exists": False}}
+    stats = {"sessions": 0, "messages": 0, "empty": 0}
+
+    last_id = None
+    while True:
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["_id"] = {"$gt": last_id}
+        docs = list(metadata.find(page_query, {"session_id": 1}).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        for doc in docs:
+            session_id = doc.get("session_id")
+            if not session_id:
+                continue
+            if dry_run:
+                count = db[store.LEGACY_COLLECTION].count_documents({"SessionId": session_id})
+            else:
+                count = store.migrate_session(db, session_id, drop_legacy=drop_legacy)
+            stats["sessions"] += 1
+            stats["messages"] += count
+            stats["empty"] += not count
+        print(f"  ... {stats['sessions']} sessions / {stats['messages']} messages "
+              f"{'would be ' if dry_run else ''}migrated")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch", type=int, default=200)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--drop-legacy", action="store_true",
+                        help="Also delete each session's chat_histories docs once its buckets exist")
+    args = parser.parse_args()
+
+    secrets = load_secrets()
+    _client, db, _ = get_mongo_db_connection(
+        mongo_uri=secrets["MONGO_URI"],
+        db_name=secrets["MONGO_DB_NAME"],
+        collection_name=secrets["USER"],
+    )
+
+    print(f"Bucket size: {store.HISTORY_BUCKET_SIZE} messages{' (dry run)' if args.dry_run else ''}")
+    stats = migrate(db, args.batch, args.dry_run, args.drop_legacy)
+    print(f"Done: {stats}")
+    legacy = db[store.LEGACY_COLLECTION].estimated_document_count()
+    print(f"{store.LEGACY_COLLECTION} still holds ~{legacy} documents"
+          f"{'' if args.drop_legacy else ' (re-run with --drop-legacy to remove migrated ones)'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""
+Re-encode existing vector_collection chunks to a new dimension / storage mode.
+Usage: cd backend && python scripts/migrate_vector_storage.py --mode int8 --dims 1024 [--dry-run] [--update-index]
+
+Reads each chunk's full-precision vector (`embedding_rescore` if present,
+else `embedding`), truncates + re-normalizes it to --dims (no re-embedding:
+text-embedding-3 vectors are Matryoshka-trained) and rewrites it with
+quantization.encode_for_storage. Chunks already tagged with the target
+`embedding_format` are skipped, so the script is resumable.
+
+Rollout:
+  1. Run with --dry-run to see counts and the target Atlas index definition.
+  2. Run for real, then --update-index (or apply the printed definition in
+     the Atlas UI). Queries fail or degrade until the index matches.
+  3. Set EMBEDDING_DIMENSIONS / VECTOR_STORAGE_MODE to the same values and
+     redeploy so new chunks and queries use the new format.
+"""
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+load_dotenv()
+
+from pymongo import UpdateOne
+
+from src.utils.config import load_secrets
+from src.backend.database.mongo_utils import get_mongo_db_connection
+from src.retrieval import quantization, scope_versions
+from src.retrieval.engine import VECTOR_COLLECTION, VECTOR_INDEX_NAME
+
+
+def index_definition(mode: str, dims: int) -> dict:
+    """Atlas Vector Search definition for the target format. Bit vectors
+    only support euclidean (Hamming) similarity."""
+    return {"fields": [
+        {
+            "type": "vector",
+            "path": "embedding",
+            "numDimensions": dims,
+            "similarity": "euclidean" if mode == "binary" else "cosine",
+        },
+        {"type": "filter", "path": "config_id"},
+        {"type": "filter", "path": "source_file_id"},
+    ]}
+
+
+def migrate(db, mode: str, dims: int, batch_size: int, dry_run: bool) -> dict:
+    collection = db[VECTOR_COLLECTION]
+    target = quantization.storage_format(dims, mode)
+    query = {quantization.FORMAT_KEY: {"$ne": target}}
+    projection = {"embedding": 1, quantization.RESCORE_KEY: 1, "config_id": 1}
+    stats = {"migrated": 0, "skipped_lossy": 0, "skipped_short": 0}
+    scopes = set()
+
+    last_id = None
+    while True:
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["_id"] = {"$gt": last_id}
+        docs = list(collection.find(page_query, projection).sort("_id", 1).limit(batch_size))
+        if not docs:
+            break
+        last_id = docs[-1]["_id"]
+
+        ops = []
+        for doc in docs:
+            rescore = doc.get(quantization.RESCORE_KEY)
+            embedding = doc.get("embedding")
+            if rescore is not None:
+                source = quantization.from_bson(rescore)
+            elif isinstance(embedding, list) or (embedding and bytes(embedding)[0] == quantization.DTYPE_FLOAT32):
+                source = quantization.from_bson(embedding)
+            else:
+                # Quantized with no float copy — re-encoding would compound loss.
+                stats["skipped_lossy"] += 1
+                continue
+            if not source:
+                continue
+            if len(source) < dims:
+                stats["skipped_short"] += 1
+                continue
+            fields = quantization.encode_for_storage(source, mode=mode, dims=dims)
+            update = {"$set": fields}
+            if quantization.RESCORE_KEY not in fields:
+                update["$unset"] = {quantization.RESCORE_KEY: ""}
+            ops.append(UpdateOne({"_id": doc["_id"]}, update))
+            scopes.add(doc.get("config_id"))
+
+        if ops and not dry_run:
+            collection.bulk_write(ops, ordered=False)
+        stats["migrated"] += len(ops)
+        print(f"  ... {stats['migrated']} chunks {'would be ' if dry_run else ''}re-encoded")
+
+    if not dry_run:
+        scope_versions.bump(db, *scopes)
+    stats["scopes"] = len(scopes)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=quantization.STORAGE_MODES, required=True)
+    parser.add_argument("--dims", type=int, required=True, help="e.g. 3072, 1024, 512")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--update-index", action="store_true",
+                        help=f"Apply the new definition to the '{VECTOR_INDEX_NAME}' Atlas index")
+    args = parser.parse_args()
+
+    secrets = load_secrets()
+    _client, db, _ = get_mongo_db_connection(
+        mongo_uri=secrets["MONGO_URI"],
+        db_name=secrets["MONGO_DB_NAME"],
+        collection_name=secrets["USER"],
+    )
+
+    print(f"Target format: {quantization.storage_format(args.dims, args.mode)}"
+          f"{' (dry run)' if args.dry_run else ''}")
+    stats = migrate(db, args.mode, args.dims, args.batch, args.dry_run)
+    print(f"Done: {stats}")
+
+    definition = index_definition(args.mode, args.dims)
+    if args.update_index and not args.dry_run:
+        db[VECTOR_COLLECTION].update_search_index(VECTOR_INDEX_NAME, definition)
+        print(f"Updated Atlas index '{VECTOR_INDEX_NAME}' (rebuilds asynchronously)")
+    else:
+        print(f"Atlas index '{VECTOR_INDEX_NAME}' definition:\n{json.dumps(definition, indent=2)}")
+    print(f"Now deploy with EMBEDDING_DIMENSIONS={args.dims} VECTOR_STORAGE_MODE={args.mode}")
+
+
+if __name__ == "__main__":
+    main()
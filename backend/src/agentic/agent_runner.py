@@ -1,15 +1,18 @@
 """
 Agentic chat runner — Claude tool-use loop.
 
-Single entry point: `stream_agentic_response`. Yields dict events that the
-chat_routes layer wraps in NDJSON for the browser.
+Entry points: `stream_agentic_response` (threaded Flask route) and its
+async twin `astream_agentic_response` (ASGI chat service, asgi_chat.py).
+Both yield the same dict events, which the route layer wraps in NDJSON
+for the browser.
 
 Step 5 will wire this into `/api/chat/...` behind the `web_access` + Claude
 branch. Step 6 teaches the frontend to render the new event types.
 """
+import asyncio
 import logging
 import os
-from typing import Any, Dict, Iterator, List
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List
 
 from src.agentic.constants import (
     DEFAULT_MAX_TOKENS,
@@ -18,6 +21,7 @@ from src.agentic.constants import (
 )
 from src.agentic.registry import execute, get_tool_specs
 from src.agentic.tools.base import ToolContext
+from src.llm.clients import anthropic_async_client, anthropic_client
 
 logger = logging.getLogger(__name__)
 
@@ -124,6 +128,75 @@ def _to_dict(block) -> Dict[str, Any]:
     return {"type": "text", "text": str(block)}
 
 
+def _prepare_turn(config, user_input, history_messages, images):
+    """-> (request kwargs without `messages`, messages) for the first round.
+    Shared by the sync and async runners."""
+    tool_specs = get_tool_specs(config)
+    tool_names = {s['name'] for s in tool_specs}
+    system_prompt = _build_system_prompt(config, tool_names)
+
+    # Cache the system prompt + tool specs across turns in the same chat.
+    kwargs = {
+        "model": config.get('model_name') or 'claude-sonnet-4-5',
+        "system": [{
+            "type": "text",
+            "text": system_prompt,
+            "cache_control": {"type": "ephemeral"},
+        }],
+        "max_tokens": DEFAULT_MAX_TOKENS,
+    }
+    temp = config.get('temperature')
+    if temp is not None:
+        try:
+            kwargs["temperature"] = float(temp)
+        except (TypeError, ValueError):
+            pass
+    if tool_specs:
+        # Attach cache_control to the last tool spec — covers the whole
+        # tools block per Anthropic's caching rules.
+        tools_param = [dict(s) for s in tool_specs]
+        tools_param[-1] = {**tools_param[-1], "cache_control": {"type": "ephemeral"}}
+        kwargs["tools"] = tools_param
+
+    messages = list(history_messages)
+    if images:
+        user_content = list(images) + [{"type": "text", "text": user_input}]
+        messages.append({"role": "user", "content": user_content})
+    else:
+        messages.append({"role": "user", "content": user_input})
+    return kwargs, messages
+
+
+def _run_tool(tu: Dict[str, Any], ctx: ToolContext, tool_use_counts: Dict[str, int]):
+    """Execute one tool_use block -> (content, is_error)."""
+    tu_name = tu.get("name") or ""
+    # Enforce per-tool cap before invoking — return a synthetic error
+    # so the model can recover (use a different tool / answer with
+    # what it already has).
+    cap = MAX_USES_PER_TOOL.get(tu_name)
+    current = tool_use_counts.get(tu_name, 0)
+    tool_use_counts[tu_name] = current + 1
+    if cap is not None and current >= cap:
+        return (
+            f"Tool '{tu_name}' has reached its per-turn limit of {cap}. "
+            "Answer with what you already have or try a different tool.",
+            True,
+        )
+    result = execute(tu_name, tu.get("input") or {}, ctx)
+    return result.get("content") or "", bool(result.get("is_error"))
+
+
+def _setup_error(api_key):
+    """Event to emit instead of running the turn, or None."""
+    if not api_key:
+        return "Anthropic API key is not configured on this server."
+    try:
+        import anthropic  # noqa: F401
+    except ImportError:
+        return "anthropic SDK is not installed on this server."
+    return None
+
+
 def stream_agentic_response(
     config: Dict[str, Any],
     user_input: str,
@@ -155,72 +228,105 @@ def stream_agentic_response(
     it on the AI message as `additional_kwargs.tool_trace`.
     """
     api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        yield {"type": "token", "data": "Anthropic API key is not configured on this server."}
+    error = _setup_error(api_key)
+    if error:
+        yield {"type": "token", "data": error}
         yield {"type": "done", "stop_reason": "error", "assistant_blocks": []}
         return
 
-    try:
-        import anthropic
-    except ImportError:
-        yield {"type": "token", "data": "anthropic SDK is not installed on this server."}
-        yield {"type": "done", "stop_reason": "error", "assistant_blocks": []}
-        return
+    client = anthropic_client(api_key)
+    kwargs, messages = _prepare_turn(config, user_input, history_messages, images)
 
-    client = anthropic.Anthropic(api_key=api_key)
-    model = config.get('model_name') or 'claude-sonnet-4-5'
+    full_trace: List[Dict[str, Any]] = []
+    final_stop_reason = "end_turn"
+    # Per-turn use count per tool — enforced against MAX_USES_PER_TOOL.
+    tool_use_counts: Dict[str, int] = {}
 
-    tool_specs = get_tool_specs(config)
-    tool_names = {s['name'] for s in tool_specs}
-    system_prompt = _build_system_prompt(config, tool_names)
+    for round_idx in range(MAX_TOOL_ROUNDS):
+        try:
+            with client.messages.stream(messages=messages, **kwargs) as stream:
+                for chunk in stream.text_stream:
+                    if chunk:
+                        yield {"type": "token", "data": chunk}
+                final_message = stream.get_final_message()
+        except Exception as e:
+            logger.error("Anthropic stream failed (round %d): %s", round_idx, e, exc_info=True)
+            yield {"type": "token", "data": f"\n\n[Connection error: {e}]"}
+            yield {"type": "done", "stop_reason": "error", "assistant_blocks": full_trace}
+            return
 
-    # Cache the system prompt + tool specs across turns in the same chat.
-    system_param = [{
-        "type": "text",
-        "text": system_prompt,
-        "cache_control": {"type": "ephemeral"},
-    }]
-    tools_param = None
-    if tool_specs:
-        # Attach cache_control to the last tool spec — covers the whole
-        # tools block per Anthropic's caching rules.
-        tools_param = [dict(s) for s in tool_specs]
-        tools_param[-1] = {**tools_param[-1], "cache_control": {"type": "ephemeral"}}
+        assistant_blocks = [_to_dict(b) for b in final_message.content]
+        full_trace.extend(assistant_blocks)
+        messages.append({"role": "assistant", "content": assistant_blocks})
 
-    messages = list(history_messages)
-    if images:
-        user_content = list(images) + [{"type": "text", "text": user_input}]
-        messages.append({"role": "user", "content": user_content})
+        final_stop_reason = final_message.stop_reason or "end_turn"
+        if final_stop_reason != "tool_use":
+            break
+
+        tool_uses = [b for b in assistant_blocks if b.get("type") == "tool_use"]
+        if not tool_uses:
+            # Defensive: stop_reason said tool_use but no blocks present.
+            break
+
+        tool_result_blocks: List[Dict[str, Any]] = []
+        for tu in tool_uses:
+            yield _tool_use_event(tu)
+            content, is_error = _run_tool(tu, ctx, tool_use_counts)
+            yield _tool_result_event(tu, content, is_error)
+            tool_result_blocks.append(_tool_result_block(tu, content, is_error))
+
+        full_trace.extend(tool_result_blocks)
+        messages.append({"role": "user", "content": tool_result_blocks})
     else:
-        messages.append({"role": "user", "content": user_input})
+        # Loop exhausted without natural stop — let the user know.
+        logger.warning("Agentic turn hit MAX_TOOL_ROUNDS=%d", MAX_TOOL_ROUNDS)
+        yield {"type": "token", "data": "\n\n[Reached the tool-use limit for this turn.]"}
+        final_stop_reason = "max_rounds"
+
+    yield {
+        "type": "done",
+        "stop_reason": final_stop_reason,
+        "assistant_blocks": full_trace,
+    }
+
+
+async def astream_agentic_response(
+    config: Dict[str, Any],
+    user_input: str,
+    history_messages: List[Dict[str, Any]],
+    ctx: ToolContext,
+    images: List[Dict[str, Any]] = None,
+    offload: Callable[..., Awaitable[Any]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Async twin of `stream_agentic_response` (same events) for the ASGI
+    chat service. Model rounds stream over AsyncAnthropic, so a turn holds
+    no thread while Claude generates. Tools are sync (Mongo, Tavily, page
+    fetches); each call runs through `offload(fn, *args)` — by default
+    `asyncio.to_thread` — which the service uses to push a Flask app
+    context for them.
+    """
+    api_key = os.getenv("ANTHROPIC_API_KEY")
+    error = _setup_error(api_key)
+    if error:
+        yield {"type": "token", "data": error}
+        yield {"type": "done", "stop_reason": "error", "assistant_blocks": []}
+        return
+
+    offload = offload or asyncio.to_thread
+    client = anthropic_async_client(api_key)
+    kwargs, messages = _prepare_turn(config, user_input, history_messages, images)
 
     full_trace: List[Dict[str, Any]] = []
     final_stop_reason = "end_turn"
-    # Per-turn use count per tool — enforced against MAX_USES_PER_TOOL below.
     tool_use_counts: Dict[str, int] = {}
 
     for round_idx in range(MAX_TOOL_ROUNDS):
-        kwargs = {
-            "model": model,
-            "system": system_param,
-            "messages": messages,
-            "max_tokens": DEFAULT_MAX_TOKENS,
-        }
-        temp = config.get('temperature')
-        if temp is not None:
-            try:
-                kwargs["temperature"] = float(temp)
-            except (TypeError, ValueError):
-                pass
-        if tools_param:
-            kwargs["tools"] = tools_param
-
         try:
-            with client.messages.stream(**kwargs) as stream:
-                for chunk in stream.text_stream:
+            async with client.messages.stream(messages=messages, **kwargs) as stream:
+                async for chunk in stream.text_stream:
                     if chunk:
                         yield {"type": "token", "data": chunk}
-                final_message = stream.get_final_message()
+                final_message = await stream.get_final_message()
         except Exception as e:
             logger.error("Anthropic stream failed (round %d): %s", round_idx, e, exc_info=True)
             yield {"type": "token", "data": f"\n\n[Connection error: {e}]"}
@@ -237,58 +343,18 @@ def stream_agentic_response(
 
         tool_uses = [b for b in assistant_blocks if b.get("type") == "tool_use"]
         if not tool_uses:
-            # Defensive: stop_reason said tool_use but no blocks present.
             break
 
         tool_result_blocks: List[Dict[str, Any]] = []
         for tu in tool_uses:
-            tu_id = tu.get("id") or ""
-            tu_name = tu.get("name") or ""
-            tu_input = tu.get("input") or {}
-
-            yield {
-                "type": "tool_use",
-                "id": tu_id,
-                "name": tu_name,
-                "input": tu_input,
-            }
-
-            # Enforce per-tool cap before invoking — return a synthetic error
-            # so the model can recover (use a different tool / answer with
-            # what it already has).
-            cap = MAX_USES_PER_TOOL.get(tu_name)
-            current = tool_use_counts.get(tu_name, 0)
-            tool_use_counts[tu_name] = current + 1
-            if cap is not None and current >= cap:
-                content = (
-                    f"Tool '{tu_name}' has reached its per-turn limit of {cap}. "
-                    "Answer with what you already have or try a different tool."
-                )
-                is_error = True
-            else:
-                result = execute(tu_name, tu_input, ctx)
-                content = result.get("content") or ""
-                is_error = bool(result.get("is_error"))
-
-            yield {
-                "type": "tool_result",
-                "id": tu_id,
-                "name": tu_name,
-                "content": content,
-                "is_error": is_error,
-            }
-
-            tool_result_blocks.append({
-                "type": "tool_result",
-                "tool_use_id": tu_id,
-                "content": content,
-                "is_error": is_error,
-            })
+            yield _tool_use_event(tu)
+            content, is_error = await offload(_run_tool, tu, ctx, tool_use_counts)
+            yield _tool_result_event(tu, content, is_error)
+            tool_result_blocks.append(_tool_result_block(tu, content, is_error))
 
         full_trace.extend(tool_result_blocks)
         messages.append({"role": "user", "content": tool_result_blocks})
     else:
-        # Loop exhausted without natural stop — let the user know.
         logger.warning("Agentic turn hit MAX_TOOL_ROUNDS=%d", MAX_TOOL_ROUNDS)
         yield {"type": "token", "data": "\n\n[Reached the tool-use limit for this turn.]"}
         final_stop_reason = "max_rounds"
@@ -298,3 +364,18 @@ def stream_agentic_response(
         "stop_reason": final_stop_reason,
         "assistant_blocks": full_trace,
     }
+
+
+def _tool_use_event(tu):
+    return {"type": "tool_use", "id": tu.get("id") or "", "name": tu.get("name") or "",
+            "input": tu.get("input") or {}}
+
+
+def _tool_result_event(tu, content, is_error):
+    return {"type": "tool_result", "id": tu.get("id") or "", "name": tu.get("name") or "",
+            "content": content, "is_error": is_error}
+
+
+def _tool_result_block(tu, content, is_error):
+    return {"type": "tool_result", "tool_use_id": tu.get("id") or "",
+            "content": content, "is_error": is_error}
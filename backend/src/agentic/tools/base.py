@@ -20,6 +20,7 @@ class ToolContext:
     config: Dict[str, Any]
     variant: str = 'A'  # 'A' (user library) or 'B' (config-scoped)
     selected_file_ids: List[str] = field(default_factory=list)
+    session_id: Optional[str] = None  # chat session, for per-session usage accounting
 
 
 # name -> {"fn", "spec", "enabled_when"}
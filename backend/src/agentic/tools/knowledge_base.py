@@ -1,10 +1,12 @@
 """
 search_knowledge_base — vector search over the user's uploaded files.
 
-Mirrors the existing chat_routes pre_filter logic so agentic and non-agentic
-chats see the same chunks.
+Uses the same retrieval engine and context budget as the legacy chat
+path so agentic and non-agentic chats see the same chunks, and records the
+context tokens it returns against the chat session the same way.
 """
-from flask import current_app
+from src.retrieval.context_builder import budget_for, build_context
+from src.retrieval.engine import retrieve
 
 from .base import tool, ToolContext
 
@@ -44,40 +46,33 @@ def search_knowledge_base(inputs: dict, ctx: ToolContext) -> dict:
     except (TypeError, ValueError):
         top_k = 5
 
-    from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
-
-    vector_store = MongoDBAtlasVectorSearch(
-        collection=current_app.config['MONGO_DB']['vector_collection'],
-        embedding=current_app.config['EMBEDDINGS'],
-        index_name="vector",
+    docs = retrieve(
+        query,
+        config_id=ctx.config_id,
+        user_id=ctx.user_id,
+        variant=ctx.variant,
+        selected_file_ids=ctx.selected_file_ids,
+        k=top_k,
+        mode=(ctx.config or {}).get("retrieval_mode"),
+        rerank=bool((ctx.config or {}).get("rerank")),
     )
 
-    config_id_str = str(ctx.config_id)
-    is_authenticated = bool(ctx.user_id and ctx.user_id != "anonymous")
-
-    if ctx.variant == 'B':
-        pre_filter = {"config_id": config_id_str}
-    elif ctx.selected_file_ids and is_authenticated:
-        pre_filter = {"$or": [
-            {"config_id": config_id_str},
-            {"source_file_id": {"$in": [str(x) for x in ctx.selected_file_ids]}},
-        ]}
-    else:
-        config_ids = [config_id_str]
-        if is_authenticated:
-            config_ids.append(f"user:{ctx.user_id}")
-        pre_filter = {"config_id": {"$in": config_ids}}
-
-    docs = vector_store.similarity_search(query=query, k=top_k, pre_filter=pre_filter)
-
     if not docs:
         return {"content": "No matching passages in the knowledge base."}
 
+    # Adjacent chunks are stitched into one passage and the total is capped
+    # at the model's context budget.
+    blocks, stats = build_context(docs, budget_for((ctx.config or {}).get("model_name")))
+    if ctx.session_id:
+        # Imported here: src.chat.turn imports the agent runner, which loads this module.
+        from src.chat.turn import record_context_usage
+
+        record_context_usage(ctx.session_id, stats)
     parts = []
-    for i, d in enumerate(docs, 1):
-        meta = d.metadata or {}
+    for i, block in enumerate(blocks, 1):
+        meta = block["metadata"]
         src = meta.get('original_file') or meta.get('source_url') or meta.get('source') or 'unknown'
         slide = meta.get('slide_number')
         loc = f" (slide {slide})" if slide else ""
-        parts.append(f"[{i}] {src}{loc}\n{d.page_content}")
+        parts.append(f"[{i}] {src}{loc}\n{block['text']}")
     return {"content": "\n\n".join(parts)}
@@ -1,6 +1,8 @@
 """
 web_fetch — read a single URL via the shared fetch helper. Reuses the same
-safety check (private IPs, loopback, cloud metadata) as URL ingestion.
+safety check (private IPs, loopback, cloud metadata) as URL ingestion, and
+the same page cache (src/utils/web/page_cache.py), so a course link many
+students ask about is downloaded once per PAGE_CACHE_TTL_SECONDS.
 """
 from .base import tool, ToolContext
 
@@ -39,9 +41,10 @@ def web_fetch(inputs: dict, ctx: ToolContext) -> dict:
     if not url:
         return {"content": "URL is required.", "is_error": True}
 
-    from src.utils.web.fetch import fetch_url_as_documents, UnsafeURLError
+    from src.utils.web.fetch import UnsafeURLError
+    from src.utils.web.page_cache import fetch_documents
     try:
-        docs, title = fetch_url_as_documents(url)
+        docs, title = fetch_documents(url)
     except UnsafeURLError as e:
         return {"content": str(e), "is_error": True}
     except Exception as e:
@@ -1,5 +1,6 @@
 """
 web_search — Tavily-backed web search, gated on `web_access` and TAVILY_API_KEY.
+Results are cached briefly across users (src/utils/web/search.py).
 """
 import os
 
@@ -53,17 +54,16 @@ def web_search(inputs: dict, ctx: ToolContext) -> dict:
         return {"content": "Web search is not configured on this server.", "is_error": True}
 
     try:
-        from tavily import TavilyClient
+        import tavily  # noqa: F401
     except ImportError:
         return {"content": "tavily-python is not installed on the server.", "is_error": True}
 
+    from src.utils.web.search import search
     try:
-        client = TavilyClient(api_key=api_key)
-        resp = client.search(query=query, max_results=max_results, search_depth="basic")
+        results = search(query, max_results, api_key=api_key)
     except Exception as e:
         return {"content": f"Web search failed: {e}", "is_error": True}
 
-    results = (resp or {}).get("results") or []
     if not results:
         return {"content": "No web results."}
 
@@ -57,6 +57,20 @@ def get_mongo_db_connection(mongo_uri: str, db_name: str, collection_name: str):
         # For a Streamlit app, letting it fail loudly with st.stop() or raise is a good strategy.
         raise e
 
+def get_async_mongo_db(mongo_uri: str, db_name: str):
+    """AsyncMongoClient database for the ASGI chat service (asgi_chat.py).
+    Same read/write settings as get_mongo_db_connection; the client
+    connects lazily on first use, inside the service's event loop."""
+    mongo_client = pymongo.AsyncMongoClient(
+        mongo_uri,
+        serverSelectionTimeoutMS=5000,
+        readPreference="secondaryPreferred",
+        retryWrites=True,
+        w="majority",
+    )
+    return mongo_client, mongo_client[db_name]
+
+
 # --- CORRECTED CUSTOM CHAT MESSAGE HISTORY CLASS ---
 # This class now takes the connection_string as required by the base class.
 class MongoDbChatMessageHistory(MongoDBChatMessageHistory):
@@ -0,0 +1,8 @@
+"""
+Chat turns shared by the Flask chat route and the ASGI chat service.
+
+`turn.py` holds the pieces both serving paths need to stay in step:
+request parsing, model and prompt selection, usage resolution, message
+shaping, session identity fields and the sync history / context-usage
+steps. The routes own the HTTP and streaming side.
+"""
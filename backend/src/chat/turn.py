@@ -0,0 +1,392 @@
+"""
+Per-turn helpers for POST /api/chat/<config_id>/<chat_id>.
+
+Used by routes/chat_routes.py (Flask) and routes/chat_async.py (ASGI) so
+the two paths parse the same payload, pick the same model and prompt,
+meter the same identity and persist the same messages. Everything here
+is sync; the history and context-usage steps read the Mongo handle from
+the Flask app context (the ASGI service runs them on its worker-thread
+pool inside one).
+"""
+import logging
+import re
+import time
+
+from bson import ObjectId
+from flask import current_app
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+from src.agentic.agent_runner import FORMATTING_GUIDE
+from src.history import store as history_store
+from src.history import window as history_window
+from src.llm.clients import get_chat_model, openai_with_fallback
+from src.usage import limits as usage_limits
+
+logger = logging.getLogger(__name__)
+
+CHAT_CONFIG_PROJECTION = {
+    "model_name": 1, "temperature": 1, "prompt_template": 1,
+    "is_public": 1, "user_id": 1,
+    "web_access": 1, "bot_name": 1, "instructions": 1,
+    "class_code": 1, "usage_pool": 1, "is_playground": 1, "is_personal": 1,
+    "retrieval_mode": 1, "rerank": 1,
+}
+
+# Allowed template variables for the chat prompt - others are escaped to avoid LangChain errors
+ALLOWED_PROMPT_VARS = {"context", "history", "question"}
+
+
+# --- request ---------------------------------------------------------------------
+
+def parse_chat_payload(data):
+    """Request body of POST /chat/<config_id>/<chat_id> -> named fields."""
+    marketing_opt_in = data.get('marketing_opt_in')
+    return {
+        "user_input": data.get('input'),
+        "file_variant": data.get('variant', 'A'),
+        "selected_file_ids": data.get('selected_file_ids', []),
+        # Snapshot of file metadata the frontend showed as chips at send time;
+        # persisted on the user message so the chips survive a history reload.
+        "attached_files": data.get('attached_files', []) or [],
+        "images": data.get('images', []) or [],
+        "qualtrics_id": data.get('qualtrics_id') or None,
+        "student_label": data.get('student_label') or None,
+        "student_email": data.get('student_email') or None,
+        "marketing_opt_in": bool(marketing_opt_in) if marketing_opt_in is not None else None,
+        "model_override": (data.get('model_override') or '').strip(),
+    }
+
+
+def apply_model_override(config_doc, model_override):
+    """Per-message model override — only honored on free playground / personal
+    bots, never on a professor's class/standard bot."""
+    if (model_override
+            and model_override in usage_limits.ALLOWED_MODELS
+            and (config_doc.get("is_playground") or config_doc.get("is_personal"))):
+        return {**config_doc, "model_name": model_override}
+    return config_doc
+
+
+def is_agentic(config_doc):
+    """Claude bots with web_access run the tool-using agent."""
+    return bool(config_doc.get("web_access")) and (config_doc.get("model_name") or "").lower().startswith("claude")
+
+
+def resolve_usage(config_doc, metering_user, client_ip, device_id):
+    """-> (identity, pre-flight status). Fails open if the check errors."""
+    identity = usage_limits.resolve_identity(config_doc, metering_user, client_ip, device_id)
+    try:
+        pre = usage_limits.check(identity)
+    except Exception as e:
+        logger.error("usage check failed (fail-open): %s", e)
+        pre = {"status": "ok"}
+    return identity, pre
+
+
+def set_device_cookie(resp, signed_value, request):
+    """Attach the signed device-id cookie. SameSite=None+Secure for the
+    Qualtrics iframe (cross-site); Lax fallback on plain-http dev. Works
+    for Flask and Starlette requests/responses."""
+    if hasattr(request, "is_secure"):
+        secure = bool(request.is_secure)
+    else:
+        secure = request.url.scheme == "https"
+    resp.set_cookie(
+        usage_limits.DEVICE_COOKIE, signed_value,
+        max_age=usage_limits.DEVICE_COOKIE_MAX_AGE,
+        httponly=True, secure=secure, samesite="None" if secure else "Lax",
+    )
+
+
+# --- model + prompt --------------------------------------------------------------
+
+def _escape_prompt_variables(text: str) -> str:
+    """Escape {var} to {{var}} for any var not in ALLOWED_PROMPT_VARS, so LangChain treats them as literal."""
+    if not text:
+        return text
+    def replacer(m):
+        var = m.group(1)
+        return m.group(0) if var in ALLOWED_PROMPT_VARS else "{{" + var + "}}"
+    return re.sub(r"\{(\w+)\}", replacer, text)
+
+
+def legacy_prompt(config_doc):
+    """System + history + question template for the non-agentic chain."""
+    base_instruction = config_doc.get("prompt_template", "Answer based on context.")
+    # Escape any {var} in user prompt that isn't our template vars (context, history, question)
+    base_instruction = _escape_prompt_variables(base_instruction)
+
+    # IMPROVED SYSTEM PROMPT: Forces AI to look at history
+    system_message = f"""{base_instruction}
+
+    Use the provided Context (retrieved documents) and the Conversation History to answer.
+    If the user asks about previous messages, look at the History.
+
+    Context:
+    {{context}}
+    """ + _escape_prompt_variables(FORMATTING_GUIDE)
+
+    return ChatPromptTemplate.from_messages([
+        ("system", system_message),
+        MessagesPlaceholder(variable_name="history"),
+        ("human", "{question}")
+    ])
+
+
+def select_chat_llm(config_doc, app_config):
+    """Streaming chat model for the non-agentic chain, picked by the
+    config's model_name. `app_config` supplies the provider API keys."""
+    # -- DYNAMIC MODEL SELECTION --
+    model_name = config_doc.get("model_name", "gpt-4o")
+    temperature = config_doc.get("temperature", 0.7)
+    primary_openai_key = app_config.get("OPENAI_API_KEY")
+    fallback_openai_key = app_config.get("OPENAI_API_KEY_2")
+
+    # Clients come from the shared registry (src/llm/clients.py):
+    # one per model/key/params for the whole process, so a turn
+    # reuses a warm connection instead of opening a new one.
+    if model_name == "gpt-5-nano":
+        # CASE 1: GPT-5-Nano (gpt-4o w/o temperature)
+        llm = openai_with_fallback(
+            "gpt-5-nano", primary_openai_key, fallback_openai_key,
+            max_tokens=500, streaming=True,
+        )
+
+    elif model_name.lower().startswith("gemini"):
+        # CASE 2: Gemini Models (e.g., gemini-2.5-flash, gemini-2.5-pro)
+        llm = get_chat_model(
+            "google", model_name, app_config.get("GEMINI_API_KEY"),
+            temperature=temperature, streaming=True,
+        )
+    elif model_name.lower().startswith("qwen"):
+        # CASE 2: Qwen models (Use ChatTongyi)
+        llm = get_chat_model(
+            "tongyi", model_name, app_config.get("DASHSCOPE_API_KEY"),
+            temperature=temperature, streaming=True,
+        )
+
+    elif model_name.lower().startswith("deepseek"):
+        # CASE 3: DeepSeek models (Use ChatDeepSeek)
+        llm = get_chat_model(
+            "deepseek", model_name, app_config.get("DEEPSEEK_API_KEY"),
+            temperature=temperature, streaming=True,
+        )
+
+    elif model_name.lower().startswith("claude"):
+        # CASE 3b: Anthropic Claude models
+        llm = get_chat_model(
+            "anthropic", model_name, app_config.get("ANTHROPIC_API_KEY"),
+            temperature=temperature, max_tokens=500, streaming=True,
+        )
+
+    else:
+        # CASE 4: Standard OpenAI
+        llm = openai_with_fallback(
+            model_name, primary_openai_key, fallback_openai_key,
+            temperature=temperature, max_tokens=500, streaming=True,
+        )
+    return llm
+
+
+# --- messages --------------------------------------------------------------------
+
+def user_message(user_input, attached_files):
+    """Persisted HumanMessage. `attached_files` rides in additional_kwargs
+    so the file chips survive a history reload."""
+    kwargs = {"attached_files": attached_files} if attached_files else {}
+    return HumanMessage(content=user_input, additional_kwargs=kwargs)
+
+
+def to_anthropic_history(messages):
+    """Convert LangChain messages → Anthropic [{role, content}, ...].
+
+    For agentic AI messages we only feed the rendered text back to Claude on
+    follow-up turns — the tool_trace stays in MongoDB for frontend replay
+    but isn't replayed into the model context (saves tokens, avoids stale
+    tool-use IDs that would confuse the API).
+    """
+    out = []
+    for msg in messages:
+        if isinstance(msg, HumanMessage):
+            content = (msg.content or "").strip()
+            if content:
+                out.append({"role": "user", "content": content})
+        elif isinstance(msg, AIMessage):
+            content = (msg.content or "").strip()
+            if content:
+                out.append({"role": "assistant", "content": content})
+    return out
+
+
+def selected_files_context_note(selected_file_ids, user_id_for_history):
+    """Return a short bracketed note listing names of the user's selected
+    library files, or empty string if none. Prepended to the user input so
+    the agent recognizes that "this", "the document", etc. refer to files
+    it can read via search_knowledge_base.
+    """
+    if not selected_file_ids or user_id_for_history == "anonymous":
+        return ""
+    try:
+        oids = []
+        for fid in selected_file_ids:
+            try:
+                oids.append(ObjectId(str(fid)))
+            except Exception:
+                continue
+        if not oids:
+            return ""
+        files_col = current_app.config['MONGO_DB']['user_files']
+        names = []
+        for doc in files_col.find(
+            {"_id": {"$in": oids}, "user_id": user_id_for_history},
+            {"filename": 1, "source_url": 1, "is_url": 1},
+        ):
+            label = doc.get("filename") or doc.get("source_url") or "(untitled)"
+            if doc.get("is_url") and doc.get("source_url"):
+                label = f"{label} (URL: {doc['source_url']})"
+            names.append(f'"{label}"')
+        if not names:
+            return ""
+        listing = ", ".join(names)
+        return (
+            f"[System note: The user has selected the following file(s) "
+            f"from their library: {listing}. When they refer to \"this\", "
+            f"\"that\", \"the document\", \"the link\", etc., they almost "
+            f"certainly mean these. Use search_knowledge_base to read them.]\n\n"
+        )
+    except Exception as e:
+        logger.warning("Could not build selected-files context note: %s", e)
+        return ""
+
+
+def parse_image_blocks(images):
+    """Convert frontend dataUrl list to Anthropic image content blocks."""
+    blocks = []
+    for img in (images or []):
+        data_url = img.get('dataUrl', '')
+        if not data_url.startswith('data:'):
+            continue
+        try:
+            header, b64data = data_url.split(',', 1)
+            media_type = header.split(':')[1].split(';')[0]
+            if media_type not in ('image/jpeg', 'image/png', 'image/gif', 'image/webp'):
+                continue
+            blocks.append({
+                "type": "image",
+                "source": {"type": "base64", "media_type": media_type, "data": b64data},
+            })
+        except Exception:
+            continue
+    return blocks
+
+
+# --- session metadata ------------------------------------------------------------
+
+def title_prompt(text: str):
+    return [HumanMessage(content=(
+        "Generate a concise 4-6 word title that summarises this chat opening message. "
+        "Return only the title, no quotes, no trailing punctuation.\n\n" + text[:300]
+    ))]
+
+
+def title_model():
+    return get_chat_model("openai", "gpt-4o-mini", None, max_tokens=20, temperature=0.3)
+
+
+def fallback_chat_title(text: str) -> str:
+    """First ~55 characters of the message, cut on a word boundary."""
+    words = text.split()
+    title, length = "", 0
+    for w in words:
+        if length + len(w) + 1 > 55:
+            break
+        title = (title + " " + w).strip()
+        length += len(w) + 1
+    return title or text[:55]
+
+
+def generate_chat_title(text: str) -> str:
+    """Return a 4-6 word summary title for the given user message."""
+    try:
+        result = title_model().invoke(title_prompt(text))
+        return result.content.strip()
+    except Exception:
+        return fallback_chat_title(text)
+
+
+def session_identity_fields(qualtrics_id, student_label, student_email, marketing_opt_in) -> dict:
+    """Survey / student identity fields recorded on chat_session_metadata."""
+    fields = {}
+    if qualtrics_id:
+        fields["qualtrics_id"] = qualtrics_id
+    if student_label:
+        fields["student_label"] = student_label
+    if student_email:
+        fields["student_email"] = student_email
+    if marketing_opt_in is not None:
+        fields["marketing_opt_in"] = marketing_opt_in
+    return fields
+
+
+def potential_user_upsert(student_email, student_label, marketing_opt_in):
+    """(filter, update) for the potential_users upsert on a session's first message."""
+    return (
+        {"email": student_email},
+        {"$set": {
+            "email": student_email,
+            "name": student_label or "",
+            "marketing_opt_in": marketing_opt_in if marketing_opt_in is not None else True,
+            "last_seen": time.time(),
+        }, "$setOnInsert": {"first_seen": time.time()}},
+    )
+
+
+# --- history + context usage (app context) ---------------------------------------
+
+def load_history(session_id, model_name):
+    """Prompt history for a turn: recent messages verbatim plus the cached
+    summary of older ones, within the model's history budget
+    (src/history/window.py)."""
+    messages, stats = history_window.load(current_app.config['MONGO_DB'], session_id, model_name)
+    if stats["messages"]:
+        logger.info(
+            "History | session=%s messages=%d read=%d sent=%d summarized=%d dropped=%d tokens=%d budget=%d",
+            session_id, stats["messages"], stats["read"], stats["sent"], stats["summarized"],
+            stats["dropped"], stats["tokens"], stats["budget"],
+        )
+    return messages
+
+
+def refresh_history_summary(session_id):
+    """Background step after a persisted turn: fold aged-out messages into
+    the session's rolling summary."""
+    history_window.refresh_summary(current_app.config['MONGO_DB'], session_id)
+
+
+def append_history(session_id, messages):
+    history_store.append(current_app.config['MONGO_DB'], session_id, messages)
+
+
+def migrate_history(session_id):
+    """Move a legacy session into buckets (the async path runs this off the loop)."""
+    return history_store.migrate_session(current_app.config['MONGO_DB'], session_id)
+
+
+def record_context_usage(session_id, stats):
+    """Log and accumulate the retrieved-context tokens a turn actually sent."""
+    logger.info(
+        "Context | session=%s chunks=%d blocks=%d tokens=%d budget=%d truncated=%d dropped=%d",
+        session_id, stats["chunks"], stats["blocks"], stats["tokens"], stats["budget"],
+        stats["truncated"], stats["dropped"],
+    )
+    try:
+        current_app.config['MONGO_DB']["chat_session_metadata"].update_one(
+            {"session_id": session_id},
+            {
+                "$inc": {"context_tokens_total": stats["tokens"], "context_turns": 1},
+                "$set": {"last_context_tokens": stats["tokens"]},
+            },
+        )
+    except Exception as e:
+        logger.warning("Failed to record context usage | session=%s err=%s", session_id, e)
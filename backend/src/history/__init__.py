@@ -0,0 +1,8 @@
+"""
+Conversation history for chat turns.
+
+`window.py` decides what a turn sends to the model: the last few turns
+verbatim plus a rolling summary of everything older, cached on
+chat_session_metadata, inside a per-model token budget — and reads only
+the messages that can make it into the prompt.
+"""
@@ -0,0 +1,295 @@
+"""
+Bucketed chat-history storage.
+
+MongoDBChatMessageHistory's layout — one chat_histories document per
+message, the message JSON-encoded into a `History` string — made every
+read scan and `json.loads` a session message by message, and every
+session list `$lookup` the whole collection per session. Here a session's
+messages live in chat_history_buckets as native BSON arrays:
+
+    {session_id, seq, messages: [{pos, **message_to_dict(m)}, ...], created_at, updated_at}
+
+HISTORY_BUCKET_SIZE (100) messages per bucket, bucket `seq` holding
+positions seq*SIZE .. (seq+1)*SIZE-1, under a unique (session_id, seq)
+index — any range of a session is one indexed fetch of one or two
+buckets. chat_session_metadata keeps `message_count` and
+`first_message` (the opening user message, for session lists), so
+listings read metadata alone.
+
+An append reserves its positions with `$inc` on `message_count` and then
+`$push`es each message tagged with its `pos`. Reads place messages by
+`pos`, not by array index: two racing appends may push in either order,
+and an append whose bucket write fails after the reservation leaves a gap
+at its positions rather than shifting every later read.
+
+A session whose metadata has no `message_count` is still in the legacy
+collection: reads fall back to it, and the first append migrates it
+(`migrate_session`, also what scripts/migrate_chat_history.py runs in
+bulk). Legacy documents are left in place unless the migration is asked
+to drop them.
+
+Settings:
+    HISTORY_BUCKET_SIZE     messages per bucket document (100)
+"""
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+BUCKET_COLLECTION = "chat_history_buckets"
+LEGACY_COLLECTION = "chat_histories"
+METADATA_COLLECTION = "chat_session_metadata"
+
+HISTORY_BUCKET_SIZE = int(os.getenv("HISTORY_BUCKET_SIZE", "100"))
+FIRST_MESSAGE_CHARS = 300
+
+
+# --- pure helpers ----------------------------------------------------------------
+
+def _text(content) -> str:
+    if isinstance(content, list):
+        content = " ".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return content or ""
+
+
+def first_message(dicts: Sequence[Dict[str, Any]]) -> Optional[str]:
+    """Opening user message (stored dict form), clipped for session lists."""
+    for d in dicts:
+        if d.get("type") == "human":
+            return _text((d.get("data") or {}).get("content"))[:FIRST_MESSAGE_CHARS]
+    return None
+
+
+def _bucket_writes(dicts: Sequence[Dict[str, Any]], start: int) -> List[Tuple[int, List[Dict[str, Any]]]]:
+    """Messages stored from position `start` on → [(seq, messages), ...],
+    each message tagged with its `pos`."""
+    writes: List[Tuple[int, List[Dict[str, Any]]]] = []
+    for offset, d in enumerate(dicts):
+        pos = start + offset
+        seq = pos // HISTORY_BUCKET_SIZE
+        if not writes or writes[-1][0] != seq:
+            writes.append((seq, []))
+        writes[-1][1].append({"pos": pos, **d})
+    return writes
+
+
+def _bucket_query(session_id: str, start: int, stop: Optional[int]) -> Dict[str, Any]:
+    seq = {"$gte": start // HISTORY_BUCKET_SIZE}
+    if stop is not None:
+        seq["$lte"] = max(stop - 1, 0) // HISTORY_BUCKET_SIZE
+    return {"session_id": session_id, "seq": seq}
+
+
+def _slice(buckets, start: int, stop: Optional[int]) -> List[Dict[str, Any]]:
+    """Messages at positions [start, stop) in position order. Messages
+    written without `pos` sit at their array index."""
+    placed: Dict[int, Dict[str, Any]] = {}
+    for b in buckets:
+        base = b["seq"] * HISTORY_BUCKET_SIZE
+        for i, d in enumerate(b.get("messages") or []):
+            d = dict(d)
+            pos = d.pop("pos", base + i)
+            if pos >= start and (stop is None or pos < stop):
+                placed.setdefault(pos, d)
+    return [placed[pos] for pos in sorted(placed)]
+
+
+def _is_bucketed(meta: Optional[Dict[str, Any]]) -> bool:
+    return meta is not None and "message_count" in meta
+
+
+def _meta_projection(extra: Sequence[str] = ()) -> Dict[str, int]:
+    projection = {"message_count": 1, "_id": 0}
+    projection.update({field: 1 for field in extra})
+    return projection
+
+
+def _push(items: List[Dict[str, Any]], now: float) -> Dict[str, Any]:
+    return {
+        "$push": {"messages": {"$each": items}},
+        "$set": {"updated_at": now},
+        "$setOnInsert": {"created_at": now},
+    }
+
+
+def _bucket_doc(session_id: str, seq: int, items: List[Dict[str, Any]], now: float) -> Dict[str, Any]:
+    return {"session_id": session_id, "seq": seq, "messages": items, "created_at": now, "updated_at": now}
+
+
+def decode(dicts: Sequence[Dict[str, Any]]) -> List[BaseMessage]:
+    return messages_from_dict(list(dicts))
+
+
+# --- sync API --------------------------------------------------------------------
+
+def session_meta(db, session_id: str, extra: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+    """The session's metadata fields this module needs (+ `extra`)."""
+    return db[METADATA_COLLECTION].find_one({"session_id": session_id}, _meta_projection(extra))
+
+
+def message_count(db, session_id: str, meta: Optional[Dict[str, Any]] = None) -> int:
+    meta = session_meta(db, session_id) if meta is None else meta
+    if _is_bucketed(meta):
+        return int(meta["message_count"])
+    return db[LEGACY_COLLECTION].count_documents({"SessionId": session_id})
+
+
+def read_dicts(db, session_id: str, start: int = 0, stop: Optional[int] = None,
+               meta: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Stored messages [start, stop) in message_to_dict form."""
+    meta = session_meta(db, session_id) if meta is None else meta
+    if _is_bucketed(meta):
+        buckets = db[BUCKET_COLLECTION].find(_bucket_query(session_id, start, stop)).sort("seq", ASCENDING)
+        return _slice(buckets, start, stop)
+    cursor = db[LEGACY_COLLECTION].find({"SessionId": session_id}).sort("_id", ASCENDING).skip(start)
+    if stop is not None:
+        cursor = cursor.limit(max(stop - start, 0))
+    return [json.loads(d["History"]) for d in cursor]
+
+
+def read(db, session_id: str, start: int = 0, stop: Optional[int] = None,
+         meta: Optional[Dict[str, Any]] = None) -> List[BaseMessage]:
+    return decode(read_dicts(db, session_id, start, stop, meta))
+
+
+def migrate_session(db, session_id: str, drop_legacy: bool = False) -> int:
+    """Copy a session's legacy messages into buckets and start maintaining
+    its counters. Idempotent, and never clobbers a bucket an append has
+    already written to. Returns the session's message count."""
+    dicts = [json.loads(d["History"]) for d in
+             db[LEGACY_COLLECTION].find({"SessionId": session_id}).sort("_id", ASCENDING)]
+    now = time.time()
+    for seq, items in _bucket_writes(dicts, 0):
+        db[BUCKET_COLLECTION].update_one(
+            {"session_id": session_id, "seq": seq},
+            {"$setOnInsert": _bucket_doc(session_id, seq, items, now)},
+            upsert=True,
+        )
+    fields = {"message_count": len(dicts)}
+    first = first_message(dicts)
+    if first:
+        fields["first_message"] = first
+    db[METADATA_COLLECTION].update_one(
+        {"session_id": session_id, "message_count": {"$exists": False}}, {"$set": fields},
+    )
+    if drop_legacy and dicts:
+        db[LEGACY_COLLECTION].delete_many({"SessionId": session_id})
+    return len(dicts)
+
+
+def _reserve(db, session_id: str, n: int) -> Optional[Dict[str, Any]]:
+    return db[METADATA_COLLECTION].find_one_and_update(
+        {"session_id": session_id, "message_count": {"$exists": True}},
+        {"$inc": {"message_count": n}},
+        projection=_meta_projection(["first_message"]),
+        return_document=ReturnDocument.BEFORE,
+    )
+
+
+def append(db, session_id: str, messages: Sequence[BaseMessage]) -> int:
+    """Append messages to the session; returns the position of the first."""
+    dicts = [message_to_dict(m) for m in messages]
+    if not dicts:
+        return message_count(db, session_id)
+    before = _reserve(db, session_id, len(dicts))
+    if before is None:
+        # Legacy session (or no metadata doc yet): migrate, then reserve.
+        if db[METADATA_COLLECTION].count_documents({"session_id": session_id}, limit=1):
+            migrate_session(db, session_id)
+        else:
+            db[METADATA_COLLECTION].update_one({"session_id": session_id},
+                                               {"$setOnInsert": {"message_count": 0}}, upsert=True)
+        before = _reserve(db, session_id, len(dicts))
+    start = int(before["message_count"])
+
+    now = time.time()
+    for seq, items in _bucket_writes(dicts, start):
+        db[BUCKET_COLLECTION].update_one({"session_id": session_id, "seq": seq}, _push(items, now), upsert=True)
+    if not before.get("first_message"):
+        first = first_message(dicts)
+        if first:
+            db[METADATA_COLLECTION].update_one(
+                {"session_id": session_id, "first_message": {"$exists": False}},
+                {"$set": {"first_message": first}},
+            )
+    return start
+
+
+def delete_sessions(db, session_ids: Sequence[str]) -> int:
+    """Drop the stored messages of these sessions (buckets and legacy docs).
+    Returns the number of documents removed."""
+    if not session_ids:
+        return 0
+    session_ids = list(session_ids)
+    removed = db[BUCKET_COLLECTION].delete_many({"session_id": {"$in": session_ids}}).deleted_count
+    removed += db[LEGACY_COLLECTION].delete_many({"SessionId": {"$in": session_ids}}).deleted_count
+    return removed
+
+
+# --- async API (pymongo AsyncMongoClient) -------------------------------------
+
+async def asession_meta(db, session_id: str, extra: Sequence[str] = ()) -> Optional[Dict[str, Any]]:
+    return await db[METADATA_COLLECTION].find_one({"session_id": session_id}, _meta_projection(extra))
+
+
+async def amessage_count(db, session_id: str, meta: Optional[Dict[str, Any]] = None) -> int:
+    meta = await asession_meta(db, session_id) if meta is None else meta
+    if _is_bucketed(meta):
+        return int(meta["message_count"])
+    return await db[LEGACY_COLLECTION].count_documents({"SessionId": session_id})
+
+
+async def aread(db, session_id: str, start: int = 0, stop: Optional[int] = None,
+                meta: Optional[Dict[str, Any]] = None) -> List[BaseMessage]:
+    meta = await asession_meta(db, session_id) if meta is None else meta
+    if _is_bucketed(meta):
+        cursor = db[BUCKET_COLLECTION].find(_bucket_query(session_id, start, stop)).sort("seq", ASCENDING)
+        return decode(_slice([b async for b in cursor], start, stop))
+    cursor = db[LEGACY_COLLECTION].find({"SessionId": session_id}).sort("_id", ASCENDING).skip(start)
+    if stop is not None:
+        cursor = cursor.limit(max(stop - start, 0))
+    return decode([json.loads(d["History"]) async for d in cursor])
+
+
+async def aappend(db, session_id: str, messages: Sequence[BaseMessage], *, migrate) -> int:
+    """append() for the async service. A legacy session is migrated by
+    awaiting `migrate(session_id)` — migrate_session run off the loop."""
+    dicts = [message_to_dict(m) for m in messages]
+    metadata = db[METADATA_COLLECTION]
+    if not dicts:
+        return await amessage_count(db, session_id)
+
+    def reserve():
+        return metadata.find_one_and_update(
+            {"session_id": session_id, "message_count": {"$exists": True}},
+            {"$inc": {"message_count": len(dicts)}},
+            projection=_meta_projection(["first_message"]),
+            return_document=ReturnDocument.BEFORE,
+        )
+
+    before = await reserve()
+    if before is None:
+        if await metadata.count_documents({"session_id": session_id}, limit=1):
+            await migrate(session_id)
+        else:
+            await metadata.update_one({"session_id": session_id},
+                                      {"$setOnInsert": {"message_count": 0}}, upsert=True)
+        before = await reserve()
+    start = int(before["message_count"])
+
+    now = time.time()
+    for seq, items in _bucket_writes(dicts, start):
+        await db[BUCKET_COLLECTION].update_one({"session_id": session_id, "seq": seq},
+                                               _push(items, now), upsert=True)
+    if not before.get("first_message"):
+        first = first_message(dicts)
+        if first:
+            await metadata.update_one({"session_id": session_id, "first_message": {"$exists": False}},
+                                      {"$set": {"first_message": first}})
+    return start
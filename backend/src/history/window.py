@@ -0,0 +1,232 @@
+"""
+Sliding-window + summary history for chat prompts.
+
+Chat turns used to send every stored message of a session to the model,
+so a semester-long tutoring chat paid for hundreds of old messages on
+each turn. Here a turn gets:
+
+  1. the session's rolling summary (`history_summary` on
+     chat_session_metadata) — covers the first `covers` stored messages;
+  2. the newer messages verbatim, newest first, until the model's history
+     token budget runs out (at least the last message is always kept),
+     trimmed so the window starts on a user turn.
+
+`load()` / `aload()` read the session's metadata (message count +
+summary) and then only the messages the summary doesn't cover yet
+(src/history/store.py — a range of buckets), at most HISTORY_READ_WINDOWS
+recent windows of them. Once refreshes keep up that is about
+2 * HISTORY_RECENT_TURNS messages, usually one bucket fetch.
+`refresh_summary()` runs after a turn (off the critical path): once at
+least HISTORY_SUMMARY_MIN_NEW messages have aged out of the recent window
+it folds the oldest of them, at most HISTORY_SUMMARY_MAX_FOLD per call,
+into the cached summary with a cheap model, guarded by the `covers` it
+started from so two concurrent refreshes can't both write.
+
+Until refreshes catch up — a long session stored before summaries existed
+takes a few turns — messages older than the summary but inside the read
+cap are sent verbatim if the budget allows; older ones are left out.
+
+Settings:
+    HISTORY_RECENT_TURNS        turns (user + assistant) kept verbatim (6)
+    HISTORY_TOKEN_BUDGET        default history budget in tokens (3000)
+    HISTORY_READ_WINDOWS        cap on messages read per turn, in recent windows (4)
+    HISTORY_SUMMARY_MIN_NEW     aged-out messages that trigger a refresh (4)
+    HISTORY_SUMMARY_MAX_FOLD    messages one refresh folds into the summary (40)
+    HISTORY_SUMMARY_MAX_TOKENS  summary length cap (400)
+    HISTORY_SUMMARY_MODEL       OpenAI model that writes the summary (gpt-4o-mini)
+"""
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import BaseMessage, HumanMessage
+
+from src.history import store
+from src.utils.vector_stores.embed_pipeline import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+HISTORY_RECENT_TURNS = int(os.getenv("HISTORY_RECENT_TURNS", "6"))
+DEFAULT_HISTORY_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "3000"))
+HISTORY_READ_WINDOWS = int(os.getenv("HISTORY_READ_WINDOWS", "4"))
+HISTORY_SUMMARY_MIN_NEW = int(os.getenv("HISTORY_SUMMARY_MIN_NEW", "4"))
+# 40 messages clipped to SUMMARY_INPUT_CHARS stay ~20k tokens of prompt.
+HISTORY_SUMMARY_MAX_FOLD = int(os.getenv("HISTORY_SUMMARY_MAX_FOLD", "40"))
+HISTORY_SUMMARY_MAX_TOKENS = int(os.getenv("HISTORY_SUMMARY_MAX_TOKENS", "400"))
+HISTORY_SUMMARY_MODEL = os.getenv("HISTORY_SUMMARY_MODEL", "gpt-4o-mini")
+# Prefix match on model_name, longest prefix wins (as MODEL_CONTEXT_BUDGETS).
+MODEL_HISTORY_BUDGETS = {
+    "claude-sonnet": 2500,
+    "claude-opus": 2500,
+    "gpt-4.1": 2500,
+    "gpt-4o": 2500,
+    "gpt-4-turbo": 2500,
+    "gemini-2.5-pro": 2500,
+    "gpt-4o-mini": 4000,
+    "gpt-5-nano": 4000,
+    "claude-haiku": 4000,
+    "gemini-2.5-flash": 4000,
+    "deepseek": 4000,
+    "qwen": 4000,
+}
+# Per-message overhead (role, separators) on top of the content estimate.
+MESSAGE_OVERHEAD_TOKENS = 4
+# A stored message is clipped to this many characters in the summarizer's input.
+SUMMARY_INPUT_CHARS = 2000
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+
+
+def history_budget_for(model_name: Optional[str]) -> int:
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in MODEL_HISTORY_BUDGETS if name.startswith(prefix)]
+    return MODEL_HISTORY_BUDGETS[max(matches, key=len)] if matches else DEFAULT_HISTORY_BUDGET
+
+
+def recent_limit() -> int:
+    """Messages kept verbatim once a summary has caught up."""
+    return 2 * HISTORY_RECENT_TURNS
+
+
+def _text(message: BaseMessage) -> str:
+    content = message.content
+    if isinstance(content, list):
+        content = " ".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return content or ""
+
+
+def message_tokens(message: BaseMessage) -> int:
+    return estimate_tokens(_text(message)) + MESSAGE_OVERHEAD_TOKENS
+
+
+def summary_message(text: str) -> HumanMessage:
+    """The cached summary as the first history message. A user turn rather
+    than a system message: Anthropic only accepts a system prompt up front."""
+    return HumanMessage(content=SUMMARY_PREFIX + text, additional_kwargs={"history_summary": True})
+
+
+def fit(messages: Sequence[BaseMessage], first_index: int, summary: Optional[Dict[str, Any]],
+        budget_tokens: int, total: int) -> Tuple[List[BaseMessage], Dict[str, int]]:
+    """The newest stored messages (oldest first; `messages[0]` is stored
+    message number `first_index`) → (prompt history, stats)."""
+    summary = summary or {}
+    covered = min(int(summary.get("covers") or 0), total)
+    summary_text = (summary.get("text") or "").strip() if covered else ""
+    candidates = list(messages[max(0, covered - first_index):])
+
+    prefix = [summary_message(summary_text)] if summary_text else []
+    used = sum(message_tokens(m) for m in prefix)
+    kept: List[BaseMessage] = []
+    for message in reversed(candidates):
+        cost = message_tokens(message)
+        if kept and used + cost > budget_tokens:
+            break
+        kept.append(message)
+        used += cost
+    kept.reverse()
+    # A window that opens on an assistant reply reads as a non-sequitur.
+    while len(kept) > 1 and not isinstance(kept[0], HumanMessage):
+        used -= message_tokens(kept.pop(0))
+
+    stats = {
+        "messages": total,
+        "read": len(messages),
+        "sent": len(kept),
+        "summarized": covered if summary_text else 0,
+        "dropped": total - len(kept) - (covered if summary_text else 0),
+        "tokens": used,
+        "budget": budget_tokens,
+    }
+    return prefix + kept, stats
+
+
+def _read_limit(total: int, summary: Optional[Dict[str, Any]]) -> int:
+    """Everything after the summary, up to HISTORY_READ_WINDOWS recent
+    windows; `fit()` bounds what is sent."""
+    covered = int((summary or {}).get("covers") or 0)
+    return max(0, min(total - covered, HISTORY_READ_WINDOWS * recent_limit()))
+
+
+def load(db, session_id: str, model_name: Optional[str]) -> Tuple[List[BaseMessage], Dict[str, int]]:
+    """Prompt history for a turn of `session_id`, read with bounded queries."""
+    meta = store.session_meta(db, session_id, ["history_summary"])
+    total = store.message_count(db, session_id, meta)
+    summary = (meta or {}).get("history_summary")
+    start = total - _read_limit(total, summary)
+    messages = store.read(db, session_id, start, total, meta) if start < total else []
+    return fit(messages, start, summary, history_budget_for(model_name), total)
+
+
+async def aload(db, session_id: str, model_name: Optional[str]) -> Tuple[List[BaseMessage], Dict[str, int]]:
+    """load() over pymongo's AsyncMongoClient."""
+    meta = await store.asession_meta(db, session_id, ["history_summary"])
+    total = await store.amessage_count(db, session_id, meta)
+    summary = (meta or {}).get("history_summary")
+    start = total - _read_limit(total, summary)
+    messages = await store.aread(db, session_id, start, total, meta) if start < total else []
+    return fit(messages, start, summary, history_budget_for(model_name), total)
+
+
+# --- rolling summary -----------------------------------------------------------
+
+def _transcript(messages: Sequence[BaseMessage]) -> str:
+    lines = []
+    for message in messages:
+        role = "Student" if isinstance(message, HumanMessage) else "Assistant"
+        text = " ".join(_text(message).split())
+        if len(text) > SUMMARY_INPUT_CHARS:
+            text = text[:SUMMARY_INPUT_CHARS] + " …"
+        lines.append(f"{role}: {text}")
+    return "\n".join(lines)
+
+
+def summarize(previous: str, messages: Sequence[BaseMessage]) -> str:
+    """Fold `messages` into `previous` (may be empty) with the summary model."""
+    from src.llm.clients import get_chat_model
+
+    words = int(HISTORY_SUMMARY_MAX_TOKENS * 0.7)
+    prompt = (
+        "You maintain the running summary of a tutoring chat between a student and an assistant. "
+        "Update the summary so it also covers the new messages. Keep what later turns may need: "
+        "the student's goals and level, topics and documents discussed, answers and decisions "
+        "already given, and open questions. Drop small talk. Write plain prose, at most "
+        f"{words} words. Return only the summary.\n\n"
+        f"Current summary:\n{previous or '(none)'}\n\nNew messages:\n{_transcript(messages)}"
+    )
+    model = get_chat_model("openai", HISTORY_SUMMARY_MODEL, None,
+                           max_tokens=HISTORY_SUMMARY_MAX_TOKENS, temperature=0)
+    return model.invoke([HumanMessage(content=prompt)]).content.strip()
+
+
+def refresh_summary(db, session_id: str, summarizer=summarize) -> Optional[Dict[str, Any]]:
+    """Fold messages that have aged out of the recent window into the
+    session's cached summary, the oldest HISTORY_SUMMARY_MAX_FOLD at a time;
+    later refreshes fold the rest. Returns the new summary doc, or None when
+    there wasn't enough new to summarize (or another refresh won)."""
+    meta = store.session_meta(db, session_id, ["history_summary"])
+    if meta is None:
+        return None
+    cutoff = store.message_count(db, session_id, meta) - recent_limit()
+    summary = meta.get("history_summary") or {}
+    covered = int(summary.get("covers") or 0)
+    if cutoff - covered < HISTORY_SUMMARY_MIN_NEW:
+        return None
+    cutoff = min(cutoff, covered + HISTORY_SUMMARY_MAX_FOLD)
+
+    started = time.perf_counter()
+    text = summarizer(summary.get("text") or "", store.read(db, session_id, covered, cutoff, meta))
+    doc = {
+        "text": text,
+        "covers": cutoff,
+        "tokens": estimate_tokens(text),
+        "updated_at": time.time(),
+    }
+    guard = {"history_summary.covers": covered} if summary else {"history_summary": {"$exists": False}}
+    result = db[store.METADATA_COLLECTION].update_one({"session_id": session_id, **guard},
+                                                      {"$set": {"history_summary": doc}})
+    if not result.modified_count:
+        logger.info("History summary SKIPPED (concurrent refresh) | session=%s", session_id)
+        return None
+    logger.info("History summary OK | session=%s covers=%d new=%d tokens=%d secs=%.2f",
+                session_id, cutoff, cutoff - covered, doc["tokens"], time.perf_counter() - started)
+    return doc
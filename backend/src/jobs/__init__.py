@@ -0,0 +1,7 @@
+"""
+Durable background jobs.
+
+`queue.py` is the Mongo-backed queue (enqueue / claim with a lease /
+heartbeat / retry with backoff), `worker.py` the process that drains it and
+`handlers.py` the job kinds. See worker.py for how to run workers.
+"""
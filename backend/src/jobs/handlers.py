@@ -0,0 +1,80 @@
+"""
+Job kinds. Importing this module registers them (Worker.start does).
+
+The implementations stay next to the code that enqueues them; handlers
+import them lazily so the queue/worker modules don't pull in the routes.
+"""
+import os
+
+from flask import current_app
+
+from src.jobs.queue import handler
+
+
+def _upload_ingest_dead(payload, error):
+    from routes.user_files import _fail_async_ingest
+
+    _fail_async_ingest(payload, error)
+
+
+@handler("upload_ingest", on_dead=_upload_ingest_dead)
+def upload_ingest(payload, job):
+    """Library upload: OCR / deferred embedding (routes/user_files.py)."""
+    from routes.user_files import _run_async_ingest
+
+    _run_async_ingest(**payload, attempt=job["attempts"])
+
+
+def _url_ingest_dead(payload, error):
+    from routes.user_files import _fail_url_ingest
+
+    _fail_url_ingest(payload, error)
+
+
+@handler("url_ingest", on_dead=_url_ingest_dead)
+def url_ingest(payload, job):
+    """Bulk URL ingest: concurrent conditional fetch → diff → embed
+    (routes/user_files.py)."""
+    from routes.user_files import _run_url_ingest
+
+    _run_url_ingest(**payload, attempt=job["attempts"])
+
+
+@handler("direct_upload_sweep")
+def direct_upload_sweep(payload, job):
+    """Delete direct uploads that were never confirmed (routes/user_files.py)."""
+    from routes.user_files import _sweep_abandoned_uploads
+
+    _sweep_abandoned_uploads(current_app.config['MONGO_DB'])
+
+
+def _video_pipeline_dead(payload, error):
+    from src.video.pipeline import mark_pipeline_failed
+
+    mark_pipeline_failed(payload["submission_id"], payload["job_id"], error)
+
+
+@handler("video_pipeline", on_dead=_video_pipeline_dead)
+def video_pipeline(payload, job):
+    """Video submission analysis (src/video/pipeline.py)."""
+    from src.video.pipeline import _run_video_pipeline
+
+    _run_video_pipeline(current_app._get_current_object(), payload["submission_id"], payload["job_id"])
+
+
+def _ocr_batch_tick_dead(payload, error):
+    from src.ocr.batching import OCR_BATCH_POLL_SECONDS, ensure_tick
+
+    # The tick re-arms itself; a dead one would stop batching for every upload.
+    ensure_tick(current_app.config['MONGO_DB'], delay_seconds=OCR_BATCH_POLL_SECONDS)
+
+
+@handler("ocr_batch_tick", on_dead=_ocr_batch_tick_dead)
+def ocr_batch_tick(payload, job):
+    """Shared OCR Message Batch: submit pending windows, poll open batches
+    (src/ocr/batching.py)."""
+    from src.llm.clients import anthropic_client
+    from src.ocr.batching import tick
+
+    api_key = current_app.config.get("ANTHROPIC_API_KEY") or os.environ.get("ANTHROPIC_API_KEY")
+    tick(current_app.config['MONGO_DB'], anthropic_client(api_key))
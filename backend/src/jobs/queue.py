@@ -0,0 +1,181 @@
+"""
+Mongo-backed work queue with leases.
+
+A job is one document in `job_queue`:
+
+    {kind, payload, status, attempts, max_attempts, run_at,
+     lease_owner, lease_expires_at, last_error, created_at, updated_at}
+
+status: queued → running → done, or back to queued (retry, `run_at` pushed
+out with exponential backoff) until `max_attempts`, then dead.
+
+A worker claims a job atomically (find_one_and_update) and holds it for
+JOB_LEASE_SECONDS, extending the lease with `heartbeat` while it works. A
+running job whose lease has expired — its worker crashed, was redeployed or
+lost the database — is claimable again, so restarts resume unfinished jobs
+instead of stranding them. Handlers must therefore be safe to re-run.
+
+Payloads must be plain BSON (ids as strings, no Documents / file handles).
+"""
+import logging
+import os
+import random
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from pymongo import ASCENDING, ReturnDocument
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUE_COLLECTION = "job_queue"
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "120"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "30"))
+JOB_RETRY_MAX_SECONDS = float(os.getenv("JOB_RETRY_MAX_SECONDS", "1800"))
+
+QUEUED, RUNNING, DONE, DEAD = "queued", "running", "done", "dead"
+
+# kind -> {"fn", "on_dead"}. Populated by @handler in src/jobs/handlers.py.
+HANDLERS: Dict[str, Dict[str, Callable]] = {}
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (bad input, nothing to
+    extract). The job goes straight to dead."""
+
+
+def handler(kind: str, on_dead: Optional[Callable[[Dict[str, Any], str], None]] = None):
+    """Register `fn(payload, job)` as the handler for `kind`.
+
+    `on_dead(payload, error)` runs (inside the app context) once the job is
+    out of attempts, to mark whatever the user is watching as failed.
+    """
+    def wrap(fn):
+        if kind in HANDLERS:
+            raise ValueError(f"Job kind collision: '{kind}' is already registered by "
+                             f"{HANDLERS[kind]['fn'].__module__}")
+        HANDLERS[kind] = {"fn": fn, "on_dead": on_dead}
+        return fn
+
+    return wrap
+
+
+def ensure_indexes(db) -> None:
+    col = db[JOB_QUEUE_COLLECTION]
+    col.create_index([("status", ASCENDING), ("run_at", ASCENDING)], name="status_run_at")
+    col.create_index([("status", ASCENDING), ("lease_expires_at", ASCENDING)], name="status_lease")
+
+
+def enqueue(db, kind: str, payload: Dict[str, Any], *, max_attempts: int = JOB_MAX_ATTEMPTS,
+            delay_seconds: float = 0) -> str:
+    now = time.time()
+    result = db[JOB_QUEUE_COLLECTION].insert_one({
+        "kind": kind,
+        "payload": payload,
+        "status": QUEUED,
+        "attempts": 0,
+        "max_attempts": max_attempts,
+        "run_at": now + delay_seconds,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": None,
+        "created_at": now,
+        "updated_at": now,
+    })
+    logger.info("Job ENQUEUED | kind=%s job=%s", kind, result.inserted_id)
+    return str(result.inserted_id)
+
+
+def enqueue_once(db, kind: str, payload: Dict[str, Any], *, delay_seconds: float = 0) -> bool:
+    """Enqueue unless a job of `kind` is already queued — for periodic
+    singleton jobs (pollers) that re-arm themselves. A running one doesn't
+    count, so a job can schedule its own next run. Two racing callers may
+    both insert; singleton handlers must tolerate an occasional twin.
+    Returns True if a job was added."""
+    if db[JOB_QUEUE_COLLECTION].find_one({"kind": kind, "status": QUEUED}, {"_id": 1}):
+        return False
+    enqueue(db, kind, payload, delay_seconds=delay_seconds)
+    return True
+
+
+def claim(db, worker_id: str, kinds: Optional[Iterable[str]] = None,
+          lease_seconds: float = JOB_LEASE_SECONDS,
+          exclude_kinds: Optional[Iterable[str]] = None) -> Optional[Dict[str, Any]]:
+    """Atomically take the oldest runnable job — queued and due, or running
+    with an expired lease — of `kinds` (default: any) but not of
+    `exclude_kinds`, or None."""
+    now = time.time()
+    query: Dict[str, Any] = {"$or": [
+        {"status": QUEUED, "run_at": {"$lte": now}},
+        {"status": RUNNING, "lease_expires_at": {"$lt": now}},
+    ]}
+    kind_filter: Dict[str, Any] = {}
+    if kinds:
+        kind_filter["$in"] = list(kinds)
+    if exclude_kinds:
+        kind_filter["$nin"] = list(exclude_kinds)
+    if kind_filter:
+        query["kind"] = kind_filter
+    job = db[JOB_QUEUE_COLLECTION].find_one_and_update(
+        query,
+        {
+            "$set": {
+                "status": RUNNING,
+                "lease_owner": worker_id,
+                "lease_expires_at": now + lease_seconds,
+                "updated_at": now,
+            },
+            "$inc": {"attempts": 1},
+        },
+        sort=[("run_at", ASCENDING)],
+        return_document=ReturnDocument.AFTER,
+    )
+    if job and job["attempts"] > 1:
+        logger.info("Job RESUMED | kind=%s job=%s attempt=%d", job["kind"], job["_id"], job["attempts"])
+    return job
+
+
+def heartbeat(db, job_id, worker_id: str, lease_seconds: float = JOB_LEASE_SECONDS) -> bool:
+    """Extend the lease. False if this worker no longer owns the job."""
+    now = time.time()
+    result = db[JOB_QUEUE_COLLECTION].update_one(
+        {"_id": job_id, "status": RUNNING, "lease_owner": worker_id},
+        {"$set": {"lease_expires_at": now + lease_seconds, "updated_at": now}},
+    )
+    return result.modified_count == 1
+
+
+def complete(db, job_id, worker_id: str) -> None:
+    db[JOB_QUEUE_COLLECTION].update_one(
+        {"_id": job_id, "lease_owner": worker_id},
+        {"$set": {"status": DONE, "lease_owner": None, "lease_expires_at": None, "updated_at": time.time()}},
+    )
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with ±20% jitter: base, 2×base, 4×base … capped."""
+    delay = min(JOB_RETRY_MAX_SECONDS, JOB_RETRY_BASE_SECONDS * 2 ** max(attempts - 1, 0))
+    return delay * random.uniform(0.8, 1.2)
+
+
+def fail(db, job: Dict[str, Any], worker_id: str, error: str, permanent: bool = False) -> str:
+    """Record a failed attempt. Returns the new status (queued or dead)."""
+    now = time.time()
+    dead = permanent or job["attempts"] >= job.get("max_attempts", JOB_MAX_ATTEMPTS)
+    update = {
+        "status": DEAD if dead else QUEUED,
+        "lease_owner": None,
+        "lease_expires_at": None,
+        "last_error": error[:2000],
+        "updated_at": now,
+    }
+    if not dead:
+        update["run_at"] = now + retry_delay(job["attempts"])
+    db[JOB_QUEUE_COLLECTION].update_one({"_id": job["_id"], "lease_owner": worker_id}, {"$set": update})
+    return update["status"]
+
+
+def stats(db) -> Dict[str, int]:
+    """Job counts by status, for ops endpoints."""
+    rows = db[JOB_QUEUE_COLLECTION].aggregate([{"$group": {"_id": "$status", "n": {"$sum": 1}}}])
+    return {row["_id"]: row["n"] for row in rows}
@@ -0,0 +1,264 @@
+"""
+Job worker — drains `job_queue` (see queue.py).
+
+Two ways to run it:
+
+  embedded    create_app() starts the worker threads (see Lanes) in
+              the web process (JOB_WORKER_EMBEDDED=true, the default). Same
+              footprint as the old per-upload daemon threads, but jobs
+              survive a restart: the next process reclaims them once their
+              lease expires. Under a multi-process server (gunicorn -w N)
+              only the first process to take JOB_WORKER_LOCK_FILE starts
+              them; the others serve requests only.
+  standalone  cd backend && python -m src.jobs.worker [--concurrency N] [--lanes ...] [--kinds upload_ingest ...]
+              e.g. a second container running the same image. Set
+              JOB_WORKER_EMBEDDED=false on the web containers to move all
+              processing off them. Throughput scales with processes ×
+              concurrency; the atomic claim makes that safe.
+
+Lanes: JOB_WORKER_CONCURRENCY threads serve every job kind except those
+given a lane of their own in JOB_WORKER_LANES. A lane's threads only claim
+its kinds, so long jobs in one lane (a video pipeline can run for many
+minutes) never hold the slots uploads and the OCR batch poller need, and
+the shared threads never pick those kinds up. Format:
+`kind[+kind...]=threads`, comma-separated, e.g.
+"video_pipeline=1,ocr_batch_tick=1" (the default); set it empty to run
+every kind on the shared threads.
+
+Browser progress events from a standalone worker only reach clients when
+the web server and the worker share a SocketIO message queue
+(SOCKETIO_MESSAGE_QUEUE, e.g. redis://…). Without it the frontend falls back
+to polling the job status endpoints, which read Mongo.
+
+Settings:
+    JOB_WORKER_CONCURRENCY  shared threads, for kinds without a lane (2)
+    JOB_WORKER_LANES        dedicated threads per kind group (video_pipeline=1,ocr_batch_tick=1)
+    JOB_POLL_SECONDS        idle wait between claims (2)
+    JOB_WORKER_LOCK_FILE    host-wide lock for the embedded worker (<tmp>/rag-job-worker.lock)
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import tempfile
+import threading
+import uuid
+from typing import Iterable, List, Optional, Tuple
+
+from flask import current_app
+
+from src.jobs import queue
+
+logger = logging.getLogger(__name__)
+
+JOB_WORKER_CONCURRENCY = int(os.getenv("JOB_WORKER_CONCURRENCY", "2"))
+JOB_WORKER_LANES = os.getenv("JOB_WORKER_LANES", "video_pipeline=1,ocr_batch_tick=1")
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+JOB_WORKER_LOCK_FILE = os.getenv("JOB_WORKER_LOCK_FILE",
+                                 os.path.join(tempfile.gettempdir(), "rag-job-worker.lock"))
+
+try:
+    import fcntl
+except ImportError:  # Windows dev boxes: no lock, one process anyway
+    fcntl = None
+
+# Held for the life of the process that owns the embedded worker.
+_lock_file = None
+
+
+def parse_lanes(spec: str) -> List[Tuple[List[str], int]]:
+    """"a+b=2,c=1" → [(["a", "b"], 2), (["c"], 1)]."""
+    lanes = []
+    for entry in (spec or "").split(","):
+        if not entry.strip():
+            continue
+        kinds, _, threads = entry.partition("=")
+        kinds = [k.strip() for k in kinds.split("+") if k.strip()]
+        if not kinds or not threads.strip().isdigit():
+            raise ValueError(f"Bad JOB_WORKER_LANES entry: {entry!r}")
+        lanes.append((kinds, int(threads)))
+    return lanes
+
+
+class Worker:
+    """`concurrency` shared threads plus each lane's own threads, every
+    thread claiming and running one job at a time."""
+
+    def __init__(self, app, concurrency: int = JOB_WORKER_CONCURRENCY,
+                 kinds: Optional[Iterable[str]] = None, poll_seconds: float = JOB_POLL_SECONDS,
+                 lanes: Optional[List[Tuple[List[str], int]]] = None):
+        self.app = app
+        self.concurrency = concurrency
+        self.kinds = list(kinds) if kinds else None
+        self.lanes = parse_lanes(JOB_WORKER_LANES) if lanes is None else lanes
+        self.poll_seconds = poll_seconds
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._stop = threading.Event()
+        self._threads = []
+
+    def plan(self) -> List[Tuple[str, Optional[List[str]], Optional[List[str]], int]]:
+        """[(name, kinds, exclude_kinds, threads), ...] for this worker.
+        With `kinds` set, lanes are narrowed to them (and dropped if empty)."""
+        plan = []
+        laned: List[str] = []
+        for lane_kinds, threads in self.lanes:
+            laned.extend(lane_kinds)
+            if self.kinds is not None:
+                lane_kinds = [k for k in lane_kinds if k in self.kinds]
+            if lane_kinds and threads > 0:
+                plan.append(("+".join(lane_kinds), lane_kinds, None, threads))
+        shared = [k for k in self.kinds if k not in laned] if self.kinds is not None else None
+        if shared != [] and self.concurrency > 0:
+            plan.insert(0, ("shared", shared, laned or None, self.concurrency))
+        return plan
+
+    def start(self) -> "Worker":
+        from src.jobs import handlers  # noqa: F401  side-effect: registers job kinds
+
+        plan = self.plan()
+        for name, kinds, exclude, threads in plan:
+            for i in range(threads):
+                t = threading.Thread(target=self._loop, args=(kinds, exclude),
+                                     name=f"job-worker-{name}-{i}", daemon=True)
+                t.start()
+                self._threads.append(t)
+        logger.info("Job worker STARTED | id=%s lanes=%s", self.worker_id,
+                    ", ".join(f"{name}={threads}" for name, _, _, threads in plan) or "none")
+        return self
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming and wait for running jobs. Jobs still running after
+        `timeout` are picked up elsewhere once their lease expires."""
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+
+    def _loop(self, kinds: Optional[List[str]], exclude: Optional[List[str]]) -> None:
+        with self.app.app_context():
+            db = current_app.config['MONGO_DB']
+        while not self._stop.is_set():
+            try:
+                job = queue.claim(db, self.worker_id, kinds, exclude_kinds=exclude)
+            except Exception as e:
+                logger.error("Job claim failed | worker=%s err=%s", self.worker_id, e)
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_seconds)
+                continue
+            self.run_job(db, job)
+
+    def _heartbeat(self, db, job_id, done: threading.Event) -> None:
+        interval = queue.JOB_LEASE_SECONDS / 3
+        while not done.wait(interval):
+            try:
+                if not queue.heartbeat(db, job_id, self.worker_id):
+                    logger.warning("Job lease LOST | job=%s worker=%s", job_id, self.worker_id)
+                    return
+            except Exception as e:
+                logger.warning("Job heartbeat failed | job=%s err=%s", job_id, e)
+
+    def run_job(self, db, job) -> None:
+        kind, job_id = job["kind"], job["_id"]
+        entry = queue.HANDLERS.get(kind)
+        if entry is None:
+            queue.fail(db, job, self.worker_id, f"No handler for job kind '{kind}'", permanent=True)
+            logger.error("Job DEAD: no handler | kind=%s job=%s", kind, job_id)
+            return
+        if job["attempts"] > job.get("max_attempts", queue.JOB_MAX_ATTEMPTS):
+            # Reclaimed after a crash on its last attempt.
+            self._dead(db, job, entry, "Worker stopped during the final attempt")
+            return
+
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(db, job_id, done), daemon=True).start()
+        logger.info("Job START | kind=%s job=%s attempt=%d", kind, job_id, job["attempts"])
+        try:
+            with self.app.app_context():
+                entry["fn"](job["payload"], job)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            if isinstance(e, queue.PermanentJobError) or job["attempts"] >= job.get("max_attempts", queue.JOB_MAX_ATTEMPTS):
+                logger.error("Job FAILED | kind=%s job=%s attempt=%d err=%s", kind, job_id, job["attempts"], error,
+                             exc_info=not isinstance(e, queue.PermanentJobError))
+                self._dead(db, job, entry, error)
+            else:
+                queue.fail(db, job, self.worker_id, error)
+                logger.warning("Job RETRY | kind=%s job=%s attempt=%d err=%s", kind, job_id, job["attempts"], error)
+        else:
+            queue.complete(db, job_id, self.worker_id)
+            logger.info("Job OK | kind=%s job=%s attempt=%d", kind, job_id, job["attempts"])
+        finally:
+            done.set()
+
+    def _dead(self, db, job, entry, error: str) -> None:
+        queue.fail(db, job, self.worker_id, error, permanent=True)
+        if entry["on_dead"] is None:
+            return
+        try:
+            with self.app.app_context():
+                entry["on_dead"](job["payload"], error)
+        except Exception as e:
+            logger.error("Job on_dead hook failed | kind=%s job=%s err=%s", job["kind"], job["_id"], e)
+
+
+def _take_host_lock() -> bool:
+    """True if this process may run the embedded worker: it holds the
+    host-wide lock (released by the OS when the process exits)."""
+    global _lock_file
+    if fcntl is None or _lock_file is not None:
+        return True
+    f = open(JOB_WORKER_LOCK_FILE, "a")
+    try:
+        fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return False
+    _lock_file = f
+    return True
+
+
+def start_embedded(app) -> Optional[Worker]:
+    """Called from create_app(); no-op when JOB_WORKER_EMBEDDED=false or
+    another process on this host already runs the embedded worker."""
+    if os.getenv("JOB_WORKER_EMBEDDED", "true").lower() not in ("true", "1"):
+        return None
+    if not _take_host_lock():
+        logger.info("Embedded job worker SKIPPED | pid=%s another process holds %s",
+                    os.getpid(), JOB_WORKER_LOCK_FILE)
+        return None
+    try:
+        queue.ensure_indexes(app.config['MONGO_DB'])
+    except Exception as e:
+        logger.warning("job_queue index creation failed: %s", e)
+    return Worker(app).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a standalone job worker.")
+    parser.add_argument("--concurrency", type=int, default=JOB_WORKER_CONCURRENCY,
+                        help="Shared threads, for kinds without a lane")
+    parser.add_argument("--lanes", default=JOB_WORKER_LANES,
+                        help="Dedicated threads per kind group, e.g. video_pipeline=2,ocr_batch_tick=1")
+    parser.add_argument("--kinds", nargs="+", help="Only run these job kinds (default: all)")
+    args = parser.parse_args()
+
+    # This process is the worker; don't let create_app() start a second one.
+    os.environ["JOB_WORKER_EMBEDDED"] = "false"
+    from app import create_app
+
+    app = create_app()
+    queue.ensure_indexes(app.config['MONGO_DB'])
+    worker = Worker(app, concurrency=args.concurrency, kinds=args.kinds, lanes=parse_lanes(args.lanes)).start()
+
+    stopping = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stopping.set())
+    while not stopping.wait(1):
+        pass
+    logger.info("Job worker STOPPING | id=%s", worker.worker_id)
+    worker.stop(timeout=queue.JOB_LEASE_SECONDS)
+
+
+if __name__ == "__main__":
+    main()
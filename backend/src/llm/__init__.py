@@ -0,0 +1,8 @@
+"""
+Model clients shared across requests.
+
+`clients.py` keeps one client per (provider, model, key, params) for the
+life of the process, so chat, agent turns, group-chat bots, analysis and
+video scoring reuse warm HTTP connection pools instead of building (and
+throwing away) a client on every call.
+"""
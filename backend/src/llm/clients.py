@@ -0,0 +1,171 @@
+"""
+Process-wide model client registry.
+
+Building a ChatOpenAI / ChatAnthropic / anthropic.Anthropic per request
+also builds a new HTTP client, so every chat turn paid a fresh TCP + TLS
+handshake before its first token. get_chat_model() and anthropic_client()
+hand out one instance per (provider, model, API key, params) instead; the
+instances are stateless and thread-safe, so they are shared by every
+request thread. The raw Anthropic SDK client also gets a connection pool
+that keeps idle connections for LLM_KEEPALIVE_SECONDS, longer than httpx's
+5 s default, so a chat that pauses between turns still finds a warm
+connection.
+
+The registry is an LRU of at most LLM_CLIENT_MAX_ENTRIES clients (one per
+distinct model / temperature / key combination actually in use).
+"""
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CLIENT_MAX_ENTRIES = int(os.getenv("LLM_CLIENT_MAX_ENTRIES", "64"))
+LLM_KEEPALIVE_SECONDS = float(os.getenv("LLM_KEEPALIVE_SECONDS", "120"))
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "50"))
+# One connection per in-flight stream on the ASGI chat service (asgi_chat.py).
+LLM_ASYNC_MAX_CONNECTIONS = int(os.getenv("LLM_ASYNC_MAX_CONNECTIONS", "2000"))
+
+_lock = threading.Lock()
+_clients: "OrderedDict[tuple, Any]" = OrderedDict()
+_counters = {"created": 0, "reused": 0, "evicted": 0}
+
+
+def _openai(model, api_key, **params):
+    from langchain_openai import ChatOpenAI
+
+    return ChatOpenAI(model=model, api_key=api_key, **params)
+
+
+def _anthropic(model, api_key, **params):
+    from langchain_anthropic import ChatAnthropic
+
+    return ChatAnthropic(model=model, api_key=api_key, **params)
+
+
+def _google(model, api_key, **params):
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(model=model, google_api_key=api_key, **params)
+
+
+def _tongyi(model, api_key, **params):
+    from langchain_community.chat_models import ChatTongyi
+
+    return ChatTongyi(model=model, api_key=api_key, **params)
+
+
+def _deepseek(model, api_key, **params):
+    from langchain_deepseek import ChatDeepSeek
+
+    return ChatDeepSeek(model=model, api_key=api_key, **params)
+
+
+def _anthropic_http_kwargs(anthropic, max_connections):
+    # The SDK's own httpx flavour: newer releases are built on httpx2 and
+    # reject plain httpx clients/limits, so take the Limits type from it.
+    limits = type(anthropic.DEFAULT_CONNECTION_LIMITS)(
+        max_connections=max_connections,
+        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_SECONDS,
+    )
+    return {"limits": limits}
+
+
+def _anthropic_sdk(model, api_key, **params):
+    import anthropic
+
+    http_client = anthropic.DefaultHttpxClient(**_anthropic_http_kwargs(anthropic, LLM_MAX_CONNECTIONS))
+    return anthropic.Anthropic(api_key=api_key, http_client=http_client,
+                               timeout=anthropic.Timeout(600.0, connect=10.0), **params)
+
+
+def _anthropic_sdk_async(model, api_key, **params):
+    import anthropic
+
+    http_client = anthropic.DefaultAsyncHttpxClient(**_anthropic_http_kwargs(anthropic, LLM_ASYNC_MAX_CONNECTIONS))
+    return anthropic.AsyncAnthropic(api_key=api_key, http_client=http_client,
+                                    timeout=anthropic.Timeout(600.0, connect=10.0), **params)
+
+
+# provider -> factory(model, api_key, **params)
+PROVIDERS: Dict[str, Callable[..., Any]] = {
+    "openai": _openai,
+    "anthropic": _anthropic,
+    "google": _google,
+    "tongyi": _tongyi,
+    "deepseek": _deepseek,
+    "anthropic_sdk": _anthropic_sdk,
+    "anthropic_sdk_async": _anthropic_sdk_async,
+}
+
+
+def _key(provider: str, model: Optional[str], api_key: Optional[str], params: Dict[str, Any]) -> tuple:
+    # The key's digest, not the key, so stats() can show entries safely.
+    key_id = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12] if api_key else None
+    return provider, model, key_id, tuple(sorted((k, repr(v)) for k, v in params.items()))
+
+
+def get_client(provider: str, model: Optional[str], api_key: Optional[str], **params) -> Any:
+    """The shared client for these arguments, built on first use."""
+    key = _key(provider, model, api_key, params)
+    with _lock:
+        client = _clients.get(key)
+        if client is not None:
+            _clients.move_to_end(key)
+            _counters["reused"] += 1
+            return client
+        client = PROVIDERS[provider](model, api_key, **params)
+        _clients[key] = client
+        _counters["created"] += 1
+        while len(_clients) > LLM_CLIENT_MAX_ENTRIES:
+            _clients.popitem(last=False)
+            _counters["evicted"] += 1
+    logger.info("LLM client CREATED | provider=%s model=%s params=%s", provider, model, sorted(params))
+    return client
+
+
+def get_chat_model(provider: str, model: str, api_key: Optional[str], **params) -> Any:
+    """Shared LangChain chat model (provider: openai, anthropic, google,
+    tongyi, deepseek). Params are the model's constructor kwargs."""
+    return get_client(provider, model, api_key, **params)
+
+
+def openai_with_fallback(model: str, primary_key: Optional[str], fallback_key: Optional[str], **params) -> Any:
+    """ChatOpenAI on the primary key, falling back to the second key's
+    client on error (both shared)."""
+    primary = get_chat_model("openai", model, primary_key, **params)
+    if not fallback_key:
+        return primary
+    return primary.with_fallbacks([get_chat_model("openai", model, fallback_key, **params)])
+
+
+def anthropic_client(api_key: Optional[str]) -> Any:
+    """Shared anthropic.Anthropic SDK client with a keep-alive pool."""
+    return get_client("anthropic_sdk", None, api_key)
+
+
+def anthropic_async_client(api_key: Optional[str]) -> Any:
+    """Shared anthropic.AsyncAnthropic client for the ASGI chat service.
+    Its connection pool belongs to the event loop that first uses it, so
+    only call this from the one loop the service runs on."""
+    return get_client("anthropic_sdk_async", None, api_key)
+
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        return {
+            **_counters,
+            "size": len(_clients),
+            "max_entries": LLM_CLIENT_MAX_ENTRIES,
+            "clients": [{"provider": p, "model": m, "key": k, "params": [name for name, _ in ps]}
+                        for p, m, k, ps in _clients],
+        }
+
+
+def clear() -> None:
+    with _lock:
+        _clients.clear()
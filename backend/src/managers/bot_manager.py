@@ -6,14 +6,11 @@ from flask import current_app
 logger = logging.getLogger(__name__)
 
 # --- LangChain Imports ---
-from langchain_openai import ChatOpenAI
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.chat_models import ChatTongyi
-from langchain_deepseek import ChatDeepSeek
-from langchain_anthropic import ChatAnthropic
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 
+from src.llm.clients import get_chat_model, openai_with_fallback
+
 DEFAULT_SYSTEM_PROMPT = (
     "You are a helpful, neutral conversational partner. "
     "Keep the conversation natural and balanced."
@@ -52,49 +49,32 @@ class ChatBot:
         supports_temp = not ("gpt-5" in model_lower or "gemini" in model_lower)
         temp_kwargs = {"temperature": self.temperature} if supports_temp else {}
 
+        # Shared clients (src/llm/clients.py): bots with the same model and
+        # temperature — and update_persona rebuilding this one — reuse them.
         if "gpt-5-nano" in model_lower:
-            primary_llm = ChatOpenAI(model="gpt-5-nano", api_key=primary_openai_key, max_tokens=500, **temp_kwargs)
-            if fallback_openai_key:
-                fallback_llm = ChatOpenAI(model="gpt-5-nano", api_key=fallback_openai_key, max_tokens=500, **temp_kwargs)
-                return primary_llm.with_fallbacks([fallback_llm])
-            return primary_llm
+            return openai_with_fallback("gpt-5-nano", primary_openai_key, fallback_openai_key,
+                                        max_tokens=500, **temp_kwargs)
 
         elif "gemini" in model_lower:
-            return ChatGoogleGenerativeAI(
-                model=self.model_name,
-                google_api_key=current_app.config.get("GEMINI_API_KEY"),
-                **temp_kwargs
-            )
-            
+            return get_chat_model("google", self.model_name, current_app.config.get("GEMINI_API_KEY"),
+                                  **temp_kwargs)
+
         elif "qwen" in model_lower:
-            return ChatTongyi(
-                model=self.model_name,
-                api_key=current_app.config.get("DASHSCOPE_API_KEY"),
-                **temp_kwargs
-            )
+            return get_chat_model("tongyi", self.model_name, current_app.config.get("DASHSCOPE_API_KEY"),
+                                  **temp_kwargs)
 
         elif "deepseek" in model_lower:
-            return ChatDeepSeek(
-                model=self.model_name,
-                api_key=current_app.config.get("DEEPSEEK_API_KEY"),
-                **temp_kwargs
-            )
+            return get_chat_model("deepseek", self.model_name, current_app.config.get("DEEPSEEK_API_KEY"),
+                                  **temp_kwargs)
 
         elif "claude" in model_lower:
-            return ChatAnthropic(
-                model=self.model_name,
-                api_key=current_app.config.get("ANTHROPIC_API_KEY"),
-                max_tokens=500,
-                **temp_kwargs
-            )
+            return get_chat_model("anthropic", self.model_name, current_app.config.get("ANTHROPIC_API_KEY"),
+                                  max_tokens=500, **temp_kwargs)
 
         else:
             # Standard OpenAI Fallback (GPT-4o, GPT-3.5, etc.)
-            primary_llm = ChatOpenAI(model=self.model_name, api_key=primary_openai_key, max_tokens=500, **temp_kwargs)
-            if fallback_openai_key:
-                fallback_llm = ChatOpenAI(model=self.model_name, api_key=fallback_openai_key, max_tokens=500, **temp_kwargs)
-                return primary_llm.with_fallbacks([fallback_llm])
-            return primary_llm
+            return openai_with_fallback(self.model_name, primary_openai_key, fallback_openai_key,
+                                        max_tokens=500, **temp_kwargs)
 
     def generate_response(self, user_id: str, user_message: str, full_context_summary: str, rag_context: str) -> Optional[str]:
         """Generates a response synchronously using LangChain chains with RAG context."""
@@ -182,12 +162,8 @@ def analyze_intent(user_text: str, bots_config: list, history_text: str) -> List
     """
 
     try:
-        router_llm = ChatOpenAI(
-            model="gpt-4o-mini",
-            temperature=0,
-            max_tokens=20,
-            api_key=current_app.config.get("OPENAI_API_KEY")
-        )
+        router_llm = get_chat_model("openai", "gpt-4o-mini", current_app.config.get("OPENAI_API_KEY"),
+                                    temperature=0, max_tokens=20)
 
         prompt = ChatPromptTemplate.from_messages([
             ("system", orchestrator_prompt),
@@ -0,0 +1,6 @@
+"""
+OCR for scanned / image-only PDFs via Claude vision.
+
+`render.py` turns pages into image blocks, `engine.py` runs windows of them
+through Claude with concurrency, rate limiting and Mongo checkpoints.
+"""
@@ -0,0 +1,314 @@
+"""
+Shared Message Batch for OCR across uploads.
+
+Before, every large scan submitted its own batches and polled them from its
+own worker thread. Now an upload job that would batch hands its windows to
+this module and ends (OCRDeferred):
+
+  1. defer_windows() stores each window's rendered request in
+     `ocr_batch_requests` (status pending) and a per-file record in
+     `ocr_batch_files` holding the job to resume, then arms the
+     `ocr_batch_tick` job. A request whose page images would push the doc
+     past OCR_BATCH_DOC_MAX_MB keeps them in `ocr_batch_request_parts`
+     instead, a slice of the blocks per doc, so a 100-page window never
+     hits Mongo's 16 MB document limit.
+  2. The tick — a singleton job that re-arms itself while there is work —
+     waits until the oldest pending request is OCR_BATCH_COLLECT_SECONDS
+     old, so uploads arriving together share one Message Batch (one
+     request per window, `custom_id` = file + pages), and submits
+     everything pending, OCR_BATCH_MAX_MB per batch.
+  3. Each tick polls every open batch once (one poller for all uploads).
+     Results are written as OCR checkpoints (engine.save_checkpoint); when
+     the last window of a file is back, its resume job is enqueued. That
+     job finds every window checkpointed and carries on to chunk / embed;
+     windows the batch failed are OCR'd in realtime there.
+
+Every step is idempotent — request state moves with conditional updates —
+so a tick that dies half-way is simply redone by the next one. Nothing is
+lost if the tick job itself goes dead: ensure_tick() re-arms it from its
+on_dead hook and from every defer_windows() call while work is left.
+
+Settings:
+    OCR_BATCH_COLLECT_SECONDS   wait for more uploads before submitting (20)
+    OCR_BATCH_POLL_SECONDS      delay between polls of open batches (15)
+    OCR_BATCH_MAX_MB            request bytes per Message Batch (100)
+    OCR_BATCH_DOC_MAX_MB        image bytes stored per Mongo doc (8)
+"""
+import logging
+import os
+import time
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from pymongo import ASCENDING, ReturnDocument
+
+from src.jobs import queue
+from src.ocr.engine import (
+    CLAUDE_BATCH_TIMEOUT_SECONDS,
+    CLAUDE_PDF_FALLBACK_MODEL,
+    OCR_MAX_TOKENS,
+    _message_text,
+    save_checkpoint,
+)
+
+logger = logging.getLogger(__name__)
+
+OCR_BATCH_COLLECT_SECONDS = float(os.getenv("OCR_BATCH_COLLECT_SECONDS", "20"))
+OCR_BATCH_POLL_SECONDS = float(os.getenv("OCR_BATCH_POLL_SECONDS", "15"))
+# The API caps a batch at 256 MB / 100k requests; the SDK builds the body in
+# memory, so stay well below.
+OCR_BATCH_MAX_MB = float(os.getenv("OCR_BATCH_MAX_MB", "100"))
+OCR_BATCH_MAX_REQUESTS = 100_000
+# Mongo rejects documents over 16 MB; base64 blocks plus BSON overhead stay
+# well under it at this size.
+OCR_BATCH_DOC_MAX_MB = float(os.getenv("OCR_BATCH_DOC_MAX_MB", "8"))
+# A claim older than this belongs to a tick that died mid-submit.
+SUBMIT_STALE_SECONDS = 600
+
+TICK_KIND = "ocr_batch_tick"
+REQUESTS_COLLECTION = "ocr_batch_requests"
+PARTS_COLLECTION = "ocr_batch_request_parts"
+FILES_COLLECTION = "ocr_batch_files"
+BATCHES_COLLECTION = "ocr_batches"
+
+PENDING, SUBMITTING, SUBMITTED, DONE, FAILED = "pending", "submitting", "submitted", "done", "failed"
+
+
+class OCRDeferred(Exception):
+    """The document's windows are queued for the shared batch. The job that
+    asked should stop here; its resume job is enqueued when they are back."""
+
+    def __init__(self, windows: int):
+        super().__init__(f"{windows} OCR windows queued for batch")
+        self.windows = windows
+
+
+def custom_id(key: str, window: Sequence[int]) -> str:
+    # Batch custom_ids allow [a-zA-Z0-9_-] only.
+    return f"{key}_{window[0]}-{window[-1]}_{len(window)}"
+
+
+def _content_bytes(content: List[dict]) -> int:
+    return sum(len(b.get("source", {}).get("data", "")) + len(b.get("text", "")) for b in content)
+
+
+def _split_content(content: List[dict], max_bytes: float) -> List[List[dict]]:
+    """Consecutive slices of `content`, each under `max_bytes` (a block
+    bigger than that on its own gets a slice to itself)."""
+    parts, part, size = [], [], 0
+    for block in content:
+        block_bytes = _content_bytes([block])
+        if part and size + block_bytes > max_bytes:
+            parts.append(part)
+            part, size = [], 0
+        part.append(block)
+        size += block_bytes
+    if part:
+        parts.append(part)
+    return parts
+
+
+def _store_request(db, key: str, window: Sequence[int], content: List[dict]) -> None:
+    request_id = custom_id(key, window)
+    parts = _split_content(content, OCR_BATCH_DOC_MAX_MB * 1024 * 1024)
+    db[PARTS_COLLECTION].delete_many({"request": request_id})
+    if len(parts) > 1:
+        # Parts first: a tick must never claim a request whose content is half-written.
+        for seq, part in enumerate(parts):
+            db[PARTS_COLLECTION].insert_one({"_id": f"{request_id}:{seq}", "key": key, "request": request_id,
+                                             "seq": seq, "content": part})
+    db[REQUESTS_COLLECTION].replace_one(
+        {"_id": request_id},
+        {"key": key, "pages": list(window), "content": content if len(parts) == 1 else None,
+         "parts": len(parts), "bytes": _content_bytes(content),
+         "status": PENDING, "batch_id": None, "created_at": time.time()},
+        upsert=True,
+    )
+
+
+def _request_content(db, doc: Dict[str, Any]) -> List[dict]:
+    if doc.get("content") is not None:
+        return doc["content"]
+    parts = db[PARTS_COLLECTION].find({"request": doc["_id"]}).sort("seq", ASCENDING)
+    return [block for part in parts for block in part["content"]]
+
+
+def ensure_tick(db, delay_seconds: Optional[float] = None) -> bool:
+    """Arm the tick (after `delay_seconds`, default the collect window) if
+    windows are waiting or a batch is open. Returns True if a tick job was
+    added."""
+    if delay_seconds is None:
+        delay_seconds = OCR_BATCH_COLLECT_SECONDS
+    if not (db[REQUESTS_COLLECTION].find_one({"status": {"$in": [PENDING, SUBMITTING, SUBMITTED]}}, {"_id": 1})
+            or db[BATCHES_COLLECTION].find_one({}, {"_id": 1})):
+        return False
+    return queue.enqueue_once(db, TICK_KIND, {}, delay_seconds=delay_seconds)
+
+
+def defer_windows(db, key: str, requests: Iterable[Tuple[Sequence[int], List[dict]]],
+                  resume: Dict[str, Any]) -> int:
+    """Queue `(window pages, message content)` pairs for `key` (the
+    checkpoint key). `resume` = {"kind", "payload"} is enqueued once all of
+    them are resolved. Returns the number of windows queued."""
+    now = time.time()
+    db[FILES_COLLECTION].replace_one(
+        {"_id": key},
+        {"resume": resume, "windows": None, "done": 0, "failed": 0, "resumed": False, "created_at": now},
+        upsert=True,
+    )
+    n = 0
+    for window, content in requests:
+        _store_request(db, key, window, content)
+        n += 1
+    db[FILES_COLLECTION].update_one({"_id": key}, {"$set": {"windows": n}})
+    if n:
+        logger.info("OCR batch DEFERRED | key=%s windows=%d", key, n)
+    ensure_tick(db)
+    _maybe_resume(db, key)
+    return n
+
+
+def _maybe_resume(db, key: str) -> None:
+    group = db[FILES_COLLECTION].find_one({"_id": key})
+    if not group or group["windows"] is None or group["done"] + group["failed"] < group["windows"]:
+        return
+    if not db[FILES_COLLECTION].find_one_and_update({"_id": key, "resumed": False}, {"$set": {"resumed": True}}):
+        return
+    if group["windows"]:
+        queue.enqueue(db, group["resume"]["kind"], group["resume"]["payload"])
+        logger.info("OCR batch RESUME | key=%s done=%d failed=%d", key, group["done"], group["failed"])
+    db[REQUESTS_COLLECTION].delete_many({"key": key})
+    db[PARTS_COLLECTION].delete_many({"key": key})
+    db[FILES_COLLECTION].delete_one({"_id": key})
+
+
+def _resolve(db, request_id: str, text: Optional[str] = None, error: Optional[str] = None) -> None:
+    """Record one window's outcome (once — replays are no-ops)."""
+    request = db[REQUESTS_COLLECTION].find_one_and_update(
+        {"_id": request_id, "status": SUBMITTED},
+        {"$set": {"status": DONE if error is None else FAILED, "error": error}},
+        projection={"key": 1, "pages": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    if request is None:
+        return
+    if error is None:
+        save_checkpoint(db, request["key"], request["pages"], text or "")
+    else:
+        logger.warning("OCR batch window failed | request=%s err=%s", request_id, error)
+    db[FILES_COLLECTION].update_one({"_id": request["key"]}, {"$inc": {"done" if error is None else "failed": 1}})
+    _maybe_resume(db, request["key"])
+
+
+def _claim_pending(db, owner: str) -> List[Dict[str, Any]]:
+    max_bytes = OCR_BATCH_MAX_MB * 1024 * 1024
+    ids, total = [], 0
+    for doc in db[REQUESTS_COLLECTION].find({"status": PENDING}, {"bytes": 1}).sort("created_at", ASCENDING):
+        if ids and (total + doc["bytes"] > max_bytes or len(ids) >= OCR_BATCH_MAX_REQUESTS):
+            break
+        ids.append(doc["_id"])
+        total += doc["bytes"]
+    if not ids:
+        return []
+    db[REQUESTS_COLLECTION].update_many(
+        {"_id": {"$in": ids}, "status": PENDING},
+        {"$set": {"status": SUBMITTING, "owner": owner, "claimed_at": time.time()}},
+    )
+    return list(db[REQUESTS_COLLECTION].find({"owner": owner, "status": SUBMITTING}))
+
+
+def submit_pending(db, client) -> int:
+    """Submit pending windows once the oldest has waited out the collect
+    window. Returns the number of batches created."""
+    now = time.time()
+    db[REQUESTS_COLLECTION].update_many(
+        {"status": SUBMITTING, "claimed_at": {"$lt": now - SUBMIT_STALE_SECONDS}},
+        {"$set": {"status": PENDING, "owner": None}},
+    )
+    oldest = db[REQUESTS_COLLECTION].find_one({"status": PENDING}, {"created_at": 1}, sort=[("created_at", ASCENDING)])
+    if not oldest or now - oldest["created_at"] < OCR_BATCH_COLLECT_SECONDS:
+        return 0
+
+    batches = 0
+    while True:
+        owner = uuid.uuid4().hex
+        docs = _claim_pending(db, owner)
+        if not docs:
+            return batches
+        try:
+            batch = client.messages.batches.create(requests=[{
+                "custom_id": doc["_id"],
+                "params": {
+                    "model": CLAUDE_PDF_FALLBACK_MODEL,
+                    "max_tokens": OCR_MAX_TOKENS,
+                    "messages": [{"role": "user", "content": _request_content(db, doc)}],
+                },
+            } for doc in docs])
+        except Exception:
+            db[REQUESTS_COLLECTION].update_many({"owner": owner}, {"$set": {"status": PENDING, "owner": None}})
+            raise
+        db[BATCHES_COLLECTION].insert_one({"_id": batch.id, "requests": len(docs), "created_at": now,
+                                           "cancel_requested": False})
+        db[REQUESTS_COLLECTION].update_many(
+            {"owner": owner},
+            {"$set": {"status": SUBMITTED, "batch_id": batch.id}, "$unset": {"content": ""}},
+        )
+        db[PARTS_COLLECTION].delete_many({"request": {"$in": [doc["_id"] for doc in docs]}})
+        batches += 1
+        logger.info("OCR batch SUBMITTED | batch=%s requests=%d files=%d",
+                    batch.id, len(docs), len({doc["key"] for doc in docs}))
+
+
+def poll_batches(db, client) -> int:
+    """Check every open batch once; dispatch results of those that ended.
+    Returns the number still open."""
+    open_batches = 0
+    for record in db[BATCHES_COLLECTION].find({}):
+        batch_id = record["_id"]
+        try:
+            if client.messages.batches.retrieve(batch_id).processing_status != "ended":
+                open_batches += 1
+                if (time.time() - record["created_at"] > CLAUDE_BATCH_TIMEOUT_SECONDS
+                        and not record.get("cancel_requested")):
+                    logger.error("OCR batch timed out, cancelling | batch=%s", batch_id)
+                    client.messages.batches.cancel(batch_id)
+                    db[BATCHES_COLLECTION].update_one({"_id": batch_id}, {"$set": {"cancel_requested": True}})
+                continue
+            usage = {"input_tokens": 0, "output_tokens": 0}
+            for result in client.messages.batches.results(batch_id):
+                if result.result.type == "succeeded":
+                    message = result.result.message
+                    for field in usage:
+                        usage[field] += getattr(getattr(message, "usage", None), field, 0) or 0
+                    _resolve(db, result.custom_id, text=_message_text(message))
+                else:
+                    _resolve(db, result.custom_id, error=result.result.type)
+            for orphan in db[REQUESTS_COLLECTION].find({"batch_id": batch_id, "status": SUBMITTED}, {"_id": 1}):
+                _resolve(db, orphan["_id"], error="missing")
+            db[BATCHES_COLLECTION].delete_one({"_id": batch_id})
+            logger.info("OCR batch ENDED | batch=%s requests=%d in_tokens=%d out_tokens=%d",
+                        batch_id, record["requests"], usage["input_tokens"], usage["output_tokens"])
+        except Exception as e:
+            open_batches += 1
+            logger.warning("OCR batch poll failed | batch=%s err=%s", batch_id, e)
+    return open_batches
+
+
+def tick(db, client) -> Optional[float]:
+    """One submit + poll pass. Re-arms itself and returns the delay until
+    the next pass, or None when there is nothing left to do."""
+    try:
+        submit_pending(db, client)
+    except Exception as e:
+        logger.error("OCR batch submit failed | err=%s", e, exc_info=True)
+    delays = []
+    if poll_batches(db, client):
+        delays.append(OCR_BATCH_POLL_SECONDS)
+    oldest = db[REQUESTS_COLLECTION].find_one({"status": {"$in": [PENDING, SUBMITTING]}}, {"created_at": 1},
+                                              sort=[("created_at", ASCENDING)])
+    if oldest:
+        delays.append(max(1.0, oldest["created_at"] + OCR_BATCH_COLLECT_SECONDS - time.time()))
+    if not delays:
+        return None
+    queue.enqueue_once(db, TICK_KIND, {}, delay_seconds=min(delays))
+    return min(delays)
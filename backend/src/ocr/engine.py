@@ -0,0 +1,318 @@
+"""
+Windowed, concurrent OCR with per-window checkpoints.
+
+Pages (0-based `page_indices`, default all) are cut into fixed windows of
+OCR_WINDOW_PAGES. Each window is rendered, sent to Claude as one request and
+released. Windows run OCR_CONCURRENCY at a time under a process-wide
+OCR_REQUESTS_PER_MINUTE limit, and each is retried OCR_WINDOW_RETRIES times.
+
+With a `checkpoint_key` (the upload's file id) every finished window's text
+is saved to `ocr_checkpoints`. A re-run — the job retrying after a crash or
+after one window failed (OCRIncomplete) — only OCRs the windows still
+missing. Text is stitched back in page order. Call clear_checkpoints()
+once it is indexed, or once the job has given up for good.
+
+Pages are rendered by render.PageRenderer (adaptive DPI / crop / greyscale,
+blank and duplicate pages skipped); a window left with no images costs no
+request.
+
+Jobs of CLAUDE_BATCH_PAGE_THRESHOLD+ pages use the Message Batches API
+instead (50% cheaper, minutes slower). Jobs that pass `batch_resume` hand
+their windows to the shared cross-upload batch (batching.py) and get
+OCRDeferred; the resume job re-enters here with every window checkpointed.
+Other callers submit and poll their own batches inline.
+"""
+import logging
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from src.llm.clients import anthropic_client
+from src.ocr.render import PageRenderer
+
+logger = logging.getLogger(__name__)
+
+CLAUDE_PDF_FALLBACK_MODEL = "claude-haiku-4-5-20251001"
+# Anthropic Batch API: 50% off, but adds polling latency. Only worth using
+# for jobs large enough that the savings outweigh the wait.
+CLAUDE_BATCH_PAGE_THRESHOLD = 40
+CLAUDE_BATCH_TIMEOUT_SECONDS = 600  # 10 min hard cap
+# Pages per request — bounds memory per in-flight window and keeps each
+# transcript well under max_tokens. Claude accepts up to 100 images.
+OCR_WINDOW_PAGES = min(int(os.getenv("OCR_WINDOW_PAGES", "10")), 100)
+OCR_MAX_PAGES = int(os.getenv("OCR_MAX_PAGES", "300"))
+OCR_CONCURRENCY = int(os.getenv("OCR_CONCURRENCY", "4"))
+OCR_REQUESTS_PER_MINUTE = float(os.getenv("OCR_REQUESTS_PER_MINUTE", "50"))
+OCR_WINDOW_RETRIES = int(os.getenv("OCR_WINDOW_RETRIES", "2"))
+OCR_MAX_TOKENS = 8192
+OCR_CHECKPOINT_COLLECTION = "ocr_checkpoints"
+OCR_PROMPT = (
+    "Extract every piece of text from this document, in reading order. "
+    "Preserve paragraph breaks, headings, and lists. Do not summarize, "
+    "rephrase, or add commentary. Return only the extracted text."
+)
+
+
+class OCRIncomplete(RuntimeError):
+    """Windows still failed after their retries. The finished ones stay
+    checkpointed, so a retry of the job only redoes these."""
+
+    def __init__(self, failed: int, windows: int):
+        super().__init__(f"OCR failed for {failed}/{windows} windows")
+        self.failed, self.windows = failed, windows
+
+
+class RateLimiter:
+    """Spaces request starts at least 60/per_minute seconds apart, across
+    threads. Shared by every OCR job in the process."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        with self._lock:
+            now = time.monotonic()
+            wait = self._next - now
+            self._next = max(now, self._next) + self.interval
+        if wait > 0:
+            time.sleep(wait)
+
+
+_limiter = RateLimiter(OCR_REQUESTS_PER_MINUTE)
+
+
+def windows_for(pages: Sequence[int], size: int = OCR_WINDOW_PAGES) -> List[List[int]]:
+    pages = list(pages)
+    return [pages[i:i + size] for i in range(0, len(pages), size)]
+
+
+def _checkpoint_id(key: str, window: Sequence[int]) -> str:
+    return f"{key}:{window[0]}-{window[-1]}:{len(window)}"
+
+
+def load_checkpoints(db, key: str, windows: Sequence[Sequence[int]]) -> Dict[int, str]:
+    """{window index: text} for windows already OCR'd under `key`."""
+    ids = {_checkpoint_id(key, w): i for i, w in enumerate(windows)}
+    found = db[OCR_CHECKPOINT_COLLECTION].find({"_id": {"$in": list(ids)}}, {"text": 1})
+    return {ids[doc["_id"]]: doc.get("text") or "" for doc in found}
+
+
+def save_checkpoint(db, key: str, window: Sequence[int], text: str) -> None:
+    try:
+        db[OCR_CHECKPOINT_COLLECTION].replace_one(
+            {"_id": _checkpoint_id(key, window)},
+            {"key": key, "pages": list(window), "text": text, "created_at": datetime.now(timezone.utc)},
+            upsert=True,
+        )
+    except Exception as e:
+        logger.warning("OCR checkpoint write failed | key=%s pages=%s err=%s", key, window, e)
+
+
+def clear_checkpoints(db, key: str) -> None:
+    try:
+        db[OCR_CHECKPOINT_COLLECTION].delete_many({"key": key})
+    except Exception as e:
+        logger.warning("OCR checkpoint cleanup failed | key=%s err=%s", key, e)
+
+
+def stitch(texts: Dict[int, str], n_windows: int) -> str:
+    return "\n\n".join(texts[i].strip() for i in range(n_windows) if (texts.get(i) or "").strip())
+
+
+def _content(image_blocks: List[dict]) -> List[dict]:
+    return [*image_blocks, {"type": "text", "text": OCR_PROMPT}]
+
+
+def _message_text(msg) -> str:
+    return "".join(b.text for b in msg.content if hasattr(b, "text"))
+
+
+def _add_usage(total: Dict[str, int], usage) -> None:
+    total["input_tokens"] += getattr(usage, "input_tokens", 0) or 0
+    total["output_tokens"] += getattr(usage, "output_tokens", 0) or 0
+
+
+def _ocr_window(client, renderer, pdf_doc, window: Sequence[int], filename: str, usage: Dict[str, int]) -> str:
+    """One realtime request for `window`, retried with backoff. Raises on
+    final failure."""
+    images = renderer.render_window(pdf_doc, window)
+    if not images:
+        return ""
+    content = _content(images)
+    images = None
+    for attempt in range(OCR_WINDOW_RETRIES + 1):
+        try:
+            _limiter.acquire()
+            msg = client.messages.create(
+                model=CLAUDE_PDF_FALLBACK_MODEL,
+                max_tokens=OCR_MAX_TOKENS,
+                messages=[{"role": "user", "content": content}],
+            )
+            _add_usage(usage, getattr(msg, "usage", None))
+            if getattr(msg, "stop_reason", None) == "max_tokens":
+                logger.warning("OCR window hit max_tokens | file=%s pages=%s", filename, window)
+            return _message_text(msg)
+        except Exception as e:
+            if attempt >= OCR_WINDOW_RETRIES:
+                raise
+            delay = 2 ** attempt * random.uniform(1.0, 2.0)
+            logger.warning("OCR window retry | file=%s pages=%s attempt=%d err=%s",
+                           filename, window, attempt + 1, e)
+            time.sleep(delay)
+    return ""
+
+
+def _run_realtime(client, renderer, pdf_doc, windows, missing, filename, on_window, usage) -> Dict[int, str]:
+    texts: Dict[int, str] = {}
+
+    def run(i):
+        text = _ocr_window(client, renderer, pdf_doc, windows[i], filename, usage)
+        on_window(i, text)
+        return i, text
+
+    with ThreadPoolExecutor(max_workers=max(1, OCR_CONCURRENCY)) as pool:
+        futures = [pool.submit(run, i) for i in missing]
+        for future in futures:
+            try:
+                i, text = future.result()
+                texts[i] = text
+            except Exception as e:
+                logger.error("OCR window FAILED | file=%s err=%s", filename, e)
+    return texts
+
+
+def _run_batches(client, renderer, pdf_doc, windows, missing, filename, on_window, usage) -> Dict[int, str]:
+    """One single-request batch per missing window, submitted as each is
+    rendered (flat memory), then polled together."""
+    texts: Dict[int, str] = {}
+    batches: Dict[str, int] = {}
+    for i in missing:
+        try:
+            images = renderer.render_window(pdf_doc, windows[i])
+            if not images:
+                texts[i] = ""
+                on_window(i, "")
+                continue
+            _limiter.acquire()
+            batch = client.messages.batches.create(requests=[{
+                "custom_id": f"ocr-{i}",
+                "params": {
+                    "model": CLAUDE_PDF_FALLBACK_MODEL,
+                    "max_tokens": OCR_MAX_TOKENS,
+                    "messages": [{"role": "user", "content": _content(images)}],
+                },
+            }])
+            images = None
+            batches[batch.id] = i
+        except Exception as e:
+            logger.error("Claude batch submit failed | file=%s pages=%s err=%s", filename, windows[i], e)
+    logger.info("Claude batch submitted | file=%s batches=%d", filename, len(batches))
+
+    start = time.time()
+    pending = set(batches)
+    while pending:
+        for batch_id in list(pending):
+            try:
+                if client.messages.batches.retrieve(batch_id).processing_status != "ended":
+                    continue
+                pending.discard(batch_id)
+                for result in client.messages.batches.results(batch_id):
+                    if result.result.type != "succeeded":
+                        logger.error("Claude batch result not succeeded | file=%s batch=%s type=%s",
+                                     filename, batch_id, result.result.type)
+                        continue
+                    i = batches[batch_id]
+                    texts[i] = _message_text(result.result.message)
+                    _add_usage(usage, getattr(result.result.message, "usage", None))
+                    on_window(i, texts[i])
+            except Exception as e:
+                logger.warning("Claude batch poll failed | file=%s batch=%s err=%s", filename, batch_id, e)
+        if not pending:
+            break
+        if time.time() - start > CLAUDE_BATCH_TIMEOUT_SECONDS:
+            logger.error("Claude batch timed out | file=%s pending=%d/%d elapsed=%ds",
+                         filename, len(pending), len(batches), int(time.time() - start))
+            for batch_id in pending:
+                try:
+                    client.messages.batches.cancel(batch_id)
+                except Exception:
+                    pass
+            break
+        time.sleep(5 if (time.time() - start) < 60 else 15)
+    return texts
+
+
+def ocr_pdf(pdf_path: str, filename: str, page_indices=None, *, api_key: str,
+            checkpoint_key: Optional[str] = None, db=None,
+            batch_resume: Optional[Dict] = None,
+            realtime_only: bool = False) -> Tuple[Optional[str], Dict[str, int]]:
+    """OCR `page_indices` of the PDF. Returns (text, stats); text is None if
+    any window is still missing after retries. With checkpoints that case
+    raises OCRIncomplete instead: its neighbours stay checkpointed and the
+    caller retries rather than indexing a partial transcript. Raises on
+    setup errors (missing deps, unreadable PDF, too many pages), and
+    batching.OCRDeferred when the windows went to the shared batch (needs
+    checkpoint_key, db and `batch_resume` = the {"kind", "payload"} job to
+    enqueue afterwards). `realtime_only` skips batching — the resume job
+    uses it for windows the shared batch failed."""
+    import fitz  # PyMuPDF
+
+    client = anthropic_client(api_key)
+    renderer = PageRenderer()
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    with fitz.open(pdf_path) as pdf_doc:
+        selected = list(page_indices) if page_indices is not None else list(range(pdf_doc.page_count))
+        if len(selected) > OCR_MAX_PAGES:
+            raise ValueError(f"{len(selected)} pages to OCR exceeds OCR_MAX_PAGES={OCR_MAX_PAGES}")
+        windows = windows_for(selected)
+
+        use_checkpoints = bool(checkpoint_key) and db is not None
+        texts = load_checkpoints(db, checkpoint_key, windows) if use_checkpoints else {}
+        missing = [i for i in range(len(windows)) if i not in texts]
+
+        def on_window(i, text):
+            if use_checkpoints:
+                save_checkpoint(db, checkpoint_key, windows[i], text)
+
+        batch = len(selected) >= CLAUDE_BATCH_PAGE_THRESHOLD and not realtime_only
+        if batch and missing and use_checkpoints and batch_resume is not None:
+            from src.ocr import batching
+
+            def requests():
+                for i in missing:
+                    images = renderer.render_window(pdf_doc, windows[i])
+                    if not images:
+                        save_checkpoint(db, checkpoint_key, windows[i], "")
+                        continue
+                    yield windows[i], _content(images)
+
+            deferred = batching.defer_windows(db, checkpoint_key, requests(), batch_resume)
+            if deferred:
+                raise batching.OCRDeferred(deferred)
+            texts = load_checkpoints(db, checkpoint_key, windows)
+            missing = []
+        run = _run_batches if batch else _run_realtime
+        texts.update(run(client, renderer, pdf_doc, windows, missing, filename, on_window, usage))
+
+    stats = {
+        "pages": len(selected),
+        "windows": len(windows),
+        "resumed": len(windows) - len(missing),
+        "failed": len(windows) - len(texts),
+        "batch": batch,
+        "skipped_blank": renderer.stats["blank"],
+        "skipped_duplicate": renderer.stats["duplicate"],
+        "image_bytes": renderer.stats["bytes"],
+        **usage,
+    }
+    if stats["failed"]:
+        if use_checkpoints:
+            raise OCRIncomplete(stats["failed"], stats["windows"])
+        return None, stats
+    return stitch(texts, len(windows)), stats
@@ -0,0 +1,222 @@
+"""
+Page rendering for OCR: PDF pages → base64 JPEG image blocks.
+
+Fixed mode renders every page at RENDER_DPI in colour. Adaptive mode
+(OCR_ADAPTIVE_RENDER, default on) first renders a cheap PROBE_DPI thumbnail of each page and uses it to:
+
+  - skip blank pages, and pages that are perceptual-hash duplicates of a
+    page already rendered for the same document (repeated cover sheets,
+    pages scanned twice);
+  - crop to the inked area plus CROP_PADDING_PT — Claude bills images by
+    area, so margins are paid for;
+  - pick the DPI from the pitch of the text lines: small print gets up to
+    OCR_MAX_DPI, slide-sized text as little as OCR_MIN_DPI, and nothing
+    past the long edge Claude would downscale to anyway;
+  - render in greyscale unless the page has real colour content.
+
+PyMuPDF shares one global context, so rendering is serialized behind
+`RENDER_LOCK`; only the Claude calls run concurrently.
+"""
+import base64
+import math
+import os
+import threading
+from typing import Dict, Iterable, List, Optional
+
+RENDER_DPI = 150
+JPEG_QUALITY = 75
+
+OCR_ADAPTIVE_RENDER = os.getenv("OCR_ADAPTIVE_RENDER", "true").lower() in ("true", "1")
+OCR_MIN_DPI = int(os.getenv("OCR_MIN_DPI", "96"))
+OCR_MAX_DPI = int(os.getenv("OCR_MAX_DPI", "200"))
+# Rendered line pitch Claude transcribes reliably (10pt body text at the
+# old fixed 150 DPI is ~31px). Pages without regular lines use RENDER_DPI.
+TARGET_LINE_PITCH_PX = 30
+MAX_PITCH_SEARCH = 120
+MIN_PITCH_CORRELATION = 0.3
+PROBE_DPI = 72
+CROP_PADDING_PT = 12
+# Claude downscales images past this long edge / area; pixels beyond it are
+# upload bandwidth for nothing.
+CLAUDE_MAX_EDGE_PX = 1568
+CLAUDE_MAX_PIXELS = 1_150_000
+# Probe pixels darker than this count as ink; rows/columns with less ink
+# than INK_MIN_FRACTION are margin (scanner speckle, page edges).
+INK_LEVEL = 200
+INK_MIN_FRACTION = 0.005
+# Colour: a page is colour if it has more pixels with channel spread above
+# COLOR_SPREAD than COLOR_MIN_FRACTION of its ink pixels.
+COLOR_SPREAD = 40
+COLOR_MIN_FRACTION = 0.05
+# Duplicate = dHash within DEDUPE_MAX_BITS (of 256) and mean absolute
+# difference of 64x64 thumbnails within DEDUPE_MAX_MAD grey levels. The
+# second check keeps distinct pages of dense body text apart.
+OCR_DEDUPE = os.getenv("OCR_DEDUPE", "true").lower() in ("true", "1")
+DEDUPE_MAX_BITS = 8
+DEDUPE_MAX_MAD = 4.0
+
+RENDER_LOCK = threading.Lock()
+
+
+def image_block(jpeg_bytes: bytes) -> dict:
+    return {
+        "type": "image",
+        "source": {
+            "type": "base64",
+            "media_type": "image/jpeg",
+            "data": base64.b64encode(jpeg_bytes).decode("ascii"),
+        },
+    }
+
+
+def image_tokens(width: int, height: int) -> int:
+    """Claude's input-token estimate for an image (after its own resize)."""
+    scale = min(1.0, CLAUDE_MAX_EDGE_PX / max(width, height), math.sqrt(CLAUDE_MAX_PIXELS / (width * height)))
+    return math.ceil(width * scale * height * scale / 750)
+
+
+def render_window(pdf_doc, page_indices: Iterable[int]) -> List[dict]:
+    """Image blocks for one window of pages at the fixed RENDER_DPI."""
+    return PageRenderer(adaptive=False).render_window(pdf_doc, page_indices)
+
+
+def _line_pitch(row_ink) -> Optional[int]:
+    """Text line pitch (probe px): first clear peak of the autocorrelation
+    of the per-row ink profile. None when the page has no regular lines
+    (tables, figures, handwriting)."""
+    import numpy as np
+
+    x = row_ink - row_ink.mean()
+    if not x.any():
+        return None
+    ac = np.correlate(x, x, "full")[len(x) - 1:]
+    ac = ac / ac[0]
+    below = np.flatnonzero(ac < 0)
+    if not len(below):
+        return None
+    for lag in range(below[0] + 1, min(len(ac) - 1, below[0] + MAX_PITCH_SEARCH)):
+        if ac[lag] > MIN_PITCH_CORRELATION and ac[lag] >= ac[lag - 1] and ac[lag] >= ac[lag + 1]:
+            return lag
+    return None
+
+
+def _downsample(gray, rows: int, cols: int):
+    """Block means on a rows x cols grid (cells never empty, even for
+    content smaller than the grid)."""
+    import numpy as np
+
+    def edges(n, parts):
+        starts = np.floor(np.linspace(0, n, parts + 1)).astype(int)
+        return [(a, max(b, a + 1)) for a, b in zip(np.minimum(starts[:-1], n - 1), starts[1:])]
+
+    return np.array([[gray[r0:r1, c0:c1].mean() for c0, c1 in edges(gray.shape[1], cols)]
+                     for r0, r1 in edges(gray.shape[0], rows)])
+
+
+def dhash(gray) -> int:
+    """256-bit difference hash: sign of horizontal gradients of a 16x17
+    thumbnail."""
+    small = _downsample(gray, 16, 17)
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def analyze_page(page) -> Dict:
+    """Probe one page: `blank`, or the inked clip rect (page points), DPI,
+    colour flag and the fingerprints used for dedupe."""
+    import fitz  # PyMuPDF
+    import numpy as np
+
+    scale = PROBE_DPI / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(scale, scale), colorspace=fitz.csRGB, alpha=False)
+    rgb = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)[:, :, :3]
+    gray = rgb.mean(axis=2)
+    ink = gray < INK_LEVEL
+    rows = np.flatnonzero(ink.mean(axis=1) > INK_MIN_FRACTION)
+    cols = np.flatnonzero(ink.mean(axis=0) > INK_MIN_FRACTION)
+    if not len(rows) or not len(cols):
+        return {"blank": True}
+
+    y0, y1, x0, x1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+    content = gray[y0:y1, x0:x1]
+    bounds = page.rect
+    clip = fitz.Rect(
+        bounds.x0 + x0 / scale - CROP_PADDING_PT, bounds.y0 + y0 / scale - CROP_PADDING_PT,
+        bounds.x0 + x1 / scale + CROP_PADDING_PT, bounds.y0 + y1 / scale + CROP_PADDING_PT,
+    ) & bounds
+
+    pitch = _line_pitch(ink[y0:y1, x0:x1].mean(axis=1))
+    dpi = RENDER_DPI if not pitch else 72 * TARGET_LINE_PITCH_PX * scale / pitch
+    edge_cap = CLAUDE_MAX_EDGE_PX * 72 / max(clip.width, clip.height)
+    dpi = max(OCR_MIN_DPI, min(dpi, OCR_MAX_DPI, edge_cap))
+
+    spread = rgb.max(axis=2).astype(int) - rgb.min(axis=2)
+    color = bool((spread > COLOR_SPREAD).sum() > COLOR_MIN_FRACTION * ink.sum())
+
+    return {
+        "blank": False,
+        "clip": clip,
+        "dpi": round(dpi),
+        "color": color,
+        "hash": dhash(content),
+        "thumb": _downsample(content, 64, 64),
+    }
+
+
+class PageRenderer:
+    """Renders OCR windows for one document. Remembers the fingerprints of
+    pages it has rendered, so duplicates are skipped across windows; call
+    render_window() under the engine's concurrency (it takes RENDER_LOCK)."""
+
+    def __init__(self, adaptive: bool = OCR_ADAPTIVE_RENDER, dedupe: bool = OCR_DEDUPE):
+        self.adaptive = adaptive
+        self.dedupe = dedupe
+        self._seen = []
+        self.stats = {"pages": 0, "rendered": 0, "blank": 0, "duplicate": 0,
+                      "bytes": 0, "image_tokens": 0}
+
+    def _is_duplicate(self, info) -> bool:
+        for seen_hash, seen_thumb in self._seen:
+            if bin(seen_hash ^ info["hash"]).count("1") > DEDUPE_MAX_BITS:
+                continue
+            if abs(seen_thumb - info["thumb"]).mean() <= DEDUPE_MAX_MAD:
+                return True
+        self._seen.append((info["hash"], info["thumb"]))
+        return False
+
+    def _render_page(self, page):
+        import fitz  # PyMuPDF
+
+        if not self.adaptive:
+            matrix = fitz.Matrix(RENDER_DPI / 72, RENDER_DPI / 72)
+            return page.get_pixmap(matrix=matrix, alpha=False)
+
+        info = analyze_page(page)
+        if info["blank"]:
+            self.stats["blank"] += 1
+            return None
+        if self.dedupe and self._is_duplicate(info):
+            self.stats["duplicate"] += 1
+            return None
+        matrix = fitz.Matrix(info["dpi"] / 72, info["dpi"] / 72)
+        colorspace = fitz.csRGB if info["color"] else fitz.csGRAY
+        return page.get_pixmap(matrix=matrix, clip=info["clip"], colorspace=colorspace, alpha=False)
+
+    def render_window(self, pdf_doc, page_indices: Iterable[int]) -> List[dict]:
+        """Image blocks for the pages of one window that are worth sending
+        (possibly none)."""
+        blocks = []
+        with RENDER_LOCK:
+            for i in page_indices:
+                self.stats["pages"] += 1
+                pix = self._render_page(pdf_doc[i])
+                if pix is None:
+                    continue
+                width, height = pix.width, pix.height
+                img_bytes = pix.tobytes("jpeg", jpg_quality=JPEG_QUALITY)
+                pix = None
+                self.stats["rendered"] += 1
+                self.stats["bytes"] += len(img_bytes)
+                self.stats["image_tokens"] += image_tokens(width, height)
+                blocks.append(image_block(img_bytes))
+        return blocks
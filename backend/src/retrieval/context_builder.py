@@ -0,0 +1,143 @@
+"""
+Token-budgeted context assembly.
+
+`chat()` used to `"\n\n".join` whatever came back from retrieval: adjacent
+500-char chunks of the same page arrived as separate fragments, their
+overlap was sent twice, and nothing bounded the total. Here retrieved
+chunks are:
+
+  1. de-duplicated (same text from two uploads of one file);
+  2. stitched — chunks of the same file + page whose `start_index` spans
+     touch or overlap become one block, overlap dropped;
+  3. packed best-first into a per-model token budget (a block that doesn't
+     fit is clipped at a word boundary if enough budget is left, else
+     skipped in favour of smaller blocks further down).
+
+Chunks ingested before `start_index` existed are still de-duplicated and
+budgeted, just never stitched.
+"""
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.utils.vector_stores.embed_pipeline import estimate_tokens
+
+DEFAULT_CONTEXT_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Prefix match on model_name, longest prefix wins. Pricier models get a
+# tighter budget; cheap/fast ones can afford more context.
+MODEL_CONTEXT_BUDGETS = {
+    "claude-sonnet": 1500,
+    "claude-opus": 1500,
+    "gpt-4.1": 1500,
+    "gpt-4o": 1500,
+    "gpt-4-turbo": 1500,
+    "gemini-2.5-pro": 1500,
+    "gpt-4o-mini": 3000,
+    "gpt-5-nano": 3000,
+    "claude-haiku": 3000,
+    "gemini-2.5-flash": 3000,
+    "deepseek": 3000,
+    "qwen": 3000,
+}
+# Don't bother clipping a block into fewer tokens than this.
+MIN_CLIPPED_TOKENS = 60
+# Splitters strip the whitespace between chunks; a gap this small still
+# counts as adjacent.
+MAX_GAP_CHARS = 3
+
+
+def budget_for(model_name: Optional[str]) -> int:
+    name = (model_name or "").lower()
+    matches = [prefix for prefix in MODEL_CONTEXT_BUDGETS if name.startswith(prefix)]
+    return MODEL_CONTEXT_BUDGETS[max(matches, key=len)] if matches else DEFAULT_CONTEXT_BUDGET
+
+
+def _source_key(meta: Dict[str, Any]) -> tuple:
+    source = meta.get("source_file_id") or meta.get("original_file") or meta.get("source_url") or meta.get("source")
+    return source, meta.get("page"), meta.get("slide_number")
+
+
+def merge_chunks(docs: Sequence) -> List[Dict[str, Any]]:
+    """Retrieved Documents (best first) → blocks `{text, metadata, rank, chunks}`,
+    best first."""
+    seen = set()
+    groups: Dict[tuple, List[Dict[str, Any]]] = {}
+    for rank, doc in enumerate(docs):
+        text = doc.page_content or ""
+        norm = " ".join(text.split())
+        if not norm or norm in seen:
+            continue
+        seen.add(norm)
+        meta = dict(doc.metadata or {})
+        groups.setdefault(_source_key(meta), []).append(
+            {"text": text, "metadata": meta, "rank": rank, "chunks": 1, "start": meta.get("start_index")}
+        )
+
+    blocks = []
+    for items in groups.values():
+        positioned = sorted((i for i in items if isinstance(i["start"], int)), key=lambda i: i["start"])
+        merged: List[Dict[str, Any]] = []
+        for item in positioned:
+            prev = merged[-1] if merged else None
+            if prev is None or item["start"] > prev["end"] + MAX_GAP_CHARS:
+                merged.append({**item, "end": item["start"] + len(item["text"])})
+                continue
+            overlap = prev["end"] - item["start"]
+            if overlap < len(item["text"]):
+                prev["text"] += ("" if overlap >= 0 else "\n") + item["text"][max(overlap, 0):]
+                prev["end"] = item["start"] + len(item["text"])
+            prev["chunks"] += 1
+            if item["rank"] < prev["rank"]:
+                prev["rank"], prev["metadata"] = item["rank"], item["metadata"]
+        unpositioned = [i for i in items if not isinstance(i["start"], int)]
+        group_blocks = merged + [
+            i for i in unpositioned
+            if not any(i is not b and " ".join(i["text"].split()) in " ".join(b["text"].split())
+                       for b in merged + unpositioned)
+        ]
+        blocks.extend(group_blocks)
+
+    blocks.sort(key=lambda b: b["rank"])
+    for block in blocks:
+        block.pop("start", None)
+        block.pop("end", None)
+    return blocks
+
+
+def _clip(text: str, max_tokens: int) -> str:
+    limit = max_tokens * 4
+    if len(text) <= limit:
+        return text
+    cut = text.rfind(" ", 0, limit)
+    return text[:cut if cut > limit // 2 else limit].rstrip() + " …"
+
+
+def build_context(docs: Sequence, budget_tokens: int) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """Blocks that fit `budget_tokens`, best first, plus stats for logging."""
+    blocks = merge_chunks(docs)
+    kept, used, truncated, dropped = [], 0, 0, 0
+    for block in blocks:
+        tokens = estimate_tokens(block["text"])
+        remaining = budget_tokens - used
+        if tokens <= remaining:
+            kept.append(block)
+            used += tokens
+        elif remaining >= MIN_CLIPPED_TOKENS:
+            block = {**block, "text": _clip(block["text"], remaining)}
+            kept.append(block)
+            used += estimate_tokens(block["text"])
+            truncated += 1
+        else:
+            dropped += 1
+    stats = {
+        "chunks": len(docs),
+        "blocks": len(kept),
+        "tokens": used,
+        "budget": budget_tokens,
+        "truncated": truncated,
+        "dropped": dropped,
+    }
+    return kept, stats
+
+
+def render(blocks: Sequence[Dict[str, Any]]) -> str:
+    return "\n\n".join(b["text"] for b in blocks)
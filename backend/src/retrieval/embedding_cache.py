@@ -0,0 +1,138 @@
+"""
+Query-embedding cache in front of the shared OpenAIEmbeddings instance.
+
+Students in the same class ask near-identical questions against the same
+bot, and every chat turn / `search_knowledge_base` call used to re-embed
+the query. `CachedEmbeddings` wraps the real embeddings object and answers
+`embed_query` from (1) an in-process LRU/TTL cache, then (2) an optional
+Mongo collection shared by every worker, and only then (3) the API.
+
+Only `embed_query` is cached here. Document embeddings at ingestion time go
+through `embed_documents` untouched.
+"""
+import hashlib
+import logging
+import re
+import threading
+import unicodedata
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from langchain_core.embeddings import Embeddings
+
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Mongo collection shared across workers. Docs expire via the TTL index on
+# `created_at` (see create_cache_indexes.py).
+EMBEDDING_CACHE_COLLECTION = "embedding_cache"
+
+_WS = re.compile(r"\s+")
+
+
+def normalize_query(text: str) -> str:
+    """Canonical form used for the cache key: NFKC, casefolded, single-spaced."""
+    text = unicodedata.normalize("NFKC", text or "")
+    return _WS.sub(" ", text).strip().casefold()
+
+
+def cache_key(text: str, model: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """Drop-in replacement for app.config['EMBEDDINGS'].
+
+    `collection` is optional; pass None to keep the cache process-local.
+    Mongo errors are logged and treated as misses so a cache outage never
+    breaks retrieval.
+    """
+
+    def __init__(self, inner: Embeddings, collection=None, max_entries: int = 4096,
+                 ttl_seconds: Optional[float] = 24 * 3600):
+        self.inner = inner
+        self.collection = collection
+        self.model = getattr(inner, "model", "") or type(inner).__name__
+        dims = getattr(inner, "dimensions", None)
+        if dims:
+            self.model = f"{self.model}@{dims}"
+        self._cache = TTLCache("query_embeddings", max_entries=max_entries, ttl_seconds=ttl_seconds)
+        self._lock = threading.Lock()
+        self.shared_hits = 0
+        self.api_calls = 0
+
+    # -- cache tiers -------------------------------------------------------
+
+    def _lookup_shared(self, key: str) -> Optional[List[float]]:
+        if self.collection is None:
+            return None
+        try:
+            doc = self.collection.find_one({"_id": key}, {"embedding": 1})
+        except Exception as e:
+            logger.warning("Embedding cache read failed: %s", e)
+            return None
+        return doc.get("embedding") if doc else None
+
+    def _store_shared(self, key: str, vector: List[float]) -> None:
+        if self.collection is None:
+            return
+        try:
+            self.collection.update_one(
+                {"_id": key},
+                {"$setOnInsert": {
+                    "model": self.model,
+                    "embedding": vector,
+                    "created_at": datetime.now(timezone.utc),
+                }},
+                upsert=True,
+            )
+        except Exception as e:
+            logger.warning("Embedding cache write failed: %s", e)
+
+    def _cached(self, text: str):
+        key = cache_key(text, self.model)
+        vector = self._cache.get(key)
+        if vector is not None:
+            return key, vector
+        vector = self._lookup_shared(key)
+        if vector is not None:
+            with self._lock:
+                self.shared_hits += 1
+            self._cache.set(key, vector)
+        return key, vector
+
+    def _remember(self, key: str, vector: List[float]) -> None:
+        with self._lock:
+            self.api_calls += 1
+        self._cache.set(key, vector)
+        self._store_shared(key, vector)
+
+    # -- Embeddings interface ---------------------------------------------
+
+    def embed_query(self, text: str) -> List[float]:
+        key, vector = self._cached(text)
+        if vector is None:
+            vector = self.inner.embed_query(text)
+            self._remember(key, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key, vector = self._cached(text)
+        if vector is None:
+            vector = await self.inner.aembed_query(text)
+            self._remember(key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.inner.aembed_documents(texts)
+
+    def stats(self) -> dict:
+        """Memory-tier counters plus shared-tier hits and real API calls."""
+        out = self._cache.stats()
+        out["shared_hits"] = self.shared_hits
+        out["api_calls"] = self.api_calls
+        return out
@@ -0,0 +1,309 @@
+"""
+Retrieval engine — one `$vectorSearch` aggregation per query.
+
+Single source of truth for "which chunks can this chat see" and "how many
+do we fetch". Used by the legacy LangChain chat path, the
+`search_knowledge_base` agent tool and group chat, so all of them see the
+same chunks and recall/latency is tuned in one place.
+
+Scopes (mirrors the old three-branch pre_filter logic):
+  - variant B               → the bot's own files only
+  - variant A + selection   → bot baseline + the selected library files
+  - variant A default       → bot baseline + the caller's whole library
+
+With int8 / binary VECTOR_STORAGE_MODE (quantization.py) the vector search
+(in hybrid mode, its vector side) over-fetches and rescores candidates
+against the float32 `embedding_rescore` copy. With LOCAL_VECTOR_INDEX=true, vector-mode queries over small config_id
+scopes are answered in-process from local_index.py instead of Atlas.
+
+Configs with `rerank: true` over-fetch and rerank (rerank.py). A caller that
+starts retrieval speculatively passes `cancelled` (a threading.Event); once
+it is set the paid rerank call is skipped.
+
+Modes (per config `retrieval_mode`):
+  - "vector" — `$vectorSearch` only
+  - "hybrid" — `$vectorSearch` + Atlas Search BM25 in one aggregation
+               (`$unionWith`), fused with reciprocal rank fusion (lexical.py)
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.retrieval import quantization, scope_versions
+from src.retrieval import rerank as reranker
+from src.retrieval.lexical import reciprocal_rank_fusion, search_stage
+
+logger = logging.getLogger(__name__)
+
+VECTOR_COLLECTION = "vector_collection"
+VECTOR_INDEX_NAME = "vector"
+TEXT_KEY = "text"
+EMBEDDING_KEY = "embedding"
+
+# numCandidates = k * multiplier (Atlas recommends 10-20x k for good recall
+# on HNSW). Capped at Atlas' hard limit.
+NUM_CANDIDATES_MULTIPLIER = int(os.getenv("VECTOR_NUM_CANDIDATES_MULTIPLIER", "15"))
+NUM_CANDIDATES_MIN = 50
+NUM_CANDIDATES_MAX = 10000
+
+RETRIEVAL_MODES = ("vector", "hybrid")
+DEFAULT_RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "vector")
+LOCAL_VECTOR_INDEX = os.getenv("LOCAL_VECTOR_INDEX", "false").lower() in ("true", "1")
+# Each side of a hybrid search fetches this many × k before fusion, so a
+# chunk ranked low by one search can still be lifted by the other.
+HYBRID_FETCH_MULTIPLIER = 4
+HYBRID_FETCH_MIN = 20
+
+# Metadata consumers actually read. Everything else (incl. the 3072-dim
+# embedding) stays on the server.
+PROJECTED_METADATA = (
+    "source", "original_file", "source_url", "title",
+    "slide_number", "page", "source_file_id", "config_id", "start_index",
+)
+
+
+def _is_authenticated(user_id: Optional[str]) -> bool:
+    return bool(user_id) and user_id != "anonymous"
+
+
+def scope_filter(config_id: str, user_id: Optional[str] = None, variant: str = "A",
+                 selected_file_ids: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    """The `$vectorSearch.filter` for a chat's visible chunks."""
+    config_id = str(config_id)
+    if variant == "B":
+        return {"config_id": config_id}
+    if selected_file_ids and _is_authenticated(user_id):
+        return {"$or": [
+            {"config_id": config_id},
+            {"source_file_id": {"$in": [str(x) for x in selected_file_ids]}},
+        ]}
+    config_ids = [config_id]
+    if _is_authenticated(user_id):
+        config_ids.append(f"user:{user_id}")
+    return {"config_id": {"$in": config_ids}}
+
+
+def default_k(user_id: Optional[str] = None, variant: str = "A",
+              selected_file_ids: Optional[Sequence[str]] = None) -> int:
+    """Chunks for the legacy chain: 3 for a single scope, 5 when the caller's
+    library is merged in."""
+    if variant == "B":
+        return 3
+    return 5 if _is_authenticated(user_id) else 3
+
+
+def num_candidates(k: int) -> int:
+    return max(NUM_CANDIDATES_MIN, min(NUM_CANDIDATES_MAX, k * NUM_CANDIDATES_MULTIPLIER))
+
+
+def _projection(score_meta: str, keep_id: bool = False) -> Dict[str, Any]:
+    project = {"_id": 1 if keep_id else 0, TEXT_KEY: 1, "score": {"$meta": score_meta}}
+    project.update({field: 1 for field in PROJECTED_METADATA})
+    return project
+
+
+def build_pipeline(query_vector: List[float], filter_: Dict[str, Any], k: int,
+                   candidates: Optional[int] = None, keep_id: bool = False,
+                   with_rescore: bool = False) -> List[Dict[str, Any]]:
+    """`$vectorSearch` + projection of only the fields callers use.
+
+    The query is encoded to match the stored vector type; `with_rescore`
+    also returns the float32 copy for `rescore_rows`.
+    """
+    project = _projection("vectorSearchScore", keep_id)
+    if with_rescore:
+        project[quantization.RESCORE_KEY] = 1
+    return [
+        {"$vectorSearch": {
+            "index": VECTOR_INDEX_NAME,
+            "path": EMBEDDING_KEY,
+            "queryVector": quantization.encode_query(query_vector),
+            "numCandidates": candidates or num_candidates(k),
+            "limit": k,
+            "filter": filter_,
+        }},
+        {"$project": project},
+    ]
+
+
+def rescore_rows(rows: List[Dict[str, Any]], query_vector: List[float], k: int) -> List[Dict[str, Any]]:
+    """Re-rank quantized candidates by exact cosine against their float32
+    copy. Rows without one (not yet migrated) keep their Atlas score."""
+    for row in rows:
+        full = quantization.from_bson(row.pop(quantization.RESCORE_KEY, None))
+        if full:
+            row["score"] = (1.0 + quantization.cosine(query_vector, full)) / 2.0
+    rows.sort(key=lambda r: r.get("score") or 0.0, reverse=True)
+    return rows[:k]
+
+
+def hybrid_fetch(k: int) -> int:
+    return max(HYBRID_FETCH_MIN, k * HYBRID_FETCH_MULTIPLIER)
+
+
+def build_hybrid_pipeline(query: str, query_vector: List[float], filter_: Dict[str, Any],
+                          k: int) -> List[Dict[str, Any]]:
+    """Vector and BM25 candidates in one round trip, tagged with `_via`.
+
+    Under quantized storage the vector side over-fetches with the float32
+    copy, as vector mode does; `rescore_hybrid_rows` trims it back.
+    """
+    fetch = hybrid_fetch(k)
+    rescore = quantization.needs_rescore()
+    vector_fetch = fetch * quantization.RESCORE_MULTIPLIER if rescore else fetch
+    return [
+        *build_pipeline(query_vector, filter_, vector_fetch, keep_id=True, with_rescore=rescore),
+        {"$addFields": {"_via": "vector"}},
+        {"$unionWith": {"coll": VECTOR_COLLECTION, "pipeline": [
+            search_stage(query, filter_),
+            {"$limit": fetch},
+            {"$project": _projection("searchScore", keep_id=True)},
+            {"$addFields": {"_via": "lexical"}},
+        ]}},
+    ]
+
+
+def rescore_hybrid_rows(rows: List[Dict[str, Any]], query_vector: List[float], k: int) -> List[Dict[str, Any]]:
+    """rescore_rows on the vector side of a hybrid result (its best
+    hybrid_fetch(k) survive); lexical rows pass through."""
+    vector = [row for row in rows if row.get("_via") == "vector"]
+    lexical = [row for row in rows if row.get("_via") != "vector"]
+    return rescore_rows(vector, query_vector, hybrid_fetch(k)) + lexical
+
+
+def fuse_rows(rows: List[Dict[str, Any]], k: int) -> List[Dict[str, Any]]:
+    """RRF over the vector and lexical rankings of a hybrid result.
+
+    `score` on the returned rows is the fused RRF score.
+    """
+    by_id: Dict[str, Dict[str, Any]] = {}
+    rankings: Dict[str, List[tuple]] = {"vector": [], "lexical": []}
+    for row in rows:
+        key = str(row.get("_id"))
+        rankings.setdefault(row.get("_via"), []).append((row.get("score") or 0.0, key))
+        by_id.setdefault(key, row)
+    ordered = [
+        [key for _score, key in sorted(ranking, key=lambda x: x[0], reverse=True)]
+        for ranking in rankings.values()
+    ]
+    fused = []
+    for key, score in reciprocal_rank_fusion(ordered, limit=k):
+        row = dict(by_id[key])
+        row.pop("_id", None)
+        row.pop("_via", None)
+        row["score"] = score
+        fused.append(row)
+    return fused
+
+
+def to_documents(rows: List[Dict[str, Any]]):
+    """Aggregation rows → LangChain Documents with `metadata['score']`."""
+    from langchain_core.documents import Document
+
+    docs = []
+    for row in rows:
+        text = row.pop(TEXT_KEY, "") or ""
+        docs.append(Document(page_content=text, metadata=row))
+    return docs
+
+
+def _local_search(db, filter_: Dict[str, Any], query_vector: List[float], k: int):
+    """Rows from the in-process index, or None to use Atlas. Only plain
+    config_id scopes are served locally; file selections go to Atlas."""
+    cond = filter_.get("config_id")
+    if cond is None or len(filter_) != 1:
+        return None
+    scopes = cond["$in"] if isinstance(cond, dict) else [cond]
+    try:
+        from src.retrieval import local_index
+        return local_index.search(db, scopes, query_vector, k, PROJECTED_METADATA)
+    except Exception as e:
+        logger.warning("Local vector index failed, using Atlas | scopes=%s err=%s", scopes, e)
+        return None
+
+
+def filter_scopes(filter_: Dict[str, Any], user_id: Optional[str] = None) -> List[str]:
+    """config_id scopes a filter can match (selected library files count as
+    the caller's `user:<id>` scope)."""
+    if "$or" in filter_:
+        return list(dict.fromkeys(s for f in filter_["$or"] for s in filter_scopes(f, user_id)))
+    scopes = []
+    cond = filter_.get("config_id")
+    if cond is not None:
+        scopes.extend(cond["$in"] if isinstance(cond, dict) else [cond])
+    if "source_file_id" in filter_ and _is_authenticated(user_id):
+        scopes.append(f"user:{user_id}")
+    return scopes
+
+
+def retrieve(query: str, *, config_id: str, user_id: Optional[str] = None,
+             variant: str = "A", selected_file_ids: Optional[Sequence[str]] = None,
+             k: Optional[int] = None, mode: Optional[str] = None, rerank: bool = False,
+             db=None, embeddings=None, cancelled=None):
+    """Top-k chunks for `query` within the chat's scope, best first.
+
+    With `rerank`, RERANK_CANDIDATES chunks are fetched and reordered by
+    rerank.py; results are cached per query + scope version. If
+    `cancelled` is set by then, the candidates come back unreranked.
+
+    `db` / `embeddings` default to the app's; pass them explicitly when
+    running outside a request (e.g. socket handlers holding `app`).
+    """
+    if db is None or embeddings is None:
+        from flask import current_app
+        db = db if db is not None else current_app.config["MONGO_DB"]
+        embeddings = embeddings if embeddings is not None else current_app.config["EMBEDDINGS"]
+
+    if k is None:
+        k = default_k(user_id, variant, selected_file_ids)
+    if mode not in RETRIEVAL_MODES:
+        mode = DEFAULT_RETRIEVAL_MODE
+    filter_ = scope_filter(config_id, user_id, variant, selected_file_ids)
+    if not rerank:
+        return _search(query, filter_, k, mode, db, embeddings)
+
+    versions = scope_versions.get_versions(db, filter_scopes(filter_, user_id))
+    key = reranker.cache_key(query, filter_, versions, k)
+    cached = reranker.get_cached(key)
+    if cached is not None:
+        return cached
+    candidates = _search(query, filter_, max(k, reranker.RERANK_CANDIDATES), mode, db, embeddings)
+    if cancelled is not None and cancelled.is_set():
+        logger.info("Rerank SKIPPED (request cancelled) | config=%s", config_id)
+        return candidates[:k]
+    try:
+        docs = reranker.rerank(query, candidates, k)
+    except Exception as e:
+        logger.warning("Rerank failed, using retrieval order | config=%s err=%s", config_id, e)
+        return candidates[:k]
+    reranker.put_cached(key, docs)
+    return docs
+
+
+def _search(query: str, filter_: Dict[str, Any], k: int, mode: str, db, embeddings):
+    query_vector = embeddings.embed_query(query)
+    collection = db[VECTOR_COLLECTION]
+
+    if mode == "hybrid":
+        try:
+            rows = list(collection.aggregate(build_hybrid_pipeline(query, query_vector, filter_, k)))
+            if quantization.needs_rescore():
+                rows = rescore_hybrid_rows(rows, query_vector, k)
+            return to_documents(fuse_rows(rows, k))
+        except Exception as e:
+            # Most likely the Atlas Search index isn't built yet
+            # (create_search_index.py) — degrade to vector-only.
+            logger.warning("Hybrid retrieval failed, falling back to vector | filter=%s err=%s", filter_, e)
+
+    if LOCAL_VECTOR_INDEX and mode == "vector":
+        rows = _local_search(db, filter_, query_vector, k)
+        if rows is not None:
+            return to_documents(rows)
+
+    if quantization.needs_rescore():
+        fetch = k * quantization.RESCORE_MULTIPLIER
+        rows = list(collection.aggregate(build_pipeline(query_vector, filter_, fetch, with_rescore=True)))
+        return to_documents(rescore_rows(rows, query_vector, k))
+
+    rows = list(collection.aggregate(build_pipeline(query_vector, filter_, k)))
+    return to_documents(rows)
@@ -0,0 +1,108 @@
+"""
+Lexical retrieval + reciprocal rank fusion for hybrid search.
+
+Dense `text-embedding-3-large` retrieval misses exact tokens students paste
+(course codes like "ECON-2103", formula names, slide titles). Hybrid mode
+runs an Atlas Search `$search` (BM25) next to `$vectorSearch` in the same
+aggregation and fuses the two rankings with RRF — rank-based, so the very
+different score scales of the two searches never need calibrating.
+
+`BM25Index` is a small in-process equivalent of the Atlas Search scoring
+used by the retrieval benchmark (scripts/bench_retrieval.py) so hybrid vs
+vector can be measured on a local fixture corpus without Atlas.
+"""
+import math
+import os
+import re
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+SEARCH_INDEX_NAME = os.getenv("ATLAS_SEARCH_INDEX", "text_search")
+RRF_K = 60
+
+# Keeps "ECON-2103", "f=ma"-style joined tokens whole *and* their parts, so
+# both the exact code and its pieces match.
+_TOKEN_RE = re.compile(r"\w+(?:[-./=]\w+)*", re.UNICODE)
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for tok in _TOKEN_RE.findall((text or "").lower()):
+        tokens.append(tok)
+        parts = re.split(r"[-./=]", tok)
+        if len(parts) > 1:
+            tokens.extend(p for p in parts if p)
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a fixed list of texts."""
+
+    def __init__(self, texts: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self._tfs = [Counter(tokenize(t)) for t in texts]
+        self._lens = [sum(tf.values()) for tf in self._tfs]
+        self._avg_len = (sum(self._lens) / len(self._lens)) if self._lens else 0.0
+        df: Counter = Counter()
+        for tf in self._tfs:
+            df.update(tf.keys())
+        n = len(self._tfs)
+        self._idf = {term: math.log(1 + (n - d + 0.5) / (d + 0.5)) for term, d in df.items()}
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[int, float]]:
+        """[(text index, score)] best first; texts with no matching term are omitted."""
+        terms = [t for t in tokenize(query) if t in self._idf]
+        if not terms:
+            return []
+        scores = []
+        for i, tf in enumerate(self._tfs):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * self._lens[i] / (self._avg_len or 1))
+            for term in terms:
+                f = tf.get(term)
+                if f:
+                    score += self._idf[term] * f * (self.k1 + 1) / (f + norm)
+            if score > 0:
+                scores.append((i, score))
+        scores.sort(key=lambda x: x[1], reverse=True)
+        return scores[:k]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Hashable]], k: int = RRF_K,
+                           limit: Optional[int] = None) -> List[Tuple[Hashable, float]]:
+    """Fuse best-first rankings: score(d) = Σ 1 / (k + rank). Ties keep first-seen order."""
+    scores: Dict[Hashable, float] = {}
+    for ranking in rankings:
+        for rank, key in enumerate(ranking, 1):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+    fused = sorted(scores.items(), key=lambda x: x[1], reverse=True)
+    return fused[:limit] if limit else fused
+
+
+def search_filter(filter_: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Translate a `$vectorSearch` scope filter (engine.scope_filter) into
+    Atlas Search `compound.filter` clauses."""
+    if "$or" in filter_:
+        return [{"compound": {
+            "should": [{"compound": {"filter": search_filter(f)}} for f in filter_["$or"]],
+            "minimumShouldMatch": 1,
+        }}]
+    clauses = []
+    for path, cond in filter_.items():
+        if isinstance(cond, dict) and "$in" in cond:
+            clauses.append({"in": {"path": path, "value": list(cond["$in"])}})
+        else:
+            clauses.append({"equals": {"path": path, "value": cond}})
+    return clauses
+
+
+def search_stage(query: str, filter_: Dict[str, Any], index: str = SEARCH_INDEX_NAME) -> Dict[str, Any]:
+    """`$search` stage: BM25 over chunk text, restricted to the chat's scope."""
+    return {"$search": {
+        "index": index,
+        "compound": {
+            "must": [{"text": {"query": query, "path": "text"}}],
+            "filter": search_filter(filter_),
+        },
+    }}
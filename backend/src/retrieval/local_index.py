@@ -0,0 +1,218 @@
+"""
+Local in-process vector index for small scopes.
+
+Most bots have < 2,000 chunks, yet every query used to pay an Atlas
+`$vectorSearch` round trip. With LOCAL_VECTOR_INDEX=true the engine answers
+plain config_id-scoped queries from a float32 matrix per scope instead:
+
+  - built lazily on first query from vector_collection, written to
+    LOCAL_INDEX_DIR as a .npy file and memory-mapped (page cache shares it
+    between gunicorn workers; restarts reuse it);
+  - keyed by the scope's version (scope_versions.py) — ingest and delete
+    bump it, so a stale matrix is rebuilt on the next query;
+  - queried with one normalized dot product; scores use Atlas' cosine
+    convention, (1 + cos) / 2, so callers can't tell the paths apart.
+
+Scopes above LOCAL_INDEX_MAX_CHUNKS (or with mixed dimensions) return None
+and the engine falls back to Atlas.
+
+Every `user:<id>` library is a scope, so the in-memory indexes (and the
+too-large markers and per-scope build locks) are LRU-bounded to
+LOCAL_INDEX_MAX_SCOPES; an evicted scope reloads from its .npy file.
+
+Settings:
+    LOCAL_INDEX_MAX_CHUNKS  largest scope served locally (2000)
+    LOCAL_INDEX_MAX_SCOPES  scope indexes kept in memory per process (256)
+    LOCAL_INDEX_DIR         where matrices are persisted (uploads/vector_index)
+"""
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from src.retrieval import quantization, scope_versions
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_MAX_CHUNKS = int(os.getenv("LOCAL_INDEX_MAX_CHUNKS", "2000"))
+LOCAL_INDEX_MAX_SCOPES = int(os.getenv("LOCAL_INDEX_MAX_SCOPES", "256"))
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", os.path.join("uploads", "vector_index"))
+
+VECTOR_COLLECTION = "vector_collection"
+TEXT_KEY = "text"
+EMBEDDING_KEY = "embedding"
+
+
+class ScopeIndex:
+    """Unit-normalized vectors (rows) + the projected metadata for each row."""
+
+    def __init__(self, scope: str, version: int, matrix: np.ndarray, rows: List[Dict[str, Any]]):
+        self.scope = scope
+        self.version = version
+        self.matrix = matrix
+        self.rows = rows
+
+    def top_k(self, query: np.ndarray, k: int):
+        """[(cosine, row index)] best first."""
+        if not self.rows:
+            return []
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), int(i)) for i in top]
+
+
+def _drop_build_lock(scope: str, _index=None) -> None:
+    """Forget an idle scope's build lock (a held one is still in use)."""
+    with _lock:
+        lock = _build_locks.get(scope)
+        if lock is not None and not lock.locked():
+            del _build_locks[scope]
+
+
+_lock = threading.Lock()
+_build_locks: Dict[str, threading.Lock] = {}
+_indexes = TTLCache("local_vector_index", max_entries=LOCAL_INDEX_MAX_SCOPES, on_evict=_drop_build_lock)
+# scope -> version at which it was found too large; skip recounting until it changes.
+_too_large = TTLCache("local_vector_index_too_large", max_entries=LOCAL_INDEX_MAX_SCOPES)
+
+
+def _paths(scope: str, version: int):
+    stem = os.path.join(LOCAL_INDEX_DIR, re.sub(r"[^A-Za-z0-9_-]", "_", scope))
+    return f"{stem}.v{version}.npy", f"{stem}.v{version}.json", stem
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _load_from_disk(scope: str, version: int) -> Optional[ScopeIndex]:
+    matrix_path, rows_path, _stem = _paths(scope, version)
+    if not (os.path.exists(matrix_path) and os.path.exists(rows_path)):
+        return None
+    try:
+        with open(rows_path, encoding="utf-8") as f:
+            rows = json.load(f)
+        matrix = np.load(matrix_path, mmap_mode="r")
+        if matrix.shape[0] != len(rows):
+            return None
+        return ScopeIndex(scope, version, matrix, rows)
+    except Exception as e:
+        logger.warning("Local vector index unreadable, rebuilding | scope=%s err=%s", scope, e)
+        return None
+
+
+def _build(db, scope: str, version: int, metadata_fields: Sequence[str]) -> Optional[ScopeIndex]:
+    collection = db[VECTOR_COLLECTION]
+    count = collection.count_documents({"config_id": scope}, limit=LOCAL_INDEX_MAX_CHUNKS + 1)
+    if count > LOCAL_INDEX_MAX_CHUNKS:
+        _too_large.set(scope, version)
+        return None
+
+    projection = {"_id": 0, TEXT_KEY: 1, EMBEDDING_KEY: 1, quantization.RESCORE_KEY: 1}
+    projection.update({field: 1 for field in metadata_fields})
+    rows, vectors = [], []
+    for doc in collection.find({"config_id": scope}, projection):
+        # Prefer the full-precision copy when chunks are stored quantized.
+        full = doc.pop(quantization.RESCORE_KEY, None)
+        vector = quantization.from_bson(full if full is not None else doc.pop(EMBEDDING_KEY, None))
+        doc.pop(EMBEDDING_KEY, None)
+        if not vector:
+            continue
+        vectors.append(vector)
+        rows.append(doc)
+    if vectors and len({len(v) for v in vectors}) > 1:
+        # Mixed dimensions mid-migration — let Atlas handle it.
+        logger.warning("Local vector index skipped, mixed dimensions | scope=%s", scope)
+        return None
+
+    matrix = _normalize(np.asarray(vectors, dtype=np.float32)) if vectors else np.zeros((0, 0), np.float32)
+    matrix_path, rows_path, stem = _paths(scope, version)
+    try:
+        os.makedirs(LOCAL_INDEX_DIR, exist_ok=True)
+        tmp = f"{stem}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp + ".npy", "wb") as f:
+            np.save(f, matrix)
+        with open(tmp + ".json", "w", encoding="utf-8") as f:
+            json.dump(rows, f, default=str)
+        os.replace(tmp + ".json", rows_path)
+        os.replace(tmp + ".npy", matrix_path)
+        _remove_stale(scope, version)
+        matrix = np.load(matrix_path, mmap_mode="r")
+    except OSError as e:
+        # Disk is an optimization; keep serving from memory.
+        logger.warning("Local vector index not persisted | scope=%s err=%s", scope, e)
+
+    logger.info("Local vector index built | scope=%s version=%d chunks=%d", scope, version, len(rows))
+    return ScopeIndex(scope, version, matrix, rows)
+
+
+def _remove_stale(scope: str, version: int) -> None:
+    matrix_path, rows_path, stem = _paths(scope, version)
+    prefix = os.path.basename(stem) + ".v"
+    keep = {os.path.basename(matrix_path), os.path.basename(rows_path)}
+    for name in os.listdir(LOCAL_INDEX_DIR):
+        if name.startswith(prefix) and name not in keep:
+            try:
+                os.remove(os.path.join(LOCAL_INDEX_DIR, name))
+            except OSError:
+                pass
+
+
+def get_index(db, scope: str, version: int, metadata_fields: Sequence[str]) -> Optional[ScopeIndex]:
+    """The scope's index at `version`, loading or building it if needed."""
+    index = _indexes.get(scope)
+    if index is not None and index.version == version:
+        return index
+    if _too_large.get(scope) == version:
+        return None
+
+    with _lock:
+        build_lock = _build_locks.setdefault(scope, threading.Lock())
+    # One builder per scope; concurrent queries wait rather than all
+    # pulling the same chunks.
+    with build_lock:
+        index = _indexes.get(scope)
+        if index is not None and index.version == version:
+            return index
+        index = _load_from_disk(scope, version) or _build(db, scope, version, metadata_fields)
+        if index is not None:
+            _indexes.set(scope, index)
+    if index is None:
+        # Not served locally; nothing will be cached under this lock.
+        _drop_build_lock(scope)
+    return index
+
+
+def search(db, scopes: Sequence[str], query_vector: Sequence[float], k: int,
+           metadata_fields: Sequence[str]) -> Optional[List[Dict[str, Any]]]:
+    """Top-k rows across `scopes`, or None if any scope can't be served locally."""
+    versions = scope_versions.get_versions(db, scopes)
+    indexes = []
+    for scope in versions:
+        index = get_index(db, scope, versions[scope], metadata_fields)
+        if index is None:
+            return None
+        indexes.append(index)
+
+    query = np.asarray(query_vector, dtype=np.float32)
+    norm = np.linalg.norm(query)
+    if norm:
+        query = query / norm
+
+    hits = []
+    for index in indexes:
+        if index.rows and index.matrix.shape[1] != query.shape[0]:
+            return None
+        hits.extend((cos, index, i) for cos, i in index.top_k(query, k))
+    hits.sort(key=lambda h: h[0], reverse=True)
+    return [{**index.rows[i], "score": (1.0 + cos) / 2.0} for cos, index, i in hits[:k]]
+
@@ -0,0 +1,159 @@
+"""
+Reduced-dimension and quantized embedding storage.
+
+`text-embedding-3-large` vectors are 3072 doubles per chunk; stored as a
+BSON array that is ~14 bytes per dimension (type byte + index key + 8-byte
+double), and Atlas holds the indexed field in RAM. Two independent knobs:
+
+  EMBEDDING_DIMENSIONS  — request shorter vectors (e.g. 1024 / 512). The
+                          text-embedding-3 models are Matryoshka-trained, so
+                          truncating an existing vector and re-normalizing is
+                          equivalent; migrations don't need to re-embed.
+  VECTOR_STORAGE_MODE   — how `embedding` is written:
+      float    BSON double array (legacy default)
+      float32  BSON vector BinData, float32 (4 bytes/dim, same recall)
+      int8     BSON vector BinData, int8 scalar-quantized (1 byte/dim)
+      binary   BSON vector BinData, 1 bit/dim (sign)
+
+For int8 / binary, a float32 copy is kept in `embedding_rescore` (stored,
+not indexed — no index RAM) and the engine over-fetches then rescores the
+candidates at full precision.
+
+Everything here is pure Python on lists/bytes; `to_bson` wraps the result
+in a bson Binary (subtype 9) only at the storage boundary.
+"""
+import math
+import os
+import struct
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+STORAGE_MODES = ("float", "float32", "int8", "binary")
+VECTOR_STORAGE_MODE = os.getenv("VECTOR_STORAGE_MODE", "float")
+EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "0")) or None
+
+RESCORE_KEY = "embedding_rescore"
+FORMAT_KEY = "embedding_format"
+# Candidates fetched per result before full-precision rescoring.
+RESCORE_MULTIPLIER = int(os.getenv("VECTOR_RESCORE_MULTIPLIER", "4"))
+
+# BSON binary vector subtype 9: [dtype byte][padding byte][data].
+BSON_VECTOR_SUBTYPE = 9
+DTYPE_INT8 = 0x03
+DTYPE_FLOAT32 = 0x27
+DTYPE_PACKED_BIT = 0x10
+
+
+def needs_rescore(mode: str = VECTOR_STORAGE_MODE) -> bool:
+    return mode in ("int8", "binary")
+
+
+def storage_format(dims: int, mode: str = VECTOR_STORAGE_MODE) -> str:
+    """Tag stored on each chunk, e.g. "int8@1024" — lets migrations resume."""
+    return f"{mode}@{dims}"
+
+
+def truncate(vector: Sequence[float], dims: Optional[int]) -> List[float]:
+    """First `dims` components, re-normalized to unit length."""
+    out = list(vector[:dims] if dims else vector)
+    norm = math.sqrt(sum(x * x for x in out))
+    return [x / norm for x in out] if norm else out
+
+
+def cosine(a: Sequence[float], b: Sequence[float]) -> float:
+    dot = sum(x * y for x, y in zip(a, b))
+    na = math.sqrt(sum(x * x for x in a))
+    nb = math.sqrt(sum(y * y for y in b))
+    return dot / (na * nb) if na and nb else 0.0
+
+
+# -- encoders (return (dtype, padding, data)) --------------------------------
+
+def pack_float32(vector: Sequence[float]) -> Tuple[int, int, bytes]:
+    return DTYPE_FLOAT32, 0, struct.pack(f"<{len(vector)}f", *vector)
+
+
+def quantize_int8(vector: Sequence[float]) -> Tuple[int, int, bytes]:
+    """Per-vector max-abs scaling to [-127, 127]. Cosine is scale-invariant,
+    so no per-vector scale needs storing."""
+    peak = max((abs(x) for x in vector), default=0.0) or 1.0
+    values = [max(-127, min(127, round(x / peak * 127))) for x in vector]
+    return DTYPE_INT8, 0, struct.pack(f"<{len(values)}b", *values)
+
+
+def quantize_binary(vector: Sequence[float]) -> Tuple[int, int, bytes]:
+    """Sign bits, most significant bit first; `padding` = unused low bits."""
+    out = bytearray((len(vector) + 7) // 8)
+    for i, x in enumerate(vector):
+        if x > 0:
+            out[i // 8] |= 0x80 >> (i % 8)
+    return DTYPE_PACKED_BIT, (-len(vector)) % 8, bytes(out)
+
+
+_ENCODERS = {"float32": pack_float32, "int8": quantize_int8, "binary": quantize_binary}
+
+
+def decode(dtype: int, padding: int, data: bytes) -> List[float]:
+    """Back to floats (int8 → raw levels, bits → ±1). Good enough for cosine."""
+    if dtype == DTYPE_FLOAT32:
+        return list(struct.unpack(f"<{len(data) // 4}f", data))
+    if dtype == DTYPE_INT8:
+        return [float(x) for x in struct.unpack(f"<{len(data)}b", data)]
+    if dtype == DTYPE_PACKED_BIT:
+        bits = len(data) * 8 - padding
+        return [1.0 if data[i // 8] & (0x80 >> (i % 8)) else -1.0 for i in range(bits)]
+    raise ValueError(f"Unknown vector dtype 0x{dtype:02x}")
+
+
+# -- BSON boundary -----------------------------------------------------------
+
+def to_bson(encoded: Tuple[int, int, bytes]):
+    from bson.binary import Binary
+
+    dtype, padding, data = encoded
+    return Binary(bytes([dtype, padding]) + data, BSON_VECTOR_SUBTYPE)
+
+
+def from_bson(value: Any) -> Optional[List[float]]:
+    """Float list from a stored `embedding` / `embedding_rescore` value."""
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    raw = bytes(value)
+    return decode(raw[0], raw[1], raw[2:])
+
+
+def encode_for_storage(vector: Sequence[float], mode: str = VECTOR_STORAGE_MODE,
+                       dims: Optional[int] = EMBEDDING_DIMENSIONS) -> Dict[str, Any]:
+    """Fields to write on a chunk: `embedding`, the format tag and, for
+    int8 / binary, the float32 rescore copy."""
+    vector = truncate(vector, dims) if dims and len(vector) > dims else list(vector)
+    fields = {FORMAT_KEY: storage_format(len(vector), mode)}
+    if mode == "float":
+        fields["embedding"] = vector
+        return fields
+    fields["embedding"] = to_bson(_ENCODERS[mode](vector))
+    if needs_rescore(mode):
+        fields[RESCORE_KEY] = to_bson(pack_float32(vector))
+    return fields
+
+
+def encode_query(vector: Sequence[float], mode: str = VECTOR_STORAGE_MODE):
+    """`queryVector` matching the stored type (Atlas requires int8 / bit
+    queries against int8 / bit fields)."""
+    if mode in ("int8", "binary"):
+        return to_bson(_ENCODERS[mode](vector))
+    return list(vector)
+
+
+def bson_size(mode: str, dims: int) -> Dict[str, int]:
+    """Bytes per chunk: `indexed` (the `embedding` field Atlas loads into
+    RAM) and `stored` (indexed + rescore copy), as BSON element values."""
+    if mode == "float":
+        # array doc: int32 len + per element (type, key cstring, double) + NUL
+        indexed = 4 + sum(1 + len(str(i)) + 1 + 8 for i in range(dims)) + 1
+    else:
+        data = {"float32": dims * 4, "int8": dims, "binary": (dims + 7) // 8}[mode]
+        indexed = 4 + 1 + 2 + data  # int32 len, subtype, dtype + padding
+    stored = indexed + (4 + 1 + 2 + dims * 4 if needs_rescore(mode) else 0)
+    return {"indexed": indexed, "stored": stored}
@@ -0,0 +1,152 @@
+"""
+Rerank stage — over-fetch candidates, keep the best k.
+
+Raw vector top-k often carries near-duplicates and loosely related chunks
+straight into the prompt of expensive chat models. Configs with
+`rerank: true` have the engine fetch RERANK_CANDIDATES chunks and reorder
+them here with one of two backends (RERANK_BACKEND):
+
+  llm            — one short call to a cheap model (RERANK_MODEL, Haiku by
+                   default) that returns the passage numbers worth keeping,
+                   best first. It may keep fewer than k.
+  cross-encoder  — a local sentence-transformers CrossEncoder (optional
+                   dependency: `pip install sentence-transformers`).
+
+Results are cached per (query, scope, scope versions, k): a repeated
+question skips embedding, search and rerank entirely, and any ingest or
+delete in the scope changes its version and so the key. The cache holds
+its own copies of the documents and hands out fresh ones, so a request
+that edits a result's metadata never changes what the next one sees.
+"""
+import copy
+import hashlib
+import json
+import logging
+import os
+import re
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+from src.llm.clients import anthropic_client
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+RERANK_BACKEND = os.getenv("RERANK_BACKEND", "llm")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "30"))
+RERANK_MODEL = os.getenv("RERANK_MODEL", "claude-haiku-4-5-20251001")
+CROSS_ENCODER_MODEL = os.getenv("RERANK_CROSS_ENCODER_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+# Passages are clipped in the rerank prompt; ~600 chars is enough to judge
+# relevance and keeps a 30-candidate call around 5k input tokens.
+RERANK_PASSAGE_CHARS = 600
+
+_results = TTLCache(
+    "rerank_results",
+    max_entries=int(os.getenv("RERANK_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=float(os.getenv("RERANK_CACHE_TTL_SECONDS", "3600")),
+)
+
+_client_lock = threading.Lock()
+_cross_encoder = None
+
+
+def cache_key(query: str, filter_: Dict[str, Any], versions: Dict[str, int], k: int,
+              backend: str = RERANK_BACKEND) -> str:
+    payload = json.dumps(
+        [" ".join((query or "").split()).casefold(), filter_, sorted(versions.items()), k, backend],
+        sort_keys=True, default=str,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _copy(doc):
+    out = copy.copy(doc)
+    out.metadata = dict(doc.metadata)
+    return out
+
+
+def get_cached(key: str) -> Optional[list]:
+    docs = _results.get(key)
+    return [_copy(d) for d in docs] if docs is not None else None
+
+
+def put_cached(key: str, docs: list) -> None:
+    _results.set(key, [_copy(d) for d in docs])
+
+
+def parse_ranking(text: str, n: int, k: int) -> List[int]:
+    """Passage numbers from the model's reply: first JSON array found,
+    out-of-range and repeated entries dropped, at most k."""
+    match = re.search(r"\[[^\[\]]*\]", text or "")
+    if not match:
+        raise ValueError(f"No ranking in rerank reply: {text!r:.200}")
+    ranking = []
+    for item in json.loads(match.group(0)):
+        try:
+            i = int(item)
+        except (TypeError, ValueError):
+            continue
+        if 0 <= i < n and i not in ranking:
+            ranking.append(i)
+    return ranking[:k]
+
+
+def _api_key() -> Optional[str]:
+    try:
+        from flask import current_app
+        return current_app.config.get("ANTHROPIC_API_KEY") or os.getenv("ANTHROPIC_API_KEY")
+    except RuntimeError:
+        return os.getenv("ANTHROPIC_API_KEY")  # outside an app context
+
+
+def _llm_ranking(query: str, texts: Sequence[str], k: int) -> List[int]:
+    passages = "\n\n".join(
+        f"[{i}] {' '.join(t.split())[:RERANK_PASSAGE_CHARS]}" for i, t in enumerate(texts)
+    )
+    response = anthropic_client(_api_key()).messages.create(
+        model=RERANK_MODEL,
+        max_tokens=100,
+        temperature=0,
+        system="You rank retrieved passages by how useful they are for answering a student's question.",
+        messages=[{"role": "user", "content": (
+            f"Question: {query}\n\nPassages:\n{passages}\n\n"
+            f"Reply with only a JSON array of the numbers of the passages that help answer "
+            f"the question, most useful first, at most {k}. Omit irrelevant passages."
+        )}],
+    )
+    text = "".join(getattr(block, "text", "") for block in response.content)
+    return parse_ranking(text, len(texts), k)
+
+
+def _cross_encoder_ranking(query: str, texts: Sequence[str], k: int) -> List[int]:
+    global _cross_encoder
+    with _client_lock:
+        if _cross_encoder is None:
+            from sentence_transformers import CrossEncoder
+
+            _cross_encoder = CrossEncoder(CROSS_ENCODER_MODEL)
+    scores = _cross_encoder.predict([(query, t) for t in texts])
+    return sorted(range(len(texts)), key=lambda i: float(scores[i]), reverse=True)[:k]
+
+
+def rerank(query: str, docs: list, k: int, backend: str = RERANK_BACKEND) -> list:
+    """Best ≤k of `docs` (LangChain Documents), with `metadata['rerank_rank']`.
+
+    Raises on backend failure — the engine falls back to vector order.
+    """
+    if len(docs) <= 1:
+        return docs[:k]
+    texts = [d.page_content for d in docs]
+    if backend == "cross-encoder":
+        ranking = _cross_encoder_ranking(query, texts, k)
+    else:
+        ranking = _llm_ranking(query, texts, k)
+    if not ranking:
+        # Nothing judged relevant; don't starve the prompt — keep vector order.
+        return docs[:k]
+    kept = []
+    for rank, i in enumerate(ranking, 1):
+        docs[i].metadata["rerank_rank"] = rank
+        kept.append(docs[i])
+    logger.info("Rerank | backend=%s candidates=%d kept=%d", backend, len(docs), len(kept))
+    return kept
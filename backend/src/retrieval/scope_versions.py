@@ -0,0 +1,62 @@
+"""
+Per-scope version counters for vector_collection.
+
+A scope is a chunk `config_id` — a bot's id or `user:<id>` for a personal
+library. Every write or delete of chunks in a scope bumps its counter in
+`vector_scope_versions`, so anything derived from a scope's chunks (the
+local vector index, cached rerank results) can tell it is stale, across
+processes, with one small read.
+
+Reads are cached for VERSION_CHECK_SECONDS: another process' ingest becomes
+visible within that window; bumps from this process are visible at once.
+"""
+import logging
+import os
+from typing import Dict, Iterable
+
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+SCOPE_VERSIONS_COLLECTION = "vector_scope_versions"
+VERSION_CHECK_SECONDS = float(os.getenv("VECTOR_SCOPE_VERSION_TTL_SECONDS", "5"))
+
+_versions = TTLCache("vector_scope_versions", max_entries=4096, ttl_seconds=VERSION_CHECK_SECONDS)
+
+
+def get_versions(db, scopes: Iterable[str]) -> Dict[str, int]:
+    """{scope: version}; scopes never written since versioning started are 0."""
+    out: Dict[str, int] = {}
+    missing = []
+    for scope in dict.fromkeys(str(s) for s in scopes):
+        cached = _versions.get(scope)
+        if cached is None:
+            missing.append(scope)
+        else:
+            out[scope] = cached
+    if missing:
+        found = {
+            doc["_id"]: int(doc.get("version") or 0)
+            for doc in db[SCOPE_VERSIONS_COLLECTION].find({"_id": {"$in": missing}}, {"version": 1})
+        }
+        for scope in missing:
+            out[scope] = found.get(scope, 0)
+            _versions.set(scope, out[scope])
+    return out
+
+
+def get_version(db, scope: str) -> int:
+    return get_versions(db, [scope])[str(scope)]
+
+
+def bump(db, *scopes) -> None:
+    """Mark scopes as changed. Never raises — a missed bump only delays
+    invalidation until the next write to the scope."""
+    for scope in dict.fromkeys(str(s) for s in scopes if s):
+        _versions.pop(scope)
+        try:
+            db[SCOPE_VERSIONS_COLLECTION].update_one(
+                {"_id": scope}, {"$inc": {"version": 1}}, upsert=True,
+            )
+        except Exception as e:
+            logger.warning("Scope version bump failed | scope=%s err=%s", scope, e)
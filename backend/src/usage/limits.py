@@ -82,13 +82,18 @@ def get_or_set_device_id(request):
 
 def client_ip(request):
     """Real client IP. Prefers X-Forwarded-For first hop (set by nginx); falls
-    back to remote_addr (which is also correct once ProxyFix is applied)."""
+    back to remote_addr (which is also correct once ProxyFix is applied).
+    Also accepts a Starlette request (ASGI chat service), whose peer is
+    request.client."""
     xff = request.headers.get("X-Forwarded-For", "")
     if xff:
         first = xff.split(",")[0].strip()
         if first:
             return first
-    return request.remote_addr or "unknown"
+    remote = getattr(request, "remote_addr", None)
+    if remote is None and getattr(request, "client", None) is not None:
+        remote = request.client.host
+    return remote or "unknown"
 
 
 # --- identity resolution --------------------------------------------------
@@ -100,10 +105,13 @@ class Identity:
     everything else has one. An empty list means exempt (admins, owners).
     """
 
-    def __init__(self, population, entries, cta=None):
+    def __init__(self, population, entries, cta=None, settings=None):
         self.population = population
         self.entries = entries
         self.cta = cta
+        # Settings read during resolution, reused by check()/consume() so a
+        # turn reads usage_config once.
+        self.settings = settings
 
 
 def resolve_identity(config_doc, user, ip, device_id):
@@ -115,6 +123,7 @@ def resolve_identity(config_doc, user, ip, device_id):
             "anon",
             [("anon_ip", ip, cap), ("anon_device", device_id, cap)],
             cta="create_account",
+            settings=settings,
         )
 
     role = user.get("role", "professor")
@@ -129,24 +138,32 @@ def resolve_identity(config_doc, user, ip, device_id):
             "class_pool",
             [("class_pool", str(config_doc.get("_id")), int(usage_pool))],
             cta="contact_professor",
+            settings=settings,
         )
 
     if role == "student":
         cap = int(settings.get("student_default_cap", 100))
-        return Identity("student", [("student", str(user["_id"]), cap)], cta="create_account")
+        return Identity("student", [("student", str(user["_id"]), cap)], cta="create_account",
+                        settings=settings)
 
     if role == "professor":
         cap = int(settings.get("professor_default_cap", 2000))
-        return Identity("professor", [("professor", str(user["_id"]), cap)], cta="generic")
+        return Identity("professor", [("professor", str(user["_id"]), cap)], cta="generic",
+                        settings=settings)
 
     return Identity("exempt", [])
 
 
 # --- counters -------------------------------------------------------------
 
-def _read_count(scope, key):
-    doc = _db()[COUNTERS].find_one({"scope": scope, "key": key}, {"count": 1})
-    return int(doc["count"]) if doc and "count" in doc else 0
+def _read_counts(entries):
+    """[(cap, count)] for every entry, in one round trip."""
+    docs = _db()[COUNTERS].find(
+        {"$or": [{"scope": scope, "key": key} for scope, key, _ in entries]},
+        {"scope": 1, "key": 1, "count": 1},
+    )
+    found = {(d["scope"], d["key"]): int(d.get("count", 0)) for d in docs}
+    return [(cap, found.get((scope, key), 0)) for scope, key, cap in entries]
 
 
 def _summarize(identity, counts):
@@ -154,7 +171,7 @@ def _summarize(identity, counts):
     if not identity.entries:
         return {"status": "ok", "remaining": None, "cap": None,
                 "population": identity.population, "cta": identity.cta}
-    threshold = float(get_settings().get("warn_threshold", 0.8))
+    threshold = float((identity.settings or get_settings()).get("warn_threshold", 0.8))
     status = "ok"
     min_remaining = None
     cap_for_min = None
@@ -173,8 +190,9 @@ def _summarize(identity, counts):
 
 def check(identity):
     """Read-only pre-flight. Does not increment."""
-    counts = [(cap, _read_count(scope, key)) for scope, key, cap in identity.entries]
-    return _summarize(identity, counts)
+    if not identity.entries:
+        return _summarize(identity, [])
+    return _summarize(identity, _read_counts(identity.entries))
 
 
 def consume(identity, n=1):
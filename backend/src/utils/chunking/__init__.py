@@ -0,0 +1,16 @@
+"""
+Structure-aware chunking, keyed by loader type.
+
+Auto-imports every sibling module so `@chunker` decorators register on
+import — adding a strategy = dropping a `.py` file here. `base.py` owns the
+registries and `registry.py` the public API; files starting with `_` are
+ignored.
+"""
+import importlib
+import pkgutil
+
+_pkg = __name__
+for _, modname, _ in pkgutil.iter_modules(__path__):
+    if modname.startswith('_') or modname in ('base', 'registry'):
+        continue
+    importlib.import_module(f"{_pkg}.{modname}")
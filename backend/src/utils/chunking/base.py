@@ -0,0 +1,49 @@
+"""
+Chunker primitives — `@chunker` decorator + the module-level registries the
+decorators populate.
+
+A chunker has signature
+    (docs: List[Document], chunk_size: int, chunk_overlap: int) -> List[Document]
+and must:
+  - copy each input Document's metadata (page / slide_number / source) onto
+    every chunk it produces — chunks never span two input Documents;
+  - set `metadata['start_index']` to the chunk's character offset in its
+    input Document, with `page_content` an exact slice from that offset
+    (the context builder stitches neighbours back together on it).
+"""
+from typing import Any, Callable, Dict, Sequence
+
+# name -> {"fn", "description"}
+CHUNKERS: Dict[str, Dict[str, Any]] = {}
+# loader type -> chunker name. Loader types are loader class names
+# (`PyPDFLoader`, `SimplePPTXLoader`, ...) plus the pseudo-loaders `web`
+# (trafilatura page text) and `ocr` (Claude PDF extraction).
+LOADER_CHUNKERS: Dict[str, str] = {}
+
+
+def chunker(name: str, description: str, loaders: Sequence[str] = ()):
+    """Register a chunking strategy and make it the default for `loaders`."""
+    def wrap(fn: Callable):
+        if name in CHUNKERS:
+            raise ValueError(
+                f"Chunker name collision: '{name}' is already registered by "
+                f"{CHUNKERS[name]['fn'].__module__}"
+            )
+        CHUNKERS[name] = {"fn": fn, "description": description}
+        for loader in loaders:
+            if loader in LOADER_CHUNKERS:
+                raise ValueError(f"Loader '{loader}' already mapped to chunker '{LOADER_CHUNKERS[loader]}'")
+            LOADER_CHUNKERS[loader] = name
+        return fn
+
+    return wrap
+
+
+def make_chunk(doc, text: str, start: int, **extra):
+    """Chunk Document carrying `doc`'s metadata plus start_index / extras."""
+    from langchain_core.documents import Document
+
+    metadata = dict(doc.metadata or {})
+    metadata["start_index"] = start
+    metadata.update({k: v for k, v in extra.items() if v is not None})
+    return Document(page_content=text, metadata=metadata)
@@ -0,0 +1,16 @@
+"""
+`recursive` — the original character splitter (RecursiveCharacterTextSplitter
+at CHUNK_SIZE / CHUNK_OVERLAP). Used for loader types with no mapping and as
+the baseline in scripts/bench_chunking.py.
+"""
+from src.utils.vector_stores.splitting import get_text_splitter
+
+from .base import chunker
+
+
+@chunker(
+    name="recursive",
+    description="Character splitter on paragraph / line / word boundaries, fixed overlap.",
+)
+def recursive(docs, chunk_size, chunk_overlap):
+    return get_text_splitter(chunk_size, chunk_overlap).split_documents(docs)
@@ -0,0 +1,105 @@
+"""Public API for the chunking package.
+
+Importing this module triggers strategy discovery (via `chunking/__init__.py`).
+Mirrors `src/video/rubrics/registry.py`.
+
+Chunk size / overlap come from the config (`chunk_size`, `chunk_overlap`)
+when set, else CHUNK_SIZE / CHUNK_OVERLAP. CHUNKING_STRATEGY=auto (default)
+picks the strategy by loader type; naming a strategy (e.g. `recursive`)
+forces it for every upload.
+"""
+import logging
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.chunking import base
+from src.utils import chunking  # noqa: F401  side-effect: discovers all chunkers
+from src.utils.vector_stores.splitting import CHUNK_OVERLAP, CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+CHUNKING_STRATEGY = os.getenv("CHUNKING_STRATEGY", "auto")
+FALLBACK_STRATEGY = "recursive"
+MIN_CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 4000
+
+
+def list_strategies() -> List[Dict[str, Any]]:
+    return [
+        {
+            "name": name,
+            "description": entry["description"],
+            "loaders": sorted(l for l, n in base.LOADER_CHUNKERS.items() if n == name),
+        }
+        for name, entry in base.CHUNKERS.items()
+    ]
+
+
+def strategy_for(loader_type: Optional[str]) -> str:
+    if CHUNKING_STRATEGY in base.CHUNKERS:
+        return CHUNKING_STRATEGY
+    return base.LOADER_CHUNKERS.get(loader_type or "", FALLBACK_STRATEGY)
+
+
+def chunk_documents(docs, loader_type: Optional[str], chunk_size: Optional[int] = None,
+                    chunk_overlap: Optional[int] = None, strategy: Optional[str] = None) -> list:
+    """Split loaded Documents into chunks with the strategy for `loader_type`.
+
+    Every chunk keeps its source Document's metadata (page / slide_number /
+    source) and gains `start_index` and `chunker`.
+    """
+    name = strategy if strategy in base.CHUNKERS else strategy_for(loader_type)
+    size = chunk_size or CHUNK_SIZE
+    overlap = CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap
+    chunks = base.CHUNKERS[name]["fn"](docs, size, overlap)
+    for chunk in chunks:
+        chunk.metadata["chunker"] = name
+    logger.debug("Chunked | loader=%s chunker=%s size=%d docs=%d chunks=%d",
+                 loader_type, name, size, len(docs), len(chunks))
+    return chunks
+
+
+def parse_chunk_settings(data: Dict[str, Any]) -> Tuple[Dict[str, int], Optional[str]]:
+    """Validated `chunk_size` / `chunk_overlap` from request data.
+
+    Only keys that were sent (non-empty) are returned. Second item is an
+    error message for a 400, or None.
+    """
+    settings: Dict[str, int] = {}
+    for key in ("chunk_size", "chunk_overlap"):
+        raw = data.get(key)
+        if raw is None or str(raw).strip() == "":
+            continue
+        try:
+            settings[key] = int(str(raw))
+        except (TypeError, ValueError):
+            return {}, f"{key} must be an integer"
+    size = settings.get("chunk_size")
+    if size is not None and not (MIN_CHUNK_SIZE <= size <= MAX_CHUNK_SIZE):
+        return {}, f"chunk_size must be between {MIN_CHUNK_SIZE} and {MAX_CHUNK_SIZE}"
+    overlap = settings.get("chunk_overlap")
+    if overlap is not None and not (0 <= overlap <= (size or CHUNK_SIZE) // 2):
+        return {}, "chunk_overlap must be between 0 and half the chunk size"
+    return settings, None
+
+
+def config_chunk_settings(config_doc: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """`chunk_documents` kwargs from a config document ({} → defaults)."""
+    config_doc = config_doc or {}
+    return {k: config_doc[k] for k in ("chunk_size", "chunk_overlap") if isinstance(config_doc.get(k), int)}
+
+
+def chunk_settings(db, config_id) -> Dict[str, int]:
+    """Chunk settings for uploads into `config_id`; {} for the personal
+    library or an unknown config."""
+    if not config_id or str(config_id).startswith("user:"):
+        return {}
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        oid = config_id if isinstance(config_id, ObjectId) else ObjectId(str(config_id))
+    except (InvalidId, TypeError):
+        return {}
+    config_doc = db["config_collections"].find_one({"_id": oid}, {"chunk_size": 1, "chunk_overlap": 1})
+    return config_chunk_settings(config_doc)
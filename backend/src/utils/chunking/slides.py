@@ -0,0 +1,37 @@
+"""
+`slides` — one chunk per slide.
+
+A slide is already a self-contained unit (title + bullets); cutting it at
+500 chars split bullets from their title. Slides longer than
+CHUNK_SLIDE_MAX_CHARS (dense text slides, pasted tables) go through
+`structured` instead. The first line — normally the slide title — becomes
+`metadata['section']`.
+"""
+import os
+
+from .base import chunker, make_chunk
+from .structured import structured
+
+SLIDE_MAX_CHARS = int(os.getenv("CHUNK_SLIDE_MAX_CHARS", "2000"))
+
+
+@chunker(
+    name="slides",
+    description="Keep each slide whole; oversized slides fall back to structured splitting.",
+    loaders=("SimplePPTXLoader",),
+)
+def slides(docs, chunk_size, chunk_overlap):
+    limit = max(chunk_size, SLIDE_MAX_CHARS)
+    chunks = []
+    for doc in docs:
+        text = (doc.page_content or "").strip()
+        if not text:
+            continue
+        title = text.splitlines()[0].strip()[:200]
+        if len(text) <= limit:
+            chunks.append(make_chunk(doc, text, 0, section=title))
+            continue
+        for chunk in structured([doc], chunk_size, chunk_overlap):
+            chunk.metadata.setdefault("section", title)
+            chunks.append(chunk)
+    return chunks
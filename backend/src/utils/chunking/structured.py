@@ -0,0 +1,155 @@
+"""
+`structured` — split on headings and paragraphs instead of every N chars.
+
+Each input Document (a PDF page, a docx / txt / md file, a fetched web page)
+is cut into units: heading lines and paragraphs (blank-line separated, or
+single lines when the text has no blank lines, as pypdf output often
+doesn't). Units are packed into chunks of at most chunk_size characters. A
+heading always starts a new chunk and is recorded as `metadata['section']`
+on every chunk under it. Only a single paragraph longer than chunk_size is
+handed to the recursive splitter (with overlap); chunks cut on paragraph
+boundaries need none.
+"""
+import re
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+from src.utils.vector_stores.splitting import get_text_splitter
+
+from .base import chunker, make_chunk
+
+MAX_HEADING_CHARS = 100
+MAX_TITLE_WORDS = 8
+_MARKDOWN_HEADING = re.compile(r"^#{1,6}\s+\S")
+# "2.3 Elasticity", "4 Results", "IV. Discussion", "Chapter 3: Markets".
+# Plain "1. Foo" is left alone — that's usually a list item.
+_NUMBERED_HEADING = re.compile(
+    r"^((\d+(\.\d+)+\.?|\d+|[IVXLC]+\.)\s+[A-Z]"
+    r"|(chapter|section|part|unit|lecture|module|appendix)\s+[\w.]+\b)",
+    re.IGNORECASE,
+)
+_TRAILING_PUNCTUATION = ".,;:!?"
+
+
+class Span(NamedTuple):
+    start: int
+    end: int
+    section: Optional[str]
+    oversize: bool = False
+
+
+def _lines(text: str) -> Iterator[Tuple[int, int, str]]:
+    """(start, end, stripped) per line; offsets point at the stripped text."""
+    pos = 0
+    for raw in text.splitlines(keepends=True):
+        body = raw.rstrip("\r\n")
+        stripped = body.strip()
+        lead = len(body) - len(body.lstrip())
+        yield pos + lead, pos + lead + len(stripped), stripped
+        pos += len(raw)
+
+
+def is_heading(line: str, standalone: bool = False) -> bool:
+    """Markdown / numbered / ALL-CAPS headings anywhere; short Title Case
+    lines only when `standalone` (own paragraph)."""
+    if not line or len(line) > MAX_HEADING_CHARS:
+        return False
+    if _MARKDOWN_HEADING.match(line):
+        return True
+    if line[-1] in _TRAILING_PUNCTUATION:
+        return False
+    if _NUMBERED_HEADING.match(line) and len(line.split()) <= MAX_TITLE_WORDS + 2:
+        return True
+    letters = [c for c in line if c.isalpha()]
+    if len(letters) >= 3 and all(c.isupper() for c in letters):
+        return True
+    if standalone and line[0].isupper():
+        words = line.split()
+        long_words = [w for w in words if len(w) > 3]
+        return len(words) <= MAX_TITLE_WORDS and all(w[0].isupper() for w in long_words)
+    return False
+
+
+def _units(text: str) -> List[Tuple[str, int, int, str]]:
+    """("heading" | "text", start, end, line) — paragraphs when the text has
+    blank lines, otherwise single lines."""
+    lines = list(_lines(text))
+    paragraphs = any(not line for _, _, line in lines)
+    units, current, prev_blank = [], None, True
+    for i, (start, end, line) in enumerate(lines):
+        if not line:
+            if current:
+                units.append(current)
+                current = None
+            prev_blank = True
+            continue
+        next_blank = i + 1 >= len(lines) or not lines[i + 1][2]
+        if is_heading(line, standalone=paragraphs and prev_blank and next_blank):
+            if current:
+                units.append(current)
+                current = None
+            units.append(("heading", start, end, line))
+        elif current and paragraphs:
+            current = ("text", current[1], end, "")
+        else:
+            if current:
+                units.append(current)
+            current = ("text", start, end, "")
+        prev_blank = False
+    if current:
+        units.append(current)
+    return units
+
+
+def split_spans(text: str, chunk_size: int) -> List[Span]:
+    """Chunk boundaries for `text` as character spans, in order."""
+    spans: List[Span] = []
+    section = None
+    start = end = None
+    has_body = False
+    for kind, unit_start, unit_end, line in _units(text):
+        if kind == "heading":
+            if has_body:
+                spans.append(Span(start, end, section))
+                start, has_body = None, False
+            if start is None:
+                start = unit_start
+            end = unit_end
+            section = line.lstrip("#").strip()
+            continue
+        if has_body and unit_end - start > chunk_size:
+            spans.append(Span(start, end, section))
+            start, has_body = None, False
+        if start is None:
+            start = unit_start
+        if unit_end - start > chunk_size:
+            spans.append(Span(start, unit_end, section, oversize=True))
+            start, has_body = None, False
+            continue
+        end, has_body = unit_end, True
+    # A trailing heading with nothing under it is noise unless it's all there is.
+    if start is not None and (has_body or not spans):
+        spans.append(Span(start, end, section))
+    return spans
+
+
+@chunker(
+    name="structured",
+    description="Heading- and paragraph-aware packing; long paragraphs fall back to the recursive splitter.",
+    loaders=("PyPDFLoader", "Docx2txtLoader", "TextLoader", "web", "ocr"),
+)
+def structured(docs, chunk_size, chunk_overlap):
+    chunks = []
+    for doc in docs:
+        text = doc.page_content or ""
+        for span in split_spans(text, chunk_size):
+            if not span.oversize:
+                chunks.append(make_chunk(doc, text[span.start:span.end], span.start, section=span.section))
+                continue
+            splitter = get_text_splitter(chunk_size, chunk_overlap)
+            for piece in splitter.create_documents([text[span.start:span.end]]):
+                offset = piece.metadata.get("start_index", -1)
+                chunks.append(make_chunk(
+                    doc, piece.page_content, span.start + offset if offset >= 0 else None,
+                    section=span.section,
+                ))
+    return chunks
@@ -15,15 +15,21 @@ except ImportError:  # pragma: no cover - import error surfaced at first use
 
 
 class SimplePPTXLoader:
-    def __init__(self, file_path: str):
+    def __init__(self, file_path, source: str | None = None):
+        # file_path may also be a binary file object (python-pptx takes
+        # either); `source` then names it in the metadata.
         self.file_path = file_path
+        self.source = source or file_path
 
     def load(self):
+        return list(self.lazy_load())
+
+    def lazy_load(self):
+        """Yield one Document per non-empty slide (same as BaseLoader.lazy_load)."""
         if Presentation is None:
             raise ImportError("python-pptx is required to load .pptx files")
 
         prs = Presentation(self.file_path)
-        documents = []
         for idx, slide in enumerate(prs.slides, start=1):
             lines = []
             for shape in slide.shapes:
@@ -38,11 +44,10 @@ class SimplePPTXLoader:
             if not content:
                 continue
 
-            documents.append(Document(
+            yield Document(
                 page_content=content,
                 metadata={
                     'slide_number': idx,
-                    'source': self.file_path,
+                    'source': self.source,
                 },
-            ))
-        return documents
+            )
@@ -0,0 +1,102 @@
+"""
+Loaders that read from a binary file object instead of a path.
+
+Used for direct-to-S3 uploads: the ingest worker hands them an
+S3ObjectReader (src/utils/s3_client.py) so the file is never copied to
+local disk. Each yields the same Documents (text and metadata) as the path
+loader it stands in for, and reports that loader's class name so chunking
+picks the same strategy (chunking.registry is keyed on it).
+"""
+import os
+
+from langchain_core.documents import Document
+
+from src.utils.loaders.pptx_loader import SimplePPTXLoader
+
+
+class StreamPDFLoader:
+    """pypdf, one Document per page — PyPDFLoader's text and page metadata.
+
+    Given a stream, pypdf seeks to the objects it needs rather than reading
+    the whole file into memory first (it does that for paths)."""
+
+    loader_type = "PyPDFLoader"
+
+    def __init__(self, stream, source: str):
+        self.stream = stream
+        self.source = source
+
+    def load(self):
+        return list(self.lazy_load())
+
+    def lazy_load(self):
+        from pypdf import PdfReader
+
+        reader = PdfReader(self.stream)
+        total = len(reader.pages)
+        for i, page in enumerate(reader.pages):
+            try:
+                label = reader.page_labels[i]
+            except Exception:
+                label = str(i + 1)
+            yield Document(
+                page_content=page.extract_text() or "",
+                metadata={"source": self.source, "total_pages": total, "page": i, "page_label": label},
+            )
+
+
+class StreamDocxLoader:
+    """docx2txt on the stream (zip members are read on demand)."""
+
+    loader_type = "Docx2txtLoader"
+
+    def __init__(self, stream, source: str):
+        self.stream = stream
+        self.source = source
+
+    def load(self):
+        return list(self.lazy_load())
+
+    def lazy_load(self):
+        import docx2txt
+
+        yield Document(page_content=docx2txt.process(self.stream), metadata={"source": self.source})
+
+
+class StreamTextLoader:
+    """UTF-8 text / markdown, read whole (as TextLoader does)."""
+
+    loader_type = "TextLoader"
+
+    def __init__(self, stream, source: str):
+        self.stream = stream
+        self.source = source
+
+    def load(self):
+        return list(self.lazy_load())
+
+    def lazy_load(self):
+        yield Document(page_content=self.stream.read().decode("utf-8"), metadata={"source": self.source})
+
+
+class StreamPPTXLoader(SimplePPTXLoader):
+    loader_type = "SimplePPTXLoader"
+
+    def __init__(self, stream, source: str):
+        super().__init__(stream, source=source)
+
+
+STREAM_LOADERS = {
+    ".pdf": StreamPDFLoader,
+    ".docx": StreamDocxLoader,
+    ".txt": StreamTextLoader,
+    ".md": StreamTextLoader,
+    ".pptx": StreamPPTXLoader,
+}
+
+
+def get_stream_loader(stream, filename: str):
+    """Loader for `filename`'s type reading from `stream`, or None if the
+    type isn't supported."""
+    loader_class = STREAM_LOADERS.get(os.path.splitext(filename)[1].lower())
+    return loader_class(stream, filename) if loader_class else None
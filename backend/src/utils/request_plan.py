@@ -0,0 +1,164 @@
+"""
+Per-request step planner with stage timings.
+
+A chat turn does several independent lookups before its first token
+(usage counters, vector search, history read, session metadata). A
+RequestPlan starts each one on a shared thread pool as soon as its inputs
+are known, and the route collects results where it needs them, so the
+pre-stream latency is the slowest step instead of the sum of all of them.
+Work nobody waits for (the LLM-generated chat title, the history
+summary refresh) goes to `background()`, which runs on its own small pool
+so slow model calls there never hold threads the next request's steps
+need; when that pool's queue is full the job is dropped and logged (both
+jobs are retried on a later turn or have a fallback).
+
+Every step, and every inline block wrapped in `stage(name)`, is timed.
+`timings()` reports stage durations plus `mark()`ed offsets from the
+start of the request (e.g. first_token), in milliseconds;
+`server_timing()` renders the finished stages as a Server-Timing header,
+for responses sent after every stage has run (a streamed reply reports
+its timings in its final event instead).
+
+`cancel()` drops speculative steps when the request ends early (e.g. the
+usage check blocks it): queued steps never run, and `cancelled` is set so
+steps already running can skip expensive work (retrieve() skips rerank).
+
+StageTimings is the timing half on its own, for code that is already
+concurrent (the asyncio chat service).
+
+Settings:
+    CHAT_PLAN_WORKERS            shared pool size for plan steps (32)
+    CHAT_BACKGROUND_WORKERS      pool size for background() jobs (4)
+    CHAT_BACKGROUND_QUEUE        background jobs queued or running before new ones are dropped (64)
+"""
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+CHAT_PLAN_WORKERS = int(os.getenv("CHAT_PLAN_WORKERS", "32"))
+CHAT_BACKGROUND_WORKERS = int(os.getenv("CHAT_BACKGROUND_WORKERS", "4"))
+CHAT_BACKGROUND_QUEUE = int(os.getenv("CHAT_BACKGROUND_QUEUE", "64"))
+
+_pool = None
+_background_pool = None
+_pool_lock = threading.Lock()
+_background_slots = threading.BoundedSemaphore(CHAT_BACKGROUND_QUEUE)
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=CHAT_PLAN_WORKERS, thread_name_prefix="chat-plan")
+        return _pool
+
+
+def _background_executor() -> ThreadPoolExecutor:
+    global _background_pool
+    with _pool_lock:
+        if _background_pool is None:
+            _background_pool = ThreadPoolExecutor(max_workers=CHAT_BACKGROUND_WORKERS,
+                                                  thread_name_prefix="chat-background")
+        return _background_pool
+
+
+def run_in_background(app, name: str, fn: Callable[..., Any], *args, **kwargs) -> bool:
+    """Fire-and-forget `fn` inside `app`'s application context on the
+    background pool. Failures are logged, never raised. Returns False (and
+    skips the job) when CHAT_BACKGROUND_QUEUE jobs are already pending."""
+    if not _background_slots.acquire(blocking=False):
+        logger.warning("Background step dropped (queue full) | step=%s", name)
+        return False
+
+    def run():
+        try:
+            with app.app_context():
+                fn(*args, **kwargs)
+        except Exception as e:
+            logger.warning("Background step failed | step=%s err=%s", name, e)
+        finally:
+            _background_slots.release()
+    try:
+        _background_executor().submit(run)
+    except Exception:
+        _background_slots.release()
+        raise
+    return True
+
+
+class StageTimings:
+    def __init__(self):
+        self._t0 = time.perf_counter()
+        self._stages: Dict[str, float] = {}
+        self._marks: Dict[str, float] = {}
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self._t0) * 1000
+
+    def record(self, name: str, ms: float) -> None:
+        self._stages[name] = ms
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def mark(self, name: str) -> None:
+        """Offset from the start of the request; first call wins."""
+        self._marks.setdefault(name, self.elapsed_ms())
+
+    def timings(self) -> Dict[str, float]:
+        out = {name: round(ms, 1) for name, ms in self._stages.items()}
+        out.update({name: round(ms, 1) for name, ms in self._marks.items()})
+        return out
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={ms:.1f}" for name, ms in self._stages.items())
+
+
+class RequestPlan(StageTimings):
+    """Steps run inside `app`'s application context."""
+
+    def __init__(self, app):
+        super().__init__()
+        self._app = app
+        self._steps: Dict[str, Future] = {}
+        self.cancelled = threading.Event()
+
+    def _run(self, name, fn, args, kwargs):
+        started = time.perf_counter()
+        try:
+            with self._app.app_context():
+                return fn(*args, **kwargs)
+        finally:
+            self.record(name, (time.perf_counter() - started) * 1000)
+
+    def start(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        self._steps[name] = _executor().submit(self._run, name, fn, args, kwargs)
+        return self._steps[name]
+
+    def started(self, name: str) -> bool:
+        return name in self._steps
+
+    def result(self, name: str, timeout: float = None) -> Any:
+        """The step's return value; re-raises its exception."""
+        return self._steps[name].result(timeout)
+
+    def cancel(self) -> None:
+        """Cancel every step that hasn't started and flag running ones."""
+        self.cancelled.set()
+        for future in self._steps.values():
+            future.cancel()
+
+    def background(self, name: str, fn: Callable[..., Any], *args, **kwargs) -> bool:
+        """Fire-and-forget on the background pool (see run_in_background)."""
+        return run_in_background(self._app, name, fn, *args, **kwargs)
@@ -3,7 +3,10 @@
 Credentials are pulled from app.config (loaded by src.utils.config.load_secrets).
 """
 
+import io
 import logging
+import os
+from collections import OrderedDict
 
 import boto3
 from botocore.exceptions import BotoCoreError, ClientError
@@ -11,6 +14,11 @@ from flask import current_app
 
 logger = logging.getLogger(__name__)
 
+# S3ObjectReader: bytes per ranged GET, and how many blocks stay cached (the
+# reader's memory ceiling is their product).
+S3_READ_BLOCK_BYTES = int(os.getenv("S3_READ_BLOCK_BYTES", str(1024 * 1024)))
+S3_READ_CACHE_BLOCKS = int(os.getenv("S3_READ_CACHE_BLOCKS", "16"))
+
 
 def get_s3_client():
     return boto3.client(
@@ -31,6 +39,11 @@ def upload_file(local_path: str, key: str, content_type: str | None = None) -> s
     return key
 
 
+def download_file(key: str, local_path: str) -> str:
+    get_s3_client().download_file(get_bucket(), key, local_path)
+    return local_path
+
+
 def generate_presigned_put_url(
     key: str,
     content_type: str,
@@ -57,6 +70,101 @@ def object_exists(key: str) -> bool:
         return False
 
 
+def object_size(key: str) -> int | None:
+    """ContentLength of the object, or None if it isn't there."""
+    try:
+        return get_s3_client().head_object(Bucket=get_bucket(), Key=key)['ContentLength']
+    except (ClientError, BotoCoreError):
+        return None
+
+
+class S3ObjectReader(io.RawIOBase):
+    """Seekable, read-only file object over an S3 object.
+
+    Reads are served from S3_READ_BLOCK_BYTES blocks fetched with ranged
+    GETs; the last S3_READ_CACHE_BLOCKS are kept, so parsers that seek
+    around (pypdf jumps between the xref table and page objects) don't
+    refetch. Nothing is written to disk and at most block * cache bytes of
+    the object are in memory at once.
+    """
+
+    def __init__(self, key: str, *, client=None, bucket: str | None = None, size: int | None = None,
+                 block_size: int | None = None, cache_blocks: int | None = None):
+        self.key = key
+        self._client = client or get_s3_client()
+        self._bucket = bucket or get_bucket()
+        self.size = size if size is not None else self._client.head_object(
+            Bucket=self._bucket, Key=key)['ContentLength']
+        self._block_size = block_size or S3_READ_BLOCK_BYTES
+        self._cache_blocks = cache_blocks or S3_READ_CACHE_BLOCKS
+        self._blocks: OrderedDict[int, bytes] = OrderedDict()
+        self._pos = 0
+        self.requests = 0
+        self.bytes_fetched = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        if pos < 0:
+            raise ValueError(f"negative seek position {pos}")
+        self._pos = pos
+        return pos
+
+    def _block(self, index: int) -> bytes:
+        data = self._blocks.get(index)
+        if data is not None:
+            self._blocks.move_to_end(index)
+            return data
+        start = index * self._block_size
+        end = min(start + self._block_size, self.size) - 1
+        data = self._client.get_object(
+            Bucket=self._bucket, Key=self.key, Range=f"bytes={start}-{end}",
+        )['Body'].read()
+        self.requests += 1
+        self.bytes_fetched += len(data)
+        self._blocks[index] = data
+        if len(self._blocks) > self._cache_blocks:
+            self._blocks.popitem(last=False)
+        return data
+
+    def readinto(self, buffer) -> int:
+        view = memoryview(buffer).cast('B')
+        n = 0
+        while n < len(view) and self._pos < self.size:
+            index, offset = divmod(self._pos, self._block_size)
+            piece = self._block(index)[offset:offset + len(view) - n]
+            if not piece:
+                break
+            view[n:n + len(piece)] = piece
+            n += len(piece)
+            self._pos += len(piece)
+        return n
+
+    def close(self) -> None:
+        self._blocks.clear()
+        super().close()
+
+
+def open_object(key: str, size: int | None = None) -> S3ObjectReader:
+    """Open an object for streaming reads (see S3ObjectReader)."""
+    return S3ObjectReader(key, size=size)
+
+
 def delete_object(key: str) -> None:
     try:
         get_s3_client().delete_object(Bucket=get_bucket(), Key=key)
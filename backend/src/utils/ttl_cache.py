@@ -0,0 +1,103 @@
+"""
+Bounded, thread-safe LRU cache with per-entry TTL and hit/miss counters.
+
+The server runs Flask-SocketIO in threading mode, so every cache shared
+across requests needs a lock. Instances register themselves in `CACHES`
+under a unique name so ops tooling can report hit rates without knowing
+which module owns which cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# name -> TTLCache. Populated as a side-effect of constructing a cache.
+CACHES: Dict[str, "TTLCache"] = {}
+
+_MISSING = object()
+
+
+class TTLCache:
+    """LRU cache that also expires entries `ttl_seconds` after they were set.
+
+    `max_entries` bounds memory: the least-recently-used entry is evicted
+    once the cap is reached, and `on_evict(key, value)` (if given) is
+    called for it outside the lock. `ttl_seconds=None` disables expiry.
+    """
+
+    def __init__(self, name: str, max_entries: int = 1024,
+                 ttl_seconds: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._on_evict = on_evict
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        CACHES[name] = self
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING:
+                self.misses += 1
+                return default
+            value, expires_at = entry
+            if expires_at is not None and self._clock() >= expires_at:
+                del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any, ttl_seconds: Optional[float] = None) -> None:
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        expires_at = self._clock() + ttl if ttl is not None else None
+        evicted = []
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                evicted.append(self._data.popitem(last=False))
+                self.evictions += 1
+        if self._on_evict is not None:
+            for old_key, (old_value, _expires_at) in evicted:
+                self._on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
+
+
+def all_stats() -> Dict[str, Dict[str, Any]]:
+    """Stats for every registered cache, keyed by cache name."""
+    return {name: cache.stats() for name, cache in CACHES.items()}
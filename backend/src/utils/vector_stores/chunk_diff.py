@@ -0,0 +1,88 @@
+"""
+Chunk-level diff for replacing a file's content.
+
+A new version of a file is chunked exactly like an upload; its chunks are
+then matched against the file's stored chunks by `content_hash` (as a
+multiset — a paragraph repeated three times stays three chunks):
+
+  kept     same text in both versions: no embedding, no insert. Only the
+           metadata that moved (page, start_index, section, file name …)
+           is updated in place.
+  added    text only in the new version: embedded (through the
+           content-addressed store, so text seen in any upload is still
+           free) and inserted.
+  removed  stored chunks whose text is gone: deleted.
+
+Fixing a typo touches the one or two chunks around it; the rest of the
+file costs a metadata comparison.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+
+from src.utils.vector_stores.embedding_store import content_hash
+
+# Metadata that may disappear between versions (a heading removed, a page
+# without a label). Other keys are only ever overwritten.
+VOLATILE_KEYS = ("page", "page_label", "start_index", "section", "slide_number", "total_pages")
+
+
+def _position(meta: Dict[str, Any]) -> tuple:
+    return (
+        meta.get("page") if isinstance(meta.get("page"), int) else -1,
+        meta.get("slide_number") if isinstance(meta.get("slide_number"), int) else -1,
+        meta.get("start_index") if isinstance(meta.get("start_index"), int) else -1,
+    )
+
+
+def metadata_changes(stored: Dict[str, Any], meta: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+    """Mongo update ({"$set": …, "$unset": …}) bringing a kept chunk's stored
+    metadata in line with the new version's, or {} if nothing moved."""
+    update: Dict[str, Dict[str, Any]] = {}
+    changed = {k: v for k, v in meta.items() if stored.get(k) != v}
+    if changed:
+        update["$set"] = changed
+    gone = {k: "" for k in VOLATILE_KEYS if k in stored and k not in meta}
+    if gone:
+        update["$unset"] = gone
+    return update
+
+
+def metadata_revert(stored: Dict[str, Any], update: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    """The update undoing `update` (from metadata_changes) on that chunk:
+    puts back the stored values and drops keys it added."""
+    revert: Dict[str, Dict[str, Any]] = {}
+    keys = list(update.get("$set", {})) + list(update.get("$unset", {}))
+    restore = {k: stored[k] for k in keys if k in stored}
+    if restore:
+        revert["$set"] = restore
+    added = {k: "" for k in keys if k not in stored}
+    if added:
+        revert["$unset"] = added
+    return revert
+
+
+def diff_chunks(stored: Sequence[Dict[str, Any]], splits: Sequence) -> Tuple[
+        List[Tuple[Dict[str, Any], Any]], List[Any], List[Any]]:
+    """Match stored chunk docs (need `_id` and `content_hash`) against the new
+    version's Documents. Returns (kept [(doc, split)], added [split],
+    removed [_id]). Same-text chunks pair up in reading order. Stamps
+    `content_hash` on every split."""
+    old_by_hash: Dict[str, List[Dict[str, Any]]] = {}
+    for doc in stored:
+        old_by_hash.setdefault(doc.get("content_hash"), []).append(doc)
+    new_by_hash: Dict[str, List[Any]] = {}
+    for split in splits:
+        digest = content_hash(split.page_content)
+        split.metadata["content_hash"] = digest
+        new_by_hash.setdefault(digest, []).append(split)
+
+    kept, added, removed = [], [], []
+    for digest, new in new_by_hash.items():
+        old = sorted(old_by_hash.pop(digest, []), key=_position)
+        new = sorted(new, key=lambda s: _position(s.metadata))
+        kept.extend(zip(old, new))
+        added.extend(new[len(old):])
+        removed.extend(doc["_id"] for doc in old[len(new):])
+    # Chunks stored before content_hash existed land here too (hash None).
+    for docs in old_by_hash.values():
+        removed.extend(doc["_id"] for doc in docs)
+    return kept, added, removed
@@ -0,0 +1,183 @@
+"""
+Batched, bounded-concurrency embedding stage for ingestion.
+
+Replaces the single `from_documents` call that embedded and inserted a whole
+upload in one synchronous shot. Chunks are:
+
+  1. hashed and looked up in the content-addressed store (embedding_store)
+     — known chunks are written immediately, no API call;
+  2. grouped into token-budgeted batches of unseen content;
+  3. embedded on a small thread pool, retrying 429s with backoff;
+  4. written with `insert_many` as each batch completes, so a large file
+     streams into vector_collection instead of landing all at once.
+
+`on_progress(done, total)` is called from the caller's thread after every
+batch — the async upload worker turns it into `upload_job_progress` events.
+Every scope (chunk config_id) written to gets its version bumped, even on
+failure, so local indexes never serve a half-ingested file as current.
+"""
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional, Sequence
+
+from src.retrieval import scope_versions
+from src.retrieval.quantization import encode_for_storage
+from src.utils.vector_stores.embedding_store import (
+    TEXT_KEY,
+    VECTOR_COLLECTION,
+    content_hash,
+    embedding_model_key,
+    lookup_vectors,
+    remember_vectors,
+)
+
+logger = logging.getLogger(__name__)
+
+# OpenAI caps a single embeddings request at 300k input tokens / 2048 inputs.
+# Staying well below keeps each batch fast and gives the pool work to share.
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "50000"))
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "256"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "4"))
+EMBED_MAX_RETRIES = 5
+EMBED_BACKOFF_BASE_SECONDS = 1.0
+EMBED_BACKOFF_MAX_SECONDS = 30.0
+
+
+def estimate_tokens(text: str) -> int:
+    """~4 characters per token for English; good enough for batch sizing."""
+    return max(1, len(text or "") // 4)
+
+
+def make_batches(texts: Sequence[str], max_tokens: int = EMBED_BATCH_MAX_TOKENS,
+                 max_items: int = EMBED_BATCH_MAX_ITEMS) -> List[List[int]]:
+    """Group text indices into batches under both the token and item caps.
+
+    A single text larger than `max_tokens` gets a batch of its own.
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (current_tokens + tokens > max_tokens or len(current) >= max_items):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+def _is_rate_limited(exc: Exception) -> bool:
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    return status == 429 or type(exc).__name__ == "RateLimitError"
+
+
+def embed_with_backoff(embeddings, texts: List[str], max_retries: int = EMBED_MAX_RETRIES,
+                       sleep: Callable[[float], None] = time.sleep) -> List[List[float]]:
+    """`embed_documents` with exponential backoff + jitter on 429s only.
+
+    Anything other than a rate limit is raised straight away.
+    """
+    attempt = 0
+    while True:
+        try:
+            return embeddings.embed_documents(texts)
+        except Exception as e:
+            if not _is_rate_limited(e) or attempt >= max_retries:
+                raise
+            delay = min(EMBED_BACKOFF_MAX_SECONDS, EMBED_BACKOFF_BASE_SECONDS * (2 ** attempt))
+            delay += random.uniform(0, delay / 2)
+            logger.warning(
+                "Embedding rate-limited, retrying | inputs=%d attempt=%d delay=%.1fs",
+                len(texts), attempt + 1, delay,
+            )
+            sleep(delay)
+            attempt += 1
+
+
+def run_embedding_pipeline(splits, embeddings, db,
+                           on_progress: Optional[Callable[[int, int], None]] = None,
+                           max_workers: int = EMBED_MAX_WORKERS) -> dict:
+    """Embed (reusing known vectors) and insert LangChain Documents.
+
+    Stamps `content_hash` on each split's metadata. Returns stats with
+    chunks / embedded / reused / reuse_ratio / batches. Raises if any batch
+    ultimately fails — the caller decides how to clean up.
+    """
+    if not splits:
+        return {"chunks": 0, "embedded": 0, "reused": 0, "reuse_ratio": 0.0, "batches": 0}
+
+    model = embedding_model_key(embeddings)
+    collection = db[VECTOR_COLLECTION]
+
+    by_digest: Dict[str, list] = {}
+    for split in splits:
+        digest = content_hash(split.page_content)
+        split.metadata["content_hash"] = digest
+        by_digest.setdefault(digest, []).append(split)
+
+    scopes = {split.metadata.get("config_id") for split in splits}
+    try:
+        return _embed_and_insert(by_digest, splits, embeddings, db, model, collection,
+                                 on_progress, max_workers)
+    finally:
+        scope_versions.bump(db, *scopes)
+
+
+def _embed_and_insert(by_digest, splits, embeddings, db, model, collection,
+                      on_progress, max_workers) -> dict:
+    def to_docs(digests, vectors):
+        return [
+            {TEXT_KEY: split.page_content, **encode_for_storage(vector), **split.metadata}
+            for digest, vector in zip(digests, vectors)
+            for split in by_digest[digest]
+        ]
+
+    known = lookup_vectors(db, model, list(by_digest))
+    if known:
+        known_digests = list(known)
+        collection.insert_many(to_docs(known_digests, [known[d] for d in known_digests]), ordered=False)
+
+    unseen = [d for d in by_digest if d not in known]
+    unseen_texts = [by_digest[d][0].page_content for d in unseen]
+    batches = make_batches(unseen_texts)
+    total = len(batches)
+    if on_progress:
+        on_progress(0, total)
+
+    def embed_batch(indices):
+        texts = [unseen_texts[i] for i in indices]
+        return indices, embed_with_backoff(embeddings, texts)
+
+    done = 0
+    if batches:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as pool:
+            futures = [pool.submit(embed_batch, b) for b in batches]
+            try:
+                for fut in as_completed(futures):
+                    indices, vectors = fut.result()
+                    digests = [unseen[i] for i in indices]
+                    remember_vectors(db, model, dict(zip(digests, vectors)))
+                    collection.insert_many(to_docs(digests, vectors), ordered=False)
+                    done += 1
+                    if on_progress:
+                        on_progress(done, total)
+            except Exception:
+                # The caller rolls the file back: don't pay for batches
+                # that haven't started.
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+
+    embedded = len(unseen)
+    return {
+        "chunks": len(splits),
+        "embedded": embedded,
+        "reused": len(splits) - embedded,
+        "reuse_ratio": round((len(splits) - embedded) / len(splits), 4),
+        "batches": total,
+    }
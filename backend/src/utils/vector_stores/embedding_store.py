@@ -0,0 +1,110 @@
+"""
+Content-addressed embedding store for ingestion.
+
+The same syllabus gets uploaded by dozens of professors, and re-uploading a
+renamed file used to re-embed every chunk. Here each chunk's text is hashed
+and looked up in `chunk_embeddings` in one bulk query; only unseen chunks go
+to the embeddings API (embed_pipeline.run_embedding_pipeline does the
+lookup, batching and write-back). Vectors are keyed by (model, content hash) so a model
+or dimension change never serves stale vectors.
+
+Chunks are written to `vector_collection` (by embed_pipeline) in the same
+shape MongoDBAtlasVectorSearch.from_documents produces (`text`, `embedding`,
+flat metadata), plus a `content_hash` field used for dedupe and diffing.
+"""
+import hashlib
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_STORE_COLLECTION = "chunk_embeddings"
+VECTOR_COLLECTION = "vector_collection"
+TEXT_KEY = "text"
+EMBEDDING_KEY = "embedding"
+
+# Mongo caps $in lists by document size, not count; 1000 hashes is ~70 KB.
+_LOOKUP_BATCH = 1000
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def embedding_model_key(embeddings) -> str:
+    """Stable name for the model behind an Embeddings object (incl. dimensions)."""
+    model = getattr(embeddings, "model", "") or type(embeddings).__name__
+    dims = getattr(embeddings, "dimensions", None)
+    if dims and "@" not in model:
+        model = f"{model}@{dims}"
+    return model
+
+
+def _store_id(model: str, digest: str) -> str:
+    return f"{model}:{digest}"
+
+
+def lookup_vectors(db, model: str, digests: Sequence[str]) -> Dict[str, List[float]]:
+    """Bulk-fetch known vectors. Returns {digest: vector} for the hits only."""
+    found: Dict[str, List[float]] = {}
+    unique = list(dict.fromkeys(digests))
+    col = db[EMBEDDING_STORE_COLLECTION]
+    for i in range(0, len(unique), _LOOKUP_BATCH):
+        ids = [_store_id(model, d) for d in unique[i:i + _LOOKUP_BATCH]]
+        for doc in col.find({"_id": {"$in": ids}}, {"embedding": 1, "content_hash": 1}):
+            found[doc["content_hash"]] = doc["embedding"]
+    return found
+
+
+def remember_vectors(db, model: str, items: Dict[str, List[float]]) -> None:
+    """Persist freshly computed vectors.
+
+    Unordered insert: if a concurrent upload stored the same chunk first, its
+    duplicate-key error is expected and every other vector still lands.
+    """
+    if not items:
+        return
+    now = datetime.now(timezone.utc)
+    docs = [
+        {
+            "_id": _store_id(model, digest),
+            "model": model,
+            "content_hash": digest,
+            "embedding": vector,
+            "created_at": now,
+        }
+        for digest, vector in items.items()
+    ]
+    try:
+        db[EMBEDDING_STORE_COLLECTION].insert_many(docs, ordered=False)
+    except Exception as e:
+        write_errors = (getattr(e, "details", None) or {}).get("writeErrors") or []
+        if write_errors and all(err.get("code") == 11000 for err in write_errors):
+            return
+        # The chunks themselves are already embedded; losing the store write
+        # only costs a re-embed next time.
+        logger.warning("Embedding store write failed | vectors=%d err=%s", len(docs), e)
+
+
+def record_ingest_stats(db, source_file_id, stats: dict) -> None:
+    """Accumulate reuse counters on the user_files row (a mixed PDF ingests
+    twice: text layer, then OCR)."""
+    from bson import ObjectId
+    from bson.errors import InvalidId
+
+    try:
+        oid = ObjectId(str(source_file_id))
+    except (InvalidId, TypeError):
+        return
+    try:
+        db["user_files"].update_one(
+            {"_id": oid},
+            {"$inc": {
+                "ingest_stats.chunks": stats.get("chunks", 0),
+                "ingest_stats.embedded": stats.get("embedded", 0),
+                "ingest_stats.reused": stats.get("reused", 0),
+            }},
+        )
+    except Exception as e:
+        logger.warning("Failed to record ingest stats | file_id=%s err=%s", source_file_id, e)
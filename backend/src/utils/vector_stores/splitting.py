@@ -0,0 +1,27 @@
+"""
+Single home for the ingestion text splitter.
+
+Chunk size / overlap used to be hard-coded at every ingestion site. Chunks
+now also carry `start_index` (character offset within their page/document)
+so the context builder can stitch neighbouring chunks back together and drop
+the overlap instead of sending it twice.
+
+Which splitting strategy runs for which file type lives in
+src/utils/chunking/; this is the plain character splitter it builds on.
+"""
+import os
+from typing import Optional
+
+CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "500"))
+CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "20"))
+
+
+def get_text_splitter(chunk_size: Optional[int] = None,
+                      chunk_overlap: Optional[int] = None) -> "RecursiveCharacterTextSplitter":
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size or CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP if chunk_overlap is None else chunk_overlap,
+        add_start_index=True,
+    )
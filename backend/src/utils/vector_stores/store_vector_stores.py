@@ -1,41 +1,48 @@
 import os
 import shutil
-import base64
 import logging
 from flask import current_app
 from langchain_community.document_loaders import Docx2txtLoader, PyPDFLoader, TextLoader
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings
-
-import time
-from langchain_mongodb.vectorstores import MongoDBAtlasVectorSearch
+from pymongo import UpdateOne
 
 from src.utils.loaders.pptx_loader import SimplePPTXLoader
+from src.utils.loaders.stream_loaders import get_stream_loader
+from src.retrieval import scope_versions
+from src.retrieval.quantization import RESCORE_KEY
+from src.utils.vector_stores.chunk_diff import diff_chunks, metadata_changes, metadata_revert
+from src.utils.vector_stores.embed_pipeline import run_embedding_pipeline
+from src.utils.vector_stores.embedding_store import record_ingest_stats
+from src.utils.chunking.registry import chunk_documents, chunk_settings
+from src.ocr.batching import OCRDeferred
+from src.ocr.engine import OCRIncomplete, ocr_pdf
 
 logger = logging.getLogger(__name__)
 
 # Claude PDF input limits (Anthropic spec)
 CLAUDE_PDF_MAX_BYTES = 32 * 1024 * 1024
-CLAUDE_PDF_MAX_PAGES = 100
-CLAUDE_PDF_FALLBACK_MODEL = "claude-haiku-4-5-20251001"
-
-# Anthropic Batch API: 50% off, but adds polling latency. Only worth using
-# for jobs large enough that the savings outweigh the wait.
-CLAUDE_BATCH_PAGE_THRESHOLD = 40
-CLAUDE_BATCH_TIMEOUT_SECONDS = 600  # 10 min hard cap
+# Chunks per embed+write group when streaming a large file (worker path).
+INGEST_STREAM_GROUP_CHUNKS = int(os.getenv("INGEST_STREAM_GROUP_CHUNKS", "200"))
 
 
-def _extract_pdf_text_via_claude(pdf_path: str, filename: str, page_indices=None) -> str | None:
+def _extract_pdf_text_via_claude(pdf_path: str, filename: str, page_indices=None,
+                                 checkpoint_key=None, batch_resume=None, realtime_only=False) -> str | None:
     """Fallback for scanned/image-only PDFs.
 
-    Renders each page to a 150-DPI JPEG via PyMuPDF and sends them as image
-    blocks to Claude Haiku for transcription. Cheaper than the raw `document`
-    block because we control DPI + JPEG quality. If page_indices is given
-    (0-based), only those pages are rendered — used for mixed PDFs where
-    pypdf already extracted text from the rest. Returns the text, or None
-    if the PDF exceeds limits, a dep/key is missing, or the call fails.
-    Caller logs + treats None as a clean failure.
+    Renders pages to JPEGs via PyMuPDF and has Claude Haiku transcribe them,
+    OCR_WINDOW_PAGES per request, several windows in flight at once (see
+    src/ocr/engine.py). If page_indices is given (0-based), only those pages
+    are rendered — used for mixed PDFs where pypdf already extracted text
+    from the rest. With a checkpoint_key, finished windows are saved and a
+    window that still fails raises OCRIncomplete, so the job retries and
+    only redoes the ones that failed. Returns the text, or None if the PDF
+    exceeds limits, a dep/key is missing, or (without a checkpoint_key) a
+    window still fails. Caller logs + treats None as a clean failure.
+
+    Jobs pass `batch_resume` (and a checkpoint_key): a large scan then joins
+    the shared Message Batch (src/ocr/batching.py) and OCRDeferred is raised
+    — the job stops and `batch_resume` runs once the windows are back.
     """
     try:
         size = os.path.getsize(pdf_path)
@@ -58,13 +65,13 @@ def _extract_pdf_text_via_claude(pdf_path: str, filename: str, page_indices=None
             return None
 
         try:
-            import fitz  # PyMuPDF
+            import fitz  # noqa: F401  PyMuPDF
         except ImportError:
             logger.error("Claude PDF fallback: pymupdf not installed | file=%s", filename)
             return None
 
         try:
-            from anthropic import Anthropic
+            import anthropic  # noqa: F401
         except ImportError:
             logger.error(
                 "Claude PDF fallback: anthropic SDK not installed | file=%s",
@@ -72,69 +79,34 @@ def _extract_pdf_text_via_claude(pdf_path: str, filename: str, page_indices=None
             )
             return None
 
-        mat = fitz.Matrix(150 / 72, 150 / 72)  # 150 DPI
-        image_blocks = []
-        with fitz.open(pdf_path) as pdf_doc:
-            page_count = pdf_doc.page_count
-            selected = list(page_indices) if page_indices is not None else list(range(page_count))
-            if len(selected) > CLAUDE_PDF_MAX_PAGES:
-                logger.error(
-                    "Claude PDF fallback: too many pages | file=%s pages=%s max=%s",
-                    filename, len(selected), CLAUDE_PDF_MAX_PAGES,
-                )
-                return None
-
-            for i in selected:
-                pix = pdf_doc[i].get_pixmap(matrix=mat, alpha=False)
-                img_bytes = pix.tobytes("jpeg", jpg_quality=75)
-                image_blocks.append({
-                    "type": "image",
-                    "source": {
-                        "type": "base64",
-                        "media_type": "image/jpeg",
-                        "data": base64.b64encode(img_bytes).decode("ascii"),
-                    },
-                })
-
-        content = [
-            *image_blocks,
-            {
-                "type": "text",
-                "text": (
-                    "Extract every piece of text from this document, in reading order. "
-                    "Preserve paragraph breaks, headings, and lists. Do not summarize, "
-                    "rephrase, or add commentary. Return only the extracted text."
-                ),
-            },
-        ]
-
-        client = Anthropic(api_key=api_key)
-        if len(selected) >= CLAUDE_BATCH_PAGE_THRESHOLD:
-            logger.info(
-                "Claude PDF fallback: using Batch API | file=%s pages=%d",
-                filename, len(selected),
-            )
-            text, usage = _claude_via_batch(client, content, filename)
-        else:
-            msg = client.messages.create(
-                model=CLAUDE_PDF_FALLBACK_MODEL,
-                max_tokens=8192,
-                messages=[{"role": "user", "content": content}],
+        text, stats = ocr_pdf(
+            pdf_path, filename, page_indices,
+            api_key=api_key,
+            checkpoint_key=checkpoint_key,
+            db=current_app.config.get("MONGO_DB") if checkpoint_key else None,
+            batch_resume=batch_resume,
+            realtime_only=realtime_only,
+        )
+        if text is None:
+            logger.error(
+                "Claude PDF fallback: windows failed | file=%s failed=%d/%d resumed=%d",
+                filename, stats["failed"], stats["windows"], stats["resumed"],
             )
-            text = "".join(b.text for b in msg.content if hasattr(b, "text"))
-            usage = getattr(msg, "usage", None)
-
-        if not text or not text.strip():
+            return None
+        if not text.strip():
             logger.error("Claude PDF fallback: empty response | file=%s", filename)
             return None
 
         logger.info(
-            "Claude PDF fallback OK | file=%s pages=%s chars=%d in_tokens=%s out_tokens=%s",
-            filename, len(selected), len(text),
-            getattr(usage, "input_tokens", "?") if usage else "?",
-            getattr(usage, "output_tokens", "?") if usage else "?",
+            "Claude PDF fallback OK | file=%s pages=%s windows=%d resumed=%d batch=%s chars=%d "
+            "skipped_blank=%d skipped_dup=%d image_kib=%d in_tokens=%s out_tokens=%s",
+            filename, stats["pages"], stats["windows"], stats["resumed"], stats["batch"], len(text),
+            stats["skipped_blank"], stats["skipped_duplicate"], stats["image_bytes"] // 1024,
+            stats["input_tokens"], stats["output_tokens"],
         )
         return text
+    except (OCRDeferred, OCRIncomplete):
+        raise
     except Exception as e:
         logger.error(
             "Claude PDF fallback: API call crashed | file=%s err=%s",
@@ -144,63 +116,6 @@ def _extract_pdf_text_via_claude(pdf_path: str, filename: str, page_indices=None
         return None
 
 
-def _claude_via_batch(client, content, filename):
-    """Submit a single-request Message Batch and poll until it ends.
-
-    Returns (text, usage) on success, (None, None) on timeout / error /
-    non-success result. Caller decides whether to treat None as a hard fail.
-    """
-    try:
-        batch = client.messages.batches.create(
-            requests=[{
-                "custom_id": "ocr-1",
-                "params": {
-                    "model": CLAUDE_PDF_FALLBACK_MODEL,
-                    "max_tokens": 8192,
-                    "messages": [{"role": "user", "content": content}],
-                },
-            }],
-        )
-        logger.info("Claude batch submitted | file=%s batch=%s", filename, batch.id)
-
-        start = time.time()
-        deadline = start + CLAUDE_BATCH_TIMEOUT_SECONDS
-        while True:
-            b = client.messages.batches.retrieve(batch.id)
-            if b.processing_status == "ended":
-                break
-            if time.time() > deadline:
-                logger.error(
-                    "Claude batch timed out | file=%s batch=%s elapsed=%ds",
-                    filename, batch.id, int(time.time() - start),
-                )
-                try:
-                    client.messages.batches.cancel(batch.id)
-                except Exception:
-                    pass
-                return None, None
-            time.sleep(5 if (time.time() - start) < 60 else 15)
-
-        for result in client.messages.batches.results(batch.id):
-            if result.result.type != "succeeded":
-                logger.error(
-                    "Claude batch result not succeeded | file=%s type=%s",
-                    filename, result.result.type,
-                )
-                return None, None
-            msg = result.result.message
-            text = "".join(b.text for b in msg.content if hasattr(b, "text"))
-            return text, getattr(msg, "usage", None)
-        return None, None
-    except Exception as e:
-        logger.error(
-            "Claude batch crashed | file=%s err=%s",
-            filename, e,
-            exc_info=True,
-        )
-        return None, None
-
-
 def get_document_loader(file_path):
     """
     Returns the appropriate LangChain document loader based on the file extension.
@@ -250,7 +165,7 @@ def handle_cleanup_error(func, path, exc_info):
     """
     current_app.logger.error(f"Error during cleanup of {path}: {exc_info}")
 
-def process_files_and_create_vector_store(temp_file_paths, user_id, collection_name, config_id):
+def process_files_and_create_vector_store(temp_file_paths, user_id, collection_name, config_id, chunking=None):
     """
     Processes multiple uploaded documents, combines their content, creates a single 
     Chroma vector store, uploads it to S3, and cleans up local files.
@@ -259,6 +174,8 @@ def process_files_and_create_vector_store(temp_file_paths, user_id, collection_n
         temp_file_paths (list): A list of paths to the temporary uploaded files.
         user_id (str): The ID of the user.
         collection_name (str): The name for the ChromaDB collection.
+        chunking (dict): chunk_size / chunk_overlap overrides; read from the
+            config when omitted.
 
     Returns:
         str: The S3 path to the created vector store, or None if an error occurs.
@@ -269,7 +186,8 @@ def process_files_and_create_vector_store(temp_file_paths, user_id, collection_n
 
     try:
         db = current_app.config['MONGO_DB']
-        mongo_collection = db['vector_collection']
+        if chunking is None:
+            chunking = chunk_settings(db, config_id)
 
         # --- 1. Load and Split Documents from All Files ---
         for temp_file_path in temp_file_paths:
@@ -287,8 +205,7 @@ def process_files_and_create_vector_store(temp_file_paths, user_id, collection_n
 
 
             # Split the document and add its chunks to the master list
-            recursive_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20)
-            splits = recursive_splitter.split_documents(pages)
+            splits = chunk_documents(pages, type(loader).__name__, **chunking)
             for split in splits:
                 split.metadata['user_id'] = user_id
                 split.metadata['config_id'] = str(config_id) # Link chunk to the config
@@ -307,14 +224,12 @@ def process_files_and_create_vector_store(temp_file_paths, user_id, collection_n
         current_app.logger.info(f"Inserting {len(all_splits)} document chunks into Atlas for collection '{collection_name}'")
         # Note: Ensure you have your OpenAI API key set in your environment for this to work
         embeddings = current_app.config['EMBEDDINGS']
-        
-        MongoDBAtlasVectorSearch.from_documents(
-            documents=all_splits,
-            embedding=embeddings,
-            collection=mongo_collection,
-            index_name="vector"
+
+        stats = run_embedding_pipeline(all_splits, embeddings, db)
+        current_app.logger.info(
+            "Successfully inserted vectors into MongoDB Atlas. reused=%d embedded=%d reuse_ratio=%.2f",
+            stats["reused"], stats["embedded"], stats["reuse_ratio"],
         )
-        current_app.logger.info("Successfully inserted vectors into MongoDB Atlas.")
        
         # --- 3. Upload the Entire Vector Store Directory to S3 ---
         
@@ -330,13 +245,56 @@ def process_files_and_create_vector_store(temp_file_paths, user_id, collection_n
                 current_app.logger.info(f"Cleaned up temporary upload file: {temp_file_path}")
 
 
-def extract_pdf_chunks_fast(temp_file_path, filename):
+def iter_file_chunks(temp_file_path, filename, chunking=None, stats=None):
+    """Yield chunks page by page.
+
+    Pages come from the loader's lazy_load(), so only the current page's
+    text is held — memory doesn't grow with page count. `stats` (a dict) is
+    filled in as pages stream by: `pages` seen and `image_only` 0-based
+    indices of PDF pages with no extractable text. Raises ValueError if no
+    loader handles the file; loader errors propagate.
+    """
+    loader = get_document_loader(temp_file_path)
+    if not loader:
+        raise ValueError(f"No loader for {filename}")
+    yield from _iter_loader_chunks(loader, type(loader).__name__, filename, chunking, stats)
+
+
+def iter_stream_chunks(stream, filename, chunking=None, stats=None):
+    """iter_file_chunks for a binary file object (a direct upload read from
+    S3 — see s3_client.S3ObjectReader). Same chunks, same `stats`."""
+    loader = get_stream_loader(stream, filename)
+    if not loader:
+        raise ValueError(f"No loader for {filename}")
+    yield from _iter_loader_chunks(loader, loader.loader_type, filename, chunking, stats)
+
+
+def _iter_loader_chunks(loader, loader_type, filename, chunking, stats):
+    stats = {} if stats is None else stats
+    stats.setdefault("pages", 0)
+    stats.setdefault("image_only", [])
+    is_pdf = os.path.splitext(filename)[1].lower() == ".pdf"
+    pages = loader.lazy_load() if hasattr(loader, "lazy_load") else iter(loader.load())
+    for i, page in enumerate(pages):
+        stats["pages"] = i + 1
+        if not (page.page_content or "").strip():
+            if is_pdf:
+                stats["image_only"].append(i)
+            continue
+        yield from chunk_documents([page], loader_type, **(chunking or {}))
+
+
+def extract_pdf_chunks_fast(temp_file_path, filename, chunking=None):
     """Fast synchronous extraction via pypdf (no Claude).
 
     Returns (chunks, page_count, image_only_pages). chunks may be [] if the
     PDF is scanned/image-only — caller decides whether to dispatch async OCR.
     image_only_pages is the 0-based indices of PDF pages with no extractable
     text (always [] for non-PDF files). Returns (None, 0, []) on hard error.
+
+    `chunking` holds the config's chunk_size / chunk_overlap (see
+    chunking.registry.chunk_settings); the strategy follows the loader.
+    Pages are read lazily and split one at a time (iter_file_chunks).
     """
     size_bytes = os.path.getsize(temp_file_path) if os.path.exists(temp_file_path) else -1
     ext = os.path.splitext(filename)[1].lower()
@@ -345,66 +303,127 @@ def extract_pdf_chunks_fast(temp_file_path, filename):
         filename, ext, size_bytes,
     )
 
-    loader = get_document_loader(temp_file_path)
-    if not loader:
+    stats = {}
+    try:
+        splits = list(iter_file_chunks(temp_file_path, filename, chunking, stats))
+    except ValueError:
         logger.error(
             "Ingest FAIL: no loader for file | file=%s ext=%s size=%s",
             filename, ext, size_bytes,
         )
         return None, 0, []
-
-    try:
-        pages = loader.load()
     except Exception as e:
         logger.error(
-            "Ingest FAIL: loader.load() crashed | file=%s loader=%s err=%s",
-            filename, type(loader).__name__, e,
+            "Ingest FAIL: loader crashed | file=%s page=%s err=%s",
+            filename, stats.get("pages"), e,
             exc_info=True,
         )
         return None, 0, []
 
-    logger.info("Ingest LOADED | file=%s pages=%d", filename, len(pages))
+    logger.info("Ingest LOADED | file=%s pages=%d chunks=%d", filename, stats["pages"], len(splits))
+    return splits, stats["pages"], stats["image_only"]
 
-    image_only = []
-    if ext == ".pdf":
-        image_only = [
-            i for i, p in enumerate(pages)
-            if not (p.page_content or "").strip()
-        ]
 
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20)
-    splits = splitter.split_documents(pages)
-    return splits, len(pages), image_only
+def ingest_chunk_stream(chunks, user_id, folder_path, filename, source_file_id, config_id_override=None,
+                        on_progress=None, group_size=None):
+    """ingest_chunks for a chunk iterator, INGEST_STREAM_GROUP_CHUNKS at a time.
 
+    Each group is embedded and written before the next is pulled, so a
+    large file never has all its chunks (or vectors) in memory. Returns the
+    number of chunks written, or None on failure — groups already written by
+    this call are removed. `on_progress(done, total)` counts embedding
+    batches across groups (total grows as groups arrive).
+    """
+    group_size = group_size or INGEST_STREAM_GROUP_CHUNKS
+    written, digests = 0, []
+    batches = {"before": 0, "group": 0}
+
+    def progress(done, total):
+        batches["group"] = total
+        if on_progress:
+            on_progress(batches["before"] + done, batches["before"] + total)
+
+    def flush(group):
+        if not ingest_chunks(group, user_id, folder_path, filename, source_file_id,
+                             config_id_override, on_progress=progress):
+            return False
+        digests.extend(c.metadata.get("content_hash") for c in group if c.metadata.get("content_hash"))
+        batches["before"] += batches["group"]
+        return True
 
-def ingest_chunks(splits, user_id, folder_path, filename, source_file_id, config_id_override=None):
+    group = []
+    try:
+        for chunk in chunks:
+            group.append(chunk)
+            if len(group) >= group_size:
+                if not flush(group):
+                    raise RuntimeError("group ingest failed")
+                written += len(group)
+                group = []
+        if group:
+            if not flush(group):
+                raise RuntimeError("group ingest failed")
+            written += len(group)
+    except Exception as e:
+        logger.error(
+            "Ingest stream FAIL | file=%s written=%d err=%s",
+            filename, written, e,
+            exc_info=not isinstance(e, RuntimeError),
+        )
+        if digests:
+            db = current_app.config['MONGO_DB']
+            try:
+                db['vector_collection'].delete_many({
+                    "source_file_id": str(source_file_id),
+                    "content_hash": {"$in": digests},
+                })
+                scope_versions.bump(db, config_id_override or f"user:{user_id}")
+            except Exception:
+                pass
+        return None
+    logger.info("Ingest stream OK | file=%s chunks=%d", filename, written)
+    return written
+
+
+def _stamp_metadata(splits, user_id, folder_path, filename, source_file_id, config_id_override=None):
+    """Ownership / scope metadata every stored chunk carries. Returns the
+    effective config_id."""
+    effective_config_id = config_id_override if config_id_override else f"user:{user_id}"
+    scope = 'config' if config_id_override else 'user'
+    for split in splits:
+        split.metadata['user_id'] = user_id
+        split.metadata['config_id'] = effective_config_id
+        split.metadata['owner_user_id'] = user_id
+        split.metadata['scope'] = scope
+        split.metadata['source_file_id'] = str(source_file_id)
+        split.metadata['folder_path'] = folder_path or ''
+        split.metadata['original_file'] = filename
+    return effective_config_id
+
+
+def ingest_chunks(splits, user_id, folder_path, filename, source_file_id, config_id_override=None,
+                  on_progress=None):
     """Stamp metadata onto chunks and write them to the vector collection.
 
-    Returns True on success, False on failure. Logs explicit error lines.
+    Embedding runs through the batched pipeline; `on_progress(done, total)`
+    is called after each embedding batch. Returns True on success, False on
+    failure (chunks written by this call are removed). Logs explicit error
+    lines.
     """
     if not splits:
         return False
+    db = current_app.config['MONGO_DB']
     try:
-        effective_config_id = config_id_override if config_id_override else f"user:{user_id}"
-        scope = 'config' if config_id_override else 'user'
-        for split in splits:
-            split.metadata['user_id'] = user_id
-            split.metadata['config_id'] = effective_config_id
-            split.metadata['owner_user_id'] = user_id
-            split.metadata['scope'] = scope
-            split.metadata['source_file_id'] = str(source_file_id)
-            split.metadata['folder_path'] = folder_path or ''
-            split.metadata['original_file'] = filename
-
-        MongoDBAtlasVectorSearch.from_documents(
-            documents=splits,
-            embedding=current_app.config['EMBEDDINGS'],
-            collection=current_app.config['MONGO_DB']['vector_collection'],
-            index_name="vector",
+        effective_config_id = _stamp_metadata(splits, user_id, folder_path, filename, source_file_id,
+                                              config_id_override)
+        stats = run_embedding_pipeline(
+            splits, current_app.config['EMBEDDINGS'], db, on_progress=on_progress,
         )
+        record_ingest_stats(db, source_file_id, stats)
         logger.info(
-            "Ingest OK | file=%s chunks=%d config_id=%s",
-            filename, len(splits), effective_config_id,
+            "Ingest OK | file=%s chunks=%d batches=%d config_id=%s reused=%d embedded=%d reuse_ratio=%.2f",
+            filename, len(splits), stats["batches"], effective_config_id,
+            stats["reused"], stats["embedded"], stats["reuse_ratio"],
         )
         return True
     except Exception as e:
@@ -413,9 +432,99 @@ def ingest_chunks(splits, user_id, folder_path, filename, source_file_id, config
             filename, len(splits), e,
             exc_info=True,
         )
+        # Batches that landed before the failure would otherwise be orphaned.
+        digests = [s.metadata.get("content_hash") for s in splits if s.metadata.get("content_hash")]
+        try:
+            db['vector_collection'].delete_many({
+                "source_file_id": str(source_file_id),
+                "content_hash": {"$in": digests},
+            })
+            scope_versions.bump(db, effective_config_id)
+        except Exception:
+            pass
         return False
 
 
+def replace_file_chunks(splits, user_id, folder_path, filename, source_file_id, config_id_override=None):
+    """Bring a file's stored chunks in line with `splits` (its new version)
+    via a chunk-level diff (chunk_diff.py): embed + insert only new text,
+    update metadata of kept chunks that moved, delete vanished ones.
+
+    New chunks are written before anything is deleted, so readers never see
+    the file with content missing. Returns {kept, added, removed, moved,
+    embedded}, or None on failure. A failure before the final delete rolls
+    back: chunks inserted for this version are deleted again and moved
+    metadata is put back, so the file reads as its old version and a retry
+    re-diffs from there.
+    """
+    db = current_app.config['MONGO_DB']
+    col = db['vector_collection']
+    effective_config_id = _stamp_metadata(splits, user_id, folder_path, filename, source_file_id,
+                                          config_id_override)
+    scopes = {effective_config_id}
+    stored, added, moves = [], [], []
+    try:
+        stored = list(col.find(
+            {"source_file_id": str(source_file_id), "owner_user_id": user_id},
+            {"text": 0, "embedding": 0, RESCORE_KEY: 0},
+        ))
+        kept, added, removed = diff_chunks(stored, splits)
+        scopes |= {d.get("config_id") for d in stored if d.get("config_id")}
+
+        stats = {"kept": len(kept), "added": len(added), "removed": len(removed), "moved": 0, "embedded": 0}
+        if added:
+            pipeline_stats = run_embedding_pipeline(added, current_app.config['EMBEDDINGS'], db)
+            record_ingest_stats(db, source_file_id, pipeline_stats)
+            stats["embedded"] = pipeline_stats["embedded"]
+
+        for doc, split in kept:
+            update = metadata_changes(doc, split.metadata)
+            if update:
+                moves.append((doc, update))
+        if moves:
+            col.bulk_write([UpdateOne({"_id": doc["_id"]}, update) for doc, update in moves], ordered=False)
+            stats["moved"] = len(moves)
+        if removed:
+            col.delete_many({"_id": {"$in": removed}})
+        if moves or removed:
+            scope_versions.bump(db, *scopes)
+
+        logger.info(
+            "Replace OK | file=%s kept=%d added=%d removed=%d moved=%d embedded=%d",
+            filename, stats["kept"], stats["added"], stats["removed"], stats["moved"], stats["embedded"],
+        )
+        return stats
+    except Exception as e:
+        logger.error(
+            "Replace FAIL | file=%s file_id=%s err=%s",
+            filename, source_file_id, e,
+            exc_info=True,
+        )
+        if added or moves:
+            _rollback_replace(col, db, source_file_id, stored, added, moves, scopes)
+        return None
+
+
+def _rollback_replace(col, db, source_file_id, stored, added, moves, scopes):
+    """Undo a failed replace_file_chunks: drop the chunks it inserted (by
+    content hash, never one of the stored chunks) and put moved metadata
+    back. Best-effort — logged, never raised."""
+    try:
+        if added:
+            col.delete_many({
+                "source_file_id": str(source_file_id),
+                "content_hash": {"$in": list({s.metadata["content_hash"] for s in added})},
+                "_id": {"$nin": [d["_id"] for d in stored]},
+            })
+        if moves:
+            col.bulk_write([UpdateOne({"_id": doc["_id"]}, metadata_revert(doc, update))
+                            for doc, update in moves], ordered=False)
+        scope_versions.bump(db, *scopes)
+        logger.info("Replace rolled back | file_id=%s added=%d moved=%d", source_file_id, len(added), len(moves))
+    except Exception as e:
+        logger.error("Replace rollback FAIL | file_id=%s err=%s", source_file_id, e, exc_info=True)
+
+
 def process_user_file_and_create_vectors(temp_file_path, user_id, folder_path, filename, source_file_id, config_id_override=None):
     """
     Synchronous orchestrator: pypdf → (Claude fallback if image-only PDF) → ingest.
@@ -426,7 +535,8 @@ def process_user_file_and_create_vectors(temp_file_path, user_id, folder_path, f
     """
     try:
         ext = os.path.splitext(filename)[1].lower()
-        splits, page_count, _ = extract_pdf_chunks_fast(temp_file_path, filename)
+        chunking = chunk_settings(current_app.config['MONGO_DB'], config_id_override)
+        splits, page_count, _ = extract_pdf_chunks_fast(temp_file_path, filename, chunking)
         if splits is None:
             return False  # hard error already logged
 
@@ -437,10 +547,9 @@ def process_user_file_and_create_vectors(temp_file_path, user_id, folder_path, f
             )
             extracted = _extract_pdf_text_via_claude(temp_file_path, filename)
             if extracted:
-                splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20)
-                splits = splitter.split_documents([
+                splits = chunk_documents([
                     Document(page_content=extracted, metadata={"source": filename})
-                ])
+                ], "ocr", **chunking)
                 logger.info("Ingest FALLBACK: Claude produced %d chunks | file=%s", len(splits), filename)
 
         if not splits:
@@ -473,10 +582,8 @@ def process_user_url_and_create_vectors(documents, user_id, folder_path, filenam
         )
 
         db = current_app.config['MONGO_DB']
-        mongo_collection = db['vector_collection']
 
-        splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=20)
-        splits = splitter.split_documents(documents)
+        splits = chunk_documents(documents, "web", **chunk_settings(db, config_id_override))
         if not splits:
             logger.error(
                 "Ingest URL FAIL: no chunks produced | url=%s docs=%d "
@@ -498,12 +605,7 @@ def process_user_url_and_create_vectors(documents, user_id, folder_path, filenam
             split.metadata['source_url'] = source_url
 
         try:
-            MongoDBAtlasVectorSearch.from_documents(
-                documents=splits,
-                embedding=current_app.config['EMBEDDINGS'],
-                collection=mongo_collection,
-                index_name="vector"
-            )
+            stats = run_embedding_pipeline(splits, current_app.config['EMBEDDINGS'], db)
         except Exception as e:
             logger.error(
                 "Ingest URL FAIL: vector write/embed crashed | url=%s chunks=%d err=%s",
@@ -512,7 +614,11 @@ def process_user_url_and_create_vectors(documents, user_id, folder_path, filenam
             )
             return False
 
-        logger.info("Ingest URL OK | url=%s chunks=%d", source_url, len(splits))
+        record_ingest_stats(db, source_file_id, stats)
+        logger.info(
+            "Ingest URL OK | url=%s chunks=%d reused=%d embedded=%d reuse_ratio=%.2f",
+            source_url, len(splits), stats["reused"], stats["embedded"], stats["reuse_ratio"],
+        )
         return True
     except Exception as e:
         logger.error(
@@ -0,0 +1,203 @@
+"""
+Shared cache of fetched pages (extracted text + title), keyed by
+normalized URL.
+
+Popular course links were downloaded and run through trafilatura every
+time any student's agent called `web_fetch`. Pages now come from (1) an
+in-process LRU/TTL cache, then (2) the `page_cache` Mongo collection shared
+by every worker, and only then (3) the network. Used by:
+
+  - the web_fetch agent tool (fetch_documents)
+  - single-URL ingestion (fetch_documents)
+  - bulk URL ingestion, which always revalidates with the origin and
+    stores what it extracted (put_page) so the tool sees it too
+
+The shared tier is bounded two ways: entries expire PAGE_CACHE_TTL_SECONDS
+after they were fetched (TTL index on `created_at`, see
+create_cache_indexes.py, plus a read-side check), and every
+PAGE_CACHE_EVICT_EVERY writes the least recently used pages are dropped
+until the collection is under PAGE_CACHE_MAX_MB / PAGE_CACHE_MAX_ENTRIES.
+Mongo errors are logged and treated as misses.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from langchain_core.documents import Document
+
+from src.utils.ttl_cache import TTLCache
+from src.utils.web.fetch import UnsafeURLError, _is_safe_url, fetch_url_as_documents
+
+logger = logging.getLogger(__name__)
+
+PAGE_CACHE_COLLECTION = "page_cache"
+PAGE_CACHE_TTL_SECONDS = float(os.getenv("PAGE_CACHE_TTL_SECONDS", str(6 * 3600)))
+PAGE_CACHE_MAX_MB = float(os.getenv("PAGE_CACHE_MAX_MB", "256"))
+PAGE_CACHE_MAX_ENTRIES = int(os.getenv("PAGE_CACHE_MAX_ENTRIES", "20000"))
+PAGE_CACHE_EVICT_EVERY = int(os.getenv("PAGE_CACHE_EVICT_EVERY", "50"))
+# A hit refreshes `last_access` at most this often (one write per page per
+# minute, not per read).
+LAST_ACCESS_RESOLUTION_SECONDS = 60
+
+# Query parameters that only track where a click came from.
+TRACKING_PARAMS = {"fbclid", "gclid", "dclid", "msclkid", "mc_cid", "mc_eid", "ref_src"}
+
+_memory = TTLCache(
+    "fetched_pages",
+    max_entries=int(os.getenv("PAGE_CACHE_MEMORY_ENTRIES", "512")),
+    ttl_seconds=PAGE_CACHE_TTL_SECONDS,
+)
+_lock = threading.Lock()
+_counters = {"shared_hits": 0, "fetches": 0, "stores": 0, "evicted": 0}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used for the cache key: lowercase scheme and host,
+    default port, fragment and tracking parameters dropped, remaining query
+    parameters sorted."""
+    parts = urlsplit((url or "").strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    if port and not ((scheme == "http" and port == 80) or (scheme == "https" and port == 443)):
+        host = f"{host}:{port}"
+    query = sorted(
+        (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+        if not k.lower().startswith("utm_") and k.lower() not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, host, parts.path or "/", urlencode(query), ""))
+
+
+def cache_key(url: str) -> str:
+    return hashlib.sha256(normalize_url(url).encode("utf-8")).hexdigest()
+
+
+def _count(name: str, n: int = 1) -> None:
+    with _lock:
+        _counters[name] += n
+
+
+def _collection(db):
+    if db is None:
+        from flask import current_app, has_app_context
+
+        if not has_app_context():
+            return None
+        db = current_app.config.get("MONGO_DB")
+    return db[PAGE_CACHE_COLLECTION] if db is not None else None
+
+
+def get_page(url: str, db=None) -> Optional[Dict[str, Any]]:
+    """Cached {url, title, text, fetched_at} for `url`, or None."""
+    key = cache_key(url)
+    page = _memory.get(key)
+    if page is not None:
+        return page
+    col = _collection(db)
+    if col is None:
+        return None
+    now = time.time()
+    try:
+        doc = col.find_one({"_id": key})
+        if not doc or now - doc["fetched_at"] >= PAGE_CACHE_TTL_SECONDS:
+            return None
+        if now - doc.get("last_access", 0) >= LAST_ACCESS_RESOLUTION_SECONDS:
+            col.update_one({"_id": key}, {"$set": {"last_access": now}})
+    except Exception as e:
+        logger.warning("Page cache read failed: %s", e)
+        return None
+    page = {"url": doc["url"], "title": doc.get("title"), "text": doc["text"], "fetched_at": doc["fetched_at"]}
+    _count("shared_hits")
+    _memory.set(key, page, ttl_seconds=max(1.0, doc["fetched_at"] + PAGE_CACHE_TTL_SECONDS - now))
+    return page
+
+
+def put_page(url: str, text: str, title: Optional[str] = None, db=None) -> None:
+    """Store a freshly fetched page in both tiers."""
+    key = cache_key(url)
+    now = time.time()
+    page = {"url": url, "title": title, "text": text, "fetched_at": now}
+    _memory.set(key, page)
+    col = _collection(db)
+    if col is None:
+        return
+    try:
+        col.replace_one({"_id": key}, {
+            **page,
+            "bytes": len(text.encode("utf-8")),
+            "last_access": now,
+            "created_at": datetime.now(timezone.utc),
+        }, upsert=True)
+    except Exception as e:
+        logger.warning("Page cache write failed: %s", e)
+        return
+    with _lock:
+        _counters["stores"] += 1
+        evict = _counters["stores"] % PAGE_CACHE_EVICT_EVERY == 0
+    if evict:
+        enforce_limits(col)
+
+
+def enforce_limits(col) -> int:
+    """Drop least recently used pages until the collection is within
+    PAGE_CACHE_MAX_MB and PAGE_CACHE_MAX_ENTRIES. Returns pages removed."""
+    try:
+        totals = list(col.aggregate([{"$group": {"_id": None, "bytes": {"$sum": "$bytes"}, "n": {"$sum": 1}}}]))
+        if not totals:
+            return 0
+        over_bytes = totals[0]["bytes"] - PAGE_CACHE_MAX_MB * 1024 * 1024
+        over_n = totals[0]["n"] - PAGE_CACHE_MAX_ENTRIES
+        if over_bytes <= 0 and over_n <= 0:
+            return 0
+        victims = []
+        for doc in col.find({}, {"bytes": 1}).sort("last_access", 1):
+            if over_bytes <= 0 and over_n <= 0:
+                break
+            victims.append(doc["_id"])
+            over_bytes -= doc.get("bytes", 0)
+            over_n -= 1
+        if victims:
+            col.delete_many({"_id": {"$in": victims}})
+            _count("evicted", len(victims))
+            logger.info("Page cache EVICT | pages=%d", len(victims))
+        return len(victims)
+    except Exception as e:
+        logger.warning("Page cache eviction failed: %s", e)
+        return 0
+
+
+def fetch_documents(url: str, db=None):
+    """fetch_url_as_documents through the cache: returns ([Document], title)
+    the same way (([], None) if nothing was extracted — not cached). Raises
+    UnsafeURLError like the uncached call, hit or miss."""
+    if not _is_safe_url(url):
+        raise UnsafeURLError(f"URL is not allowed: {url}")
+    page = get_page(url, db)
+    if page is None:
+        _count("fetches")
+        documents, title = fetch_url_as_documents(url)
+        if documents:
+            put_page(url, documents[0].page_content, title, db)
+        return documents, title
+    document = Document(
+        page_content=page["text"],
+        metadata={'source_url': url, 'title': page["title"] or url},
+    )
+    return [document], page["title"]
+
+
+def stats() -> Dict[str, Any]:
+    """Memory-tier counters plus shared-tier hits, network fetches and
+    evictions. overall_hit_rate counts both tiers."""
+    out = _memory.stats()
+    with _lock:
+        out.update(_counters)
+    served = out["hits"] + out["shared_hits"]
+    lookups = served + out["fetches"]
+    out["overall_hit_rate"] = round(served / lookups, 4) if lookups else None
+    return out
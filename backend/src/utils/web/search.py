@@ -0,0 +1,93 @@
+"""
+Tavily web search with a shared result cache.
+
+The web_search tool used to build a new TavilyClient and pay for a search
+on every call (up to MAX_USES_PER_TOOL["web_search"] per turn), while the
+same questions recur across a class within minutes. Results are now cached
+for WEB_SEARCH_CACHE_TTL_SECONDS under (normalized query, max_results,
+depth) — the normalization is the query-embedding cache's (NFKC,
+casefolded, single-spaced) with trailing punctuation dropped — and one
+client is reused per process.
+
+Counters (searches, hits, credits / dollars saved) are reported by stats()
+for the ops endpoint (GET /api/admin/ops/caches).
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+from typing import Any, Dict, List
+
+from src.retrieval.embedding_cache import normalize_query
+from src.utils.ttl_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+WEB_SEARCH_CACHE_TTL_SECONDS = float(os.getenv("WEB_SEARCH_CACHE_TTL_SECONDS", "900"))
+# Tavily bills credits per search: 1 for "basic", 2 for "advanced".
+TAVILY_CREDITS = {"basic": 1, "advanced": 2}
+TAVILY_USD_PER_CREDIT = float(os.getenv("TAVILY_USD_PER_CREDIT", "0.008"))
+
+_results = TTLCache(
+    "web_search_results",
+    max_entries=int(os.getenv("WEB_SEARCH_CACHE_MAX_ENTRIES", "2048")),
+    ttl_seconds=WEB_SEARCH_CACHE_TTL_SECONDS,
+)
+_client_lock = threading.Lock()
+_client = None
+_client_key = None
+_lock = threading.Lock()
+_counters = {"searches": 0, "errors": 0, "credits_spent": 0, "credits_saved": 0}
+
+
+def cache_key(query: str, max_results: int, depth: str = "basic") -> str:
+    text = normalize_query(query).rstrip("?!.;: ")
+    return hashlib.sha256(json.dumps([text, max_results, depth]).encode("utf-8")).hexdigest()
+
+
+def _get_client(api_key: str):
+    global _client, _client_key
+    with _client_lock:
+        if _client is None or _client_key != api_key:
+            from tavily import TavilyClient
+
+            _client = TavilyClient(api_key=api_key)
+            _client_key = api_key
+        return _client
+
+
+def search(query: str, max_results: int, *, api_key: str, depth: str = "basic") -> List[Dict[str, Any]]:
+    """Tavily results ({title, url, content, ...}) for `query`, from the
+    cache when the same search ran recently. Errors propagate (and are not
+    cached)."""
+    key = cache_key(query, max_results, depth)
+    cached = _results.get(key)
+    credits = TAVILY_CREDITS.get(depth, 1)
+    if cached is not None:
+        with _lock:
+            _counters["credits_saved"] += credits
+        return list(cached)
+
+    try:
+        resp = _get_client(api_key).search(query=query, max_results=max_results, search_depth=depth)
+    except Exception:
+        with _lock:
+            _counters["errors"] += 1
+        raise
+    results = (resp or {}).get("results") or []
+    with _lock:
+        _counters["searches"] += 1
+        _counters["credits_spent"] += credits
+    _results.set(key, list(results))
+    return results
+
+
+def stats() -> Dict[str, Any]:
+    """Cache counters plus paid searches and what the hits saved."""
+    out = _results.stats()
+    with _lock:
+        out.update(_counters)
+    out["usd_spent"] = round(out["credits_spent"] * TAVILY_USD_PER_CREDIT, 4)
+    out["usd_saved"] = round(out["credits_saved"] * TAVILY_USD_PER_CREDIT, 4)
+    return out
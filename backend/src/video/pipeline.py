@@ -1,12 +1,13 @@
 """Video processing pipeline (background worker).
 
-Dispatch mirrors user_files._run_async_pdf_ingest: a daemon thread that runs
-inside app_context, reads socketio from current_app.extensions, and emits
-progress. Heavy work fans out across a ThreadPoolExecutor so Whisper and Hume
-run concurrently (MediaPipe is one more `submit(...)` in phase 2).
+Dispatch mirrors user_files._run_async_ingest: a `video_pipeline` job on the
+durable queue (src/jobs/), run inside app_context by a job worker, which
+reads socketio from current_app.extensions and emits progress. Heavy work
+fans out across a ThreadPoolExecutor so Whisper and Hume run concurrently
+(MediaPipe is one more `submit(...)` in phase 2).
 
 The worker is a pure function of `submission_id` (reads everything else from
-Mongo/S3), so it can later move behind a real queue without a rewrite.
+Mongo/S3), so a job reclaimed after a restart simply starts over.
 """
 import logging
 import os
@@ -21,6 +22,7 @@ from datetime import datetime, timedelta
 
 from bson import ObjectId
 
+from src.jobs import queue as job_queue
 from src.utils.s3_client import get_s3_client, get_bucket, generate_download_url
 from src.video.hume_batch import run_hume_batch
 from src.video.assemblyai_words import transcribe_words
@@ -53,13 +55,29 @@ _AUDIO_TIMEOUT = int(os.getenv("VIDEO_AUDIO_TIMEOUT", "120"))
 
 
 def dispatch_pipeline(app, submission_id: str, job_id: str):
-    """Start the worker thread. Returns immediately."""
+    """Queue the pipeline for a job worker. Returns immediately."""
     _dbg(submission_id, f"dispatch_pipeline called | job_id={job_id}")
-    threading.Thread(
-        target=_run_video_pipeline,
-        kwargs={"app": app, "submission_id": submission_id, "job_id": job_id},
-        daemon=True,
-    ).start()
+    # The pipeline records its own failures, so a queue retry only happens
+    # when a worker dies mid-run — one re-run is enough.
+    job_queue.enqueue(
+        app.config["MONGO_DB"], "video_pipeline",
+        {"submission_id": submission_id, "job_id": job_id}, max_attempts=2,
+    )
+
+
+def mark_pipeline_failed(submission_id: str, job_id: str, error: str):
+    """Mark submission + job failed and tell the browser. Needs app_context."""
+    from flask import current_app
+    db = current_app.config["MONGO_DB"]
+    now = time.time()
+    db["video_submissions"].update_one({"_id": ObjectId(submission_id)},
+                                       {"$set": {"status": "failed", "error": error, "updated_at": now}})
+    db["video_jobs"].update_one({"_id": ObjectId(job_id)},
+                                {"$set": {"status": "failed", "error": error, "updated_at": now}})
+    sub = db["video_submissions"].find_one({"_id": ObjectId(submission_id)}, {"owner_user_id": 1})
+    if sub:
+        _emit(current_app.extensions.get("socketio"), sub, "video_job_done",
+              {"status": "failed", "error": error, "job_id": job_id})
 
 
 def _emit(sio, submission, event, payload):
@@ -268,9 +286,7 @@ def _run_video_pipeline(app, submission_id: str, job_id: str):
         except Exception as e:
             logger.error("[PIPELINE] FAILED | %s | err=%s", tag, e, exc_info=True)
             _dbg(submission_id, f"PIPELINE FAILED | {_name} <{_email}> | {type(e).__name__}: {e}")
-            subs.update_one({"_id": sub["_id"]}, {"$set": {"status": "failed", "error": str(e), "updated_at": time.time()}})
-            jobs.update_one({"_id": ObjectId(job_id)}, {"$set": {"status": "failed", "error": str(e), "updated_at": time.time()}})
-            _emit(sio, sub, "video_job_done", {"status": "failed", "error": str(e), "job_id": job_id})
+            mark_pipeline_failed(submission_id, job_id, str(e))
         finally:
             if acquired:
                 _semaphore.release()
@@ -22,9 +22,10 @@ import logging
 import re
 import time
 
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 
+from src.llm.clients import get_chat_model
+
 logger = logging.getLogger(__name__)
 
 # --- transcript signals --------------------------------------------------
@@ -808,7 +809,7 @@ Scoring rules:
 
     # temperature=0 + fixed seed so a rescore of unchanged data grades reproducibly
     # (default temp 0.7 made competence/coaching wobble several points each rescore).
-    llm = ChatOpenAI(model="gpt-4o", api_key=api_key, max_tokens=4000, temperature=0, seed=42)
+    llm = get_chat_model("openai", "gpt-4o", api_key, max_tokens=4000, temperature=0, seed=42)
     raw = llm.invoke([HumanMessage(content=prompt)]).content
     return _parse_json(raw)
 
@@ -0,0 +1,351 @@
+"""
+Shared test helpers: an in-memory subset of pymongo for unit tests.
+
+    from conftest import FakeDB, AsyncFakeDB
+
+FakeDB()[name] is a FakeCollection (created on first access). Documents
+live in `collection.docs` in insertion order; every read hands out deep
+copies, as a real driver would. `reads` records the size of each cursor
+iterated and `finds` counts find() calls, for tests that assert bounded
+reads. Supported: equality / dotted-key filters with $or, $and, $exists,
+$eq, $ne, $in, $nin, $gt, $gte, $lt, $lte; updates with $set,
+$setOnInsert, $inc, $unset, $push (plain or $each); upserts; cursor
+sort / skip / limit; bulk_write of UpdateOne / DeleteOne; and a
+`$match` / `$group` (`_id: None`, `$sum`) aggregate. Anything else raises
+NotImplementedError so a test can't silently pass against behavior the
+fake doesn't model.
+"""
+import copy
+import itertools
+from types import SimpleNamespace
+
+_MISSING = object()
+
+
+def _get(doc, dotted):
+    for part in dotted.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return _MISSING
+        doc = doc[part]
+    return doc
+
+
+def _compare(value, op, arg):
+    present = value is not _MISSING
+    if op == "$exists":
+        return present == bool(arg)
+    if op == "$eq":
+        return present and value == arg
+    if op == "$ne":
+        return not present or value != arg
+    if op == "$in":
+        return (value if present else None) in arg
+    if op == "$nin":
+        return (value if present else None) not in arg
+    if not present or value is None:
+        return False
+    if op == "$gt":
+        return value > arg
+    if op == "$gte":
+        return value >= arg
+    if op == "$lt":
+        return value < arg
+    if op == "$lte":
+        return value <= arg
+    raise NotImplementedError(f"FakeCollection: query operator {op}")
+
+
+def matches(doc, query):
+    for key, cond in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in cond):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict) and any(k.startswith("$") for k in cond):
+            value = _get(doc, key)
+            if not all(_compare(value, op, arg) for op, arg in cond.items()):
+                return False
+        elif _get(doc, key) is _MISSING:
+            if cond is not None:
+                return False
+        elif _get(doc, key) != cond:
+            return False
+    return True
+
+
+def _set(doc, dotted, value):
+    *parents, last = dotted.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _sort(docs, keys):
+    # Stable multi-key sort: apply the least significant key first.
+    for k, direction in reversed(keys):
+        docs.sort(key=lambda d: _get(d, k), reverse=direction < 0)
+    return docs
+
+
+def _sort_spec(key, direction=1):
+    return list(key) if isinstance(key, (list, tuple)) else [(key, direction)]
+
+
+class FakeCursor:
+    def __init__(self, docs, log):
+        self._docs, self._log = docs, log
+
+    def sort(self, key, direction=1):
+        _sort(self._docs, _sort_spec(key, direction))
+        return self
+
+    def skip(self, n):
+        self._docs = self._docs[n:]
+        return self
+
+    def limit(self, n):
+        self._docs = self._docs[:n] if n else self._docs
+        return self
+
+    def __iter__(self):
+        self._log.append(len(self._docs))
+        return iter(copy.deepcopy(self._docs))
+
+
+class FakeCollection:
+    def __init__(self, docs=None):
+        self.docs = list(docs or [])
+        self.reads = []
+        self.finds = 0
+        self._ids = itertools.count(1)
+
+    # --- helpers for tests ---------------------------------------------------
+
+    def by_id(self, _id):
+        return next((d for d in self.docs if d.get("_id") == _id), None)
+
+    # --- internals -----------------------------------------------------------
+
+    def _matching(self, query, sort=None):
+        found = [d for d in self.docs if matches(d, query)]
+        return _sort(found, list(sort)) if sort else found
+
+    def _insert(self, doc):
+        doc = copy.deepcopy(doc)
+        if "_id" not in doc:
+            doc["_id"] = next(self._ids)
+        elif self.by_id(doc["_id"]) is not None:
+            from pymongo.errors import DuplicateKeyError
+            raise DuplicateKeyError(f"duplicate _id {doc['_id']!r}", 11000)
+        self.docs.append(doc)
+        return doc
+
+    def _apply(self, doc, update, inserted):
+        unknown = set(update) - {"$set", "$setOnInsert", "$inc", "$unset", "$push"}
+        if unknown:
+            raise NotImplementedError(f"FakeCollection: update operators {sorted(unknown)}")
+        for key, value in update.get("$set", {}).items():
+            _set(doc, key, copy.deepcopy(value))
+        if inserted:
+            for key, value in update.get("$setOnInsert", {}).items():
+                _set(doc, key, copy.deepcopy(value))
+        for key, n in update.get("$inc", {}).items():
+            current = _get(doc, key)
+            _set(doc, key, (0 if current is _MISSING else current) + n)
+        for key in update.get("$unset", {}):
+            *parents, last = key.split(".")
+            parent = _get(doc, ".".join(parents)) if parents else doc
+            if isinstance(parent, dict):
+                parent.pop(last, None)
+        for key, value in update.get("$push", {}).items():
+            items = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+            current = _get(doc, key)
+            if current is _MISSING:
+                current = []
+                _set(doc, key, current)
+            current.extend(copy.deepcopy(items))
+
+    def _upsert_seed(self, query):
+        return {k: v for k, v in query.items()
+                if not k.startswith("$") and not (isinstance(v, dict) and any(o.startswith("$") for o in v))}
+
+    def _update(self, query, update, upsert, many):
+        found = self._matching(query)
+        if not many:
+            found = found[:1]
+        for doc in found:
+            self._apply(doc, update, False)
+        upserted_id = None
+        if not found and upsert:
+            doc = self._upsert_seed(query)
+            self._apply(doc, update, True)
+            upserted_id = self._insert(doc)["_id"]
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found), upserted_id=upserted_id)
+
+    # --- pymongo API -----------------------------------------------------------
+
+    def count_documents(self, query, limit=0, **kwargs):
+        n = len(self._matching(query))
+        return min(n, limit) if limit else n
+
+    def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query=None, projection=None, sort=None, limit=0):
+        self.finds += 1
+        cursor = FakeCursor(self._matching(query, sort), self.reads)
+        return cursor.limit(limit)
+
+    def find_one(self, query=None, projection=None, sort=None):
+        found = self._matching(query, sort)
+        return copy.deepcopy(found[0]) if found else None
+
+    def insert_one(self, doc):
+        return SimpleNamespace(inserted_id=self._insert(doc)["_id"])
+
+    def insert_many(self, docs, ordered=True):
+        ids, errors = [], []
+        for i, doc in enumerate(docs):
+            try:
+                ids.append(self._insert(doc)["_id"])
+            except Exception as e:
+                if getattr(e, "code", None) != 11000:
+                    raise
+                errors.append({"index": i, "code": 11000, "errmsg": str(e)})
+                if ordered:
+                    break
+        if errors:
+            from pymongo.errors import BulkWriteError
+            raise BulkWriteError({"writeErrors": errors, "nInserted": len(ids)})
+        return SimpleNamespace(inserted_ids=ids)
+
+    def replace_one(self, query, doc, upsert=False):
+        found = self._matching(query)
+        if found:
+            target = found[0]
+            keep_id = target.get("_id")
+            target.clear()
+            target.update(copy.deepcopy(doc))
+            if keep_id is not None:
+                target["_id"] = keep_id
+        elif upsert:
+            self._insert({**self._upsert_seed(query), **doc})
+        return SimpleNamespace(matched_count=len(found[:1]), modified_count=len(found[:1]))
+
+    def update_one(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=False)
+
+    def update_many(self, query, update, upsert=False):
+        return self._update(query, update, upsert, many=True)
+
+    def find_one_and_update(self, query, update, projection=None, sort=None, upsert=False,
+                            return_document=False):
+        found = self._matching(query, sort)
+        if not found:
+            if not upsert:
+                return None
+            doc = self._upsert_seed(query)
+            self._apply(doc, update, True)
+            doc = self._insert(doc)
+            return copy.deepcopy(doc) if return_document else None
+        before = copy.deepcopy(found[0])
+        self._apply(found[0], update, False)
+        # pymongo's ReturnDocument.AFTER is True, BEFORE is False.
+        return copy.deepcopy(found[0]) if return_document else before
+
+    def delete_one(self, query):
+        found = self._matching(query)[:1]
+        if found:
+            self.docs.remove(found[0])
+        return SimpleNamespace(deleted_count=len(found))
+
+    def delete_many(self, query):
+        keep = [d for d in self.docs if not matches(d, query)]
+        removed = len(self.docs) - len(keep)
+        self.docs = keep
+        return SimpleNamespace(deleted_count=removed)
+
+    def bulk_write(self, requests, ordered=True):
+        from pymongo import DeleteOne, UpdateOne
+        for op in requests:
+            if isinstance(op, UpdateOne):
+                self._update(op._filter, op._doc, op._upsert, many=False)
+            elif isinstance(op, DeleteOne):
+                self.delete_one(op._filter)
+            else:
+                raise NotImplementedError(f"FakeCollection: bulk op {type(op).__name__}")
+        return SimpleNamespace(acknowledged=True)
+
+    def aggregate(self, pipeline):
+        docs = copy.deepcopy(self.docs)
+        for stage in pipeline:
+            (op, arg), = stage.items()
+            if op == "$match":
+                docs = [d for d in docs if matches(d, arg)]
+            elif op == "$group" and arg.get("_id") is None:
+                if not docs:
+                    return []
+                out = {"_id": None}
+                for name, acc in arg.items():
+                    if name == "_id":
+                        continue
+                    (acc_op, field), = acc.items()
+                    if acc_op != "$sum":
+                        raise NotImplementedError(f"FakeCollection: accumulator {acc_op}")
+                    out[name] = sum(d.get(field[1:], 0) if isinstance(field, str) else field for d in docs)
+                docs = [out]
+            else:
+                raise NotImplementedError(f"FakeCollection: aggregate stage {op}")
+        return docs
+
+
+class AsyncFakeCursor(FakeCursor):
+    def __aiter__(self):
+        self._it = iter(self)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def to_list(self, length=None):
+        return list(self)[:length] if length else list(self)
+
+
+class AsyncFakeCollection(FakeCollection):
+    """FakeCollection with pymongo AsyncMongoClient's awaitable methods."""
+
+    def find(self, query=None, projection=None, sort=None, limit=0):
+        self.finds += 1
+        return AsyncFakeCursor(self._matching(query, sort), self.reads).limit(limit)
+
+
+def _awaitable(name):
+    sync = getattr(FakeCollection, name)
+
+    async def method(self, *args, **kwargs):
+        return sync(self, *args, **kwargs)
+    method.__name__ = name
+    return method
+
+
+for _name in ("count_documents", "estimated_document_count", "find_one", "insert_one", "insert_many",
+              "replace_one", "update_one", "update_many", "find_one_and_update", "delete_one",
+              "delete_many"):
+    setattr(AsyncFakeCollection, _name, _awaitable(_name))
+
+
+class FakeDB(dict):
+    collection_class = FakeCollection
+
+    def __missing__(self, name):
+        self[name] = self.collection_class()
+        return self[name]
+
+
+class AsyncFakeDB(FakeDB):
+    collection_class = AsyncFakeCollection
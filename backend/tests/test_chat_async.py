@@ -0,0 +1,208 @@
+"""
+Unit tests for the async chat stream (backend/routes/chat_async.py) and the
+async agent runner (backend/src/agentic/agent_runner.py).
+Run with:  pytest backend/tests/test_chat_async.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("starlette")
+pytest.importorskip("flask_jwt_extended")
+pytest.importorskip("langchain_mongodb")
+
+from bson import ObjectId
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, messages_from_dict
+from starlette.applications import Starlette
+from starlette.testclient import TestClient
+
+from conftest import AsyncFakeDB as FakeDB
+from routes import chat_async
+from src.agentic import agent_runner
+
+
+PUBLIC_ID = str(ObjectId())
+PRIVATE_ID = str(ObjectId())
+AGENT_ID = str(ObjectId())
+
+
+@pytest.fixture
+def env(monkeypatch):
+    flask_app = Flask(__name__)
+    flask_app.config.update(JWT_SECRET_KEY="test-secret-key-that-is-long-enough", SECRET_KEY="s")
+    JWTManager(flask_app)
+    db = FakeDB()
+    db["config_collections"].docs = [
+        {"_id": ObjectId(PUBLIC_ID), "is_public": True, "model_name": "gpt-4o", "prompt_template": "Be brief."},
+        {"_id": ObjectId(PRIVATE_ID), "is_public": False, "model_name": "gpt-4o"},
+        {"_id": ObjectId(AGENT_ID), "is_public": True, "model_name": "claude-sonnet-4-6", "web_access": True},
+    ]
+    status = {"status": "ok"}
+    monkeypatch.setattr(chat_async, "_resolve_usage", lambda *a: (None, status))
+    monkeypatch.setattr(chat_async, "retrieve", lambda q, **kw: [Document(page_content="Leaves make sugar.",
+                                                                          metadata={"source": "bio.pdf"})])
+    monkeypatch.setattr(chat_async.chat_turn, "select_chat_llm",
+                        lambda doc, cfg: GenericFakeChatModel(messages=iter([AIMessage("Plants use light.")])))
+
+    async def title(text):
+        return "Photosynthesis"
+    monkeypatch.setattr(chat_async, "_agenerate_chat_title", title)
+
+    app = Starlette(routes=chat_async.routes)
+    app.state.flask_app = flask_app
+    app.state.db = db
+    return TestClient(app), flask_app, db, status
+
+
+def _events(resp):
+    return [json.loads(line) for line in resp.text.splitlines() if line]
+
+
+def test_legacy_stream_emits_contract_and_persists_turn(env):
+    client, _, db, _ = env
+    resp = client.post(f"/api/chat/{PUBLIC_ID}/chat-1",
+                       json={"input": "How do plants eat?", "attached_files": [{"name": "bio.pdf"}]})
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    events = _events(resp)
+    assert events[0] == {"type": "sources", "data": [{"source": "bio.pdf", "page_content": "Leaves make sugar."}]}
+    assert "".join(e["data"] for e in events if e["type"] == "token") == "Plants use light."
+    done = events[-1]
+    assert done["type"] == "done"
+    assert {"config", "usage", "history", "retrieval", "session", "first_token", "done"} <= set(done["timings"])
+    assert "server-timing" not in resp.headers
+
+    stored = messages_from_dict(db["chat_history_buckets"].docs[0]["messages"])
+    assert [m.type for m in stored] == ["human", "ai"]
+    assert stored[0].additional_kwargs["attached_files"] == [{"name": "bio.pdf"}]
+    assert stored[1].content == "Plants use light."
+    meta = db["chat_session_metadata"].docs[0]
+    assert meta["title"] == "Photosynthesis" and meta["user_id"] == "anonymous"
+    assert meta["message_count"] == 2 and meta["first_message"] == "How do plants eat?"
+    assert "dev_id" in resp.cookies
+
+
+def test_next_turn_reads_history_back_from_buckets(env):
+    client, _, db, _ = env
+    client.post(f"/api/chat/{PUBLIC_ID}/chat-2", json={"input": "How do plants eat?"})
+    history = asyncio.run(chat_async._aload_history(db, "chat-2", "gpt-4o"))
+    assert [(m.type, m.content) for m in history] == [("human", "How do plants eat?"), ("ai", "Plants use light.")]
+
+
+def test_private_config_requires_a_token(env):
+    client, flask_app, db, _ = env
+    assert client.post(f"/api/chat/{PRIVATE_ID}/c", json={"input": "hi"}).status_code == 401
+    with flask_app.app_context():
+        token = create_access_token(identity="user-7")
+    resp = client.post(f"/api/chat/{PRIVATE_ID}/c", json={"input": "hi"},
+                       headers={"Authorization": f"Bearer {token}"})
+    assert resp.status_code == 200 and _events(resp)[-1]["type"] == "done"
+    assert db["chat_session_metadata"].docs[0]["user_id"] == "user-7"
+
+
+def test_bad_requests_and_usage_block(env):
+    client, _, _, status = env
+    assert client.post(f"/api/chat/{PUBLIC_ID}/c", json={}).status_code == 400
+    assert client.post("/api/chat/not-an-id/c", json={"input": "hi"}).status_code == 404
+    status["status"] = "blocked"
+    resp = client.post(f"/api/chat/{PUBLIC_ID}/c", json={"input": "hi"})
+    assert resp.status_code == 429 and resp.json()["error"] == "usage_limit"
+    assert resp.headers["server-timing"].startswith("config;dur=")
+
+
+def test_agentic_stream_forwards_tool_events(env, monkeypatch):
+    client, _, db, _ = env
+
+    async def fake_runner(config, user_input, history_messages, ctx, images=None, offload=None):
+        yield {"type": "tool_use", "id": "t1", "name": "web_search", "input": {"query": "x"}}
+        yield {"type": "tool_result", "id": "t1", "name": "web_search", "content": "r", "is_error": False}
+        yield {"type": "token", "data": "Answer [1]"}
+        yield {"type": "done", "stop_reason": "end_turn", "assistant_blocks": [{"type": "text", "text": "Answer [1]"}]}
+
+    monkeypatch.setattr(chat_async, "astream_agentic_response", fake_runner)
+    events = _events(client.post(f"/api/chat/{AGENT_ID}/a", json={"input": "news?"}))
+    assert [e["type"] for e in events] == ["tool_use", "tool_result", "token", "done"]
+    assert events[-1]["stop_reason"] == "end_turn" and "assistant_blocks" not in events[-1]
+    assert "files_note" in events[-1]["timings"]
+    ai = messages_from_dict(db["chat_history_buckets"].docs[0]["messages"])[1]
+    assert ai.additional_kwargs["tool_trace"] == [{"type": "text", "text": "Answer [1]"}]
+
+
+# --- async agent runner ---------------------------------------------------------
+
+class FakeFinal:
+    def __init__(self, content, stop_reason):
+        self.content, self.stop_reason = content, stop_reason
+
+
+class FakeStream:
+    def __init__(self, text, final):
+        self._text, self._final = text, final
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    @property
+    def text_stream(self):
+        async def chunks():
+            for chunk in self._text:
+                yield chunk
+        return chunks()
+
+    async def get_final_message(self):
+        return self._final
+
+
+class FakeAsyncAnthropic:
+    def __init__(self):
+        self.rounds = [
+            FakeStream([], FakeFinal([{"type": "tool_use", "id": "t1", "name": "web_search",
+                                       "input": {"query": "q"}}], "tool_use")),
+            FakeStream(["Done ", "[1]"], FakeFinal([{"type": "text", "text": "Done [1]"}], "end_turn")),
+        ]
+        self.calls = []
+        self.messages = self
+
+    def stream(self, **kwargs):
+        self.calls.append(kwargs)
+        return self.rounds[len(self.calls) - 1]
+
+
+def test_async_runner_streams_and_runs_tools_through_offload(monkeypatch):
+    fake = FakeAsyncAnthropic()
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "k")
+    monkeypatch.setattr(agent_runner, "anthropic_async_client", lambda key: fake)
+    monkeypatch.setattr(agent_runner, "get_tool_specs", lambda config: [{"name": "web_search"}])
+    monkeypatch.setattr(agent_runner, "execute", lambda name, args, ctx: {"content": "result", "is_error": False})
+    offloaded = []
+
+    async def offload(fn, *args):
+        offloaded.append(fn.__name__)
+        return fn(*args)
+
+    async def run():
+        return [e async for e in agent_runner.astream_agentic_response(
+            {"model_name": "claude-sonnet-4-6"}, "q", [], ctx=None, offload=offload)]
+
+    events = asyncio.run(run())
+    assert [e["type"] for e in events] == ["tool_use", "tool_result", "token", "token", "done"]
+    assert events[1]["content"] == "result"
+    assert offloaded == ["_run_tool"]
+    assert events[-1]["stop_reason"] == "end_turn"
+    assert [b["type"] for b in events[-1]["assistant_blocks"]] == ["tool_use", "tool_result", "text"]
+    # The second round sees the tool result after the assistant's tool_use.
+    roles = [m["role"] for m in fake.calls[1]["messages"]]
+    assert roles[:3] == ["user", "assistant", "user"]
+    assert fake.calls[1]["messages"][2]["content"][0]["tool_use_id"] == "t1"
+    assert fake.calls[0]["tools"][-1]["cache_control"] == {"type": "ephemeral"}
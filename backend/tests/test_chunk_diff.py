@@ -0,0 +1,81 @@
+"""
+Unit tests for chunk-level diffing on file replace (backend/src/utils/vector_stores/chunk_diff.py).
+Run with:  pytest backend/tests/test_chunk_diff.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("langchain_core")
+from langchain_core.documents import Document
+
+from src.utils.vector_stores.chunk_diff import diff_chunks, metadata_changes
+from src.utils.vector_stores.embedding_store import content_hash
+
+
+def _stored(texts, page=0):
+    docs, start = [], 0
+    for i, text in enumerate(texts):
+        docs.append({"_id": f"id{i}", "content_hash": content_hash(text), "page": page,
+                     "start_index": start, "original_file": "syllabus.pdf"})
+        start += len(text) + 1
+    return docs
+
+
+def _splits(texts, page=0, filename="syllabus.pdf"):
+    splits, start = [], 0
+    for text in texts:
+        splits.append(Document(page_content=text, metadata={"page": page, "start_index": start,
+                                                             "original_file": filename}))
+        start += len(text) + 1
+    return splits
+
+
+def test_typo_fix_touches_one_chunk():
+    old = ["Week 1: intro", "Week 2: sorting algoritms", "Week 3: graphs"]
+    new = ["Week 1: intro", "Week 2: sorting algorithms", "Week 3: graphs"]
+    kept, added, removed = diff_chunks(_stored(old), _splits(new))
+    assert [split.page_content for _, split in kept] == ["Week 1: intro", "Week 3: graphs"]
+    assert [split.page_content for split in added] == ["Week 2: sorting algorithms"]
+    assert removed == ["id1"]
+    assert added[0].metadata["content_hash"] == content_hash("Week 2: sorting algorithms")
+
+
+def test_shifted_chunks_only_update_metadata():
+    old = ["Week 1: intro", "Week 2: sort", "Week 3: graphs"]
+    new = ["Week 1: introduction", "Week 2: sort", "Week 3: graphs"]
+    kept, added, removed = diff_chunks(_stored(old), _splits(new))
+    assert len(kept) == 2 and len(added) == 1 and removed == ["id0"]
+    doc, split = kept[0]
+    assert split.page_content == "Week 2: sort"
+    assert metadata_changes(doc, split.metadata) == {"$set": {"start_index": 21}}
+
+
+def test_unchanged_file_is_a_noop():
+    texts = ["alpha", "beta", "gamma"]
+    stored = _stored(texts)
+    kept, added, removed = diff_chunks(stored, _splits(texts))
+    assert (len(kept), added, removed) == (3, [], [])
+    assert all(metadata_changes(doc, split.metadata) == {} for doc, split in kept)
+
+
+def test_repeated_text_is_a_multiset():
+    stored = _stored(["same", "same", "same"])
+    kept, added, removed = diff_chunks(stored, _splits(["same", "same"]))
+    assert len(kept) == 2 and added == [] and removed == ["id2"]
+
+    kept, added, removed = diff_chunks(stored, _splits(["same"] * 4))
+    assert len(kept) == 3 and len(added) == 1 and removed == []
+
+
+def test_rename_and_dropped_section_show_as_metadata_changes():
+    stored = {"_id": "x", "content_hash": "h", "original_file": "old.pdf", "section": "Intro", "page": 0}
+    update = metadata_changes(stored, {"original_file": "new.pdf", "page": 0, "content_hash": "h"})
+    assert update == {"$set": {"original_file": "new.pdf"}, "$unset": {"section": ""}}
+
+
+def test_legacy_chunks_without_hash_are_replaced():
+    stored = [{"_id": "legacy", "page": 0}]
+    kept, added, removed = diff_chunks(stored, _splits(["fresh"]))
+    assert kept == [] and len(added) == 1 and removed == ["legacy"]
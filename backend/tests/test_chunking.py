@@ -0,0 +1,95 @@
+"""
+Unit tests for the structure-aware chunkers (backend/src/utils/chunking/).
+Run with:  pytest backend/tests/test_chunking.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from src.utils.chunking.registry import parse_chunk_settings, strategy_for
+from src.utils.chunking.structured import is_heading, split_spans
+
+PAGE = (
+    "4.1 Price Elasticity\n"
+    "Elasticity measures how quantity responds to price.\n"
+    "It is a ratio of percentage changes.\n"
+    "4.2 Revenue\n"
+    "Elastic demand: cutting the price raises revenue.\n"
+)
+
+
+def test_is_heading():
+    assert is_heading("4.1 Price Elasticity")
+    assert is_heading("## Revenue")
+    assert is_heading("SUMMARY")
+    assert is_heading("Chapter 3: Markets")
+    assert not is_heading("1. Buy low")  # list item
+    assert not is_heading("It is a ratio of percentage changes.")
+    assert not is_heading("Supply and Demand")
+    assert is_heading("Supply and Demand", standalone=True)
+
+
+def test_headings_start_new_chunks():
+    spans = split_spans(PAGE, chunk_size=500)
+    assert [PAGE[s.start:s.end].splitlines()[0] for s in spans] == ["4.1 Price Elasticity", "4.2 Revenue"]
+    assert [s.section for s in spans] == ["4.1 Price Elasticity", "4.2 Revenue"]
+    assert PAGE[spans[1].start:spans[1].end] == "4.2 Revenue\nElastic demand: cutting the price raises revenue."
+
+
+def test_packs_paragraphs_up_to_chunk_size():
+    text = "\n\n".join(f"Paragraph {i} " + "x" * 80 for i in range(6))
+    spans = split_spans(text, chunk_size=200)
+    assert all(s.end - s.start <= 200 for s in spans)
+    assert len(spans) == 3
+    # Boundaries fall between paragraphs, never inside one.
+    assert all(text[s.start:].startswith("Paragraph") for s in spans)
+
+
+def test_oversize_paragraph_is_flagged():
+    spans = split_spans("INTRO\n\n" + "word " * 100, chunk_size=100)
+    assert len(spans) == 1 and spans[0].oversize and spans[0].section == "INTRO"
+
+
+def test_strategy_for_loader():
+    assert strategy_for("SimplePPTXLoader") == "slides"
+    assert strategy_for("PyPDFLoader") == "structured"
+    assert strategy_for("web") == "structured"
+    assert strategy_for("SomethingNew") == "recursive"
+
+
+def test_parse_chunk_settings():
+    assert parse_chunk_settings({"chunk_size": "800", "chunk_overlap": "40"}) == (
+        {"chunk_size": 800, "chunk_overlap": 40}, None)
+    assert parse_chunk_settings({"chunk_size": ""}) == ({}, None)
+    assert parse_chunk_settings({"chunk_size": "50"})[1]
+    assert parse_chunk_settings({"chunk_size": "400", "chunk_overlap": "300"})[1]
+    assert parse_chunk_settings({"chunk_overlap": "abc"})[1]
+
+
+def test_chunks_keep_metadata_and_exact_offsets():
+    pytest.importorskip("langchain_text_splitters")
+    from langchain_core.documents import Document
+    from src.utils.chunking.registry import chunk_documents
+
+    page = Document(page_content=PAGE + "\n\n" + "long sentence here. " * 40, metadata={"page": 3})
+    chunks = chunk_documents([page], "PyPDFLoader", chunk_size=200, chunk_overlap=20)
+    assert len(chunks) > 2
+    for chunk in chunks:
+        assert chunk.metadata["page"] == 3
+        assert chunk.metadata["chunker"] == "structured"
+        start = chunk.metadata["start_index"]
+        assert page.page_content[start:start + len(chunk.page_content)] == chunk.page_content
+
+
+def test_slides_stay_whole():
+    pytest.importorskip("langchain_text_splitters")
+    from langchain_core.documents import Document
+    from src.utils.chunking.registry import chunk_documents
+
+    slide = Document(page_content="Monopoly\n" + "\n".join(["Single seller, barriers to entry"] * 20),
+                     metadata={"slide_number": 4})
+    chunks = chunk_documents([slide], "SimplePPTXLoader", chunk_size=200)
+    assert len(chunks) == 1
+    assert chunks[0].metadata["slide_number"] == 4
+    assert chunks[0].metadata["section"] == "Monopoly"
@@ -0,0 +1,72 @@
+"""
+Unit tests for token-budgeted context assembly (backend/src/retrieval/context_builder.py).
+Run with:  pytest backend/tests/test_context_builder.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.retrieval.context_builder import (
+    DEFAULT_CONTEXT_BUDGET,
+    budget_for,
+    build_context,
+    merge_chunks,
+    render,
+)
+
+
+class Doc:
+    def __init__(self, text, **metadata):
+        self.page_content = text
+        self.metadata = metadata
+
+
+PAGE = "Alpha beta gamma delta. " * 10  # 240 chars
+
+
+def test_adjacent_chunks_are_stitched_without_overlap():
+    first = Doc(PAGE[:120], source_file_id="f1", page=1, start_index=0)
+    second = Doc(PAGE[100:240], source_file_id="f1", page=1, start_index=100)
+    blocks = merge_chunks([second, first])
+    assert len(blocks) == 1
+    assert blocks[0]["text"] == PAGE[:240]
+    assert blocks[0]["chunks"] == 2
+    assert blocks[0]["rank"] == 0
+
+
+def test_distant_chunks_and_other_pages_stay_separate():
+    docs = [
+        Doc("first passage", source_file_id="f1", page=1, start_index=0),
+        Doc("far away passage", source_file_id="f1", page=1, start_index=5000),
+        Doc("other page", source_file_id="f1", page=2, start_index=0),
+    ]
+    assert [b["text"] for b in merge_chunks(docs)] == ["first passage", "far away passage", "other page"]
+
+
+def test_duplicates_are_dropped():
+    docs = [
+        Doc("same   text", source_file_id="a"),
+        Doc("same text", source_file_id="b"),
+        Doc("a longer passage that contains more", source_file_id="c"),
+        Doc("contains more", source_file_id="c"),
+    ]
+    assert [b["text"] for b in merge_chunks(docs)] == ["same   text", "a longer passage that contains more"]
+
+
+def test_budget_keeps_best_first_and_clips():
+    big = "word " * 400  # 500 tokens
+    docs = [Doc(big, source_file_id="a"), Doc("other " * 400, source_file_id="b")]
+    blocks, stats = build_context(docs, budget_tokens=700)
+    assert len(blocks) == 2
+    assert blocks[1]["text"].endswith("…")
+    assert stats["truncated"] == 1 and stats["tokens"] <= 700
+
+    blocks, stats = build_context(docs, budget_tokens=520)
+    assert len(blocks) == 1 and stats["dropped"] == 1
+    assert render(blocks) == big
+
+
+def test_budget_for_longest_prefix():
+    assert budget_for("gpt-4o-mini") == 3000
+    assert budget_for("gpt-4o") == 1500
+    assert budget_for("some-unknown-model") == DEFAULT_CONTEXT_BUDGET
+    assert budget_for(None) == DEFAULT_CONTEXT_BUDGET
@@ -0,0 +1,78 @@
+"""
+Unit tests for the batched embedding stage
+(backend/src/utils/vector_stores/embed_pipeline.py).
+Run with:  pytest backend/tests/test_embed_pipeline.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+from langchain_core.documents import Document
+
+from conftest import FakeDB
+from src.utils.vector_stores import embed_pipeline
+from src.utils.vector_stores.embed_pipeline import embed_with_backoff, make_batches
+
+
+def test_batches_respect_token_budget():
+    texts = ["x" * 400] * 5            # ~100 tokens each
+    batches = make_batches(texts, max_tokens=250, max_items=100)
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+def test_batches_respect_item_cap():
+    batches = make_batches(["a"] * 5, max_tokens=10_000, max_items=2)
+    assert [len(b) for b in batches] == [2, 2, 1]
+
+
+def test_oversized_text_gets_its_own_batch():
+    batches = make_batches(["x" * 4000, "y"], max_tokens=100, max_items=10)
+    assert batches == [[0], [1]]
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class Flaky:
+    def __init__(self, failures, exc=RateLimitError):
+        self.failures = failures
+        self.exc = exc
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise self.exc("slow down")
+        return [[1.0] for _ in texts]
+
+
+def test_retries_429_with_backoff():
+    sleeps = []
+    emb = Flaky(failures=2)
+    assert embed_with_backoff(emb, ["a"], sleep=sleeps.append) == [[1.0]]
+    assert emb.calls == 3
+    assert len(sleeps) == 2 and sleeps[1] > sleeps[0] * 0.9
+
+
+def test_non_rate_limit_errors_are_not_retried():
+    emb = Flaky(failures=1, exc=ValueError)
+    with pytest.raises(ValueError):
+        embed_with_backoff(emb, ["a"], sleep=lambda _s: None)
+    assert emb.calls == 1
+
+
+def test_gives_up_after_max_retries():
+    emb = Flaky(failures=10)
+    with pytest.raises(RateLimitError):
+        embed_with_backoff(emb, ["a"], max_retries=2, sleep=lambda _s: None)
+    assert emb.calls == 3
+
+
+def test_failed_batch_cancels_the_batches_not_yet_started(monkeypatch):
+    monkeypatch.setattr(embed_pipeline.make_batches, "__defaults__", (10_000, 1))  # one text per batch
+    emb = Flaky(failures=1, exc=ValueError)
+    splits = [Document(page_content=f"chunk {i}", metadata={}) for i in range(5)]
+    with pytest.raises(ValueError):
+        embed_pipeline.run_embedding_pipeline(splits, emb, FakeDB(), max_workers=1)
+    assert emb.calls == 1
@@ -0,0 +1,75 @@
+"""
+Unit tests for content-hash embedding reuse
+(backend/src/utils/vector_stores/embedding_store.py).
+Run with:  pytest backend/tests/test_embedding_store.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.documents import Document
+
+from conftest import FakeDB
+from src.utils.vector_stores.embed_pipeline import run_embedding_pipeline
+from src.utils.vector_stores.embedding_store import (
+    VECTOR_COLLECTION,
+    content_hash,
+    embedding_model_key,
+)
+
+
+class FakeEmbeddings:
+    model = "fake-embed"
+
+    def __init__(self):
+        self.calls = []
+
+    def embed_documents(self, texts):
+        self.calls.append(list(texts))
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+def _splits(texts):
+    return [Document(page_content=t, metadata={"config_id": "c1"}) for t in texts]
+
+
+def _stored(db):
+    return {d["text"]: d["embedding"] for d in db[VECTOR_COLLECTION].docs}
+
+
+def test_second_ingest_reuses_every_vector():
+    db, emb = FakeDB(), FakeEmbeddings()
+    texts = ["alpha", "beta", "gamma"]
+
+    stats1 = run_embedding_pipeline(_splits(texts), emb, db)
+    first = _stored(db)
+    db[VECTOR_COLLECTION].docs.clear()
+    stats2 = run_embedding_pipeline(_splits(texts), emb, db)
+
+    assert _stored(db) == first
+    assert stats1["embedded"] == 3 and stats1["reused"] == 0
+    assert stats2["embedded"] == 0 and stats2["reuse_ratio"] == 1.0
+    assert len(emb.calls) == 1
+
+
+def test_duplicate_chunks_in_one_upload_embed_once():
+    db, emb = FakeDB(), FakeEmbeddings()
+    splits = _splits(["same", "same", "other"])
+    stats = run_embedding_pipeline(splits, emb, db)
+    assert emb.calls == [["same", "other"]]
+    assert len(db[VECTOR_COLLECTION].docs) == 3
+    assert splits[0].metadata["content_hash"] == splits[1].metadata["content_hash"] == content_hash("same")
+    assert stats["embedded"] == 2 and stats["reused"] == 1
+
+
+def test_only_unseen_chunks_are_sent_to_the_api():
+    db, emb = FakeDB(), FakeEmbeddings()
+    run_embedding_pipeline(_splits(["a", "b"]), emb, db)
+    run_embedding_pipeline(_splits(["a", "b", "c"]), emb, db)
+    assert emb.calls[-1] == ["c"]
+
+
+def test_model_key_includes_dimensions():
+    class Dims(FakeEmbeddings):
+        dimensions = 1024
+    assert embedding_model_key(Dims()) == "fake-embed@1024"
+    assert content_hash("x") == content_hash("x") != content_hash("y")
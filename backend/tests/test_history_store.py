@@ -0,0 +1,164 @@
+"""
+Unit tests for bucketed chat-history storage (backend/src/history/store.py).
+Run with:  pytest backend/tests/test_history_store.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import json
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from conftest import FakeDB
+from src.history import store
+
+
+@pytest.fixture
+def small_buckets(monkeypatch):
+    monkeypatch.setattr(store, "HISTORY_BUCKET_SIZE", 4)
+
+
+def _new_session(db, session_id="s1"):
+    db[store.METADATA_COLLECTION].docs.append({"session_id": session_id, "message_count": 0})
+
+
+def _turn(i):
+    return [HumanMessage(content=f"q{i}", additional_kwargs={"attached_files": [{"name": "a.pdf"}]} if i == 0 else {}),
+            AIMessage(content=f"a{i}", additional_kwargs={"tool_trace": [{"type": "text", "text": f"a{i}"}]})]
+
+
+def test_append_fills_buckets_and_maintains_metadata(small_buckets):
+    db = FakeDB()
+    _new_session(db)
+    starts = [store.append(db, "s1", _turn(i)) for i in range(5)]
+    assert starts == [0, 2, 4, 6, 8]
+
+    buckets = sorted(db[store.BUCKET_COLLECTION].docs, key=lambda b: b["seq"])
+    assert [(b["seq"], len(b["messages"])) for b in buckets] == [(0, 4), (1, 4), (2, 2)]
+    # Native BSON documents, not JSON strings.
+    assert buckets[0]["messages"][0]["data"]["additional_kwargs"]["attached_files"] == [{"name": "a.pdf"}]
+
+    meta = db[store.METADATA_COLLECTION].docs[0]
+    assert meta["message_count"] == 10 and meta["first_message"] == "q0"
+    assert store.message_count(db, "s1") == 10
+
+
+def test_range_reads_fetch_only_the_covering_buckets(small_buckets):
+    db = FakeDB()
+    _new_session(db)
+    for i in range(5):
+        store.append(db, "s1", _turn(i))
+
+    col = db[store.BUCKET_COLLECTION]
+    col.reads.clear()
+    window = store.read(db, "s1", 6, 10)
+    assert [m.content for m in window] == ["q3", "a3", "q4", "a4"]
+    assert col.reads == [2]  # buckets 1 and 2, in one find
+    assert window[1].additional_kwargs["tool_trace"] == [{"type": "text", "text": "a3"}]
+
+    assert [m.content for m in store.read(db, "s1")][:3] == ["q0", "a0", "q1"]
+    assert store.read(db, "s1", 3, 5)[0].content == "a1"
+
+
+def test_racing_appends_read_back_in_reserved_order(small_buckets):
+    db = FakeDB()
+    _new_session(db)
+    col = db[store.BUCKET_COLLECTION]
+    write = col.update_one
+    raced = []
+
+    def slow_write(flt, update, upsert=False):
+        # Turn 0 has reserved positions 0-1; turn 1 reserves 2-3 and
+        # pushes into the same bucket before turn 0's push lands.
+        col.update_one = write
+        raced.append(store.append(db, "s1", _turn(1)))
+        return write(flt, update, upsert=upsert)
+
+    col.update_one = slow_write
+    assert store.append(db, "s1", _turn(0)) == 0
+    assert raced == [2]
+
+    assert [m["pos"] for m in col.docs[0]["messages"]] == [2, 3, 0, 1]
+    assert [m.content for m in store.read(db, "s1")] == ["q0", "a0", "q1", "a1"]
+    assert [m.content for m in store.read(db, "s1", 1, 3)] == ["a0", "q1"]
+
+
+def test_failed_bucket_write_leaves_a_gap_not_a_shift(small_buckets):
+    db = FakeDB()
+    _new_session(db)
+    store.append(db, "s1", _turn(0) + [HumanMessage(content="q1")])  # positions 0-2
+    col = db[store.BUCKET_COLLECTION]
+    write = col.update_one
+
+    def failing_write(flt, update, upsert=False):
+        if flt["seq"] == 1:
+            raise ConnectionError("primary stepped down")
+        return write(flt, update, upsert=upsert)
+
+    col.update_one = failing_write
+    with pytest.raises(ConnectionError):
+        store.append(db, "s1", [AIMessage(content="a1"), HumanMessage(content="q2")])  # 3, 4
+    col.update_one = write
+    # Position 3 landed in bucket 0; position 4 is lost but still counted.
+    assert store.message_count(db, "s1") == 5
+
+    store.append(db, "s1", [AIMessage(content="a2"), HumanMessage(content="q3")])  # 5, 6
+    assert [m.content for m in store.read(db, "s1", 5, 7)] == ["a2", "q3"]
+    assert [m.content for m in store.read(db, "s1", 3)] == ["a1", "a2", "q3"]
+
+
+def _legacy(db, session_id, messages):
+    col = db[store.LEGACY_COLLECTION]
+    for m in messages:
+        col.docs.append({"_id": len(col.docs), "SessionId": session_id, "History": json.dumps(message_to_dict(m))})
+
+
+def test_legacy_session_is_read_then_migrated_on_append(small_buckets):
+    db = FakeDB()
+    db[store.METADATA_COLLECTION].docs.append({"session_id": "old"})
+    _legacy(db, "old", _turn(0) + _turn(1) + _turn(2))
+
+    assert store.message_count(db, "old") == 6
+    assert [m.content for m in store.read(db, "old", 4)] == ["q2", "a2"]
+
+    assert store.append(db, "old", _turn(3)) == 6
+    meta = db[store.METADATA_COLLECTION].docs[0]
+    assert meta["message_count"] == 8 and meta["first_message"] == "q0"
+    assert [m.content for m in store.read(db, "old")] == ["q0", "a0", "q1", "a1", "q2", "a2", "q3", "a3"]
+    # Legacy docs stay for rollback until the migration drops them.
+    assert len(db[store.LEGACY_COLLECTION].docs) == 6
+
+
+def test_migration_is_idempotent_and_can_drop_legacy(small_buckets):
+    db = FakeDB()
+    db[store.METADATA_COLLECTION].docs.append({"session_id": "old"})
+    _legacy(db, "old", _turn(0) + _turn(1) + _turn(2))
+
+    assert store.migrate_session(db, "old") == 6
+    store.append(db, "old", _turn(3))
+    # A re-run must not clobber the bucket the append wrote to.
+    assert store.migrate_session(db, "old", drop_legacy=True) == 6
+    assert [m.content for m in store.read(db, "old")][-2:] == ["q3", "a3"]
+    assert db[store.METADATA_COLLECTION].docs[0]["message_count"] == 8
+    assert db[store.LEGACY_COLLECTION].docs == []
+
+
+def test_append_without_metadata_doc_starts_counting():
+    db = FakeDB()
+    assert store.append(db, "orphan", _turn(0)) == 0
+    assert store.message_count(db, "orphan") == 2
+
+
+def test_delete_sessions_removes_buckets_and_legacy_docs(small_buckets):
+    db = FakeDB()
+    _new_session(db, "a")
+    for i in range(3):
+        store.append(db, "a", _turn(i))
+    _legacy(db, "b", _turn(0))
+    _new_session(db, "keep")
+    store.append(db, "keep", _turn(0))
+
+    assert store.delete_sessions(db, ["a", "b"]) == 2 + 2
+    assert [b["session_id"] for b in db[store.BUCKET_COLLECTION].docs] == ["keep"]
+    assert db[store.LEGACY_COLLECTION].docs == []
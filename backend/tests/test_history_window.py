@@ -0,0 +1,146 @@
+"""
+Unit tests for the sliding-window + summary history (backend/src/history/window.py).
+Run with:  pytest backend/tests/test_history_window.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from langchain_core.messages import AIMessage, HumanMessage, message_to_dict
+
+from conftest import FakeDB
+from src.history import store, window
+
+
+def _add(db, messages, session_id="s1"):
+    """Append like store.append, written straight into bucket docs."""
+    meta = next(d for d in db[store.METADATA_COLLECTION].docs if d["session_id"] == session_id)
+    buckets = db[store.BUCKET_COLLECTION].docs
+    for msg in messages:
+        seq = meta["message_count"] // store.HISTORY_BUCKET_SIZE
+        bucket = next((b for b in buckets if b["session_id"] == session_id and b["seq"] == seq), None)
+        if bucket is None:
+            bucket = {"session_id": session_id, "seq": seq, "messages": []}
+            buckets.append(bucket)
+        bucket["messages"].append(message_to_dict(msg))
+        meta["message_count"] += 1
+
+
+def _session(db, turns, session_id="s1", words=5):
+    db[store.METADATA_COLLECTION].docs.append({"session_id": session_id, "message_count": 0})
+    for i in range(turns):
+        _add(db, [HumanMessage(content=f"question {i} " + "w " * words),
+                  AIMessage(content=f"answer {i} " + "w " * words)], session_id)
+
+
+def test_budget_prefers_longest_model_prefix():
+    assert window.history_budget_for("gpt-4o-mini") == window.MODEL_HISTORY_BUDGETS["gpt-4o-mini"]
+    assert window.history_budget_for("gpt-4o") == window.MODEL_HISTORY_BUDGETS["gpt-4o"]
+    assert window.history_budget_for("unknown-model") == window.DEFAULT_HISTORY_BUDGET
+
+
+def test_short_session_is_sent_whole():
+    db = FakeDB()
+    _session(db, 2)
+    messages, stats = window.load(db, "s1", "gpt-4o")
+    assert [m.content.split()[0] for m in messages] == ["question", "answer", "question", "answer"]
+    assert stats["sent"] == 4 and stats["dropped"] == 0
+    assert window.load(db, "empty", "gpt-4o") == ([], window.fit([], 0, None, 2500, 0)[1])
+
+
+def test_long_session_reads_only_what_the_summary_does_not_cover():
+    db = FakeDB()
+    _session(db, 100)
+    db[store.METADATA_COLLECTION].docs[0]["history_summary"] = {"text": "earlier", "covers": 176}
+    messages, stats = window.load(db, "s1", "gpt-4o")
+    # 24 messages from bucket 1 (176..199) — one bucket doc read.
+    assert db[store.BUCKET_COLLECTION].reads == [1]
+    assert stats["messages"] == 200 and stats["summarized"] == 176 and stats["read"] == 24
+    assert messages[-1].content.startswith("answer 99")
+    assert isinstance(messages[1], HumanMessage)
+
+
+def test_lagging_summary_reads_a_bounded_gap():
+    db = FakeDB()
+    _session(db, 100, words=1)
+    db[store.METADATA_COLLECTION].docs[0]["history_summary"] = {"text": "earlier", "covers": 20}
+    messages, stats = window.load(db, "s1", "gpt-4o")
+    cap = window.HISTORY_READ_WINDOWS * window.recent_limit()
+    assert stats["read"] == cap and stats["summarized"] == 20
+    assert stats["dropped"] == 200 - 20 - cap and stats["tokens"] <= stats["budget"]
+    assert messages[1].content.startswith(f"question {(200 - cap) // 2}")
+
+
+def test_legacy_session_summary_catches_up_a_slice_per_refresh():
+    db = FakeDB()
+    _session(db, 250)
+    assert window.load(db, "s1", "gpt-4o")[1]["read"] == window.HISTORY_READ_WINDOWS * window.recent_limit()
+    folded = []
+
+    def summarizer(previous, messages):
+        folded.append(len(messages))
+        return f"summary {len(folded)}"
+
+    cutoff = 500 - window.recent_limit()
+    while window.refresh_summary(db, "s1", summarizer):
+        pass
+    assert max(folded) == window.HISTORY_SUMMARY_MAX_FOLD and sum(folded) == cutoff
+    assert db[store.METADATA_COLLECTION].docs[0]["history_summary"]["covers"] == cutoff
+
+
+def test_budget_trims_oldest_and_keeps_the_last_message():
+    db = FakeDB()
+    _session(db, 6, words=400)  # ~200 tokens per message
+    messages, stats = window.fit(
+        store.read(db, "s1"), 0, None, budget_tokens=500, total=12)
+    assert stats["tokens"] <= 500
+    assert messages[-1].content.startswith("answer 5")
+    assert isinstance(messages[0], HumanMessage)
+
+    one, stats = window.fit(messages[-1:], 11, None, budget_tokens=10, total=12)
+    assert len(one) == 1 and stats["tokens"] > 10
+
+
+def test_refresh_folds_only_aged_out_messages_incrementally():
+    db = FakeDB()
+    _session(db, 10)
+    calls = []
+
+    def summarizer(previous, messages):
+        calls.append((previous, [m.content.split()[:2] for m in messages]))
+        return f"summary of {len(messages)} after [{previous}]"
+
+    doc = window.refresh_summary(db, "s1", summarizer)
+    cutoff = 20 - window.recent_limit()
+    assert doc["covers"] == cutoff
+    assert calls[0][0] == "" and len(calls[0][1]) == cutoff
+    assert db[store.BUCKET_COLLECTION].reads == [1]
+
+    # Nothing new has aged out: no model call.
+    assert window.refresh_summary(db, "s1", summarizer) is None
+    assert len(calls) == 1
+
+    for i in range(window.HISTORY_SUMMARY_MIN_NEW // 2):
+        _add(db, [HumanMessage(content=f"late q{i}"), AIMessage(content=f"late a{i}")])
+    doc = window.refresh_summary(db, "s1", summarizer)
+    assert doc["covers"] == cutoff + window.HISTORY_SUMMARY_MIN_NEW
+    assert calls[1][0] == f"summary of {cutoff} after []"
+    assert len(calls[1][1]) == window.HISTORY_SUMMARY_MIN_NEW
+
+    messages, stats = window.load(db, "s1", "gpt-4o")
+    assert messages[0].additional_kwargs == {"history_summary": True}
+    assert messages[0].content.startswith(window.SUMMARY_PREFIX)
+    assert stats["summarized"] == doc["covers"]
+    assert stats["sent"] == window.recent_limit()
+
+
+def test_concurrent_refresh_loses_the_guard():
+    db = FakeDB()
+    _session(db, 10)
+
+    def summarizer(previous, messages):
+        # Another worker finishes first.
+        db[store.METADATA_COLLECTION].docs[0]["history_summary"] = {"text": "theirs", "covers": 8}
+        return "mine"
+
+    assert window.refresh_summary(db, "s1", summarizer) is None
+    assert db[store.METADATA_COLLECTION].docs[0]["history_summary"]["text"] == "theirs"
@@ -0,0 +1,145 @@
+"""
+Unit tests for the durable job queue (backend/src/jobs/queue.py, worker.py).
+Run with:  pytest backend/tests/test_job_queue.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import contextlib
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from conftest import FakeCollection
+from src.jobs import queue
+
+
+@pytest.fixture
+def db():
+    return {queue.JOB_QUEUE_COLLECTION: FakeCollection()}
+
+
+def _job(db, job_id):
+    return next(d for d in db[queue.JOB_QUEUE_COLLECTION].docs if d["_id"] == job_id)
+
+
+def test_claim_is_exclusive_and_complete(db):
+    queue.enqueue(db, "k", {"x": 1})
+    job = queue.claim(db, "w1")
+    assert job["status"] == queue.RUNNING and job["attempts"] == 1 and job["payload"] == {"x": 1}
+    assert queue.claim(db, "w2") is None
+    assert queue.heartbeat(db, job["_id"], "w1")
+    assert not queue.heartbeat(db, job["_id"], "w2")
+    queue.complete(db, job["_id"], "w1")
+    assert _job(db, job["_id"])["status"] == queue.DONE
+
+
+def test_claim_filters_by_kind_and_due_time(db):
+    queue.enqueue(db, "later", {}, delay_seconds=3600)
+    queue.enqueue(db, "other", {})
+    assert queue.claim(db, "w", kinds=["later"]) is None
+    assert queue.claim(db, "w", kinds=["other"])["kind"] == "other"
+
+
+def test_claim_can_exclude_laned_kinds(db):
+    queue.enqueue(db, "video_pipeline", {})
+    queue.enqueue(db, "upload_ingest", {})
+    assert queue.claim(db, "w", exclude_kinds=["video_pipeline"])["kind"] == "upload_ingest"
+    assert queue.claim(db, "w", exclude_kinds=["video_pipeline"]) is None
+    assert queue.claim(db, "w", kinds=["video_pipeline"])["kind"] == "video_pipeline"
+
+
+def test_expired_lease_is_reclaimed(db):
+    queue.enqueue(db, "k", {})
+    job = queue.claim(db, "crashed", lease_seconds=-1)
+    resumed = queue.claim(db, "w2")
+    assert resumed["_id"] == job["_id"]
+    assert resumed["attempts"] == 2 and resumed["lease_owner"] == "w2"
+
+
+def test_fail_retries_with_backoff_then_dies(db):
+    queue.enqueue(db, "k", {}, max_attempts=2)
+    job = queue.claim(db, "w")
+    assert queue.fail(db, job, "w", "boom") == queue.QUEUED
+    assert _job(db, job["_id"])["run_at"] > job["updated_at"]
+    assert queue.claim(db, "w") is None  # backing off
+
+    _job(db, job["_id"])["run_at"] = 0
+    job = queue.claim(db, "w")
+    assert queue.fail(db, job, "w", "boom again") == queue.DEAD
+    assert _job(db, job["_id"])["last_error"] == "boom again"
+
+
+def test_retry_delay_grows_and_caps():
+    assert queue.retry_delay(1) <= queue.JOB_RETRY_BASE_SECONDS * 1.2
+    assert queue.retry_delay(3) >= queue.JOB_RETRY_BASE_SECONDS * 4 * 0.8
+    assert queue.retry_delay(50) <= queue.JOB_RETRY_MAX_SECONDS * 1.2
+
+
+def test_worker_runs_handler_and_marks_dead(db, monkeypatch):
+    pytest.importorskip("flask")
+    from src.jobs.worker import Worker
+
+    monkeypatch.setattr(queue, "HANDLERS", {})
+    seen, dead = [], []
+
+    @queue.handler("ok")
+    def ok(payload, job):
+        seen.append(payload["n"])
+
+    @queue.handler("bad", on_dead=lambda payload, error: dead.append(error))
+    def bad(payload, job):
+        raise queue.PermanentJobError("no text")
+
+    app = type("App", (), {"app_context": staticmethod(contextlib.nullcontext)})()
+    worker = Worker(app)
+    for kind in ("ok", "bad"):
+        queue.enqueue(db, kind, {"n": 7})
+        job = queue.claim(db, worker.worker_id)
+        worker.run_job(db, job)
+
+    statuses = [d["status"] for d in db[queue.JOB_QUEUE_COLLECTION].docs]
+    assert statuses == [queue.DONE, queue.DEAD]
+    assert seen == [7]
+    assert dead == ["PermanentJobError: no text"]
+
+
+def test_lanes_keep_long_kinds_off_the_shared_threads():
+    pytest.importorskip("flask")
+    from src.jobs.worker import Worker, parse_lanes
+
+    lanes = parse_lanes("video_pipeline=1, ocr_batch_tick=1,url_ingest+upload_ingest=3")
+    assert lanes == [(["video_pipeline"], 1), (["ocr_batch_tick"], 1), (["url_ingest", "upload_ingest"], 3)]
+    with pytest.raises(ValueError):
+        parse_lanes("video_pipeline")
+
+    worker = Worker(app=None, concurrency=2, lanes=lanes[:2])
+    assert worker.plan() == [
+        ("shared", None, ["video_pipeline", "ocr_batch_tick"], 2),
+        ("video_pipeline", ["video_pipeline"], None, 1),
+        ("ocr_batch_tick", ["ocr_batch_tick"], None, 1),
+    ]
+    # --kinds narrows lanes; the shared threads only get what is left.
+    worker = Worker(app=None, concurrency=2, kinds=["video_pipeline", "upload_ingest"], lanes=lanes[:2])
+    assert worker.plan() == [
+        ("shared", ["upload_ingest"], ["video_pipeline", "ocr_batch_tick"], 2),
+        ("video_pipeline", ["video_pipeline"], None, 1),
+    ]
+    assert Worker(app=None, concurrency=2, lanes=[]).plan() == [("shared", None, None, 2)]
+
+
+def test_one_process_per_host_runs_the_embedded_worker(monkeypatch, tmp_path):
+    pytest.importorskip("flask")
+    fcntl = pytest.importorskip("fcntl")
+    from src.jobs import worker
+
+    monkeypatch.setattr(worker, "JOB_WORKER_LOCK_FILE", str(tmp_path / "worker.lock"))
+    monkeypatch.setattr(worker, "_lock_file", None)
+    monkeypatch.setenv("JOB_WORKER_EMBEDDED", "true")
+    with open(worker.JOB_WORKER_LOCK_FILE, "a") as other:  # another gunicorn worker
+        fcntl.flock(other, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert worker.start_embedded(app=None) is None
+    assert worker._take_host_lock()
+    assert worker._take_host_lock()  # already ours
+    worker._lock_file.close()
@@ -0,0 +1,49 @@
+"""
+Unit tests for the search_knowledge_base agent tool
+(backend/src/agentic/tools/knowledge_base.py).
+Run with:  pytest backend/tests/test_knowledge_base_tool.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from flask import Flask
+from langchain_core.documents import Document
+
+from conftest import FakeDB
+from src.agentic.tools import knowledge_base
+from src.agentic.tools.base import ToolContext
+
+
+@pytest.fixture
+def db(monkeypatch):
+    docs = [Document(page_content="Leaves turn light into sugar.",
+                     metadata={"original_file": "bio.pdf", "source_file_id": "f1", "start_index": 0})]
+    monkeypatch.setattr(knowledge_base, "retrieve", lambda query, **kw: docs)
+    app = Flask(__name__)
+    app.config["MONGO_DB"] = FakeDB()
+    app.config["MONGO_DB"]["chat_session_metadata"].insert_one({"session_id": "chat-1"})
+    with app.app_context():
+        yield app.config["MONGO_DB"]
+
+
+def _ctx(session_id=None):
+    return ToolContext(user_id="u1", config_id="c1", config={"model_name": "claude-sonnet-4-6"},
+                       session_id=session_id)
+
+
+def test_agentic_turn_records_context_tokens(db):
+    result = knowledge_base.search_knowledge_base({"query": "photosynthesis"}, _ctx("chat-1"))
+    assert result["content"].startswith("[1] bio.pdf")
+
+    meta = db["chat_session_metadata"].docs[0]
+    assert meta["context_turns"] == 1
+    assert meta["context_tokens_total"] == meta["last_context_tokens"] > 0
+
+
+def test_no_session_records_nothing(db):
+    knowledge_base.search_knowledge_base({"query": "photosynthesis"}, _ctx())
+    assert "context_turns" not in db["chat_session_metadata"].docs[0]
@@ -0,0 +1,41 @@
+"""
+Unit tests for BM25 + reciprocal rank fusion (backend/src/retrieval/lexical.py).
+Run with:  pytest backend/tests/test_lexical.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.retrieval.lexical import BM25Index, reciprocal_rank_fusion, search_filter, tokenize
+
+
+def test_tokenize_keeps_codes_whole_and_split():
+    assert tokenize("See ECON-2103 now") == ["see", "econ-2103", "econ", "2103", "now"]
+
+
+def test_bm25_ranks_exact_code_first():
+    idx = BM25Index([
+        "Intro to microeconomics and demand curves",
+        "ECON-2103 office hours are on Tuesday",
+        "Office hours for FINA-3203 are on Monday",
+    ])
+    hits = idx.search("ECON-2103 office hours", k=3)
+    assert hits[0][0] == 1
+    assert idx.search("nothing matches here zzz") == []
+
+
+def test_rrf_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "d", "a"]], k=60)
+    keys = [k for k, _ in fused]
+    assert keys[:2] == ["b", "a"]
+    assert set(keys) == {"a", "b", "c", "d"}
+    assert len(reciprocal_rank_fusion([["a", "b"], ["c"]], limit=2)) == 2
+
+
+def test_search_filter_translates_scope_shapes():
+    assert search_filter({"config_id": "c1"}) == [{"equals": {"path": "config_id", "value": "c1"}}]
+    assert search_filter({"config_id": {"$in": ["c1", "user:u"]}}) == [
+        {"in": {"path": "config_id", "value": ["c1", "user:u"]}}
+    ]
+    (clause,) = search_filter({"$or": [{"config_id": "c1"}, {"source_file_id": {"$in": ["f"]}}]})
+    assert clause["compound"]["minimumShouldMatch"] == 1
+    assert len(clause["compound"]["should"]) == 2
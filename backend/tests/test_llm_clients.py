@@ -0,0 +1,73 @@
+"""
+Unit tests for the shared LLM client registry (backend/src/llm/clients.py).
+Run with:  pytest backend/tests/test_llm_clients.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from src.llm import clients
+
+
+class FakeModel:
+    def __init__(self, model, api_key, **params):
+        self.model, self.api_key, self.params = model, api_key, params
+        self.fallbacks = None
+
+    def with_fallbacks(self, fallbacks):
+        self.fallbacks = fallbacks
+        return self
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    clients.clear()
+    for name in clients._counters:
+        monkeypatch.setitem(clients._counters, name, 0)
+    for provider in ("openai", "anthropic", "anthropic_sdk"):
+        monkeypatch.setitem(clients.PROVIDERS, provider, FakeModel)
+    yield clients
+    clients.clear()
+
+
+def test_same_arguments_share_one_client(registry):
+    a = registry.get_chat_model("openai", "gpt-4o", "sk-1", temperature=0.7, streaming=True)
+    b = registry.get_chat_model("openai", "gpt-4o", "sk-1", streaming=True, temperature=0.7)
+    assert a is b
+    assert registry.stats()["created"] == 1 and registry.stats()["reused"] == 1
+
+
+def test_key_model_and_params_are_isolated(registry):
+    base = registry.get_chat_model("openai", "gpt-4o", "sk-1", temperature=0.7)
+    assert registry.get_chat_model("openai", "gpt-4o", "sk-2", temperature=0.7) is not base
+    assert registry.get_chat_model("openai", "gpt-4o-mini", "sk-1", temperature=0.7) is not base
+    assert registry.get_chat_model("openai", "gpt-4o", "sk-1", temperature=0.2) is not base
+    assert registry.get_chat_model("anthropic", "gpt-4o", "sk-1", temperature=0.7) is not base
+    assert registry.anthropic_client("sk-1") is registry.anthropic_client("sk-1")
+
+
+def test_lru_eviction(registry, monkeypatch):
+    monkeypatch.setattr(clients, "LLM_CLIENT_MAX_ENTRIES", 2)
+    first = registry.get_chat_model("openai", "m1", "k")
+    registry.get_chat_model("openai", "m2", "k")
+    assert registry.get_chat_model("openai", "m1", "k") is first  # m1 now most recent
+    registry.get_chat_model("openai", "m3", "k")                  # evicts m2
+    assert registry.get_chat_model("openai", "m1", "k") is first
+    stats = registry.stats()
+    assert stats["size"] == 2 and stats["evicted"] == 1
+    assert [c["model"] for c in stats["clients"]] == ["m3", "m1"]
+
+
+def test_openai_with_fallback_uses_shared_clients(registry):
+    llm = registry.openai_with_fallback("gpt-4o", "primary", "backup", temperature=0)
+    assert llm.api_key == "primary"
+    assert llm.fallbacks == [registry.get_chat_model("openai", "gpt-4o", "backup", temperature=0)]
+    assert registry.openai_with_fallback("gpt-4o", "primary", None, temperature=0) is llm
+
+
+def test_stats_never_expose_raw_keys(registry):
+    registry.get_chat_model("openai", "gpt-4o", "sk-secret-value", temperature=0.5)
+    stats = registry.stats()
+    assert "sk-secret-value" not in repr(stats)
+    assert stats["clients"][0]["params"] == ["temperature"]
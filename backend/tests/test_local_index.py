@@ -0,0 +1,78 @@
+"""
+Unit tests for the in-process vector index (backend/src/retrieval/local_index.py).
+Run with:  pytest backend/tests/test_local_index.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from conftest import FakeCollection  # noqa: E402
+from src.retrieval import local_index, scope_versions  # noqa: E402
+from src.utils.ttl_cache import TTLCache  # noqa: E402
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_INDEX_DIR", str(tmp_path))
+    local_index._indexes.clear()
+    local_index._too_large.clear()
+    local_index._build_locks.clear()
+    scope_versions._versions.clear()
+    return {
+        "vector_collection": FakeCollection([
+            {"config_id": "c1", "text": "east", "embedding": [1.0, 0.0]},
+            {"config_id": "c1", "text": "north", "embedding": [0.0, 2.0]},
+            {"config_id": "user:u1", "text": "north-east", "embedding": [1.0, 1.0]},
+        ]),
+        scope_versions.SCOPE_VERSIONS_COLLECTION: FakeCollection(),
+    }
+
+
+def test_search_merges_scopes_with_atlas_cosine_scores(db):
+    rows = local_index.search(db, ["c1", "user:u1"], [0.0, 1.0], k=2, metadata_fields=())
+    assert [r["text"] for r in rows] == ["north", "north-east"]
+    assert rows[0]["score"] == pytest.approx(1.0)
+    assert rows[1]["score"] == pytest.approx((1 + 2 ** -0.5) / 2)
+
+
+def test_index_is_reused_until_scope_version_bumps(db):
+    vc = db["vector_collection"]
+    local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    assert vc.finds == 1
+
+    vc.docs.append({"config_id": "c1", "text": "due east", "embedding": [3.0, 0.0]})
+    scope_versions.bump(db, "c1")
+    rows = local_index.search(db, ["c1"], [1.0, 0.0], k=3, metadata_fields=())
+    assert vc.finds == 2
+    assert len(rows) == 3
+
+
+def test_index_reloads_from_disk_after_restart(db):
+    local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    local_index._indexes.clear()
+    rows = local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    assert db["vector_collection"].finds == 1
+    assert rows[0]["text"] == "east"
+
+
+def test_large_scopes_fall_back(db, monkeypatch):
+    monkeypatch.setattr(local_index, "LOCAL_INDEX_MAX_CHUNKS", 1)
+    assert local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=()) is None
+    assert "c1" not in local_index._build_locks
+
+
+def test_scope_indexes_are_lru_bounded(db, monkeypatch):
+    monkeypatch.setattr(local_index, "_indexes", TTLCache(
+        "test_local_vector_index", max_entries=1, on_evict=local_index._drop_build_lock))
+    local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    local_index.search(db, ["user:u1"], [1.0, 0.0], k=1, metadata_fields=())
+    assert len(local_index._indexes) == 1
+    assert list(local_index._build_locks) == ["user:u1"]
+
+    # The evicted scope comes back from its .npy file, not from Mongo.
+    rows = local_index.search(db, ["c1"], [1.0, 0.0], k=1, metadata_fields=())
+    assert rows[0]["text"] == "east" and db["vector_collection"].finds == 2
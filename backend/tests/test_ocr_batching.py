@@ -0,0 +1,177 @@
+"""
+Unit tests for the shared OCR Message Batch (backend/src/ocr/batching.py).
+Run with:  pytest backend/tests/test_ocr_batching.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("pymongo")
+
+from flask import Flask
+
+from conftest import FakeDB
+from src.jobs import handlers  # noqa: F401  registers job kinds
+from src.jobs import queue
+from src.ocr import batching, engine
+
+
+class FakeBatches:
+    def __init__(self, fail_ids=()):
+        self.created = []
+        self.status = {}
+        self.fail_ids = set(fail_ids)
+
+    def create(self, requests):
+        batch_id = f"batch_{len(self.created) + 1}"
+        self.created.append((batch_id, requests))
+        self.status[batch_id] = "in_progress"
+        return SimpleNamespace(id=batch_id)
+
+    def retrieve(self, batch_id):
+        return SimpleNamespace(processing_status=self.status[batch_id])
+
+    def results(self, batch_id):
+        requests = dict(self.created)[batch_id]
+        for r in requests:
+            if r["custom_id"] in self.fail_ids:
+                result = SimpleNamespace(type="errored")
+            else:
+                message = SimpleNamespace(content=[SimpleNamespace(text=f"text of {r['custom_id']}")],
+                                          usage=SimpleNamespace(input_tokens=100, output_tokens=10))
+                result = SimpleNamespace(type="succeeded", message=message)
+            yield SimpleNamespace(custom_id=r["custom_id"], result=result)
+
+
+def _client(batches):
+    return SimpleNamespace(messages=SimpleNamespace(batches=batches))
+
+
+def _content(window):
+    return [{"type": "image", "source": {"data": "x" * 10 * len(window)}}, {"type": "text", "text": "p"}]
+
+
+def _defer(db, key, windows):
+    resume = {"kind": "upload_ingest", "payload": {"file_id_str": key, "ocr_batch_done": True}}
+    return batching.defer_windows(db, key, ((w, _content(w)) for w in windows), resume)
+
+
+def _jobs(db, kind):
+    return [j for j in db[queue.JOB_QUEUE_COLLECTION].docs if j["kind"] == kind]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(batching, "OCR_BATCH_COLLECT_SECONDS", 0)
+    return FakeDB()
+
+
+def test_uploads_share_one_tick_and_one_batch(db):
+    assert _defer(db, "fileA", [[0, 1], [2, 3]]) == 2
+    assert _defer(db, "fileB", [[0]]) == 1
+    assert len(_jobs(db, batching.TICK_KIND)) == 1
+
+    batches = FakeBatches()
+    delay = batching.tick(db, _client(batches))
+
+    assert len(batches.created) == 1
+    ids = sorted(r["custom_id"] for r in batches.created[0][1])
+    assert ids == ["fileA_0-1_2", "fileA_2-3_2", "fileB_0-0_1"]
+    assert delay == batching.OCR_BATCH_POLL_SECONDS
+    requests = db[batching.REQUESTS_COLLECTION].docs
+    assert all(r["status"] == batching.SUBMITTED and "content" not in r for r in requests)
+
+
+def test_waits_for_collect_window(db, monkeypatch):
+    monkeypatch.setattr(batching, "OCR_BATCH_COLLECT_SECONDS", 60)
+    _defer(db, "fileA", [[0]])
+    batches = FakeBatches()
+    delay = batching.tick(db, _client(batches))
+    assert batches.created == []
+    assert 1 <= delay <= 60
+
+
+def test_results_checkpointed_and_each_file_resumed_once(db):
+    _defer(db, "fileA", [[0, 1], [2, 3]])
+    _defer(db, "fileB", [[0]])
+    batches = FakeBatches(fail_ids={"fileA_2-3_2"})
+    batching.tick(db, _client(batches))
+    batches.status["batch_1"] = "ended"
+
+    assert batching.tick(db, _client(batches)) is None
+    resumed = _jobs(db, "upload_ingest")
+    assert sorted(j["payload"]["file_id_str"] for j in resumed) == ["fileA", "fileB"]
+
+    windows_a = [[0, 1], [2, 3]]
+    # The failed window is left for the resume job's realtime pass.
+    assert engine.load_checkpoints(db, "fileA", windows_a) == {0: "text of fileA_0-1_2"}
+    assert engine.load_checkpoints(db, "fileB", [[0]]) == {0: "text of fileB_0-0_1"}
+    assert not db[batching.REQUESTS_COLLECTION].docs
+    assert not db[batching.FILES_COLLECTION].docs
+
+    # Replaying the same results is a no-op.
+    for result in batches.results("batch_1"):
+        batching._resolve(db, result.custom_id, text="again")
+    assert len(_jobs(db, "upload_ingest")) == 2
+
+
+def test_failed_submit_returns_requests_to_pending(db):
+    class Down(FakeBatches):
+        def create(self, requests):
+            raise RuntimeError("overloaded")
+
+    _defer(db, "fileA", [[0]])
+    delay = batching.tick(db, _client(Down()))
+    assert [r["status"] for r in db[batching.REQUESTS_COLLECTION].docs] == [batching.PENDING]
+    assert delay is not None
+
+    batches = FakeBatches()
+    batching.tick(db, _client(batches))
+    assert len(batches.created) == 1
+
+
+def test_nothing_to_defer_does_not_arm_tick(db):
+    assert _defer(db, "fileA", []) == 0
+    assert _jobs(db, batching.TICK_KIND) == []
+    assert not db[batching.FILES_COLLECTION].docs
+
+
+def test_oversized_window_is_stored_in_parts_and_submitted_whole(db, monkeypatch):
+    monkeypatch.setattr(batching, "OCR_BATCH_DOC_MAX_MB", 25 / (1024 * 1024))
+    content = [{"type": "image", "source": {"data": c * 10}} for c in "abc"] + [{"type": "text", "text": "p"}]
+    resume = {"kind": "upload_ingest", "payload": {"file_id_str": "fileA"}}
+    batching.defer_windows(db, "fileA", [([0, 1, 2], content)], resume)
+
+    request, = db[batching.REQUESTS_COLLECTION].docs
+    assert request["content"] is None and request["parts"] == 2
+    parts = db[batching.PARTS_COLLECTION].docs
+    assert [len(p["content"]) for p in parts] == [2, 2]
+
+    batches = FakeBatches()
+    batching.tick(db, _client(batches))
+    sent, = batches.created[0][1]
+    assert sent["params"]["messages"][0]["content"] == content
+    assert not db[batching.PARTS_COLLECTION].docs
+
+
+def test_dead_tick_is_rearmed_while_work_is_left(db):
+    _defer(db, "fileA", [[0]])
+    tick_job, = _jobs(db, batching.TICK_KIND)
+    tick_job["status"] = "dead"
+
+    app = Flask(__name__)
+    app.config["MONGO_DB"] = db
+    with app.app_context():
+        queue.HANDLERS[batching.TICK_KIND]["on_dead"]({}, "RuntimeError: mongo down")
+    assert [j["status"] for j in _jobs(db, batching.TICK_KIND)] == ["dead", queue.QUEUED]
+
+    # A later upload re-arms it too, and nothing is armed once the work is gone.
+    _jobs(db, batching.TICK_KIND)[-1]["status"] = "dead"
+    _defer(db, "fileB", [[0]])
+    assert _jobs(db, batching.TICK_KIND)[-1]["status"] == queue.QUEUED
+    db[batching.REQUESTS_COLLECTION].docs.clear()
+    db[queue.JOB_QUEUE_COLLECTION].docs.clear()
+    assert not batching.ensure_tick(db)
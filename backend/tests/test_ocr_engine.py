@@ -0,0 +1,169 @@
+"""
+Unit tests for windowed OCR with checkpoints (backend/src/ocr/engine.py).
+Run with:  pytest backend/tests/test_ocr_engine.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+from conftest import FakeDB
+from src.ocr import engine
+
+
+class FakeClient:
+    """messages.create echoes the pages it was sent; pages in `fail_pages`
+    raise every time."""
+
+    def __init__(self, fail_pages=()):
+        self.fail_pages = set(fail_pages)
+        self.calls = []
+        self._lock = threading.Lock()
+        self.messages = SimpleNamespace(create=self._create)
+
+    def _create(self, model, max_tokens, messages):
+        pages = [b["page"] for b in messages[0]["content"] if b.get("type") == "image"]
+        with self._lock:
+            self.calls.append(pages)
+        if self.fail_pages & set(pages):
+            raise RuntimeError("overloaded")
+        return SimpleNamespace(
+            content=[SimpleNamespace(text=" ".join(f"page{p}" for p in pages))],
+            usage=SimpleNamespace(input_tokens=10 * len(pages), output_tokens=len(pages)),
+            stop_reason="end_turn",
+        )
+
+
+class FakeRenderer:
+    """One fake image block per page; pages in `skip` render to nothing
+    (blank / duplicate)."""
+
+    def __init__(self, skip=()):
+        self.skip = set(skip)
+
+        self.stats = {"blank": 0, "duplicate": 0, "bytes": 0}
+
+    def render_window(self, pdf_doc, pages):
+        return [{"type": "image", "page": p} for p in pages if p not in self.skip]
+
+
+@pytest.fixture(autouse=True)
+def _fast(monkeypatch):
+    monkeypatch.setattr(engine, "_limiter", engine.RateLimiter(0))
+    monkeypatch.setattr(engine.time, "sleep", lambda s: None)
+    monkeypatch.setattr(engine, "OCR_WINDOW_RETRIES", 1)
+
+
+def _run(client, windows, db=None, key="file1", renderer=None):
+    texts = engine.load_checkpoints(db, key, windows) if db is not None else {}
+    missing = [i for i in range(len(windows)) if i not in texts]
+    usage = {"input_tokens": 0, "output_tokens": 0}
+
+    def on_window(i, text):
+        if db is not None:
+            engine.save_checkpoint(db, key, windows[i], text)
+
+    texts.update(engine._run_realtime(client, renderer or FakeRenderer(), None, windows, missing,
+                                      "f.pdf", on_window, usage))
+    return texts, missing, usage
+
+
+def test_windows_for_keeps_page_order():
+    assert engine.windows_for([0, 1, 2, 5, 7], 2) == [[0, 1], [2, 5], [7]]
+    assert engine.windows_for([], 10) == []
+
+
+def test_realtime_windows_stitched_in_page_order():
+    windows = engine.windows_for(range(7), 2)
+    texts, _, usage = _run(FakeClient(), windows)
+    assert engine.stitch(texts, len(windows)) == "page0 page1\n\npage2 page3\n\npage4 page5\n\npage6"
+    assert usage == {"input_tokens": 70, "output_tokens": 7}
+
+
+def test_failed_window_is_retried_then_left_missing():
+    client = FakeClient(fail_pages={3})
+    windows = engine.windows_for(range(6), 2)
+    texts, _, _ = _run(client, windows)
+    assert sorted(texts) == [0, 2]
+    assert client.calls.count([2, 3]) == engine.OCR_WINDOW_RETRIES + 1
+
+
+def test_rerun_resumes_from_checkpoints():
+    db = FakeDB()
+    windows = engine.windows_for(range(6), 2)
+    texts, _, _ = _run(FakeClient(fail_pages={3}), windows, db)
+    assert len(texts) == 2
+
+    client = FakeClient()
+    texts, missing, _ = _run(client, windows, db)
+    assert missing == [1]
+    assert client.calls == [[2, 3]]
+    assert engine.stitch(texts, len(windows)) == "page0 page1\n\npage2 page3\n\npage4 page5"
+
+
+def test_failed_window_raises_so_the_job_retries_from_checkpoints(tmp_path, monkeypatch):
+    fitz = pytest.importorskip("fitz")
+    pdf = str(tmp_path / "scan.pdf")
+    with fitz.open() as doc:
+        for _ in range(6):
+            doc.new_page()
+        doc.save(pdf)
+    monkeypatch.setattr(engine.windows_for, "__defaults__", (2,))  # 2-page windows
+    monkeypatch.setattr(engine, "PageRenderer", FakeRenderer)
+    db = FakeDB()
+
+    monkeypatch.setattr(engine, "anthropic_client", lambda key: FakeClient(fail_pages={3}))
+    with pytest.raises(engine.OCRIncomplete) as info:
+        engine.ocr_pdf(pdf, "scan.pdf", api_key="k", checkpoint_key="file1", db=db)
+    assert (info.value.failed, info.value.windows) == (1, 3)
+    assert len(db[engine.OCR_CHECKPOINT_COLLECTION].docs) == 2
+
+    client = FakeClient()
+    monkeypatch.setattr(engine, "anthropic_client", lambda key: client)
+    text, stats = engine.ocr_pdf(pdf, "scan.pdf", api_key="k", checkpoint_key="file1", db=db)
+    assert client.calls == [[2, 3]] and stats["resumed"] == 2
+    assert text == "page0 page1\n\npage2 page3\n\npage4 page5"
+
+    # Without checkpoints there is nothing to resume from: a plain None.
+    monkeypatch.setattr(engine, "anthropic_client", lambda key: FakeClient(fail_pages={3}))
+    assert engine.ocr_pdf(pdf, "scan.pdf", api_key="k")[0] is None
+
+
+def test_checkpoint_ids_depend_on_window_layout():
+    db = FakeDB()
+    _run(FakeClient(), engine.windows_for(range(4), 2), db)
+    # Different window size → different windows; nothing is reused.
+    assert engine.load_checkpoints(db, "file1", engine.windows_for(range(4), 4)) == {}
+    assert engine.load_checkpoints(db, "other", engine.windows_for(range(4), 2)) == {}
+
+
+def test_clear_checkpoints_only_drops_that_key():
+    db = FakeDB()
+    windows = engine.windows_for(range(4), 2)
+    _run(FakeClient(), windows, db, key="a")
+    _run(FakeClient(), windows, db, key="b")
+    engine.clear_checkpoints(db, "a")
+    assert engine.load_checkpoints(db, "a", windows) == {}
+    assert len(engine.load_checkpoints(db, "b", windows)) == 2
+
+
+def test_window_with_no_images_makes_no_request():
+    client = FakeClient()
+    windows = engine.windows_for(range(6), 2)
+    texts, _, _ = _run(client, windows, renderer=FakeRenderer(skip={2, 3, 5}))
+    assert client.calls == [[0, 1], [4]]
+    assert engine.stitch(texts, len(windows)) == "page0 page1\n\npage4"
+
+
+def test_rate_limiter_spaces_requests(monkeypatch):
+    clock = [100.0]
+    slept = []
+    monkeypatch.setattr(engine.time, "monotonic", lambda: clock[0])
+    monkeypatch.setattr(engine.time, "sleep", slept.append)
+    limiter = engine.RateLimiter(per_minute=60)
+    for _ in range(3):
+        limiter.acquire()
+    assert slept == [1.0, 2.0]
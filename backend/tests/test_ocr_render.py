@@ -0,0 +1,85 @@
+"""
+Unit tests for adaptive OCR page rendering (backend/src/ocr/render.py).
+Run with:  pytest backend/tests/test_ocr_render.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import random
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("numpy")
+
+from src.ocr import render
+
+WORDS = ("the of and to in a is that for it as was with be by on not this are or "
+         "from at which but have an they you were her she there one all we their").split()
+
+
+def _text(n, seed):
+    rng = random.Random(seed)
+    return " ".join(rng.choice(WORDS) for _ in range(n))
+
+
+def _pdf(pages):
+    """pages: list of (fontsize, words, seed, color) or None for blank."""
+    doc = fitz.open()
+    for spec in pages:
+        page = doc.new_page()
+        if spec:
+            fontsize, words, seed, color = spec
+            page.insert_textbox(fitz.Rect(72, 72, 540, 720), _text(words, seed), fontsize=fontsize, color=color)
+    return doc
+
+
+def test_blank_page_is_skipped():
+    doc = _pdf([None])
+    assert render.analyze_page(doc[0]) == {"blank": True}
+    renderer = render.PageRenderer()
+    assert renderer.render_window(doc, [0]) == []
+    assert renderer.stats["blank"] == 1
+
+
+def test_crops_to_inked_area():
+    doc = _pdf([(10, 1200, 1, (0, 0, 0))])
+    clip = render.analyze_page(doc[0])["clip"]
+    assert clip.x0 > 40 and clip.y0 > 40 and clip.x1 < 572 and clip.y1 < 752
+
+
+def test_small_text_gets_more_dpi_than_large():
+    doc = _pdf([(8, 1800, 1, (0, 0, 0)), (12, 800, 2, (0, 0, 0)), (24, 80, 3, (0, 0, 0))])
+    small, body, large = (render.analyze_page(doc[i])["dpi"] for i in range(3))
+    assert small > body > large
+    assert large == render.OCR_MIN_DPI
+    assert small <= render.OCR_MAX_DPI
+
+
+def test_grayscale_unless_colored():
+    doc = _pdf([(10, 1200, 1, (0, 0, 0)), (10, 1200, 1, (0.9, 0, 0))])
+    assert render.analyze_page(doc[0])["color"] is False
+    assert render.analyze_page(doc[1])["color"] is True
+
+
+def test_duplicate_pages_skipped_distinct_pages_kept():
+    doc = _pdf([(10, 1200, 1, (0, 0, 0)), (10, 1200, 2, (0, 0, 0)), (10, 1200, 1, (0, 0, 0))])
+    renderer = render.PageRenderer()
+    blocks = renderer.render_window(doc, [0, 1]) + renderer.render_window(doc, [2])
+    assert len(blocks) == 2
+    assert renderer.stats["duplicate"] == 1
+
+
+def test_adaptive_sends_fewer_image_tokens_than_fixed():
+    doc = _pdf([(10, 1200, 1, (0, 0, 0)), (24, 80, 2, (0, 0, 0)), None])
+    fixed, adaptive = render.PageRenderer(adaptive=False), render.PageRenderer()
+    fixed.render_window(doc, range(3))
+    adaptive.render_window(doc, range(3))
+    assert fixed.stats["rendered"] == 3
+    assert adaptive.stats["image_tokens"] < fixed.stats["image_tokens"]
+    assert adaptive.stats["bytes"] < fixed.stats["bytes"]
+
+
+def test_image_tokens_capped_by_claude_resize():
+    assert render.image_tokens(750, 100) == 100
+    assert render.image_tokens(4000, 4000) == render.image_tokens(8000, 8000)
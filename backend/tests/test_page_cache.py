@@ -0,0 +1,88 @@
+"""
+Unit tests for the shared fetched-page cache (backend/src/utils/web/page_cache.py).
+Run with:  pytest backend/tests/test_page_cache.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.documents import Document
+
+from conftest import FakeCollection
+from src.utils.web import page_cache
+from src.utils.web.fetch import UnsafeURLError
+
+
+@pytest.fixture
+def db(monkeypatch):
+    page_cache._memory.clear()
+    for name in page_cache._counters:
+        monkeypatch.setitem(page_cache._counters, name, 0)
+    return {page_cache.PAGE_CACHE_COLLECTION: FakeCollection()}
+
+
+@pytest.fixture
+def network(monkeypatch):
+    calls = []
+
+    def fake_fetch(url):
+        calls.append(url)
+        return [Document(page_content=f"text of {url}", metadata={"source_url": url})], "Title"
+
+    monkeypatch.setattr(page_cache, "fetch_url_as_documents", fake_fetch)
+    return calls
+
+
+def test_normalize_url():
+    n = page_cache.normalize_url
+    assert n("HTTPS://Example.ORG:443/a?b=2&a=1#frag") == "https://example.org/a?a=1&b=2"
+    assert n("https://example.org?utm_source=x&fbclid=y") == "https://example.org/"
+    assert n("http://example.org:8080/x") == "http://example.org:8080/x"
+    assert n("https://example.org/A") != n("https://example.org/a")
+
+
+def test_second_fetch_is_served_from_cache(db, network):
+    docs, title = page_cache.fetch_documents("https://example.org/a?utm_medium=email", db)
+    again, title2 = page_cache.fetch_documents("https://EXAMPLE.org/a", db)
+    assert network == ["https://example.org/a?utm_medium=email"]
+    assert again[0].page_content == docs[0].page_content and title2 == "Title"
+    assert again[0].metadata["source_url"] == "https://EXAMPLE.org/a"
+
+    # Another worker: empty memory tier, same shared collection.
+    page_cache._memory.clear()
+    page_cache.fetch_documents("https://example.org/a", db)
+    assert len(network) == 1
+    stats = page_cache.stats()
+    assert stats["shared_hits"] == 1 and stats["fetches"] == 1 and stats["hits"] == 1
+    assert stats["overall_hit_rate"] == pytest.approx(2 / 3, abs=1e-3)
+
+
+def test_expired_shared_entry_is_refetched(db, network, monkeypatch):
+    page_cache.fetch_documents("https://example.org/a", db)
+    page_cache._memory.clear()
+    key = page_cache.cache_key("https://example.org/a")
+    db[page_cache.PAGE_CACHE_COLLECTION].by_id(key)["fetched_at"] -= page_cache.PAGE_CACHE_TTL_SECONDS + 1
+    page_cache.fetch_documents("https://example.org/a", db)
+    assert len(network) == 2
+
+
+def test_unsafe_url_rejected_even_when_cached(db, network):
+    page_cache.put_page("http://169.254.169.254/latest", "secret", db=db)
+    with pytest.raises(UnsafeURLError):
+        page_cache.fetch_documents("http://169.254.169.254/latest", db)
+
+
+def test_lru_eviction_respects_size_cap(db, monkeypatch):
+    monkeypatch.setattr(page_cache, "PAGE_CACHE_MAX_MB", 25 / (1024 * 1024))
+    col = db[page_cache.PAGE_CACHE_COLLECTION]
+    for i in range(4):
+        page_cache.put_page(f"https://example.org/{i}", "x" * 10, db=db)
+        col.by_id(page_cache.cache_key(f"https://example.org/{i}"))["last_access"] = i
+    col.by_id(page_cache.cache_key("https://example.org/0"))["last_access"] = 99  # recently read
+
+    assert page_cache.enforce_limits(col) == 2
+    kept = sorted(d["url"] for d in col.docs)
+    assert kept == ["https://example.org/0", "https://example.org/3"]
@@ -0,0 +1,45 @@
+"""
+Unit tests for reduced-dimension / quantized vector encoding
+(backend/src/retrieval/quantization.py).
+Run with:  pytest backend/tests/test_quantization.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from src.retrieval import quantization as q
+
+
+def test_truncate_renormalizes():
+    v = q.truncate([3.0, 4.0, 12.0], 2)
+    assert v == pytest.approx([0.6, 0.8])
+
+
+def test_float32_roundtrip():
+    vec = [0.25, -0.5, 0.125]
+    assert q.decode(*q.pack_float32(vec)) == pytest.approx(vec)
+
+
+def test_int8_preserves_direction():
+    vec = [0.9, -0.3, 0.05, 0.0]
+    dtype, padding, data = q.quantize_int8(vec)
+    assert dtype == q.DTYPE_INT8 and padding == 0 and len(data) == 4
+    assert q.cosine(vec, q.decode(dtype, padding, data)) > 0.999
+
+
+def test_binary_packs_sign_bits_msb_first():
+    dtype, padding, data = q.quantize_binary([1, -1, 1, 1, -1, -1, -1, -1, 0.5, -2])
+    assert dtype == q.DTYPE_PACKED_BIT
+    assert data == bytes([0b10110000, 0b10000000]) and padding == 6
+    assert q.decode(dtype, padding, data)[:3] == [1.0, -1.0, 1.0]
+    assert len(q.decode(dtype, padding, data)) == 10
+
+
+def test_sizes_shrink_with_mode_and_dims():
+    full = q.bson_size("float", 3072)["indexed"]
+    assert q.bson_size("float32", 3072)["indexed"] < full / 3
+    assert q.bson_size("int8", 1024)["indexed"] == 4 + 1 + 2 + 1024
+    binary = q.bson_size("binary", 1024)
+    assert binary["indexed"] == 4 + 1 + 2 + 128
+    assert binary["stored"] == binary["indexed"] + 4 + 1 + 2 + 4096
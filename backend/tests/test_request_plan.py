@@ -0,0 +1,135 @@
+"""
+Unit tests for RequestPlan / StageTimings (backend/src/utils/request_plan.py).
+Run with:  pytest backend/tests/test_request_plan.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import logging
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+from flask import Flask, current_app
+
+from src.utils import request_plan
+from src.utils.request_plan import RequestPlan, StageTimings
+
+
+@pytest.fixture
+def plan():
+    app = Flask(__name__)
+    app.config["NAME"] = "plan-test"
+    return RequestPlan(app)
+
+
+def test_steps_run_concurrently(plan):
+    barrier = threading.Barrier(3, timeout=2)
+
+    def step(value):
+        barrier.wait()  # only returns once all three steps are running at once
+        time.sleep(0.05)
+        return value
+
+    for name in ("history", "retrieval", "session"):
+        plan.start(name, step, name)
+    assert [plan.result(n) for n in ("history", "retrieval", "session")] == ["history", "retrieval", "session"]
+
+
+def test_steps_run_in_app_context(plan):
+    plan.start("cfg", lambda: current_app.config["NAME"])
+    assert plan.result("cfg") == "plan-test"
+    assert plan.started("cfg") and not plan.started("other")
+
+
+def test_result_reraises_step_error(plan):
+    def boom():
+        raise ValueError("no history")
+
+    plan.start("history", boom)
+    with pytest.raises(ValueError, match="no history"):
+        plan.result("history")
+    assert "history" in plan.timings()
+
+
+def test_background_failure_is_logged_not_raised(plan, caplog):
+    done = threading.Event()
+
+    def boom():
+        try:
+            raise RuntimeError("title model down")
+        finally:
+            done.set()
+
+    with caplog.at_level(logging.WARNING, logger="src.utils.request_plan"):
+        plan.background("title", boom)
+        assert done.wait(2)
+        for _ in range(100):
+            if "title model down" in caplog.text:
+                break
+            time.sleep(0.01)
+    assert "step=title" in caplog.text and "title model down" in caplog.text
+
+
+def test_cancel_drops_queued_steps_and_flags_running_ones(plan, monkeypatch):
+    pool = ThreadPoolExecutor(max_workers=1)
+    monkeypatch.setattr(request_plan, "_executor", lambda: pool)
+    running, ran = threading.Event(), []
+
+    def speculative():
+        running.set()
+        assert plan.cancelled.wait(2)
+        return "skipped rerank"
+
+    plan.start("retrieval", speculative)
+    plan.start("files_note", lambda: ran.append("files_note"))
+    assert running.wait(2)
+    plan.cancel()
+    assert plan.result("retrieval", timeout=2) == "skipped rerank"
+    with pytest.raises(CancelledError):
+        plan.result("files_note")
+    pool.shutdown()
+    assert ran == []
+
+
+def test_background_jobs_use_their_own_bounded_pool(plan, monkeypatch, caplog):
+    monkeypatch.setattr(request_plan, "_background_slots", threading.BoundedSemaphore(1))
+    release, names = threading.Event(), []
+
+    def slow():
+        names.append(threading.current_thread().name)
+        release.wait(2)
+
+    assert plan.background("summary", slow)
+    with caplog.at_level(logging.WARNING, logger="src.utils.request_plan"):
+        assert plan.background("title", slow) is False
+    assert "dropped (queue full) | step=title" in caplog.text
+
+    # A step on the request pool still runs while the background job is stuck.
+    plan.start("history", lambda: threading.current_thread().name)
+    assert plan.result("history", timeout=2).startswith("chat-plan")
+    release.set()
+    for _ in range(100):
+        if plan.background("title", lambda: None):
+            break
+        time.sleep(0.01)
+    else:
+        pytest.fail("background slot was never released")
+    assert names[0].startswith("chat-background")
+
+
+def test_timings_and_server_timing_header():
+    t = StageTimings()
+    with t.stage("config"):
+        time.sleep(0.01)
+    t.mark("first_token")
+    time.sleep(0.01)
+    t.mark("first_token")  # first call wins
+    t.mark("done")
+
+    out = t.timings()
+    assert out["config"] >= 10
+    assert out["first_token"] < out["done"]
+    assert t.server_timing().startswith("config;dur=")
+    assert "first_token" not in t.server_timing()
@@ -0,0 +1,59 @@
+"""
+Unit tests for the rerank stage (backend/src/retrieval/rerank.py).
+Run with:  pytest backend/tests/test_rerank.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+from src.retrieval import rerank
+
+
+class Doc:
+    def __init__(self, text):
+        self.page_content = text
+        self.metadata = {}
+
+
+def test_parse_ranking_filters_bad_entries():
+    assert rerank.parse_ranking("Sure: [3, 0, 3, 9, \"1\"]", n=5, k=3) == [3, 0, 1]
+    assert rerank.parse_ranking("[]", n=5, k=3) == []
+    with pytest.raises(ValueError):
+        rerank.parse_ranking("passage 2 is best", n=5, k=3)
+
+
+def test_cache_key_tracks_scope_version_and_normalizes_query():
+    f = {"config_id": {"$in": ["c1"]}}
+    a = rerank.cache_key("What is  PS3?", f, {"c1": 1}, 3)
+    assert a == rerank.cache_key("what is ps3?", f, {"c1": 1}, 3)
+    assert a != rerank.cache_key("what is ps3?", f, {"c1": 2}, 3)
+    assert a != rerank.cache_key("what is ps3?", f, {"c1": 1}, 5)
+
+
+def test_rerank_keeps_model_order(monkeypatch):
+    monkeypatch.setattr(rerank, "_llm_ranking", lambda q, texts, k: [2, 0])
+    docs = [Doc("a"), Doc("b"), Doc("c")]
+    kept = rerank.rerank("q", docs, k=3, backend="llm")
+    assert [d.page_content for d in kept] == ["c", "a"]
+    assert kept[0].metadata["rerank_rank"] == 1
+
+
+def test_empty_ranking_keeps_retrieval_order(monkeypatch):
+    monkeypatch.setattr(rerank, "_llm_ranking", lambda q, texts, k: [])
+    docs = [Doc("a"), Doc("b"), Doc("c")]
+    assert [d.page_content for d in rerank.rerank("q", docs, k=2, backend="llm")] == ["a", "b"]
+
+
+def test_cache_hands_out_copies():
+    docs = [Doc("a")]
+    docs[0].metadata["rerank_rank"] = 1
+    rerank.put_cached("test-copies", docs)
+    docs[0].metadata["rerank_rank"] = 9
+
+    first = rerank.get_cached("test-copies")
+    first[0].metadata["rerank_rank"] = 5
+    second = rerank.get_cached("test-copies")
+    assert second[0].metadata == {"rerank_rank": 1} and second[0] is not first[0]
+    assert second[0].page_content == "a"
+    rerank._results.pop("test-copies")
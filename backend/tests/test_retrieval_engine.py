@@ -0,0 +1,102 @@
+"""
+Unit tests for the retrieval engine's scope filter and pipeline (src/retrieval/engine.py).
+Run with:  pytest backend/tests/test_retrieval_engine.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import threading
+
+from langchain_core.documents import Document
+
+from src.retrieval import engine  # noqa: E402
+
+
+def test_variant_b_scopes_to_config_only():
+    assert engine.scope_filter("c1", "u1", "B", ["f1"]) == {"config_id": "c1"}
+    assert engine.default_k("u1", "B") == 3
+
+
+def test_selection_merges_config_and_selected_files():
+    f = engine.scope_filter("c1", "u1", "A", ["f1", "f2"])
+    assert f == {"$or": [
+        {"config_id": "c1"},
+        {"source_file_id": {"$in": ["f1", "f2"]}},
+    ]}
+    # Anonymous callers can't select library files.
+    assert engine.scope_filter("c1", "anonymous", "A", ["f1"]) == {"config_id": {"$in": ["c1"]}}
+
+
+def test_default_scope_merges_user_library():
+    assert engine.scope_filter("c1", "u1") == {"config_id": {"$in": ["c1", "user:u1"]}}
+    assert engine.default_k("u1") == 5
+    assert engine.default_k(None) == 3
+
+
+def test_pipeline_projects_score_and_skips_embedding():
+    search, project = engine.build_pipeline([0.1, 0.2], {"config_id": "c1"}, k=4)
+    assert search["$vectorSearch"]["limit"] == 4
+    assert search["$vectorSearch"]["numCandidates"] == engine.num_candidates(4)
+    assert search["$vectorSearch"]["filter"] == {"config_id": "c1"}
+    assert project["$project"]["score"] == {"$meta": "vectorSearchScore"}
+    assert "embedding" not in project["$project"]
+
+
+def test_hybrid_fusion_dedupes_and_ranks_by_rrf():
+    rows = [
+        {"_id": 1, "_via": "vector", "score": 0.9, "text": "a"},
+        {"_id": 2, "_via": "vector", "score": 0.8, "text": "b"},
+        {"_id": 3, "_via": "lexical", "score": 12.0, "text": "c"},
+        {"_id": 2, "_via": "lexical", "score": 7.0, "text": "b"},
+    ]
+    fused = engine.fuse_rows(rows, k=2)
+    assert [r["text"] for r in fused] == ["b", "a"]
+    assert "_id" not in fused[0] and "_via" not in fused[0]
+    pipeline = engine.build_hybrid_pipeline("q", [0.1], {"config_id": "c1"}, k=3)
+    assert "$unionWith" in pipeline[-1]
+
+
+def test_hybrid_rescores_the_vector_side_under_quantized_storage(monkeypatch):
+    monkeypatch.setattr(engine.quantization, "needs_rescore", lambda mode=None: True)
+    pipeline = engine.build_hybrid_pipeline("q", [1.0, 0.0], {"config_id": "c1"}, k=5)
+    search, project = pipeline[0], pipeline[1]
+    assert search["$vectorSearch"]["limit"] == engine.hybrid_fetch(5) * engine.quantization.RESCORE_MULTIPLIER
+    assert project["$project"][engine.quantization.RESCORE_KEY] == 1
+
+    def full(vector):
+        return engine.quantization.to_bson(engine.quantization.pack_float32(vector))
+
+    rows = [
+        # Atlas' int8 score put "near" last; the float32 copy says otherwise.
+        {"_id": 1, "_via": "vector", "score": 0.9, "text": "far",
+         engine.quantization.RESCORE_KEY: full([0.0, 1.0])},
+        {"_id": 2, "_via": "vector", "score": 0.5, "text": "near",
+         engine.quantization.RESCORE_KEY: full([1.0, 0.0])},
+        {"_id": 3, "_via": "lexical", "score": 7.0, "text": "bm25"},
+    ]
+    rescored = engine.rescore_hybrid_rows(rows, [1.0, 0.0], k=1)
+    assert [r["text"] for r in rescored] == ["near", "far", "bm25"]
+    assert all(engine.quantization.RESCORE_KEY not in r for r in rescored)
+
+
+def test_filter_scopes_for_rerank_cache_versions():
+    assert engine.filter_scopes(engine.scope_filter("c1", "u1")) == ["c1", "user:u1"]
+    assert engine.filter_scopes(engine.scope_filter("c1", "u1", "A", ["f1"]), "u1") == ["c1", "user:u1"]
+    assert engine.filter_scopes(engine.scope_filter("c1", "u1", "B")) == ["c1"]
+
+
+def test_cancelled_request_skips_the_rerank_call(monkeypatch):
+    monkeypatch.setattr(engine.scope_versions, "get_versions", lambda db, scopes: {})
+    candidates = [Document(page_content=t) for t in ("d1", "d2", "d3")]
+    monkeypatch.setattr(engine, "_search", lambda q, f, k, mode, db, emb: candidates)
+    calls = []
+    monkeypatch.setattr(engine.reranker, "rerank", lambda q, docs, k: calls.append(q) or docs[::-1][:k])
+    cancelled = threading.Event()
+    cancelled.set()
+
+    docs = engine.retrieve("cancelled q", config_id="c1", k=2, rerank=True,
+                           db=object(), embeddings=object(), cancelled=cancelled)
+    assert [d.page_content for d in docs] == ["d1", "d2"] and calls == []
+    # Not cached: the next (uncancelled) request still reranks.
+    docs = engine.retrieve("cancelled q", config_id="c1", k=2, rerank=True, db=object(), embeddings=object())
+    assert [d.page_content for d in docs] == ["d3", "d2"] and calls == ["cancelled q"]
@@ -0,0 +1,135 @@
+"""
+Unit tests for chunk writes to the vector collection
+(backend/src/utils/vector_stores/store_vector_stores.py).
+Run with:  pytest backend/tests/test_store_vector_stores.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("langchain_community")
+
+from flask import Flask
+from langchain_core.documents import Document
+
+from conftest import FakeDB
+from src.retrieval import scope_versions
+from src.utils.vector_stores import store_vector_stores as svs
+
+
+class FakeEmbeddings:
+    model = "fake-embed"
+
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.config.update(MONGO_DB=FakeDB(), EMBEDDINGS=FakeEmbeddings())
+    with app.app_context():
+        yield app
+
+
+def _version(app, scope="user:u1"):
+    scope_versions._versions.pop(scope)
+    return scope_versions.get_versions(app.config["MONGO_DB"], [scope])[scope]
+
+
+def _splits(*paragraphs):
+    return [Document(page_content=p, metadata={"source": "notes.txt", "start_index": i * 100})
+            for i, p in enumerate(paragraphs)]
+
+
+def _stored(app):
+    col = app.config["MONGO_DB"]["vector_collection"]
+    return sorted((d["text"], d.get("start_index"), d["original_file"]) for d in col.docs)
+
+
+def test_replace_embeds_only_new_text_and_drops_vanished_chunks(app):
+    assert svs.replace_file_chunks(_splits("alpha", "beta", "gamma"), "u1", "", "notes.txt", "f1")["added"] == 3
+    emb = app.config["EMBEDDINGS"]
+    emb.texts.clear()
+
+    stats = svs.replace_file_chunks(_splits("alpha", "delta", "beta"), "u1", "", "notes.txt", "f1")
+    assert stats == {"kept": 2, "added": 1, "removed": 1, "moved": 1, "embedded": 1}
+    assert emb.texts == ["delta"]
+    assert _stored(app) == [("alpha", 0, "notes.txt"), ("beta", 200, "notes.txt"), ("delta", 100, "notes.txt")]
+
+
+def test_failed_replace_rolls_back_to_the_old_version(app, monkeypatch):
+    svs.replace_file_chunks(_splits("alpha", "beta", "gamma"), "u1", "", "notes.txt", "f1")
+    before, version = _stored(app), _version(app)
+    col = app.config["MONGO_DB"]["vector_collection"]
+    delete_many = col.delete_many
+
+    def fail_removal(query):
+        if "content_hash" not in query:
+            raise RuntimeError("primary stepped down")
+        return delete_many(query)
+    monkeypatch.setattr(col, "delete_many", fail_removal)
+
+    # "beta" moves and is also repeated: the new copy goes, the stored one stays.
+    splits = _splits("alpha", "delta", "beta", "beta")
+    assert svs.replace_file_chunks(splits, "u1", "", "notes_v2.txt", "f1") is None
+    assert _stored(app) == before
+    assert _version(app) > version
+
+
+def test_failed_embedding_leaves_no_new_chunks(app, monkeypatch):
+    svs.replace_file_chunks(_splits("alpha"), "u1", "", "notes.txt", "f1")
+    before = _stored(app)
+
+    def boom(*a, **kw):
+        raise RuntimeError("embeddings down")
+    monkeypatch.setattr(svs, "run_embedding_pipeline", boom)
+    assert svs.replace_file_chunks(_splits("alpha", "beta"), "u1", "", "notes.txt", "f1") is None
+    assert _stored(app) == before
+
+
+# --- streamed ingest ------------------------------------------------------------------
+
+def _stream(texts, pulled):
+    for i, text in enumerate(texts):
+        pulled.append(i)
+        yield Document(page_content=text, metadata={"source": "big.txt"})
+
+
+def test_stream_embeds_a_group_before_pulling_the_next(app):
+    emb, pulled, seen, progress = app.config["EMBEDDINGS"], [], [], []
+    embed = emb.embed_documents
+
+    def embed_documents(texts):
+        seen.append(len(pulled))
+        return embed(texts)
+    emb.embed_documents = embed_documents
+
+    texts = [f"paragraph {i}" for i in range(5)]
+    written = svs.ingest_chunk_stream(_stream(texts, pulled), "u1", "", "big.txt", "f1",
+                                      on_progress=lambda done, total: progress.append((done, total)),
+                                      group_size=2)
+    assert written == 5
+    assert seen == [2, 4, 5]
+    assert progress[-1][0] == progress[-1][1] == 3
+    assert sorted(d["text"] for d in app.config["MONGO_DB"]["vector_collection"].docs) == texts
+
+
+def test_stream_failure_removes_the_groups_it_wrote(app):
+    db = app.config["MONGO_DB"]
+    svs.ingest_chunks([Document(page_content="paragraph 0", metadata={})], "u1", "", "other.txt", "f0")
+    version = _version(app)
+
+    def crashing(pulled):
+        yield from _stream(["paragraph 0", "paragraph 1", "paragraph 2"], pulled)
+        raise RuntimeError("corrupt page")
+
+    assert svs.ingest_chunk_stream(crashing([]), "u1", "", "big.txt", "f1", group_size=2) is None
+    # Only the other file's chunk (same text, different file) is left.
+    assert [(d["text"], d["source_file_id"]) for d in db["vector_collection"].docs] == [("paragraph 0", "f0")]
+    assert _version(app) > version
@@ -0,0 +1,73 @@
+"""
+Unit tests for TTLCache (backend/src/utils/ttl_cache.py).
+Run with:  pytest backend/tests/test_ttl_cache.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from src.utils.ttl_cache import CACHES, TTLCache, all_stats
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_hit_and_miss_counters():
+    c = TTLCache("t_counters", max_entries=4)
+    assert c.get("a") is None
+    c.set("a", 1)
+    assert c.get("a") == 1
+    s = c.stats()
+    assert (s["hits"], s["misses"]) == (1, 1)
+    assert s["hit_rate"] == 0.5
+
+
+def test_lru_eviction_keeps_recently_used():
+    c = TTLCache("t_lru", max_entries=2)
+    c.set("a", 1)
+    c.set("b", 2)
+    c.get("a")          # a is now most recent
+    c.set("c", 3)       # evicts b
+    assert c.get("b") is None
+    assert c.get("a") == 1 and c.get("c") == 3
+    assert c.stats()["evictions"] == 1
+
+
+def test_on_evict_sees_lru_evictions_only():
+    evicted = []
+    c = TTLCache("t_on_evict", max_entries=1, on_evict=lambda k, v: evicted.append((k, v)))
+    c.set("a", 1)
+    c.set("a", 2)       # overwrite, not an eviction
+    c.pop("a")
+    c.set("b", 3)
+    c.set("c", 4)
+    assert evicted == [("b", 3)]
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    c = TTLCache("t_ttl", max_entries=4, ttl_seconds=10, clock=clock)
+    c.set("a", 1)
+    clock.now = 9.9
+    assert c.get("a") == 1
+    clock.now = 10.0
+    assert c.get("a") is None
+    assert len(c) == 0
+
+
+def test_per_entry_ttl_override():
+    clock = FakeClock()
+    c = TTLCache("t_ttl_override", max_entries=4, ttl_seconds=100, clock=clock)
+    c.set("short", 1, ttl_seconds=1)
+    clock.now = 2
+    assert c.get("short") is None
+
+
+def test_caches_register_by_name():
+    c = TTLCache("t_registry", max_entries=1)
+    assert CACHES["t_registry"] is c
+    assert "t_registry" in all_stats()
@@ -0,0 +1,139 @@
+"""
+Unit tests for conditional / pooled URL fetching (backend/src/utils/web/fetch.py).
+Run with:  pytest backend/tests/test_url_fetch.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import threading
+import time
+
+import pytest
+
+pytest.importorskip("requests")
+
+from src.utils.web import fetch
+from src.utils.web.fetch import HostThrottle, fetch_many, fetch_page
+
+
+class FakeResponse:
+    def __init__(self, status, headers=None, body=b""):
+        self.status_code = status
+        self.headers = headers or {}
+        self.body = body
+        self.is_redirect = status in (301, 302, 303, 307, 308)
+
+    def iter_content(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class FakeSession:
+    def __init__(self, routes):
+        self.routes = routes
+        self.calls = []
+
+    def get(self, url, headers, **kwargs):
+        self.calls.append((url, headers))
+        return self.routes[url](headers)
+
+
+def test_conditional_request_returns_304_without_body():
+    def page(headers):
+        if headers.get("If-None-Match") == '"v1"':
+            return FakeResponse(304, {"ETag": '"v1"'})
+        return FakeResponse(200, {"ETag": '"v1"', "Last-Modified": "Mon, 05 Oct 2026 10:00:00 GMT"}, b"<p>hi</p>")
+
+    session = FakeSession({"https://example.org/a": page})
+    first = fetch_page("https://example.org/a", session=session)
+    assert first["status"] == 200 and first["html"] == b"<p>hi</p>"
+    assert first["etag"] == '"v1"' and first["last_modified"].startswith("Mon")
+
+    again = fetch_page("https://example.org/a", etag=first["etag"], last_modified=first["last_modified"],
+                       session=session)
+    assert again["status"] == 304 and again["html"] is None and again["error"] is None
+    assert session.calls[-1][1]["If-Modified-Since"] == first["last_modified"]
+
+
+def test_redirect_into_private_network_is_refused():
+    session = FakeSession({
+        "https://example.org/r": lambda h: FakeResponse(302, {"Location": "http://169.254.169.254/latest"}),
+    })
+    result = fetch_page("https://example.org/r", session=session)
+    assert result["error"].startswith("URL is not allowed")
+    assert len(session.calls) == 1
+
+
+def test_relative_redirect_followed_and_oversized_body_rejected(monkeypatch):
+    monkeypatch.setattr(fetch, "URL_FETCH_MAX_BYTES", 10)
+    session = FakeSession({
+        "https://example.org/old": lambda h: FakeResponse(301, {"Location": "/new"}),
+        "https://example.org/new": lambda h: FakeResponse(200, {}, b"x" * 100),
+    })
+    result = fetch_page("https://example.org/old", session=session)
+    assert [c[0] for c in session.calls] == ["https://example.org/old", "https://example.org/new"]
+    assert result["error"] == "Page too large" and result["html"] is None
+
+
+def test_http_errors_are_returned_not_raised():
+    def boom(headers):
+        raise ConnectionError("reset")
+
+    session = FakeSession({"https://example.org/404": lambda h: FakeResponse(404),
+                           "https://example.org/down": boom})
+    assert fetch_page("https://example.org/404", session=session)["error"] == "HTTP 404"
+    assert fetch_page("https://example.org/down", session=session)["error"] == "reset"
+
+
+def test_host_throttle_spaces_starts_and_caps_in_flight():
+    throttle = HostThrottle(per_host=1, delay=0.05)
+    starts = []
+    for _ in range(3):
+        throttle.acquire("a.org")
+        starts.append(time.monotonic())
+        throttle.release("a.org")
+    assert all(b - a >= 0.045 for a, b in zip(starts, starts[1:]))
+
+    throttle.acquire("b.org")
+    blocked = threading.Thread(target=throttle.acquire, args=("b.org",), daemon=True)
+    blocked.start()
+    blocked.join(0.1)
+    assert blocked.is_alive()
+    throttle.release("b.org")
+    blocked.join(1)
+    assert not blocked.is_alive()
+
+
+def test_fetch_many_runs_hosts_concurrently_and_keeps_indices():
+    in_flight, peak = {}, {}
+    lock = threading.Lock()
+
+    def fake_fetch(url, etag, last_modified, session=None):
+        host = url.split("/")[2]
+        with lock:
+            in_flight[host] = in_flight.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), in_flight[host])
+        time.sleep(0.02)
+        with lock:
+            in_flight[host] -= 1
+        return {"url": url, "status": 304 if etag else 200, "error": None}
+
+    items = [{"url": f"https://{host}/{n}", "etag": "e" if n == 0 else None}
+             for host in ("a.org", "b.org", "c.org") for n in range(4)]
+    results = list(fetch_many(items, concurrency=6, throttle=HostThrottle(per_host=2, delay=0),
+                              fetch=fake_fetch))
+
+    assert sorted(r["i"] for r in results) == list(range(len(items)))
+    assert all(r["url"] == items[r["i"]]["url"] for r in results)
+    assert [r["status"] for r in results if r["url"].endswith("/0")] == [304, 304, 304]
+    assert max(peak.values()) <= 2
+    assert len(peak) == 3
@@ -0,0 +1,257 @@
+"""
+Unit tests for the personal file library routes (backend/routes/user_files.py).
+Run with:  pytest backend/tests/test_user_files.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import io
+
+import pytest
+
+pytest.importorskip("langchain_community")
+pytest.importorskip("flask_jwt_extended")
+
+from bson import ObjectId
+from flask import Flask
+from flask_jwt_extended import JWTManager, create_access_token
+from langchain_core.documents import Document
+
+from conftest import FakeCollection, FakeDB
+from routes import user_files
+from src.jobs import queue as job_queue
+from src.utils.vector_stores.store_vector_stores import replace_file_chunks
+
+
+class FakeEmbeddings:
+    model = "fake-embed"
+
+    def embed_documents(self, texts):
+        return [[float(len(t)), 1.0] for t in texts]
+
+
+class ObjectIdCollection(FakeCollection):
+    """Mints ObjectIds as Mongo does: the routes parse ids back with ObjectId()."""
+
+    def __init__(self, docs=None):
+        super().__init__(docs)
+        self._ids = iter(ObjectId, None)
+
+
+class FakeMongo(FakeDB):
+    collection_class = ObjectIdCollection
+
+
+class FakeS3:
+    def __init__(self):
+        self.objects = {}
+
+    def upload(self, path, key, content_type=None):
+        with open(path, "rb") as f:
+            self.objects[key] = f.read()
+
+    def delete(self, key):
+        self.objects.pop(key, None)
+
+
+@pytest.fixture
+def env(monkeypatch, tmp_path):
+    app = Flask(__name__)
+    app.config.update(JWT_SECRET_KEY="test-secret-key-that-is-long-enough", MONGO_DB=FakeMongo(),
+                      EMBEDDINGS=FakeEmbeddings())
+    JWTManager(app)
+    app.register_blueprint(user_files.user_files_bp, url_prefix="/api")
+    s3 = FakeS3()
+    monkeypatch.setattr(user_files, "TMP_UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(user_files, "s3_upload", s3.upload)
+    monkeypatch.setattr(user_files, "s3_delete", s3.delete)
+    with app.app_context():
+        headers = {"Authorization": f"Bearer {create_access_token(identity='u1')}"}
+        yield app.test_client(), app.config["MONGO_DB"], s3, headers
+
+
+# --- replace in place ---------------------------------------------------------------
+
+def _library_file(db, s3, text):
+    file_id = ObjectId()
+    key = f"user_files/u1/{file_id}/notes.txt"
+    s3.objects[key] = text.encode()
+    db["user_files"].insert_one({"_id": file_id, "user_id": "u1", "filename": "notes.txt",
+                                 "folder_path": "", "storage_key": key, "ingest_status": "done"})
+    replace_file_chunks([Document(page_content=text, metadata={})], "u1", "", "notes.txt", str(file_id))
+    return file_id, key
+
+
+def _put(client, headers, file_id, text):
+    return client.put(f"/api/files/{file_id}", headers=headers, content_type="multipart/form-data",
+                      data={"file": (io.BytesIO(text.encode()), "notes.txt")})
+
+
+def test_replace_swaps_original_after_the_diff(env):
+    client, db, s3, headers = env
+    file_id, _ = _library_file(db, s3, "Photosynthesis makes sugar.")
+
+    resp = _put(client, headers, file_id, "Photosynthesis makes sugar and oxygen.")
+    assert resp.status_code == 200
+    assert resp.get_json()["diff"]["added"] == 1
+    row = db["user_files"].by_id(file_id)
+    assert row["version"] == 2 and row["storage_key"] == f"user_files/u1/{file_id}/v2/notes.txt"
+    assert list(s3.objects) == [row["storage_key"]]
+    assert [d["text"] for d in db["vector_collection"].docs] == ["Photosynthesis makes sugar and oxygen."]
+
+
+def test_failed_replace_keeps_the_old_original_and_chunks(env, monkeypatch):
+    client, db, s3, headers = env
+    file_id, old_key = _library_file(db, s3, "Photosynthesis makes sugar.")
+    row_before = db["user_files"].by_id(file_id).copy()
+    vectors = db["vector_collection"]
+    delete_many = vectors.delete_many
+
+    def fail_removal(query):
+        if "content_hash" not in query:
+            raise RuntimeError("primary stepped down")
+        return delete_many(query)
+    monkeypatch.setattr(vectors, "delete_many", fail_removal)
+
+    resp = _put(client, headers, file_id, "Photosynthesis makes sugar and oxygen.")
+    assert resp.status_code == 500
+    assert db["user_files"].by_id(file_id) == row_before
+    assert list(s3.objects) == [old_key]
+    assert [d["text"] for d in vectors.docs] == ["Photosynthesis makes sugar."]
+
+
+# --- upload: sync vs worker -------------------------------------------------------
+
+def _upload(client, headers, name, data):
+    return client.post("/api/files", headers=headers, content_type="multipart/form-data",
+                       data={"file": (io.BytesIO(data), name)})
+
+
+def test_small_upload_is_ingested_in_the_request(env):
+    client, db, s3, headers = env
+    resp = _upload(client, headers, "notes.txt", b"Photosynthesis makes sugar.")
+    assert resp.status_code == 201
+    assert resp.get_json()["file"]["ingest_status"] == "done"
+    assert [d["text"] for d in db["vector_collection"].docs] == ["Photosynthesis makes sugar."]
+    assert not db[job_queue.JOB_QUEUE_COLLECTION].docs
+
+
+@pytest.mark.parametrize("name", ["big.txt", "big.pdf"])
+def test_large_upload_is_extracted_by_the_worker(env, monkeypatch, tmp_path, name):
+    client, db, s3, headers = env
+    if name.endswith(".pdf"):
+        fitz = pytest.importorskip("fitz")
+        with fitz.open() as pdf:
+            for _ in range(3):
+                pdf.new_page().insert_text((72, 72), "Photosynthesis makes sugar.")
+            data = pdf.tobytes()
+        monkeypatch.setattr(user_files, "SYNC_INGEST_MAX_PAGES", 2)
+    else:
+        data = b"Photosynthesis makes sugar.\n\n" * 100
+        monkeypatch.setattr(user_files, "SYNC_INGEST_MAX_BYTES", 1024)
+    monkeypatch.setattr(user_files, "extract_pdf_chunks_fast",
+                        lambda *a, **kw: pytest.fail("extracted on the request thread"))
+
+    resp = _upload(client, headers, name, data)
+    assert resp.status_code == 202
+    body = resp.get_json()
+    key = body["file"]["storage_key"]
+    assert s3.objects[key] == data
+    assert not db["vector_collection"].docs
+    assert not os.listdir(user_files.TMP_UPLOAD_DIR)
+    job, = db[job_queue.JOB_QUEUE_COLLECTION].docs
+    assert job["kind"] == "upload_ingest"
+    assert job["payload"]["extract"] and job["payload"]["storage_key"] == key
+    assert job["payload"]["tmp_path"] is None
+    assert job["payload"]["job_id_str"] == body["job_id"]
+
+
+@pytest.mark.parametrize("mixed", [False, True])
+def test_ocr_upload_fails_when_it_cannot_be_staged(env, monkeypatch, mixed):
+    client, db, s3, headers = env
+    splits = [Document(page_content="Photosynthesis makes sugar.", metadata={})] if mixed else []
+    monkeypatch.setattr(user_files, "extract_pdf_chunks_fast", lambda *a, **kw: (splits, 3, [1, 2]))
+
+    def s3_down(*a, **kw):
+        raise RuntimeError("S3 unavailable")
+    monkeypatch.setattr(user_files, "s3_upload", s3_down)
+
+    resp = _upload(client, headers, "scan.pdf", b"%PDF-1.4 scanned")
+    assert resp.status_code == 502
+    assert not db["user_files"].docs and not db["upload_jobs"].docs
+    assert not db[job_queue.JOB_QUEUE_COLLECTION].docs
+    assert not db["vector_collection"].docs
+    assert not os.listdir(user_files.TMP_UPLOAD_DIR)
+
+
+# --- abandoned direct uploads -------------------------------------------------------
+
+def test_sweep_removes_only_stale_unconfirmed_uploads(env):
+    _, db, s3, _ = env
+    now, ttl = 10_000.0, user_files.DIRECT_UPLOAD_ABANDON_SECONDS
+    rows = {
+        "stale": ("awaiting_upload", now - ttl - 5),
+        "recent": ("awaiting_upload", now - 60),
+        "confirmed": ("done", now - ttl - 5),
+    }
+    for name, (status, uploaded_at) in rows.items():
+        key = f"user_files/u1/{name}/notes.txt"
+        s3.objects[key] = b"bytes"
+        db["user_files"].insert_one({"_id": name, "user_id": "u1", "filename": "notes.txt",
+                                     "storage_key": key, "ingest_status": status, "uploaded_at": uploaded_at})
+
+    assert user_files._sweep_abandoned_uploads(db, now=now) == 1
+    assert sorted(d["_id"] for d in db["user_files"].docs) == ["confirmed", "recent"]
+    assert sorted(s3.objects) == ["user_files/u1/confirmed/notes.txt", "user_files/u1/recent/notes.txt"]
+    # Re-armed for when the recent one goes stale.
+    job, = db[job_queue.JOB_QUEUE_COLLECTION].docs
+    assert job["kind"] == user_files.DIRECT_UPLOAD_SWEEP_KIND
+    assert job["run_at"] - job["created_at"] == pytest.approx(ttl - 60, abs=5)
+
+
+# --- bulk URL ingest ----------------------------------------------------------------
+
+def test_url_ingest_adds_skips_unchanged_and_settles_failures(env, monkeypatch):
+    client, db, s3, headers = env
+    known = "https://example.org/known"
+    row_id = ObjectId()
+    db["user_files"].insert_one({"_id": row_id, "user_id": "u1", "filename": "Known page", "folder_path": "",
+                                 "source_url": known, "is_url": True, "vector_ingested": True,
+                                 "ingest_status": "done", "http_etag": '"v1"'})
+    replace_file_chunks([Document(page_content="Known text.", metadata={})], "u1", "", "Known page", str(row_id))
+
+    sent = []
+
+    def fake_fetch_many(requests_):
+        sent.extend(requests_)
+        for i, item in enumerate(requests_):
+            if item["etag"] == '"v1"':
+                yield {"i": i, "status": 304, "error": None}
+            elif item["url"].endswith("/new"):
+                yield {"i": i, "status": 200, "error": None, "html": "<p>New text.</p>", "etag": '"n1"'}
+            else:
+                yield {"i": i, "status": None, "error": "HTTP 503"}
+    monkeypatch.setattr(user_files, "fetch_many", fake_fetch_many)
+    monkeypatch.setattr(user_files, "extract_documents",
+                        lambda url, html: ([Document(page_content="New text.", metadata={"source": url})], "New page"))
+
+    resp = client.post("/api/files/urls", headers=headers,
+                       json={"urls": [known, "https://example.org/new", "https://down.example/x"]})
+    assert resp.status_code == 202
+    job, = db[job_queue.JOB_QUEUE_COLLECTION].docs
+    assert job["kind"] == "url_ingest"
+    user_files._run_url_ingest(**job["payload"])
+
+    # Only the record that already has chunks sends its validator.
+    assert [r["etag"] for r in sent] == ['"v1"', None, None]
+    status = db["upload_jobs"].by_id(ObjectId(resp.get_json()["job_id"]))
+    assert status["status"] == "done"
+    assert status["counts"] == {"unchanged": 1, "updated": 0, "added": 1, "failed": 1}
+    assert status["failed"] == [{"url": "https://down.example/x", "error": "HTTP 503"}]
+
+    rows = {d["source_url"]: d for d in db["user_files"].docs}
+    assert set(rows) == {known, "https://example.org/new"}  # the failed new record is dropped
+    assert rows[known]["ingest_status"] == "done" and rows[known]["http_etag"] == '"v1"'
+    assert rows["https://example.org/new"]["filename"] == "New page"
+    assert rows["https://example.org/new"]["http_etag"] == '"n1"'
+    assert sorted(d["text"] for d in db["vector_collection"].docs) == ["Known text.", "New text."]
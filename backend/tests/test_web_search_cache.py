@@ -0,0 +1,71 @@
+"""
+Unit tests for the Tavily result cache (backend/src/utils/web/search.py).
+Run with:  pytest backend/tests/test_web_search_cache.py -v
+"""
+import sys, os
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from src.utils.web import search
+
+
+class FakeTavily:
+    instances = 0
+
+    def __init__(self, api_key):
+        FakeTavily.instances += 1
+        self.calls = []
+
+    def search(self, query, max_results, search_depth):
+        self.calls.append((query, max_results, search_depth))
+        if query == "boom":
+            raise RuntimeError("quota")
+        return {"results": [{"title": query, "url": f"https://r/{i}", "content": "c"} for i in range(max_results)]}
+
+
+@pytest.fixture
+def tavily(monkeypatch):
+    search._results.clear()
+    monkeypatch.setattr(search, "_client", None)
+    monkeypatch.setattr(search, "_client_key", None)
+    for name in search._counters:
+        monkeypatch.setitem(search._counters, name, 0)
+    FakeTavily.instances = 0
+    fake = type(sys)("tavily")
+    fake.TavilyClient = FakeTavily
+    monkeypatch.setitem(sys.modules, "tavily", fake)
+    return FakeTavily
+
+
+def test_repeated_query_is_served_from_cache_with_one_client(tavily):
+    first = search.search("What is photosynthesis?", 5, api_key="k")
+    again = search.search("  what is   PHOTOSYNTHESIS ", 5, api_key="k")
+    assert again == first and len(first) == 5
+    assert search._client.calls == [("What is photosynthesis?", 5, "basic")]
+    assert tavily.instances == 1
+
+    search.search("what is photosynthesis", 3, api_key="k")  # different max_results
+    assert len(search._client.calls) == 2
+    assert tavily.instances == 1
+
+    stats = search.stats()
+    assert stats["searches"] == 2 and stats["hits"] == 1
+    assert stats["credits_saved"] == 1
+    assert stats["usd_saved"] == pytest.approx(search.TAVILY_USD_PER_CREDIT)
+
+
+def test_errors_are_not_cached(tavily):
+    for _ in range(2):
+        with pytest.raises(RuntimeError):
+            search.search("boom", 5, api_key="k")
+    assert len(search._client.calls) == 2
+    assert search.stats()["errors"] == 2
+
+
+def test_new_api_key_gets_new_client(tavily):
+    search.search("a", 1, api_key="k1")
+    search.search("b", 1, api_key="k2")
+    assert tavily.instances == 2
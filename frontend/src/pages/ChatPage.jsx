@@ -607,20 +607,42 @@ const ChatPage = () => {
     const uploaded = [];
     try {
       for (const file of fileList) {
-        const form = new FormData();
-        form.append('file', file);
-        form.append('folder_path', folderPath);
-        if (scopeConfigId) form.append('config_id', scopeConfigId);
+        // Direct-to-S3: the backend hands out a presigned PUT URL, the bytes
+        // go straight to S3, then /uploaded queues the ingest.
+        let createdFileId = null;
+        let confirmed = false;
         try {
-          const res = await apiClient.post('/files', form, {
-            headers: { 'Content-Type': 'multipart/form-data' },
+          const created = await apiClient.post('/files/uploads', {
+            filename: file.name,
+            content_type: file.type || undefined,
+            size_bytes: file.size,
+            folder_path: folderPath,
+            ...(scopeConfigId ? { config_id: scopeConfigId } : {}),
           });
+          const { upload_url, content_type: signedType } = created.data;
+          createdFileId = created.data.file._id;
+
+          await new Promise((resolve, reject) => {
+            const xhr = new XMLHttpRequest();
+            xhr.open('PUT', upload_url);
+            xhr.setRequestHeader('Content-Type', signedType);
+            xhr.onload = () => (xhr.status >= 200 && xhr.status < 300) ? resolve() : reject(new Error(`Upload failed (${xhr.status})`));
+            xhr.onerror = () => reject(new Error('Upload failed — check your connection.'));
+            xhr.send(file);
+          });
+
+          const res = await apiClient.post(`/files/${createdFileId}/uploaded`, {});
+          confirmed = true;
           if (res.data?.file) {
             uploaded.push(res.data.file);
             setLibraryFiles((prev) => [res.data.file, ...prev]);
           }
         } catch (err) {
-          const msg = err.response?.data?.message || `Failed to upload ${file.name}`;
+          // Drop the placeholder record if the upload never got confirmed.
+          if (createdFileId && !confirmed) {
+            apiClient.delete(`/files/${createdFileId}`).catch(() => {});
+          }
+          const msg = err.response?.data?.message || err.message || `Failed to upload ${file.name}`;
           setUploadError(msg);
         }
       }